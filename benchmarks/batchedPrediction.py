@@ -0,0 +1,102 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Compare the batched prediction path of ParallelVigraRfLazyflowClassifier with predicting
+every block separately (one request per forest and block, accumulated under a lock).
+
+A volume is split into cubic blocks that are predicted concurrently, like OpVectorwiseClassifierPredict does.
+
+Usage:
+    python benchmarks/batchedPrediction.py --volume 256 --features 16 --trees 100
+"""
+import argparse
+
+import numpy as np
+
+from lazyflow.classifiers import ParallelVigraRfLazyflowClassifierFactory
+from lazyflow.request import Request, RequestLock, RequestPool
+from lazyflow.utility import Timer
+
+
+def predict_unbatched(classifier, X):
+    total = [None]
+    lock = RequestLock()
+
+    def accumulate(forest, predictions):
+        predictions *= forest.treeCount()
+        with lock:
+            if total[0] is None:
+                total[0] = predictions
+            else:
+                total[0] += predictions
+
+    pool = RequestPool()
+    for forest in classifier._forests:
+        req = Request(lambda forest=forest: forest.predictProbabilities(X))
+        req.notify_finished(lambda predictions, forest=forest: accumulate(forest, predictions))
+        pool.add(req)
+    pool.wait()
+    return total[0] / classifier._num_trees
+
+
+def run(predict, features, block_size):
+    edge = features.shape[0]
+    pool = RequestPool()
+    for z in range(0, edge, block_size):
+        for y in range(0, edge, block_size):
+            for x in range(0, edge, block_size):
+                block = features[z : z + block_size, y : y + block_size, x : x + block_size]
+
+                def predict_block(block=block):
+                    X = np.asarray(block, np.float32).reshape((-1, block.shape[-1]))
+                    return predict(X)
+
+                pool.add(Request(predict_block))
+    with Timer() as timer:
+        pool.wait()
+    return timer.seconds()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--volume", type=int, default=256, help="edge length of the (cubic) volume to predict")
+    parser.add_argument("--features", type=int, default=16)
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--classes", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    X_train = rng.random((5000, args.features), dtype=np.float32)
+    y_train = rng.integers(1, args.classes + 1, size=5000).astype(np.uint32)
+    classifier = ParallelVigraRfLazyflowClassifierFactory(args.trees).create_and_train(X_train, y_train)
+
+    features = rng.random((args.volume,) * 3 + (args.features,), dtype=np.float32)
+    block_sizes = [s for s in (32, 64, 128, 256) if s <= args.volume]
+
+    print(f"{'block':>6} {'blocks':>7} {'unbatched [s]':>14} {'batched [s]':>12} {'speedup':>8}")
+    for block_size in block_sizes:
+        num_blocks = (-(-args.volume // block_size)) ** 3
+        t_unbatched = run(lambda X: predict_unbatched(classifier, X), features, block_size)
+        t_batched = run(classifier.predict_probabilities, features, block_size)
+        print(
+            f"{block_size:>5}^3 {num_blocks:>7} {t_unbatched:>14.3f} {t_batched:>12.3f} {t_unbatched / t_batched:>8.2f}"
+        )
@@ -0,0 +1,89 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+#           http://ilastik.org/license.html
+###############################################################################
+"""
+Read throughput of OpStreamingH5N5Reader for a compressed HDF5 dataset, read in parallel requests (as the
+caches downstream of the reader do): in this process (all reads serialized by h5py) vs. in the worker
+processes of the lazyflow process pool.
+
+Usage:
+    python benchmarks/h5ReaderThroughput.py --shape 128 1024 1024 --compression gzip lzf --processes 0 2 4 8
+"""
+import argparse
+import os
+import tempfile
+
+import h5py
+import numpy as np
+
+from lazyflow.graph import Graph
+from lazyflow.operators.ioOperators import OpStreamingH5N5Reader
+from lazyflow.request import RequestPool, processPool
+from lazyflow.roi import getBlockBounds, getIntersectingBlocks, roiFromShape
+from lazyflow.utility import Timer
+
+
+def create_dataset(path, shape, chunks, compression):
+    rng = np.random.default_rng(0)
+    # Smooth-ish data, so that compression has something to do
+    data = (np.add.outer(np.arange(shape[0]), np.arange(shape[1]))[..., None] + np.arange(shape[2])) % 256
+    data = (data + rng.integers(0, 8, size=shape)).astype(np.uint8)
+    with h5py.File(path, "w") as f:
+        f.create_dataset("data", data=data, chunks=chunks, compression=compression)
+    return data.nbytes
+
+
+def read_all(path, request_shape):
+    with h5py.File(path, "r") as f:
+        op = OpStreamingH5N5Reader(graph=Graph())
+        op.H5N5File.setValue(f)
+        op.InternalPath.setValue("data")
+        shape = op.OutputImage.meta.shape
+
+        pool = RequestPool()
+        for block_start in getIntersectingBlocks(request_shape, roiFromShape(shape)):
+            start, stop = getBlockBounds(shape, request_shape, block_start)
+            pool.add(op.OutputImage(start, stop))
+        with Timer() as timer:
+            pool.wait()
+        return timer.seconds()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shape", type=int, nargs=3, default=[128, 1024, 1024])
+    parser.add_argument("--chunks", type=int, nargs=3, default=[32, 128, 128])
+    parser.add_argument("--request-shape", type=int, nargs=3, default=[64, 256, 256])
+    parser.add_argument("--compression", nargs="+", default=["gzip", "lzf"])
+    parser.add_argument("--processes", type=int, nargs="+", default=[0, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"{'compression':>11} {'processes':>9} {'time [s]':>9} {'MB/s':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for compression in args.compression:
+            path = os.path.join(tmp_dir, f"{compression}.h5")
+            nbytes = create_dataset(path, tuple(args.shape), tuple(args.chunks), compression)
+            for num_processes in args.processes:
+                processPool.reset_process_pool(num_processes)
+                if num_processes:
+                    read_all(path, tuple(args.request_shape))  # start the worker processes
+                seconds = read_all(path, tuple(args.request_shape))
+                print(f"{compression:>11} {num_processes:>9} {seconds:>9.3f} {nbytes / 1e6 / seconds:>8.1f}")
+    processPool.reset_process_pool(0)
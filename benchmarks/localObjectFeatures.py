@@ -0,0 +1,114 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+#           http://ilastik.org/license.html
+###############################################################################
+"""
+Local (neighborhood) object features of many small objects: one request per object calling
+ObjectFeaturesPlugin.compute_local (as OpRegionFeatures used to) vs. batches of objects passed
+to compute_local_batch, for several batch sizes.
+
+Usage:
+    python benchmarks/localObjectFeatures.py --size 2048 --objects 50000 --batch-sizes 256 2048 8192
+"""
+import argparse
+from functools import partial
+
+import numpy as np
+import vigra
+
+from lazyflow.request import Request, RequestPool
+from lazyflow.utility import Timer
+
+from ilastik.applets.objectExtraction.opObjectExtraction import OpRegionFeatures, _Axes, max_margin
+from ilastik.plugins.manager import pluginManager
+
+NAME = "Standard Object Features"
+
+FEATURES = {
+    "Mean in neighborhood": {"margin": (5, 5, 1)},
+    "Variance in neighborhood": {"margin": (5, 5, 1)},
+    "Maximum in neighborhood": {"margin": (5, 5, 1)},
+}
+
+
+def volumes(size, num_objects):
+    rng = np.random.default_rng(0)
+    mask = np.zeros((size, size), dtype=np.uint8)
+    for _ in range(num_objects):
+        x, y = rng.integers(0, size - 8, 2)
+        mask[x : x + rng.integers(2, 8), y : y + rng.integers(2, 8)] = 1
+    labels = vigra.analysis.labelImageWithBackground(mask)
+    raw = rng.random((size, size, 1, 1), dtype=np.float32)
+    return vigra.taggedView(raw, "xyzc"), vigra.taggedView(labels.reshape(size, size, 1), "xyz")
+
+
+def object_extents(plugin, raw, labels, axes):
+    bounds = plugin.compute_global(raw, labels, {"Coord<Minimum>": {}, "Coord<Maximum>": {}}, axes)
+    mins, maxs = bounds["Coord<Minimum>"].astype(int), bounds["Coord<Maximum>"].astype(int)
+    margin = max_margin({NAME: FEATURES})
+    return [(i + 1, OpRegionFeatures.compute_extent(i, raw, mins, maxs, axes, margin)) for i in range(len(mins))]
+
+
+def per_object(plugin, raw, labels, objects, axes):
+    results = [None] * len(objects)
+
+    def calc_single(i, raw_bbox, binary_bbox):
+        results[i] = plugin.compute_local(raw_bbox, binary_bbox, FEATURES, axes)
+
+    with Timer() as timer:
+        with RequestPool() as pool:
+            for i, (label, extent) in enumerate(objects):
+                raw_bbox = OpRegionFeatures.compute_rawbbox(raw, list(extent), axes)
+                pool.add(Request(partial(calc_single, i, raw_bbox, labels[tuple(extent)] == label)))
+    return timer.seconds()
+
+
+def batched(plugin, raw, labels, objects, axes, batch_size):
+    results = [None] * len(objects)
+
+    def calc_batch(start):
+        stop = min(start + batch_size, len(objects))
+        results[start:stop] = plugin.compute_local_batch(raw, labels, objects[start:stop], FEATURES, axes)
+
+    with Timer() as timer:
+        with RequestPool() as pool:
+            for start in range(0, len(objects), batch_size):
+                pool.add(Request(partial(calc_batch, start)))
+    return timer.seconds()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=2048, help="edge length of the (2D) image")
+    parser.add_argument("--objects", type=int, default=50000, help="number of objects placed (some merge)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[256, 2048, 8192])
+    args = parser.parse_args()
+
+    plugin = pluginManager.getPluginByName(NAME, "ObjectFeatures").plugin_object
+    axes = _Axes("xyzc")
+    raw, labels = volumes(args.size, args.objects)
+    objects = object_extents(plugin, raw, labels, axes)
+    print(f"{len(objects)} objects")
+
+    t_single = per_object(plugin, raw, labels, objects, axes)
+    print(f"{'batch size':>10} {'time [s]':>9} {'speedup':>8}")
+    print(f"{'-':>10} {t_single:>9.2f} {1.0:>8.2f}")
+    for batch_size in args.batch_sizes:
+        t_batched = batched(plugin, raw, labels, objects, axes, batch_size)
+        print(f"{batch_size:>10} {t_batched:>9.2f} {t_single / t_batched:>8.2f}")
@@ -0,0 +1,105 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+#           http://ilastik.org/license.html
+###############################################################################
+"""
+Multicut solving in OpMulticutAgglomerator while the beta parameter changes (like dragging the slider in the GUI):
+cold solves of the full problem vs. decomposed, warm-started solves, and returning to a previous beta (cached).
+
+The synthetic RAGs are 3D grid graphs (like the superpixel adjacency of a regular over-segmentation)
+with random edge probabilities that are low inside "objects" and high on their boundaries.
+
+Usage:
+    python benchmarks/multicutWarmStart.py --edges 10000 100000 1000000 --betas 0.5 0.55 0.6 0.5
+"""
+import argparse
+from types import SimpleNamespace
+
+import numpy as np
+
+from lazyflow.graph import Graph
+from lazyflow.utility import Timer
+
+from ilastik.applets.multicut.opMulticut import (
+    DEFAULT_SOLVER_NAME,
+    OpMulticutAgglomerator,
+    compute_edge_weights,
+    solve,
+)
+
+
+def synthetic_rag(num_edges, rng):
+    # A cubic grid graph with n nodes per axis has 3 * n**2 * (n - 1) edges
+    n = max(2, int(round((num_edges / 3) ** (1 / 3))))
+    node_ids = np.arange(n**3).reshape((n, n, n)) + 1  # no node 0 (it is never merged)
+    edges = []
+    for axis in range(3):
+        first = tuple(slice(0, -1) if a == axis else slice(None) for a in range(3))
+        second = tuple(slice(1, None) if a == axis else slice(None) for a in range(3))
+        edges.append(np.stack([node_ids[first].ravel(), node_ids[second].ravel()], axis=1))
+    edge_ids = np.concatenate(edges).astype(np.uint32)
+
+    # Objects: nodes with the same (random) seed in a coarse grid
+    objects = rng.integers(0, 1000, size=n**3 + 1)[np.arange(n**3 + 1) // max(1, n**3 // 1000)]
+    boundary = objects[edge_ids[:, 0]] != objects[edge_ids[:, 1]]
+    probabilities = np.clip(np.where(boundary, 0.8, 0.2) + rng.normal(0, 0.2, len(edge_ids)), 0, 1)
+    rag = SimpleNamespace(edge_ids=edge_ids, num_edges=len(edge_ids), max_sp=n**3)
+    return rag, probabilities
+
+
+def run_cold(rag, probabilities, betas, solver_name):
+    times = []
+    for beta in betas:
+        edge_weights = compute_edge_weights(rag.edge_ids, probabilities, beta, 0.5)
+        with Timer() as timer:
+            solve(rag.edge_ids, edge_weights, rag.max_sp + 1, solver_name)
+        times.append(timer.seconds())
+    return times
+
+
+def run_agglomerator(rag, probabilities, betas, solver_name):
+    op = OpMulticutAgglomerator(graph=Graph())
+    op.Rag.setValue(rag)
+    op.EdgeProbabilities.setValue(probabilities)
+    op.SolverName.setValue(solver_name)
+    op.ProbabilityThreshold.setValue(0.5)
+    times = []
+    for beta in betas:
+        op.Beta.setValue(beta)
+        with Timer() as timer:
+            op.NodeLabels.value
+        times.append(timer.seconds())
+    return times
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--edges", type=int, nargs="+", default=[10**4, 10**5, 10**6])
+    parser.add_argument("--betas", type=float, nargs="+", default=[0.5, 0.55, 0.6, 0.5])
+    parser.add_argument("--solver", default=DEFAULT_SOLVER_NAME)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'edges':>9} {'beta':>5} {'cold [s]':>9} {'operator [s]':>13} {'speedup':>8}")
+    for num_edges in args.edges:
+        rag, probabilities = synthetic_rag(num_edges, rng)
+        cold = run_cold(rag, probabilities, args.betas, args.solver)
+        agglomerator = run_agglomerator(rag, probabilities, args.betas, args.solver)
+        for beta, t_cold, t_op in zip(args.betas, cold, agglomerator):
+            print(f"{rag.num_edges:>9} {beta:>5.2f} {t_cold:>9.3f} {t_op:>13.3f} {t_cold / max(t_op, 1e-9):>8.2f}")
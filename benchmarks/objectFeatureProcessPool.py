@@ -0,0 +1,94 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+#           http://ilastik.org/license.html
+###############################################################################
+"""
+Object feature extraction (OpRegionFeatures) with and without the lazyflow process pool.
+
+The volume contains many small objects, and features are computed in their neighborhood,
+so most of the time is spent in the per-object (Python) part of the feature plugins.
+
+Usage:
+    python benchmarks/objectFeatureProcessPool.py --size 512 --objects 2000 --processes 1 2 4 8
+"""
+import argparse
+
+import numpy as np
+import vigra
+
+from lazyflow.graph import Graph
+from lazyflow.request import processPool
+from lazyflow.utility import Timer
+
+from ilastik.applets.objectExtraction.opObjectExtraction import OpRegionFeatures
+
+NAME = "Standard Object Features"
+
+FEATURES = {
+    NAME: {
+        "Count": {},
+        "Mean": {},
+        "Mean in neighborhood": {"margin": (5, 5, 1)},
+        "Variance in neighborhood": {"margin": (5, 5, 1)},
+    }
+}
+
+
+def volumes(size, num_objects, frames):
+    rng = np.random.default_rng(0)
+    labels = np.zeros((frames, size, size, 1, 1), dtype=np.uint32)
+    for t in range(frames):
+        mask = np.zeros((size, size), dtype=np.uint8)
+        for _ in range(num_objects):
+            x, y = rng.integers(0, size - 8, 2)
+            mask[x : x + rng.integers(2, 8), y : y + rng.integers(2, 8)] = 1
+        labels[t, :, :, 0, 0] = vigra.analysis.labelImageWithBackground(mask)
+    raw = rng.random(labels.shape, dtype=np.float32)
+    return vigra.taggedView(raw, "txyzc"), vigra.taggedView(labels, "txyzc")
+
+
+def run(raw, labels):
+    op = OpRegionFeatures(graph=Graph())
+    op.RawVolume.setValue(raw)
+    op.LabelVolume.setValue(labels)
+    op.Features.setValue(FEATURES)
+    with Timer() as timer:
+        op.Output[:].wait()
+    return timer.seconds()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=512, help="edge length of each (2D) frame")
+    parser.add_argument("--objects", type=int, default=2000, help="objects per frame")
+    parser.add_argument("--frames", type=int, default=4)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    raw, labels = volumes(args.size, args.objects, args.frames)
+
+    t_threads = run(raw, labels)
+    print(f"{'processes':>9} {'time [s]':>9} {'speedup':>8}")
+    print(f"{'-':>9} {t_threads:>9.2f} {1.0:>8.2f}")
+    for num_processes in args.processes:
+        processPool.reset_process_pool(num_processes)
+        run(raw[:1, :64, :64], labels[:1, :64, :64])  # start the worker processes (and import ilastik in them)
+        t_processes = run(raw, labels)
+        print(f"{num_processes:>9} {t_processes:>9.2f} {t_threads / t_processes:>8.2f}")
+    processPool.reset_process_pool(0)
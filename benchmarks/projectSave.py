@@ -0,0 +1,96 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+#           http://ilastik.org/license.html
+###############################################################################
+"""
+Saving labels (SerialBlockSlot) to a project file: a full save of a heavily labeled volume vs.
+incremental saves after editing a few blocks. The incremental saves should take time proportional
+to the number of edited blocks, not to the number of labeled blocks.
+
+Usage:
+    python benchmarks/projectSave.py --shape 256 512 512 --block 64 --edits 1 10 100
+"""
+import argparse
+import os
+import tempfile
+
+import h5py
+import numpy as np
+import vigra
+
+from lazyflow.graph import Graph, OperatorWrapper
+from lazyflow.operators import OpCompressedUserLabelArray
+from lazyflow.utility import Timer
+
+from ilastik.applets.base.appletSerializer import SerialBlockSlot
+
+
+def labeled_op(shape, block, rng):
+    op = OperatorWrapper(OpCompressedUserLabelArray, graph=Graph())
+    op.Input.resize(1)
+    op.Input[0].meta.axistags = vigra.defaultAxistags("zyxc")
+    op.Input[0].setValue(np.zeros(shape + (1,), dtype=np.uint8))
+    op.shape.setValue(shape + (1,))
+    op.eraser.setValue(255)
+    op.deleteLabel.setValue(-1)
+    op.blockShape.setValue((block,) * len(shape) + (1,))
+
+    # A brush stroke (one plane) in every block
+    for block_start in np.ndindex(*(s // block for s in shape)):
+        start = np.array(block_start) * block
+        stroke = tuple(slice(a, a + block) for a in start[1:])
+        op.Input[0][(slice(start[0], start[0] + 1),) + stroke + (slice(0, 1),)] = rng.integers(
+            1, 3, size=(1,) + (block,) * (len(shape) - 1) + (1,), dtype=np.uint8
+        )
+    return op
+
+
+def edit_blocks(op, shape, block, num_edits, rng):
+    num_blocks = [s // block for s in shape]
+    for _ in range(num_edits):
+        start = np.array([rng.integers(0, n) for n in num_blocks]) * block + block // 2
+        stroke = tuple(slice(a, a + 4) for a in start)
+        op.Input[0][stroke + (slice(0, 1),)] = rng.integers(1, 3, size=(4,) * len(shape) + (1,), dtype=np.uint8)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shape", type=int, nargs=3, default=[256, 512, 512])
+    parser.add_argument("--block", type=int, default=64)
+    parser.add_argument("--edits", type=int, nargs="+", default=[1, 10, 100])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    shape = tuple(args.shape)
+    op = labeled_op(shape, args.block, rng)
+    serializer = SerialBlockSlot(op.Output, op.Input, op.nonzeroBlocks)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with h5py.File(os.path.join(tmp_dir, "project.ilp"), "w") as f:
+            group = f.create_group("PixelClassification")
+            with Timer() as timer:
+                serializer.serialize(group)
+            print(f"full save of {len(op.nonzeroBlocks[0].value)} blocks: {timer.seconds():.3f} s")
+
+            print(f"{'edited blocks':>14} {'save [s]':>9}")
+            for num_edits in args.edits:
+                edit_blocks(op, shape, args.block, num_edits, rng)
+                with Timer() as timer:
+                    serializer.serialize(group)
+                print(f"{num_edits:>14} {timer.seconds():>9.3f}")
@@ -0,0 +1,83 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Compare the scaling of the default (shared queue) thread pool with the work-stealing thread pool.
+
+The workload mimics batch prediction: every "block" request spawns a few child requests
+(feature channels), each of which does some numpy work that releases the GIL.
+
+Usage:
+    python benchmarks/threadPoolScaling.py --max-workers 32 --blocks 512
+"""
+import argparse
+import multiprocessing
+
+import numpy as np
+
+from lazyflow.request import Request, RequestPool
+from lazyflow.utility import Timer
+
+
+def _channel(block_data, sigma):
+    # Some GIL-releasing work per channel
+    return float(np.sort(block_data * sigma, axis=None)[-1])
+
+
+def _block(block_shape, channels):
+    block_data = np.random.random(block_shape).astype(np.float32)
+    reqs = [Request(lambda s=s: _channel(block_data, s)) for s in range(1, channels + 1)]
+    for req in reqs:
+        req.submit()
+    return sum(req.wait() for req in reqs)
+
+
+def run(num_workers, work_stealing, num_blocks, block_shape, channels):
+    Request.reset_thread_pool(num_workers, work_stealing=work_stealing)
+    pool = RequestPool()
+    for _ in range(num_blocks):
+        pool.add(Request(lambda: _block(block_shape, channels)))
+
+    with Timer() as timer:
+        pool.wait()
+    return timer.seconds()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--blocks", type=int, default=256)
+    parser.add_argument("--block-size", type=int, default=64, help="edge length of the (cubic) blocks")
+    parser.add_argument("--channels", type=int, default=8)
+    args = parser.parse_args()
+
+    block_shape = (args.block_size,) * 3
+    worker_counts = sorted({1, 2, 4, 8, 16, 32, 64, args.max_workers} & set(range(1, args.max_workers + 1)))
+
+    print(f"{'workers':>8} {'shared queue [s]':>17} {'work stealing [s]':>18} {'speedup (ws)':>13}")
+    baseline = None
+    for n in worker_counts:
+        t_shared = run(n, False, args.blocks, block_shape, args.channels)
+        t_stealing = run(n, True, args.blocks, block_shape, args.channels)
+        baseline = baseline or t_stealing
+        print(f"{n:>8} {t_shared:>17.3f} {t_stealing:>18.3f} {baseline / t_stealing:>13.2f}")
+
+    Request.reset_thread_pool()
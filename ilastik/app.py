@@ -333,6 +333,7 @@ def _import_opengm():
 def _prepare_lazyflow_config(parsed_args):
     # Check environment variable settings.
     n_threads = os.getenv("LAZYFLOW_THREADS", None)
+    n_processes = int(os.getenv("LAZYFLOW_PROCESSES", None) or ilastik_config.getint("lazyflow", "processes"))
     total_ram_mb = os.getenv("LAZYFLOW_TOTAL_RAM_MB", None)
     status_interval_secs = int(os.getenv("LAZYFLOW_STATUS_MONITOR_SECONDS", "0"))
 
@@ -348,8 +349,33 @@ def _prepare_lazyflow_config(parsed_args):
             n_threads = None
     total_ram_mb = total_ram_mb or ilastik_config.getint("lazyflow", "total_ram_mb")
 
+    feature_cache_dir = os.getenv("LAZYFLOW_FEATURE_CACHE_DIR", None) or ilastik_config.get(
+        "lazyflow", "feature_cache_dir"
+    )
+    feature_cache_max_mb = ilastik_config.getint("lazyflow", "feature_cache_max_mb")
+    # Empty: keep the lazyflow default, 0: disable the cache of decoded file chunks
+    chunk_cache_max_mb = os.getenv("LAZYFLOW_CHUNK_CACHE_MB", None) or ilastik_config.get(
+        "lazyflow", "chunk_cache_max_mb"
+    )
+    chunk_cache_max_mb = int(chunk_cache_max_mb) if chunk_cache_max_mb else None
+    # Empty: read ahead only in headless mode. In the GUI, it would compute blocks outside of the viewport,
+    # competing with the visible tiles for threads and cache memory.
+    prefetch_blocks = os.getenv("LAZYFLOW_PREFETCH_BLOCKS", None) or ilastik_config.get("lazyflow", "prefetch_blocks")
+    if prefetch_blocks:
+        prefetch_blocks = int(prefetch_blocks)
+    else:
+        prefetch_blocks = 2 if parsed_args.headless else 0
+
     # Note that n_threads == 0 is valid and useful for debugging.
-    if (n_threads is not None) or total_ram_mb or status_interval_secs:
+    if (
+        (n_threads is not None)
+        or n_processes
+        or total_ram_mb
+        or status_interval_secs
+        or feature_cache_dir
+        or chunk_cache_max_mb is not None
+        or prefetch_blocks
+    ):
 
         def _configure_lazyflow_settings():
             import lazyflow
@@ -365,6 +391,11 @@ def _prepare_lazyflow_config(parsed_args):
             if n_threads is not None:
                 logger.info(f"Resetting lazyflow thread pool with {n_threads} threads.")
                 lazyflow.request.Request.reset_thread_pool(n_threads)
+            if n_processes > 0:
+                from lazyflow.request import processPool
+
+                logger.info(f"Computing process-safe operators with a pool of {n_processes} processes.")
+                processPool.reset_process_pool(n_processes)
             if total_ram_mb > 0:
                 if total_ram_mb < 500:
                     raise Exception(
@@ -376,6 +407,25 @@ def _prepare_lazyflow_config(parsed_args):
                 fmt = Memory.format(ram)
                 logger.info("Configuring lazyflow RAM limit to {}".format(fmt))
                 Memory.setAvailableRam(ram)
+            if feature_cache_dir:
+                from lazyflow.utility import featureBlockStore
+
+                logger.info(f"Storing computed features in {feature_cache_dir} (max. {feature_cache_max_mb} MB)")
+                featureBlockStore.setDefaultFeatureStore(
+                    featureBlockStore.FeatureBlockStore(feature_cache_dir, feature_cache_max_mb * 1024**2)
+                )
+            if chunk_cache_max_mb is not None:
+                from lazyflow.utility.io_util import chunkCache
+
+                logger.info(f"Caching decoded file chunks: max. {chunk_cache_max_mb} MB")
+                chunkCache.setDefaultChunkCache(
+                    chunkCache.ChunkCache(chunk_cache_max_mb * 1024**2) if chunk_cache_max_mb > 0 else None
+                )
+            if prefetch_blocks > 0:
+                from lazyflow.utility import prefetcher
+
+                logger.info(f"Reading ahead {prefetch_blocks} blocks of sequentially requested data")
+                prefetcher.setPrefetchDepth(prefetch_blocks)
 
         return _configure_lazyflow_settings
     return None
@@ -19,12 +19,14 @@
 # 		   http://ilastik.org/license.html
 ###############################################################################
 import logging
+import threading
 from abc import ABC
 
 import h5py
 
 from ilastik.config import cfg as ilastik_config
 from ilastik.utility.maybe import maybe
+from lazyflow.request import Request
 from lazyflow.utility.orderedSignal import OrderedSignal
 
 from .serializerUtils import deleteIfPresent
@@ -86,6 +88,9 @@ class AppletSerializer(ABC):
         self.serialSlots = maybe(slots, [])
         self.operator = operator
         self._ignoreDirty = False
+        # SerialSlot -> (function that deserializes it, group to deserialize it from), see _deferDeserialization
+        self._deferredSlots = {}
+        self._lazilyLoadedSlots = set()
 
     def isDirty(self):
         """Returns true if the current state of this item (in memory)
@@ -107,7 +112,7 @@ class AppletSerializer(ABC):
         # (as this seems to happen sometimes).
         if self.topGroupName:
             topGroup = hdf5File.require_group(self.topGroupName)
-            return any([ss.shouldSerialize(topGroup) for ss in self.serialSlots])
+            return any([ss.shouldSerialize(topGroup) for ss in self._slotsToSerialize(topGroup)])
 
         return False
 
@@ -132,7 +137,7 @@ class AppletSerializer(ABC):
         if group is None:
             nslots = len(self.serialSlots)
         else:
-            nslots = sum(ss.shouldSerialize(group) for ss in self.serialSlots)
+            nslots = sum(ss.shouldSerialize(group) for ss in self._slotsToSerialize(group))
         if nslots == 0:
             return 0
         return divmod(100, nslots)[0]
@@ -155,14 +160,15 @@ class AppletSerializer(ABC):
         progress = 0
         self.progressSignal(progress)
 
-        # Set the version
+        # Set the version (unless it's already there, to leave unchanged parts of the file untouched)
         key = "StorageVersion"
-        deleteIfPresent(topGroup, key)
-        topGroup.create_dataset(key, data=self.version)
+        if key not in topGroup or topGroup[key][()] != self.version.encode("utf-8"):
+            deleteIfPresent(topGroup, key)
+            topGroup.create_dataset(key, data=self.version)
 
         try:
             inc = self.progressIncrement(topGroup)
-            for ss in self.serialSlots:
+            for ss in self._slotsToSerialize(topGroup):
                 ss.serialize(topGroup)
                 progress += inc
                 self.progressSignal(progress)
@@ -188,6 +194,9 @@ class AppletSerializer(ABC):
 
         :param headless: Are we called in headless mode?
             (in headless mode corrupted files cannot be fixed via the GUI)
+            In headless mode, the serial slots that load a lot of data (e.g. labels or classifiers) are
+            only deserialized once their data is requested, unless lazy_project_loading is disabled
+            in the config. hdf5File must stay open until then.
 
         """
         self.progressSignal(0)
@@ -204,9 +213,13 @@ class AppletSerializer(ABC):
 
         try:
             if topGroup is not None:
+                lazy = headless and ilastik_config.getboolean("ilastik", "lazy_project_loading")
                 inc = self.progressIncrement()
                 for ss in self.serialSlots:
-                    ss.deserialize(topGroup)
+                    if lazy and ss.name in topGroup and ss.deferredLoadTriggers():
+                        self._deferDeserialization(ss, topGroup)
+                    else:
+                        ss.deserialize(topGroup)
                     self.progressSignal(inc)
 
                 # Call the subclass to do remaining work
@@ -216,6 +229,100 @@ class AppletSerializer(ABC):
         finally:
             self.progressSignal(100)
 
+    def _deferDeserialization(self, serialSlot, topGroup: h5py.Group):
+        """Postpone serialSlot.deserialize(topGroup) until the data of one of its deferredLoadTriggers() is requested"""
+        # The slot is loaded by one request, which all callers of load() wait for (loads are triggered from
+        # within requests, so waiting must suspend the calling request rather than block its worker thread).
+        # guard only protects loader, it is never held while loading.
+        guard = threading.Lock()
+        loader = None
+        loading_thread = None
+
+        def deserialize():
+            nonlocal loader, loading_thread
+            loading_thread = threading.current_thread()
+            try:
+                logger.debug("Deserializing deferred slot {} of {}".format(serialSlot.name, self.topGroupName))
+                ignoreDirty = serialSlot.ignoreDirty
+                serialSlot.ignoreDirty = True
+                try:
+                    serialSlot.deserialize(topGroup)
+                    del self._deferredSlots[serialSlot]
+                    self._lazilyLoadedSlots.add(serialSlot)
+
+                    # Deferred slots after this one have already been loaded, out of order.
+                    # Reload them in case loading this one invalidated them (e.g. a classifier trained on labels).
+                    index = self.serialSlots.index(serialSlot)
+                    for ss in self.serialSlots[index + 1 :]:
+                        if ss in self._lazilyLoadedSlots:
+                            ss.deserialize(topGroup)
+                finally:
+                    serialSlot.ignoreDirty = ignoreDirty
+            except BaseException:
+                # Try again on the next request
+                with guard:
+                    loader = None
+                raise
+            finally:
+                loading_thread = None
+
+        def calledWhileLoading(request):
+            # (We may be called again from within deserialize(), e.g. when loading the data makes some
+            # operator request it. Waiting for ourselves would never return.)
+            current = Request._current_request()
+            if current is None:
+                return threading.current_thread() is loading_thread
+            while current is not None:
+                if current is request:
+                    return True
+                current = current.parent_request
+            return False
+
+        def load():
+            nonlocal loader
+            with guard:
+                if serialSlot not in self._deferredSlots:
+                    return
+                start = loader is None
+                if start:
+                    loader = Request(deserialize)
+                    # Other callers may be waiting for it, too
+                    loader.uncancellable = True
+                request = loader
+            if start:
+                # (Run it in a worker, so that everything it requests descends from it)
+                request.submit()
+            if not calledWhileLoading(request):
+                request.wait()
+
+        self._deferredSlots[serialSlot] = (load, topGroup)
+        for slot in serialSlot.deferredLoadTriggers():
+            if slot.level > 0:
+                # Lanes are loaded by index: load them before they get shifted.
+                slot.notifyRemove(lambda slot, index, size, num_lanes=len(slot): load() if index < num_lanes else None)
+                lane_slots = list(slot)
+            else:
+                lane_slots = [slot]
+            for lane_slot in lane_slots:
+                # Requests downstream of lane_slot end up in the slot that computes the data.
+                while lane_slot.upstream_slot is not None:
+                    lane_slot = lane_slot.upstream_slot
+                lane_slot.deferUntilRequested(load)
+
+    def _slotsToSerialize(self, topGroup: h5py.Group):
+        """The serial slots to save to topGroup.
+
+        Slots that haven't been deserialized yet are still up-to-date in the file they would be loaded from.
+        If that's where we're saving to, they are skipped; otherwise they need to be loaded first.
+        """
+        for ss in self.serialSlots:
+            if ss in self._deferredSlots:
+                load, group = self._deferredSlots[ss]
+                if group.file == topGroup.file:
+                    continue
+                load()
+            yield ss
+
     def repairFile(self, path, filt=None):
         """get new path to lost file"""
 
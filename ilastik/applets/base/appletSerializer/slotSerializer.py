@@ -138,6 +138,14 @@ class SerialSlot:
             slot.notifyInserted(doMulti)
             slot.notifyRemoved(self.setDirty)
 
+    def deferredLoadTriggers(self) -> List[Slot]:
+        """The slots that provide the data loaded by deserialize().
+
+        If there are any, AppletSerializer may postpone deserialize() until the data of one of them is requested
+        (see AppletSerializer.deserializeFromHdf5). Override this in serial slots that load a lot of data.
+        """
+        return []
+
     def shouldSerialize(self, group: h5py.Group):
         """Whether to serialize or not."""
         result = self.dirty
@@ -352,7 +360,13 @@ class SerialListSlot(SerialSlot):
 
 
 class SerialBlockSlot(SerialSlot):
-    """A slot which only saves nonzero blocks."""
+    """A slot which only saves nonzero blocks.
+
+    Saving is incremental: the dirty rois of the slot are recorded, and if the group from the last save
+    (or load) is still intact, only the datasets of changed blocks are rewritten, the datasets of blocks
+    that are no longer nonzero are deleted, and all other datasets are left untouched.
+    To find them again, each block dataset stores the slicing of its (entire) block in the "blockKey" attribute.
+    """
 
     def __init__(
         self,
@@ -374,145 +388,206 @@ class SerialBlockSlot(SerialSlot):
 
         """
         assert isinstance(slot, OutputSlot), "slot is of wrong type: '{}' is not an OutputSlot".format(slot.name)
+        # Per lane: (start, stop) of the rois that became dirty since the last save
+        self._dirtyRois = {}
+        # Per lane: blockKey -> name of its dataset in the project file (as of the last save/load)
+        self._blockNames = None
         super().__init__(slot, inslot, name, subname, default, depends, selfdepends)
         self.blockslot = blockslot
         self._bind(slot)
+        # (_bind only subscribes to lanes that are inserted later)
+        for lane_slot in slot:
+            lane_slot.notifyDirty(self.setDirty)
         self._shrink_to_bb = shrink_to_bb
         self.compression_level = compression_level
 
-    def shouldSerialize(self, group):
-        # Should this be a docstring?
-        #
-        # Must be overloaded as SerialBlockSlot does not serialize itself in the simple way that other SerialSlot do
-        # as a consequence of the nesting of groups required. Follows the same logic as _serialize and checks to see
-        # if each relevant subgroup has been created and if any are missing or their data is missing it should be
-        # serialized. Otherwise, if everything is intact, it doesn't suggest serialization unless the state has changed.
+    @property
+    def dirty(self):
+        return self._dirty
 
-        logger.debug("Checking whether to serialize BlockSlot: {}".format(self.name))
+    @dirty.setter
+    def dirty(self, isDirty: bool):
+        if not isDirty:
+            self._dirtyRois = {}
+        elif not self.ignoreDirty:
+            # We don't know what changed
+            self._blockNames = None
+        SerialSlot.dirty.fset(self, isDirty)
+
+    def setDirty(self, *args, **kwargs):
+        if self.ignoreDirty:
+            return
+        if len(args) == 2 and isinstance(args[0], Slot) and hasattr(args[1], "start"):
+            # A dirty notification from one lane
+            subslot, roi = args
+            for index, lane_slot in enumerate(self.slot):
+                if lane_slot is subslot:
+                    self._dirtyRois.setdefault(index, []).append((tuple(roi.start), tuple(roi.stop)))
+                    self._dirty = True
+                    return
+        self.dirty = True
 
+    def deferredLoadTriggers(self):
+        return [self.slot, self.blockslot]
+
+    def shouldSerialize(self, group):
         if self.dirty:
-            logger.debug('BlockSlot "' + self.name + '" appears to be dirty. Should serialize.')
+            logger.debug('BlockSlot "{}" appears to be dirty. Should serialize.'.format(self.name))
             return True
 
-        # SerialSlot interchanges self.name and name when they frequently are the same thing. It is not clear if using
-        # self.name would be acceptable here or whether name should be an input to shouldSerialize or if there should be
-        # a _shouldSerialize method, which takes the name.
         if self.name not in group:
-            logger.debug(
-                'Missing "'
-                + self.name
-                + '" in group "'
-                + repr(group)
-                + '" belonging to BlockSlot "'
-                + self.name
-                + '". Should serialize.'
-            )
+            logger.debug('Missing "{}" in group "{!r}". Should serialize.'.format(self.name, group))
             return True
-        else:
-            logger.debug(
-                'Found "' + self.name + '" in group "' + repr(group) + '" belonging to BlockSlot "' + self.name + '".'
-            )
 
         # Just because the group was serialized doesn't mean that the relevant data was.
         mygroup = group[self.name]
-        num = len(self.blockslot)
-        for index in range(num):
+        for index in range(len(self.blockslot)):
             subname = self.subname.format(index)
-
-            # Check to se if each subname has been created as a group
-            if subname not in mygroup:
-                logger.debug(
-                    'Missing "'
-                    + subname
-                    + '" from "'
-                    + repr(mygroup)
-                    + '" belonging to BlockSlot "'
-                    + self.name
-                    + '". Should serialize.'
-                )
+            if subname not in mygroup or len(mygroup[subname]) != len(self.blockslot[index].value):
+                logger.debug('Blocks of "{}/{}" are incomplete. Should serialize.'.format(self.name, subname))
                 return True
-            else:
-                logger.debug(
-                    'Found "' + subname + '" from "' + repr(mygroup) + '" belonging to BlockSlot "' + self.name + '".'
-                )
 
-            subgroup = mygroup[subname]
+        return False
 
-            nonZeroBlocks = self.blockslot[index].value
-            for blockIndex in range(len(nonZeroBlocks)):
-                blockName = "block{:04d}".format(blockIndex)
+    def serialize(self, group):
+        if not self.shouldSerialize(group):
+            return
+        if self.name in group and self._canSerializeIncrementally(group[self.name]):
+            self._serializeIncrementally(group[self.name])
+        else:
+            deleteIfPresent(group, self.name)
+            if self.slot.ready():
+                self._serialize(group, self.name, self.slot)
+        self.dirty = False
 
-                if blockName not in subgroup:
-                    logger.debug('Missing "' + blockName + '" from "' + repr(subgroup) + '". Should serialize.')
-                    return True
-                else:
-                    logger.debug(
-                        'Found "'
-                        + blockName
-                        + '" from "'
-                        + repr(subgroup)
-                        + '" belonging to BlockSlot "'
-                        + self.name
-                        + '".'
-                    )
+    def _canSerializeIncrementally(self, mygroup):
+        """The group is exactly as we left it, and we know which blocks changed since then."""
+        if self._blockNames is None or not self.slot.ready() or len(self.blockslot) != len(self._blockNames):
+            return False
+        if set(mygroup.keys()) != {self.subname.format(index) for index in range(len(self.blockslot))}:
+            return False
+        for index, names in self._blockNames.items():
+            subgroup = mygroup[self.subname.format(index)]
+            if set(subgroup.keys()) != set(names.values()):
+                return False
+        return True
 
-        logger.debug(
-            'Everything belonging to BlockSlot "' + self.name + '" appears to be in order. Should not serialize.'
-        )
+    @staticmethod
+    def _readBlockKey(blockData) -> Optional[bytes]:
+        # (h5py reads the bytes written by slicingToString back as str)
+        blockKey = blockData.attrs.get("blockKey")
+        return blockKey.encode("utf-8") if isinstance(blockKey, str) else blockKey
 
-        return False
+    @timeLogged(logger, logging.DEBUG)
+    def _serializeIncrementally(self, mygroup):
+        logger.debug("Serializing BlockSlot incrementally: {}".format(self.name))
+        compression_options = self._compressionOptions()
+        for index, names in self._blockNames.items():
+            subgroup = mygroup[self.subname.format(index)]
+            nonzero_blocks = {}
+            for slicing in self.blockslot[index].value:
+                if not isinstance(slicing[0], slice):
+                    slicing = roiToSlice(*slicing)
+                nonzero_blocks[slicingToString(slicing)] = slicing
+
+            dirty_rois = numpy.array(self._dirtyRois.get(index, []), dtype=int).reshape(
+                (-1, 2, len(self.slot[index].meta.shape))
+            )
+
+            def is_dirty(slicing):
+                start = numpy.array([sl.start for sl in slicing])
+                stop = numpy.array([sl.stop for sl in slicing])
+                return ((dirty_rois[:, 0] < stop) & (dirty_rois[:, 1] > start)).all(axis=1).any()
+
+            removed = [key for key in names if key not in nonzero_blocks]
+            for key in removed:
+                del subgroup[names.pop(key)]
+
+            written = 0
+            used_indexes = [int(blockName[len("block") :]) for blockName in names.values()]
+            next_index = max(used_indexes, default=-1) + 1
+            for key, slicing in nonzero_blocks.items():
+                if key in names:
+                    if not is_dirty(slicing):
+                        continue
+                    blockName = names[key]
+                    del subgroup[blockName]
+                else:
+                    blockName = "block{:04d}".format(next_index)
+                    next_index += 1
+                    names[key] = blockName
+                self._writeBlock(subgroup, blockName, index, slicing, compression_options)
+                written += 1
+            logger.debug(
+                "Lane {}: wrote {} blocks, deleted {}, kept {}".format(
+                    index, written, len(removed), len(nonzero_blocks) - written
+                )
+            )
+
+    def _compressionOptions(self):
+        if self.compression_level:
+            return {"compression_opts": self.compression_level, "compression": "gzip"}
+        return {}
 
     @timeLogged(logger, logging.DEBUG)
     def _serialize(self, group, name, slot):
         logger.debug("Serializing BlockSlot: {}".format(self.name))
         mygroup = group.create_group(name)
         num = len(self.blockslot)
-        compression_options = {}
-        if self.compression_level:
-            compression_options = {"compression_opts": self.compression_level, "compression": "gzip"}
+        compression_options = self._compressionOptions()
+        self._blockNames = {}
         for index in range(num):
             subname = self.subname.format(index)
             subgroup = mygroup.create_group(subname)
             nonZeroBlocks = self.blockslot[index].value
+            self._blockNames[index] = {}
             for blockIndex, slicing in enumerate(nonZeroBlocks):
                 if not isinstance(slicing[0], slice):
                     slicing = roiToSlice(*slicing)
 
-                block = self.slot[index][slicing].wait()
-                block_tags = self.slot[index].meta.axistags
                 blockName = "block{:04d}".format(blockIndex)
-
-                if self._shrink_to_bb:
-                    nonzero_coords = numpy.nonzero(block)
-                    if len(nonzero_coords[0]) > 0:
-                        block_start = sliceToRoi(slicing, [sl.stop for sl in slicing])[0]
-                        block_bounding_box_start = numpy.array(list(map(numpy.min, nonzero_coords)))
-                        block_bounding_box_stop = 1 + numpy.array(list(map(numpy.max, nonzero_coords)))
-                        block_slicing = roiToSlice(block_bounding_box_start, block_bounding_box_stop)
-                        bounding_box_roi = numpy.array([block_bounding_box_start, block_bounding_box_stop])
-                        bounding_box_roi += block_start
-
-                        # Overwrite the vars that are written to the file
-                        slicing = roiToSlice(*bounding_box_roi)
-                        block = block[block_slicing]
-
-                # If we have a masked array, convert it to a structured array so that h5py can handle it.
-                if slot[index].meta.has_mask:
-                    mygroup.attrs["meta.has_mask"] = True
-
-                    block_group = subgroup.create_group(blockName)
-
-                    block_group.create_dataset("data", data=block.data, **compression_options)
-
-                    block_group.create_dataset("mask", data=block.mask, compression="gzip", compression_opts=2)
-                    block_group.create_dataset("fill_value", data=block.fill_value)
-
-                    block_group.attrs["blockSlice"] = slicingToString(slicing)
-                    block_group.attrs["axistags"] = block_tags.toJSON()
-                else:
-                    subgroup.create_dataset(blockName, data=block, **compression_options)
-                    subgroup[blockName].attrs["blockSlice"] = slicingToString(slicing)
-                    subgroup[blockName].attrs["axistags"] = block_tags.toJSON()
+                self._writeBlock(subgroup, blockName, index, slicing, compression_options)
+                self._blockNames[index][slicingToString(slicing)] = blockName
+
+    def _writeBlock(self, subgroup, blockName, index, slicing, compression_options):
+        """Write the data of the nonzero block at slicing (of lane index) to the dataset (or group) blockName"""
+        blockKey = slicingToString(slicing)
+        block = self.slot[index][slicing].wait()
+        block_tags = self.slot[index].meta.axistags
+
+        if self._shrink_to_bb:
+            nonzero_coords = numpy.nonzero(block)
+            if len(nonzero_coords[0]) > 0:
+                block_start = sliceToRoi(slicing, [sl.stop for sl in slicing])[0]
+                block_bounding_box_start = numpy.array(list(map(numpy.min, nonzero_coords)))
+                block_bounding_box_stop = 1 + numpy.array(list(map(numpy.max, nonzero_coords)))
+                block_slicing = roiToSlice(block_bounding_box_start, block_bounding_box_stop)
+                bounding_box_roi = numpy.array([block_bounding_box_start, block_bounding_box_stop])
+                bounding_box_roi += block_start
+
+                # Overwrite the vars that are written to the file
+                slicing = roiToSlice(*bounding_box_roi)
+                block = block[block_slicing]
+
+        # If we have a masked array, convert it to a structured array so that h5py can handle it.
+        if self.slot[index].meta.has_mask:
+            subgroup.parent.attrs["meta.has_mask"] = True
+
+            block_group = subgroup.create_group(blockName)
+
+            block_group.create_dataset("data", data=block.data, **compression_options)
+
+            block_group.create_dataset("mask", data=block.mask, compression="gzip", compression_opts=2)
+            block_group.create_dataset("fill_value", data=block.fill_value)
+
+            block_group.attrs["blockSlice"] = slicingToString(slicing)
+            block_group.attrs["axistags"] = block_tags.toJSON()
+            block_group.attrs["blockKey"] = blockKey
+        else:
+            subgroup.create_dataset(blockName, data=block, **compression_options)
+            subgroup[blockName].attrs["blockSlice"] = slicingToString(slicing)
+            subgroup[blockName].attrs["axistags"] = block_tags.toJSON()
+            subgroup[blockName].attrs["blockKey"] = blockKey
 
     def reshape_datablock_and_slicing_for_input(
         self, block: numpy.ndarray, slicing: List[slice], slot: Slot, project: Project
@@ -535,10 +610,20 @@ class SerialBlockSlot(SerialSlot):
         def extract_index(s):
             return int(index_capture.match(s).groups()[0])
 
+        blockNames = {}
+        # Whether all stored blocks can be matched to their block keys
+        complete = True
         for index, t in enumerate(sorted(list(mygroup.items()), key=lambda k_v: extract_index(k_v[0]))):
             groupName, labelGroup = t
-            for blockData in list(labelGroup.values()):
+            blockNames[index] = {}
+            for blockName, blockData in list(labelGroup.items()):
                 slicing = stringToSlicing(blockData.attrs["blockSlice"])
+                # (Files written before incremental saving don't have block keys)
+                blockKey = self._readBlockKey(blockData)
+                if blockKey is None or groupName != self.subname.format(index):
+                    complete = False
+                else:
+                    blockNames[index][blockKey] = blockName
 
                 # If it is suppose to be a masked array,
                 # deserialize the pieces and rebuild the masked array.
@@ -567,6 +652,9 @@ class SerialBlockSlot(SerialSlot):
                 )
                 self.inslot[index][slicing] = blockArray
 
+        # (deserialize() clears the dirty flag afterwards: what we just loaded is what's in the file)
+        self._blockNames = blockNames if complete else None
+
 
 class SerialClassifierSlot(SerialSlot):
     """For saving a classifier.  Here we assume the classifier is stored in the ."""
@@ -597,6 +685,9 @@ class SerialClassifierSlot(SerialSlot):
         classifier_group = group.create_group(name)
         classifier.serialize_hdf5(classifier_group)
 
+    def deferredLoadTriggers(self):
+        return [self.cache.Output]
+
     def deserialize(self, group):
         """
         Have to override this to ensure that dirty is always set False.
@@ -680,6 +771,9 @@ class SerialCountingSlot(SerialSlot):
         os.remove(cachePath)
         os.rmdir(tmpDir)
 
+    def deferredLoadTriggers(self):
+        return [self.cache.Output]
+
     def deserialize(self, group):
         """
         Have to override this to ensure that dirty is always set False.
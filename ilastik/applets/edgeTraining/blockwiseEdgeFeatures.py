@@ -0,0 +1,225 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+# 		   http://ilastik.org/license.html
+###############################################################################
+"""
+Blockwise, parallel computation of edge features.
+
+ilastikrag computes edge features on the whole volume at once. The features in
+BLOCKWISE_EDGE_FEATURES only depend on per-edge statistics that can be merged exactly
+(count, mean, sum of squared deviations, minimum, maximum), so they can be computed block by block
+instead: the voxel data is streamed in blocks through the request pool, and each block's statistics
+are merged into the totals. Memory is bounded by the block size (plus the per-edge totals).
+
+As in ilastikrag, the edge "voxels" are the pairs of adjacent voxels (along each axis) with different
+superpixel labels, and the value of such a pair is the average of the two voxel values.
+"""
+import threading
+from functools import partial
+from typing import Callable, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from lazyflow.request import Request, RequestPool
+from lazyflow.roi import determineBlockShape, getBlockBounds, getIntersectingBlocks, roiFromShape, roiToSlice
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+#: Features (ilastikrag names) that can be computed blockwise -> EdgeStatistics attribute
+BLOCKWISE_EDGE_FEATURES = {
+    "standard_edge_count": "count",
+    "standard_edge_sum": "sum",
+    "standard_edge_minimum": "minimum",
+    "standard_edge_maximum": "maximum",
+    "standard_edge_mean": "mean",
+    "standard_edge_variance": "variance",
+}
+
+DEFAULT_BLOCK_VOLUME = 128**3
+
+
+def supports_blockwise(feature_names: Sequence[str]) -> bool:
+    return len(feature_names) > 0 and all(name in BLOCKWISE_EDGE_FEATURES for name in feature_names)
+
+
+class EdgeStatistics:
+    """
+    Count, mean, sum of squared deviations from the mean (m2), minimum and maximum of the values of each edge.
+
+    Statistics of disjoint sets of values (e.g. from different blocks) are combined with merge()
+    (pairwise update of Chan et al., which is numerically stable).
+    """
+
+    def __init__(self, num_edges: int):
+        self.count = np.zeros(num_edges, dtype=np.int64)
+        self._mean = np.zeros(num_edges, dtype=np.float64)
+        self.m2 = np.zeros(num_edges, dtype=np.float64)
+        self.minimum = np.full(num_edges, np.inf)
+        self.maximum = np.full(num_edges, -np.inf)
+
+    @classmethod
+    def of_values(cls, groups: np.ndarray, num_groups: int, values: np.ndarray) -> "EdgeStatistics":
+        """Statistics of values grouped by groups (values[i] belongs to edge groups[i], 0 <= groups[i] < num_groups)"""
+        stats = cls(num_groups)
+        stats.count[:] = np.bincount(groups, minlength=num_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            stats._mean[:] = np.bincount(groups, weights=values, minlength=num_groups) / stats.count
+        stats.m2[:] = np.bincount(groups, weights=(values - stats._mean[groups]) ** 2, minlength=num_groups)
+        np.minimum.at(stats.minimum, groups, values)
+        np.maximum.at(stats.maximum, groups, values)
+        return stats
+
+    def merge(self, other: "EdgeStatistics", edges: np.ndarray = None):
+        """Merge other into the statistics of the given edges (default: all edges, in order)"""
+        if edges is None:
+            edges = slice(None)
+        n_a = self.count[edges]
+        n_b = other.count
+        n = n_a + n_b
+        delta = other._mean - self._mean[edges]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weight_b = np.where(n > 0, n_b / n, 0.0)
+        self._mean[edges] += delta * weight_b
+        self.m2[edges] += other.m2 + delta**2 * n_a * weight_b
+        self.count[edges] = n
+        self.minimum[edges] = np.minimum(self.minimum[edges], other.minimum)
+        self.maximum[edges] = np.maximum(self.maximum[edges], other.maximum)
+
+    @property
+    def mean(self):
+        return np.where(self.count > 0, self._mean, np.nan)
+
+    @property
+    def sum(self):
+        return self._mean * self.count
+
+    @property
+    def variance(self):
+        # population variance (as vigra's Variance)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.m2 / self.count
+
+
+class EdgeLookup:
+    """Maps pairs of superpixel ids (sp1 < sp2) to row indexes of an edge table (like rag.edge_ids)."""
+
+    def __init__(self, edge_ids: np.ndarray):
+        edge_ids = np.asarray(edge_ids, dtype=np.uint64)
+        self._base = np.uint64(edge_ids.max() + 1) if len(edge_ids) else np.uint64(1)
+        keys = edge_ids[:, 0] * self._base + edge_ids[:, 1]
+        self._order = np.argsort(keys)
+        self._sorted_keys = keys[self._order]
+
+    def __call__(self, sp1: np.ndarray, sp2: np.ndarray) -> np.ndarray:
+        """Row index of each edge (sp1[i], sp2[i]), -1 for edges that aren't in the table"""
+        if len(self._sorted_keys) == 0:
+            return np.full(len(sp1), -1, dtype=np.intp)
+        keys = sp1.astype(np.uint64) * self._base + sp2.astype(np.uint64)
+        positions = np.minimum(np.searchsorted(self._sorted_keys, keys), len(self._sorted_keys) - 1)
+        return np.where(self._sorted_keys[positions] == keys, self._order[positions], -1)
+
+
+def compute_edge_features_blockwise(
+    rag,
+    read_block: Callable[[np.ndarray, np.ndarray], np.ndarray],
+    features: Sequence[Tuple[int, Sequence[str]]],
+    block_shape: Sequence[int] = None,
+) -> List[pd.DataFrame]:
+    """
+    Compute BLOCKWISE_EDGE_FEATURES of the edges of an ilastikrag.Rag, block by block and in parallel.
+
+    Args:
+        rag: the region adjacency graph. Its label_img must have the same (spatial) axes as the voxel data.
+        read_block: function that returns the voxel data in the spatial roi [start, stop), with a channel axis
+        features: (channel index in the data returned by read_block, feature names) for each dataframe to compute
+        block_shape: spatial shape of the blocks (default: DEFAULT_BLOCK_VOLUME voxels)
+
+    Returns:
+        for each entry in features, a dataframe with one float32 column per feature name (in that order)
+        and one row per edge (in the order of rag.edge_ids), like rag.compute_features() without 'sp1' and 'sp2'.
+    """
+    assert all(supports_blockwise(names) for _, names in features)
+    labels = rag.label_img
+    shape = np.array(labels.shape)
+    ndim = len(shape)
+    if block_shape is None:
+        block_shape = determineBlockShape(tuple(shape), DEFAULT_BLOCK_VOLUME)
+    block_shape = np.array(block_shape)
+
+    num_edges = len(rag.edge_ids)
+    lookup = EdgeLookup(rag.edge_ids)
+    channels = sorted(set(channel for channel, _ in features))
+    totals = {channel: EdgeStatistics(num_edges) for channel in channels}
+    totals_lock = threading.Lock()
+
+    def process_block(block_start):
+        start, stop = getBlockBounds(shape, block_shape, block_start)
+        # One more voxel in each dimension, for the pairs across the block's upper faces.
+        # (Each pair is counted in the block that contains its first voxel.)
+        read_stop = np.minimum(stop + 1, shape)
+        sp = np.asarray(labels[roiToSlice(start, read_stop)])
+        data = read_block(start, read_stop)
+
+        inner_shape = stop - start
+        edge_indexes = []
+        values = {channel: [] for channel in channels}
+        for axis in range(ndim):
+            first = [slice(0, n) for n in inner_shape]
+            second = list(first)
+            first[axis] = slice(0, read_stop[axis] - start[axis] - 1)
+            second[axis] = slice(1, read_stop[axis] - start[axis])
+            first, second = tuple(first), tuple(second)
+
+            sp_first, sp_second = sp[first], sp[second]
+            mask = sp_first != sp_second
+            if not mask.any():
+                continue
+            sp_first, sp_second = sp_first[mask], sp_second[mask]
+            edge_indexes.append(lookup(np.minimum(sp_first, sp_second), np.maximum(sp_first, sp_second)))
+            for channel in channels:
+                channel_data = data[..., channel]
+                values[channel].append(
+                    ((channel_data[first][mask] + channel_data[second][mask]) / 2).astype(np.float64)
+                )
+
+        if not edge_indexes:
+            return
+        edges, groups = np.unique(np.concatenate(edge_indexes), return_inverse=True)
+        block_stats = {
+            channel: EdgeStatistics.of_values(groups, len(edges), np.concatenate(values[channel]))
+            for channel in channels
+        }
+        with totals_lock:
+            for channel, stats in block_stats.items():
+                totals[channel].merge(stats, edges)
+
+    pool = RequestPool()
+    for block_start in getIntersectingBlocks(block_shape, roiFromShape(shape)):
+        pool.add(Request(partial(process_block, block_start)))
+    pool.wait()
+
+    dataframes = []
+    for channel, feature_names in features:
+        stats = totals[channel]
+        columns = {name: getattr(stats, BLOCKWISE_EDGE_FEATURES[name]).astype(np.float32) for name in feature_names}
+        dataframes.append(pd.DataFrame(columns, columns=list(feature_names)))
+    return dataframes
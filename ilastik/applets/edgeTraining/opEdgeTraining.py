@@ -10,6 +10,7 @@ import ilastikrag
 
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.roi import roiToSlice
+from lazyflow.utility import OrderedSignal
 from lazyflow.operators import OpValueCache, OpBlockedArrayCache
 from lazyflow.classifiers import ParallelVigraRfLazyflowClassifierFactory
 
@@ -17,6 +18,8 @@ from ilastik.applets.base.applet import DatasetConstraintError
 from ilastik.utility.operatorSubView import OperatorSubView
 from ilastik.utility import OpMultiLaneWrapper
 
+from .blockwiseEdgeFeatures import EdgeLookup, compute_edge_features_blockwise, supports_blockwise
+
 import logging
 
 logger = logging.getLogger(__name__)
@@ -44,6 +47,9 @@ class OpEdgeTraining(Operator):
     def __init__(self, *args, **kwargs):
         super(OpEdgeTraining, self).__init__(*args, **kwargs)
 
+        # OpCreateRag of a lane -> spatial regions (start, stop) where the superpixels changed since its last rag
+        self._changedRegions = {}
+
         self.opCreateRag = OpMultiLaneWrapper(OpCreateRag, parent=self)
         self.opCreateRag.Superpixels.connect(self.Superpixels)
 
@@ -59,6 +65,7 @@ class OpEdgeTraining(Operator):
         self.opComputeEdgeFeatures.Rag.connect(self.opRagCache.Output)
         self.opComputeEdgeFeatures.TrainRandomForest.connect(self.TrainRandomForest)
         self.opComputeEdgeFeatures.WatershedSelectedInput.connect(self.WatershedSelectedInput)
+        self.opComputeEdgeFeatures.Superpixels.connect(self.Superpixels)
 
         self.opEdgeFeaturesCache = OpMultiLaneWrapper(OpValueCache, parent=self, broadcastingSlotNames=["fixAtCurrent"])
         self.opEdgeFeaturesCache.Input.connect(self.opComputeEdgeFeatures.EdgeFeaturesDataFrame)
@@ -149,9 +156,11 @@ class OpEdgeTraining(Operator):
         # When a new lane is added, set up the listener for dirtyness.
         self.Superpixels.notifyInserted(subscribe_to_dirty_sp)
 
-    def handle_dirty_superpixels(self, subslot, *args):
+    def handle_dirty_superpixels(self, subslot, roi=None):
         """
         Discards the labels for a given lane.
+        If only a region of the superpixels changed (roi), only the labels of edges
+        between superpixels that occurred in that region are discarded.
         NOTE: In addition to callers in this file, this function is also called from multicutWorkflow.py
         """
         if self._cleaningUp:
@@ -159,10 +168,85 @@ class OpEdgeTraining(Operator):
         # Determine which lane triggered this and delete it's labels
         lane_index = self.Superpixels.index(subslot)
         old_labels = self.EdgeLabelsDict[lane_index].value
-        if old_labels:
+        if not old_labels:
+            return
+
+        rag_op = self.opCreateRag.innerOperators[lane_index]
+        region = None
+        if roi is not None:
+            region = self._changedRegion(rag_op.last_rag, roi)
+        if region is None:
             logger.warning("Superpixels changed.  Deleting all labels in lane {}.".format(lane_index))
             logger.info("Old labels were: {}".format(old_labels))
             self.EdgeLabelsDict[lane_index].setValue({})
+            if rag_op in self._changedRegions:
+                self._changedRegions[rag_op] = []
+            return
+
+        # The new superpixels in the region may reuse ids of superpixels elsewhere.
+        # Those are only known when the new rag is created.
+        if rag_op not in self._changedRegions:
+            rag_op.rag_created.subscribe(partial(self._handle_new_rag, rag_op))
+            self._changedRegions[rag_op] = []
+        self._changedRegions[rag_op].append(region)
+
+        self._discardLabelsOfSuperpixels(lane_index, self._superpixelsInRegion(rag_op.last_rag, region))
+
+    def _handle_new_rag(self, rag_op, rag):
+        """Discard the labels of edges of superpixels in the regions that changed before rag was created."""
+        regions, self._changedRegions[rag_op] = self._changedRegions[rag_op], []
+        if not regions or self._cleaningUp:
+            return
+        lane_index = self.opCreateRag.innerOperators.index(rag_op)
+        shape = rag.label_img.shape
+        if any(len(stop) != len(shape) or np.any(stop > shape) for _, stop in regions):
+            logger.warning("Superpixels changed.  Deleting all labels in lane {}.".format(lane_index))
+            self.EdgeLabelsDict[lane_index].setValue({})
+            return
+        affected_sps = set()
+        for region in regions:
+            affected_sps |= self._superpixelsInRegion(rag, region)
+        self._discardLabelsOfSuperpixels(lane_index, affected_sps)
+
+    def _discardLabelsOfSuperpixels(self, lane_index, affected_sps):
+        old_labels = self.EdgeLabelsDict[lane_index].value
+        if not old_labels:
+            return
+        new_labels = {
+            edge: label
+            for edge, label in old_labels.items()
+            if edge[0] not in affected_sps and edge[1] not in affected_sps
+        }
+        if len(new_labels) < len(old_labels):
+            logger.warning(
+                "Superpixels changed.  Deleting {} labels in lane {}.".format(
+                    len(old_labels) - len(new_labels), lane_index
+                )
+            )
+            logger.info("Old labels were: {}".format(old_labels))
+            self.EdgeLabelsDict[lane_index].setValue(new_labels)
+
+    @staticmethod
+    def _changedRegion(last_rag, roi):
+        """
+        The spatial region (start, stop) of the given roi of the superpixels, grown by one voxel,
+        or None if the previous superpixels are unknown or the region is so large that all labels should be discarded.
+        """
+        if last_rag is None:
+            return None
+        shape = np.array(last_rag.label_img.shape)
+        if len(roi.start) != len(shape) + 1:
+            return None
+        start = np.maximum(np.array(roi.start[:-1]) - 1, 0)
+        stop = np.minimum(np.array(roi.stop[:-1]) + 1, shape)
+        if np.prod(stop - start) > OpComputeEdgeFeatures.INCREMENTAL_MAX_FRACTION * np.prod(shape):
+            return None
+        return start, stop
+
+    @staticmethod
+    def _superpixelsInRegion(rag, region):
+        """The superpixel ids of rag in the given spatial region (start, stop)"""
+        return set(np.unique(rag.label_img[roiToSlice(*region)]).tolist())
 
     def setupOutputs(self):
         for sp_slot, seg_cache_blockshape_slot in zip(self.Superpixels, self.opNaiveSegmentationCache.BlockShape):
@@ -228,6 +312,13 @@ class OpCreateRag(Operator):
     Superpixels = InputSlot()
     Rag = OutputSlot()
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The most recently created rag, to find out which superpixels were affected by a change
+        self.last_rag = None
+        # Called with each new rag
+        self.rag_created = OrderedSignal()
+
     def setupOutputs(self):
         assert (
             self.Superpixels.meta.dtype == np.uint32
@@ -242,7 +333,10 @@ class OpCreateRag(Operator):
         superpixels = superpixels.dropChannelAxis()
 
         logger.info("Creating RAG...")
-        result[0] = ilastikrag.Rag(superpixels)
+        rag = ilastikrag.Rag(superpixels)
+        self.last_rag = rag
+        self.rag_created(rag)
+        result[0] = rag
 
     def propagateDirty(self, slot, subindex, roi):
         self.Rag.setDirty()
@@ -256,25 +350,74 @@ def decodeToStringIfBytes(s):
 
 
 class OpComputeEdgeFeatures(Operator):
+    """
+    Computes the edge features of the RAG.
+
+    If Superpixels is connected, the operator remembers which region of the superpixels became dirty.
+    Then only the features of edges of superpixels that changed are recomputed (on a crop around them),
+    and the features of all other edges are taken from the previous result.
+    """
+
     WatershedSelectedInput = InputSlot()
     TrainRandomForest = InputSlot(value=False)
     FeatureNames = InputSlot()
     VoxelData = InputSlot()
     Rag = InputSlot()
+    Superpixels = InputSlot(optional=True)  # Only used to keep track of the region that changed
     EdgeFeaturesDataFrame = OutputSlot()  # Includes columns 'sp1' and 'sp2'
 
+    # If more of the volume changed, recomputing all features is faster than updating them
+    INCREMENTAL_MAX_FRACTION = 0.25
+
+    BEST_FEATURE = "standard_edge_mean"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (rag, features dataframe) of the last execute (without normalization)
+        self._last_result = None
+        # Spatial bounding box (start, stop) of the superpixels that became dirty since then
+        self._dirty_roi = None
+
     def setupOutputs(self):
         assert self.VoxelData.meta.getAxisKeys()[-1] == "c"
         self.EdgeFeaturesDataFrame.meta.shape = (1,)
         self.EdgeFeaturesDataFrame.meta.dtype = object
+        self._last_result = None
 
     def execute(self, slot, subindex, roi, result):
+        rag = self.Rag.value
+        last_result, dirty_roi = self._last_result, self._dirty_roi
+        self._dirty_roi = None
+
+        edge_features_df = None
+        if last_result is not None and self.Superpixels.ready():
+            edge_features_df = self._updateEdgeFeatures(rag, *last_result, dirty_roi)
+        if edge_features_df is None:
+            edge_features_df = self._computeEdgeFeatures(rag, np.zeros(len(rag.label_img.shape), dtype=int))
+        self._last_result = (rag, edge_features_df)
+
+        if not self.TrainRandomForest.value:
+
+            def normalize1(series):
+                series = series - np.min(series)
+                series = series / np.max(series)
+                return series
+
+            edge_features_df = edge_features_df.copy()
+            edge_features_df[self.BEST_FEATURE] = normalize1(edge_features_df[self.BEST_FEATURE])
+
+        result[0] = edge_features_df
+
+    def _computeEdgeFeatures(self, rag, offset):
+        """
+        Compute the features of all edges of the rag.
+        The rag's label_img is the region of the volume that starts at offset (spatial coordinates).
+        """
+        stop = offset + rag.label_img.shape
         if self.TrainRandomForest.value:
-            rag = self.Rag.value
             channel_feature_names = self.FeatureNames.value
 
-            edge_feature_dfs = []
-
+            selected_features = []
             for c in range(self.VoxelData.meta.shape[-1]):
                 channel_name = self.VoxelData.meta.channel_names[c]
                 if channel_name not in channel_feature_names:
@@ -284,16 +427,36 @@ class OpComputeEdgeFeatures(Operator):
                 if not feature_names:
                     # No features selected for this channel
                     continue
+                selected_features.append((c, channel_name, feature_names))
+
+            # Channels whose features can all be accumulated blockwise are computed together, in parallel
+            blockwise_features = [(c, names) for c, _, names in selected_features if supports_blockwise(names)]
+            blockwise_dfs = {}
+            if blockwise_features:
+                # Read only the channels we need (indexes relative to the first one)
+                first_channel = blockwise_features[0][0]
+                last_channel = blockwise_features[-1][0]
+                read_block = partial(self._readBlock, self.VoxelData, first_channel, last_channel + 1, offset)
+                dfs = compute_edge_features_blockwise(
+                    rag, read_block, [(c - first_channel, names) for c, names in blockwise_features]
+                )
+                blockwise_dfs = {c: df for (c, _), df in zip(blockwise_features, dfs)}
 
-                voxel_data = self.VoxelData[..., c : c + 1].wait()
-                voxel_data = vigra.taggedView(voxel_data, self.VoxelData.meta.axistags)
-                voxel_data = voxel_data[..., 0]  # drop channel
-                edge_features_df = rag.compute_features(voxel_data, feature_names)
+            edge_feature_dfs = []
 
-                # if np.isnan(edge_features_df.values).any():
-                #    raise RuntimeError("Whoa, why are there NaN values in the feature matrix?")
+            for c, channel_name, feature_names in selected_features:
+                if c in blockwise_dfs:
+                    edge_features_df = blockwise_dfs[c]
+                else:
+                    voxel_data = self.VoxelData(tuple(offset) + (c,), tuple(stop) + (c + 1,)).wait()
+                    voxel_data = vigra.taggedView(voxel_data, self.VoxelData.meta.axistags)
+                    voxel_data = voxel_data[..., 0]  # drop channel
+                    edge_features_df = rag.compute_features(voxel_data, feature_names)
 
-                edge_features_df = edge_features_df.iloc[:, 2:]  # Discard columns [sp1, sp2]
+                    # if np.isnan(edge_features_df.values).any():
+                    #    raise RuntimeError("Whoa, why are there NaN values in the feature matrix?")
+
+                    edge_features_df = edge_features_df.iloc[:, 2:]  # Discard columns [sp1, sp2]
 
                 # Prefix all column names with the channel name, to guarantee uniqueness
                 # (Generally a nice feature, but also required for serialization.)
@@ -302,35 +465,92 @@ class OpComputeEdgeFeatures(Operator):
                 ]
                 edge_feature_dfs.append(edge_features_df)
 
-            # Could use join() or merge() here, but we know the rows are already in the right order, and concat() should be faster.
-            all_edge_features_df = pd.DataFrame(rag.edge_ids, columns=["sp1", "sp2"])
-            all_edge_features_df = pd.concat([all_edge_features_df] + edge_feature_dfs, axis=1, copy=False)
-            result[0] = all_edge_features_df
-
         else:
-
-            def normalize1(series):
-                series = series - np.min(series)
-                series = series / np.max(series)
-                return series
-
-            BEST_FEATURE = "standard_edge_mean"
-
-            logger.info("Edge probabilities from feature {}...".format(BEST_FEATURE))
+            logger.info("Edge probabilities from feature {}...".format(self.BEST_FEATURE))
             # The probabilities data is the data which the
             # user has selected to run watershed on. The data source
             # cannot be hard coded, because there might be
             # many channels.
-            voxel_data = self.WatershedSelectedInput[..., 0].wait()
-            voxel_data = vigra.taggedView(voxel_data, self.VoxelData.meta.axistags)
-            voxel_data = voxel_data[..., 0]  # drop channel
-            rag = self.Rag.value
-            edge_features_df = rag.compute_features(voxel_data, [BEST_FEATURE])
-            edge_features_df[BEST_FEATURE] = normalize1(edge_features_df[BEST_FEATURE])
+            edge_feature_dfs = compute_edge_features_blockwise(
+                rag, partial(self._readBlock, self.WatershedSelectedInput, 0, 1, offset), [(0, [self.BEST_FEATURE])]
+            )
 
-            result[0] = edge_features_df
+        # Could use join() or merge() here, but we know the rows are already in the right order, and concat() should be faster.
+        all_edge_features_df = pd.DataFrame(rag.edge_ids, columns=["sp1", "sp2"])
+        return pd.concat([all_edge_features_df] + edge_feature_dfs, axis=1, copy=False)
+
+    def _updateEdgeFeatures(self, rag, last_rag, last_df, dirty_roi):
+        """
+        Derive the features of rag from the features of last_rag (last_df),
+        given that the superpixels only changed within dirty_roi (None: nowhere).
+        Returns None if everything should be recomputed instead.
+        """
+        shape = np.array(rag.label_img.shape)
+        if tuple(last_rag.label_img.shape) != tuple(shape):
+            return None
+
+        if dirty_roi is None:
+            affected_sps = np.zeros((0,), dtype=np.uint32)
+        else:
+            # Pairs of voxels across the roi's border changed, too.
+            start = np.maximum(dirty_roi[0] - 1, 0)
+            stop = np.minimum(dirty_roi[1] + 1, shape)
+            if np.prod(stop - start) > self.INCREMENTAL_MAX_FRACTION * np.prod(shape):
+                return None
+            slicing = roiToSlice(start, stop)
+            affected_sps = np.union1d(np.unique(rag.label_img[slicing]), np.unique(last_rag.label_img[slicing]))
+
+        edge_ids = np.asarray(rag.edge_ids)
+        affected = np.isin(edge_ids[:, 0], affected_sps) | np.isin(edge_ids[:, 1], affected_sps)
+
+        # All other edges (and both of their superpixels) are unchanged, and so are their features.
+        last_rows = EdgeLookup(last_df[["sp1", "sp2"]].values)(edge_ids[~affected, 0], edge_ids[~affected, 1])
+        if (last_rows < 0).any():
+            return None
+        last_values = last_df.iloc[:, 2:].to_numpy()
+        values = np.empty((len(edge_ids), last_values.shape[1]), dtype=last_values.dtype)
+        values[~affected] = last_values[last_rows]
+
+        if affected.any():
+            # Recompute the affected edges on a crop that contains all voxels of their superpixels.
+            involved = np.isin(rag.label_img, np.unique(edge_ids[affected]))
+            crop_start = np.zeros_like(shape)
+            crop_stop = shape.copy()
+            for axis in range(len(shape)):
+                other_axes = tuple(a for a in range(len(shape)) if a != axis)
+                (present,) = np.nonzero(involved.any(axis=other_axes))
+                crop_start[axis], crop_stop[axis] = present[0], present[-1] + 1
+            del involved
+
+            crop_labels = np.ascontiguousarray(rag.label_img[roiToSlice(crop_start, crop_stop)])
+            crop_rag = ilastikrag.Rag(vigra.taggedView(crop_labels, rag.label_img.axistags))
+            crop_df = self._computeEdgeFeatures(crop_rag, crop_start)
+            if list(crop_df.columns) != list(last_df.columns):
+                return None
+            crop_rows = EdgeLookup(crop_rag.edge_ids)(edge_ids[affected, 0], edge_ids[affected, 1])
+            if (crop_rows < 0).any():
+                return None
+            values[affected] = crop_df.iloc[:, 2:].to_numpy()[crop_rows]
+
+        logger.info("Recomputed the features of {} of {} edges".format(np.count_nonzero(affected), len(edge_ids)))
+        edge_features_df = pd.DataFrame(values, columns=last_df.columns[2:])
+        return pd.concat([pd.DataFrame(edge_ids, columns=["sp1", "sp2"]), edge_features_df], axis=1, copy=False)
+
+    @staticmethod
+    def _readBlock(slot, channel_start, channel_stop, offset, start, stop):
+        """Channels [channel_start, channel_stop) of the slot in the spatial roi [offset + start, offset + stop)"""
+        return slot(tuple(offset + start) + (channel_start,), tuple(offset + stop) + (channel_stop,)).wait()
 
     def propagateDirty(self, slot, subindex, roi):
+        if slot is self.Superpixels:
+            start, stop = np.array(roi.start[:-1]), np.array(roi.stop[:-1])
+            if self._dirty_roi is not None:
+                start = np.minimum(start, self._dirty_roi[0])
+                stop = np.maximum(stop, self._dirty_roi[1])
+            self._dirty_roi = (start, stop)
+        elif slot is not self.Rag:
+            # Voxel data or feature selection changed: recompute everything
+            self._last_result = None
         self.EdgeFeaturesDataFrame.setDirty()
 
 
@@ -366,8 +586,8 @@ class OpTrainEdgeClassifier(Operator):
             # Drop zero labels
             labels_df = labels_df[labels_df["label"] != 0]
 
-            # Merge in features
-            features_and_labels_df = pd.merge(edge_features_df, labels_df, how="right", on=["sp1", "sp2"])
+            # Merge in features (labels of edges that don't exist (anymore) are ignored)
+            features_and_labels_df = pd.merge(edge_features_df, labels_df, how="inner", on=["sp1", "sp2"])
             if all_features_and_labels_df is not None:
                 all_features_and_labels_df = pd.concat([all_features_and_labels_df, features_and_labels_df])
             else:
@@ -19,7 +19,8 @@
 # 		   http://ilastik.org/license.html
 ###############################################################################
 from lazyflow.graph import Operator, InputSlot, OutputSlot
-from lazyflow.operators import OpCompressedUserLabelArray
+from lazyflow.operators import OpCompressedUserLabelArray, OpSparseUserLabelArray
+from ilastik.config import cfg as ilastik_config
 from ilastik.utility.operatorSubView import OperatorSubView
 from ilastik.utility import OpMultiLaneWrapper
 
@@ -164,7 +165,10 @@ class OpLabelingSingleLane(Operator):
         self._blockDims = blockDims
 
         # Create internal operator
-        self.opLabelArray = OpCompressedUserLabelArray(parent=self)
+        if ilastik_config.getboolean("ilastik", "sparse_labels"):
+            self.opLabelArray = OpSparseUserLabelArray(parent=self)
+        else:
+            self.opLabelArray = OpCompressedUserLabelArray(parent=self)
         self.opLabelArray.Input.connect(self.LabelInput)
         self.opLabelArray.eraser.connect(self.LabelEraserValue)
         self.opLabelArray.deleteLabel.connect(self.LabelDelete)
@@ -1,9 +1,16 @@
+import hashlib
+import threading
 import warnings
+from collections import OrderedDict
+from functools import partial
 
 import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
 
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.operators import OpBlockedArrayCache, OpValueCache
+from lazyflow.request import Request, RequestPool
 from lazyflow.utility import Timer
 
 import nifty
@@ -143,6 +150,14 @@ class OpEdgeLabelDisagreementDict(Operator):
 
 
 class OpMulticutAgglomerator(Operator):
+    """
+    Solves the multicut problem of the rag.
+
+    The most recent solutions are kept (keyed by the graph, the edge probabilities, the parameters and the solver),
+    so going back to previous parameters (e.g. while dragging the beta slider) doesn't solve again.
+    New problems on the same graph are warm-started from the previous solution, if the solver supports it.
+    """
+
     SolverName = InputSlot()
     Beta = InputSlot()
     ProbabilityThreshold = InputSlot()
@@ -151,6 +166,14 @@ class OpMulticutAgglomerator(Operator):
     EdgeProbabilities = InputSlot()
     NodeLabels = OutputSlot()  # 1D array, mapping superpixels to segment labels
 
+    MAX_CACHED_SOLUTIONS = 8
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._solutions = OrderedDict()  # (graph key, problem key) -> node labeling
+        self._last_solution = None  # (graph key, node labeling)
+
     def setupOutputs(self):
         self.NodeLabels.meta.shape = (1,)
         self.NodeLabels.meta.dtype = object
@@ -159,29 +182,51 @@ class OpMulticutAgglomerator(Operator):
         rag = self.Rag.value
         beta = self.Beta.value
         solver_name = self.SolverName.value
+        threshold = self.ProbabilityThreshold.value
         edge_probabilities = self.EdgeProbabilities.value
         if edge_probabilities is None:
             # No probabilities cached yet. Merge everything
             result[0] = np.zeros(rag.max_sp + 1, dtype=np.uint32)
             return
 
-        with Timer() as timer:
-            node_labeling = self.agglomerate_with_multicut(
-                rag, edge_probabilities, beta, solver_name, self.ProbabilityThreshold.value
-            )
+        graph_key = (rag.max_sp, _array_digest(rag.edge_ids))
+        key = (graph_key, _array_digest(edge_probabilities), beta, threshold, solver_name)
+        with self._lock:
+            node_labeling = self._solutions.get(key)
+            if node_labeling is not None:
+                self._solutions.move_to_end(key)
+            initial_labels = None
+            if self._last_solution is not None and self._last_solution[0] == graph_key:
+                initial_labels = self._last_solution[1]
+
+        if node_labeling is not None:
+            logger.info(f"Reusing {solver_name!r} Multicut solution")
+        else:
+            with Timer() as timer:
+                node_labeling = self.agglomerate_with_multicut(
+                    rag, edge_probabilities, beta, solver_name, threshold, initial_labels=initial_labels
+                )
+            logger.info(f"{solver_name!r} Multicut took {timer.seconds()} seconds")
 
-        logger.info(f"{solver_name!r} Multicut took {timer.seconds()} seconds")
+            with self._lock:
+                self._solutions[key] = node_labeling
+                while len(self._solutions) > self.MAX_CACHED_SOLUTIONS:
+                    self._solutions.popitem(last=False)
+
+        with self._lock:
+            self._last_solution = (graph_key, node_labeling)
 
         # FIXME: Is it okay to produce 0-based supervoxels?
         # node_labeling[:] += 1 # RAG labels are 0-based, but we want 1-based
 
-        result[0] = node_labeling
+        # Downstream operators must not modify our cached solutions.
+        result[0] = node_labeling.copy()
 
     def propagateDirty(self, slot, subindex, roi):
         self.NodeLabels.setDirty()
 
     @classmethod
-    def agglomerate_with_multicut(cls, rag, edge_probabilities, beta, solver_name, threshold):
+    def agglomerate_with_multicut(cls, rag, edge_probabilities, beta, solver_name, threshold, initial_labels=None):
         """
         rag: ilastikrag.Rag
 
@@ -192,6 +237,8 @@ class OpMulticutAgglomerator(Operator):
 
         solver_name: The multicut solver used. Format: library_solver (e.g. nifty_Exact)
 
+        initial_labels: Optional labeling of the nodes to warm-start the solver from (e.g. a previous solution).
+
         Returns: An index array [0,1,...,N] indicating the new labels for the N nodes of the RAG.
         """
         #
@@ -205,7 +252,14 @@ class OpMulticutAgglomerator(Operator):
         edge_weights = compute_edge_weights(rag.edge_ids, edge_probabilities, beta, threshold)
         assert edge_weights.shape == (rag.num_edges,)
 
-        return solve(rag.edge_ids, edge_weights, node_count, solver_name)
+        return solve(rag.edge_ids, edge_weights, node_count, solver_name, initial_labels=initial_labels, decompose=True)
+
+
+def _array_digest(array):
+    array = np.ascontiguousarray(array)
+    digest = hashlib.blake2b(array.view(np.uint8).reshape(-1), digest_size=16)
+    digest.update(str((array.dtype.str, array.shape)).encode())
+    return digest.digest()
 
 
 def compute_edge_weights(edge_ids, edge_probabilities, beta, threshold):
@@ -244,7 +298,7 @@ def compute_edge_weights(edge_ids, edge_probabilities, beta, threshold):
     return edge_weights
 
 
-def solve(edge_ids, edge_weights, node_count, solver_method):
+def solve(edge_ids, edge_weights, node_count, solver_method, initial_labels=None, decompose=False):
     """
     Solve the given multicut problem with the 'Nifty' library and return an
     index array that maps node IDs to segment IDs.
@@ -259,16 +313,83 @@ def solve(edge_ids, edge_weights, node_count, solver_method):
 
     solver_method: see elf.segmentation.multicut.get_available_solver_names, also still supporting
                    NIFTY_FmGreedy, the previous default solver.
+
+    initial_labels: Optional labeling of the nodes (shape=(node_count,)) to warm-start the solver from.
+                    Only used by solvers in WARM_START_SOLVERS.
+
+    decompose: If True, the connected components of the graph of attractive (positive) edges
+               are solved separately and in parallel.  Nodes in different components are always
+               separated in an optimal solution, so this doesn't change the problem.
     """
     logging.debug(f"Using multicut solver {solver_method}")
+    solver = _get_solver(solver_method)
+
+    if not decompose:
+        return _solve_problem(solver_method, solver, edge_ids, edge_weights, node_count, initial_labels)
+
+    edge_ids = np.asarray(edge_ids)
+    edge_weights = np.asarray(edge_weights)
+    components = attractive_components(edge_ids, edge_weights, node_count)
+
+    # Edges between components are cut anyway
+    inner = components[edge_ids[:, 0]] == components[edge_ids[:, 1]]
+    edge_ids, edge_weights = edge_ids[inner], edge_weights[inner]
+    edge_components = components[edge_ids[:, 0]]
+    order = np.argsort(edge_components, kind="stable")
+    edge_ids, edge_weights, edge_components = edge_ids[order], edge_weights[order], edge_components[order]
+
+    # Solve small components together, to avoid the overhead of many tiny problems
+    component_starts = np.flatnonzero(np.diff(edge_components, prepend=-1))
+    batch_indices = np.unique(np.searchsorted(component_starts, np.arange(0, len(edge_ids), MIN_SUBPROBLEM_EDGES)))
+    # (Boundaries within the last component are past the last start)
+    batch_starts = component_starts[batch_indices[batch_indices < len(component_starts)]]
+    batch_stops = np.append(batch_starts[1:], len(edge_ids))
+
+    batch_results = [None] * len(batch_starts)
+
+    def solve_batch(index, start, stop):
+        nodes, local_edge_ids = np.unique(edge_ids[start:stop], return_inverse=True)
+        local_edge_ids = local_edge_ids.reshape((-1, 2))
+        local_initial_labels = None if initial_labels is None else np.asarray(initial_labels)[nodes]
+        labels = _solve_problem(
+            solver_method, solver, local_edge_ids, edge_weights[start:stop], len(nodes), local_initial_labels
+        )
+        batch_results[index] = (nodes, labels)
+
+    pool = RequestPool()
+    for index, (start, stop) in enumerate(zip(batch_starts, batch_stops)):
+        pool.add(Request(partial(solve_batch, index, start, stop)))
+    pool.wait()
+
+    # Make the labels of all batches unique. Nodes without attractive edges are segments of their own.
+    mapping_index_array = np.zeros(node_count, dtype=np.int64)
+    solved = np.zeros(node_count, dtype=bool)
+    next_label = 0
+    for nodes, labels in batch_results:
+        _, labels = np.unique(labels, return_inverse=True)
+        mapping_index_array[nodes] = labels + next_label
+        solved[nodes] = True
+        next_label += labels.max() + 1
+    mapping_index_array[~solved] = np.arange(next_label, next_label + np.count_nonzero(~solved))
+    return mapping_index_array.astype(np.uint32)
+
+
+# Below this size, connected components are batched into one subproblem
+MIN_SUBPROBLEM_EDGES = 10000
+
+# Solvers that can start from a given node labeling
+WARM_START_SOLVERS = ["kernighan-lin"]
+
+
+def _get_solver(solver_method):
     if solver_method in get_available_solver_names():
-        solver = get_multicut_solver(solver_method)
+        return get_multicut_solver(solver_method)
     elif solver_method == "Nifty_FmGreedy":
         # for backwards compatibility:
         warnings.warn(
             f"Using legacy multicut {solver_method}. This is only expected in debug mode or with old project files."
         )
-        solver = legacy_nifty_fm_greedy_solver
+        return legacy_nifty_fm_greedy_solver
     elif solver_method in LEGACY_SOLVER_NAMES:
         raise ValueError(
             f"Multicut solver method {solver_method} not supported anymore. Please run the project in ilastik 1.3.3post3, or change the solver method in debug mode."
@@ -276,9 +397,43 @@ def solve(edge_ids, edge_weights, node_count, solver_method):
     else:
         raise ValueError(f"Unsupported multicut solver method {solver_method}")
 
+
+def _solve_problem(solver_method, solver, edge_ids, edge_weights, node_count, initial_labels):
     g = nifty.graph.UndirectedGraph(int(node_count))
     g.insertEdges(edge_ids)
 
-    ret = solver(g, edge_weights)
+    if initial_labels is not None and solver_method in WARM_START_SOLVERS:
+        ret = warm_start_kernighan_lin(g, edge_weights, initial_labels)
+    else:
+        ret = solver(g, edge_weights)
     mapping_index_array = ret.astype(np.uint32)
     return mapping_index_array
+
+
+def warm_start_kernighan_lin(graph, edge_weights, initial_labels):
+    """
+    Kernighan-Lin, started from initial_labels or from the greedy additive solution
+    (the default starting point), whichever has the lower energy.
+    """
+    objective = nifty.graph.opt.multicut.multicutObjective(graph, edge_weights)
+    _, initial_labels = np.unique(initial_labels, return_inverse=True)
+    initial_labels = initial_labels.astype(np.uint64)
+    greedy_labels = objective.greedyAdditiveFactory().create(objective).optimize()
+    if objective.evalNodeLabels(greedy_labels) < objective.evalNodeLabels(initial_labels):
+        initial_labels = greedy_labels
+    solver = objective.kernighanLinFactory(warmStartGreedy=False).create(objective)
+    return solver.optimize(nodeLabels=initial_labels)
+
+
+def attractive_components(edge_ids, edge_weights, node_count):
+    """
+    Connected components of the graph that only contains the attractive (positive weight) edges.
+    Returns the component of each node.
+    """
+    attractive = edge_ids[edge_weights > 0]
+    adjacency = scipy.sparse.coo_matrix(
+        (np.ones(len(attractive), dtype=np.uint8), (attractive[:, 0], attractive[:, 1])),
+        shape=(node_count, node_count),
+    )
+    _, components = scipy.sparse.csgraph.connected_components(adjacency, directed=False)
+    return components
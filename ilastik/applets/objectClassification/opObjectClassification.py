@@ -21,6 +21,7 @@
 from typing import Tuple
 import numpy
 import numpy.typing as npt
+import threading
 import time
 import itertools
 from collections import defaultdict, OrderedDict
@@ -43,6 +44,7 @@ from ilastik.applets.objectExtraction.opObjectExtraction import default_features
 
 from ilastik.applets.base.applet import DatasetConstraintError
 from ilastik.applets.objectExtraction.opObjectExtraction import default_features_key
+from ilastik.applets.objectExtraction.featureTable import feature_table
 
 import logging
 
@@ -941,49 +943,41 @@ def _concatenate(arrays, axis):
 
 
 def make_feature_array(feats, selected, labels=None):
+    """
+    The feature matrix of the selected features of all objects (or of the labeled objects, if labels
+    are given) in the time slices of feats, taken from the feature tables of the time slices.
+
+    The matrix is read-only if it is a selection of a single time slice.
+    """
     featlist = []
     labellist = []
 
     row_names = []
     col_names = []
 
+    selected = {plugin: names for plugin, names in selected.items() if plugin != default_features_key}
     for t in sorted(feats.keys()):
-        featsMatrix_tmp = []
-        index = None
-        if labels is not None:
-            labellist_tmp = []
-            lab = labels[t].squeeze()
-            index = numpy.nonzero(lab)
-            labellist_tmp.append(lab[index])
-
-        timestep_col_names = []
-        for plugin in sorted(feats[t].keys()):
-            if plugin == default_features_key or plugin not in selected:
-                continue
-            for featname in sorted(feats[t][plugin].keys()):
-                if featname not in selected[plugin]:
-                    continue
-                value = feats[t][plugin][featname]
-                ft = numpy.asarray(value.squeeze())
-                if index is not None:
-                    ft = ft[index]
-                featsMatrix_tmp.append(ft)
-                timestep_col_names.extend([(plugin, featname)] * value.shape[1])
+        featsMatrix_tmp, timestep_col_names = feature_table(feats[t]).select(selected)
         if not col_names:
             col_names = timestep_col_names
         elif col_names != timestep_col_names:
             raise Exception("different time slices did not have same features.")
 
-        # FIXME: we can do it all with just arrays
-        featsMatrix_tmp_combined = _concatenate(featsMatrix_tmp, axis=1)
-        featlist.append(featsMatrix_tmp_combined)
-        if index is not None:
-            row_names.extend(list((t, obj) for obj in index[0]))
         if labels is not None:
-            labellist_tmp_combined = _concatenate(labellist_tmp, axis=1)
-            labellist.append(labellist_tmp_combined)
+            lab = labels[t].squeeze()
+            index = numpy.nonzero(lab)
+            featsMatrix_tmp = featsMatrix_tmp[index]
+            labellist.append(lab[index].reshape(-1, 1))
+            row_names.extend(list((t, obj) for obj in index[0]))
+        if featsMatrix_tmp.size:
+            featlist.append(featsMatrix_tmp)
 
-    featMatrix = _concatenate(featlist, axis=0)
+    if len(featlist) == 0:
+        featMatrix = numpy.array([])
+    elif len(featlist) == 1:
+        featMatrix = featlist[0]
+    else:
+        featMatrix = numpy.concatenate(featlist, axis=0)
 
     if labels is not None:
         labelsMatrix = _concatenate(labellist, axis=0)
@@ -993,12 +987,19 @@ def make_feature_array(feats, selected, labels=None):
 
 
 def replace_missing(a):
-    rows, cols = numpy.where(numpy.isnan(a) + numpy.isinf(a))
+    """
+    Replaces NaN and inf by MISSING_VALUE and returns the rows and columns where they occurred,
+    and the array (a copy, if a is read-only and had missing values).
+    """
+    rows, cols = numpy.where(~numpy.isfinite(a))
     idx = (rows, cols)
     rows = list(set(rows.flat))
     cols = list(set(cols.flat))
-    a[idx] = MISSING_VALUE
-    return rows, cols
+    if rows:
+        if not a.flags.writeable:
+            a = a.copy()
+        a[idx] = MISSING_VALUE
+    return rows, cols, a
 
 
 class OpObjectTrain(Operator):
@@ -1101,7 +1102,7 @@ class OpObjectTrain(Operator):
             if labelstmp.size == 0 or featstmp.size == 0:
                 return
 
-            rows, cols = replace_missing(featstmp)
+            rows, cols, featstmp = replace_missing(featstmp)
 
             # Critical section: Adding to shared lists.
             with lock:
@@ -1286,7 +1287,7 @@ class OpObjectPredict(Operator):
                 continue
 
             ftmatrix, _, col_names = make_feature_array({t: tmpfeats[t]}, selected)
-            rows, cols = replace_missing(ftmatrix)
+            rows, cols, ftmatrix = replace_missing(ftmatrix)
             self.bad_objects[t] = numpy.zeros((ftmatrix.shape[0],))
             self.bad_objects[t][rows] = 1
             self.uncertainty_estimate[t] = numpy.zeros((ftmatrix.shape[0],))
@@ -1303,7 +1304,7 @@ class OpObjectPredict(Operator):
                 #       For details please see wikipedia:
                 #       http://en.wikipedia.org/wiki/Electoral_College_%28United_States%29#Irrelevancy_of_national_popular_vote
                 #       (^-^)
-                prob_predictions[_t] = classifier.predict_probabilities(feats[_t].astype(numpy.float32))
+                prob_predictions[_t] = classifier.predict_probabilities(numpy.asarray(feats[_t], dtype=numpy.float32))
 
             # predict the data with all the forests in parallel
             pool = RequestPool()
@@ -1400,9 +1401,21 @@ class OpRelabelSegmentation(Operator):
     loggingName = __name__ + ".OpRelabelSegmentation"
     logger = logging.getLogger(loggingName)
 
+    # Larger requests (number of pixels) are relabeled in chunks, in parallel
+    RELABEL_CHUNK_SIZE = 2**22
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        # t -> lookup table object label -> value, see _lookupTable()
+        self._lookupTables = {}
+        # Incremented when the lookup tables are invalidated
+        self._generation = 0
+
     def setupOutputs(self):
         self.Output.meta.assignFrom(self.Image.meta)
         self.Output.meta.dtype = self.ObjectMap.meta.mapping_dtype
+        self._invalidateLookupTables()
 
     def execute(self, slot, subindex, roi, result):
         tStart = time.perf_counter()
@@ -1411,45 +1424,86 @@ class OpRelabelSegmentation(Operator):
         img = self.Image(roi.start, roi.stop).wait()
         tIMG = 1000.0 * (time.perf_counter() - tIMG)
 
+        tMAP = tWORK = 0.0
         for t in range(roi.start[0], roi.stop[0]):
-
-            tMAP = time.perf_counter()
-            map_ = self.ObjectMap([t]).wait()
-            tmap = map_[t]
-            # FIXME: necessary because predictions are returned
-            # enclosed in a list.
-            if isinstance(tmap, list):
-                tmap = tmap[0]
-            tmap = tmap.squeeze()
-            if tmap.ndim == 0:
-                # no objects, nothing to paint
-                result[t - roi.start[0]][:] = 0
-                return result
-
-            tMAP = 1000.0 * (time.perf_counter() - tMAP)
-            # FIXME: This should be cached (and reset when the input becomes dirty)")
-            tMAX = time.perf_counter()
-            idx = img.max()
-
-            if len(tmap) <= idx:
-                newTmap = numpy.zeros((idx + 1,))  # And maybe this should be cached, too?
-                newTmap[: len(tmap)] = tmap[:]
-                tmap = newTmap
-            tMAX = 1000.0 * (time.perf_counter() - tMAX)
+            tMAP -= time.perf_counter()
+            lookup_table = self._lookupTable(t)
+            tMAP += time.perf_counter()
 
             # do the work thing
-            tWORK = time.perf_counter()
-            result[t - roi.start[0]] = tmap[img[t - roi.start[0]]]
-            tWORK = 1000.0 * (time.perf_counter() - tWORK)
+            tWORK -= time.perf_counter()
+            self._relabel(img[t - roi.start[0]], lookup_table, result[t - roi.start[0]])
+            tWORK += time.perf_counter()
 
         if self.logger.getEffectiveLevel() >= logging.DEBUG:
             tStart = 1000.0 * (time.perf_counter() - tStart)
             self.logger.debug(
-                "took %f msec. (img: %f, wait ObjectMap: %f, do work: %f, max: %f)" % (tStart, tIMG, tMAP, tWORK, tMAX)
+                "took %f msec. (img: %f, lookup tables: %f, do work: %f)"
+                % (tStart, tIMG, 1000.0 * tMAP, 1000.0 * tWORK)
             )
 
         return result
 
+    def _lookupTable(self, t) -> numpy.ndarray:
+        """
+        The object map of time step t as lookup table (object label -> value) in the output dtype, with
+        an additional last entry 0 for all labels that are not in the map (see _relabel()).
+        It is cached until the object map or features become dirty.
+        """
+        with self._lock:
+            lookup_table = self._lookupTables.get(t)
+            generation = self._generation
+        if lookup_table is not None:
+            return lookup_table
+
+        tmap = self.ObjectMap([t]).wait()[t]
+        # FIXME: necessary because predictions are returned
+        # enclosed in a list.
+        if isinstance(tmap, list):
+            tmap = tmap[0]
+        tmap = numpy.asarray(tmap).squeeze()
+        if tmap.ndim == 0:
+            # no objects, nothing to paint
+            tmap = numpy.zeros((0,))
+
+        lookup_table = numpy.zeros((len(tmap) + 1,), dtype=self.Output.meta.dtype)
+        lookup_table[: len(tmap)] = tmap
+        lookup_table.flags.writeable = False
+
+        with self._lock:
+            # Don't cache tables of object maps that became dirty in the meantime
+            if generation == self._generation:
+                self._lookupTables[t] = lookup_table
+        return lookup_table
+
+    def _invalidateLookupTables(self, times=None):
+        with self._lock:
+            self._generation += 1
+            if times is None:
+                self._lookupTables.clear()
+            else:
+                for t in times:
+                    self._lookupTables.pop(t, None)
+
+    def _relabel(self, labels, lookup_table, out):
+        """out[...] = lookup_table[labels], labels beyond the end of the table are mapped to its last entry (0)"""
+        if labels.size <= self.RELABEL_CHUNK_SIZE:
+            numpy.take(lookup_table, labels, out=out, mode="clip")
+            return
+
+        axis = int(numpy.argmax(labels.shape))
+        num_chunks = -(-labels.size // self.RELABEL_CHUNK_SIZE)
+        bounds = numpy.linspace(0, labels.shape[axis], min(num_chunks, labels.shape[axis]) + 1).astype(int)
+
+        def relabel_chunk(start, stop):
+            slicing = (slice(None),) * axis + (slice(start, stop),)
+            numpy.take(lookup_table, labels[slicing], out=out[slicing], mode="clip")
+
+        pool = RequestPool()
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            pool.add(Request(partial(relabel_chunk, start, stop)))
+        pool.wait()
+
     def propagateDirty(self, slot, subindex, roi):
         if slot is self.Image:
             self.Output.setDirty(roi)
@@ -1459,12 +1513,15 @@ class OpRelabelSegmentation(Operator):
             # setDirty with a (time, object) pair, while elsewhere we
             # call setDirty with ().
             if len(roi._l) == 0:
+                self._invalidateLookupTables()
                 self.Output.setDirty(slice(None))
             elif isinstance(roi._l[0], int):
+                self._invalidateLookupTables(roi._l)
                 for t in roi._l:
                     self.Output.setDirty(slice(t))
             else:
                 assert len(roi._l[0]) == 2
+                self._invalidateLookupTables(set(t for t, _ in roi._l))
                 # for each dirty object, only set its bounding box dirty
                 ts = list(set(t for t, _ in roi._l))
                 feats = self.Features(ts).wait()
@@ -0,0 +1,264 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+# 		   http://ilastik.org/license.html
+###############################################################################
+"""
+Blockwise computation of the Standard Object Features of time slices that don't fit into memory.
+
+The in-memory extraction (OpRegionFeatures._extract) needs the raw and label volumes of a whole time slice.
+Most standard features, however, are (functions of) statistics of the object's pixels that can be computed
+for the parts of an object in each block and merged afterwards: counts, sums, extrema and central moments
+(merged with the pairwise update formulas of Pébay, "Formulas for Robust, One-Pass Parallel Computation of
+Covariances and Arbitrary-Order Statistical Moments", 2008). So objects spanning block borders simply
+contribute to the statistics of several blocks.
+
+The features are defined as in vigra.analysis.extractRegionFeatures (which computes them in memory), with
+the conventions of the Standard Object Features plugin: intensities are cast to float32, coordinates are in
+xyz order (xy for 2D time slices), the background is dropped and Coord<Maximum> is end exclusive.
+"""
+import threading
+from typing import Dict, Iterable, Mapping
+
+import numpy
+
+PLUGIN_NAME = "Standard Object Features"
+
+# Order of the central moments of the intensities a feature needs
+_INTENSITY_FEATURES = {"Sum": 1, "Mean": 1, "Variance": 2, "Skewness": 3, "Kurtosis": 4, "Minimum": 0, "Maximum": 0}
+_COORDINATE_FEATURES = {"Count", "RegionCenter", "Coord<Minimum>", "Coord<Maximum>", "RegionRadii"}
+
+MERGEABLE_FEATURES = frozenset(_INTENSITY_FEATURES) | _COORDINATE_FEATURES | {"Covariance"}
+
+
+def supports_blockwise(features: Mapping[str, Mapping[str, dict]]) -> bool:
+    """
+    Whether the selected features (features[plugin name][feature name] = parameters) can be computed blockwise.
+    """
+    return set(features) <= {PLUGIN_NAME} and all(
+        name in MERGEABLE_FEATURES and "margin" not in params for name, params in features.get(PLUGIN_NAME, {}).items()
+    )
+
+
+class RegionStatistics(object):
+    """
+    Mergeable statistics of the objects of a time slice, accumulated over its blocks (see module docstring).
+    Blocks may be added concurrently.
+    """
+
+    def __init__(self, feature_names: Iterable[str], ndim: int, num_channels: int):
+        """
+        :param feature_names: features to compute, a subset of MERGEABLE_FEATURES
+        :param ndim: number of spatial dimensions of the time slice (2 or 3)
+        :param num_channels: number of channels of the raw data
+        """
+        self.feature_names = list(feature_names)
+        unsupported = set(self.feature_names) - MERGEABLE_FEATURES
+        if unsupported:
+            raise ValueError(f"Features {sorted(unsupported)} can't be computed blockwise")
+
+        self.ndim = ndim
+        self.num_channels = num_channels
+        self._order = max((_INTENSITY_FEATURES.get(name, 0) for name in self.feature_names), default=0)
+        self._extrema = bool({"Minimum", "Maximum"} & set(self.feature_names))
+        self._coordinateScatter = "RegionRadii" in self.feature_names
+        self._channelScatter = "Covariance" in self.feature_names
+        if self._channelScatter:
+            self._order = max(self._order, 1)
+
+        self._lock = threading.Lock()
+        # statistic name -> array indexed by object id (including the background, 0).
+        # The arrays grow geometrically, only the first _size rows (max object id + 1) are used.
+        self._stats = self._empty(0)
+        self._size = 0
+
+    def _empty(self, num_objects) -> Dict[str, numpy.ndarray]:
+        """Statistics of objects without pixels"""
+        n, d, c = num_objects, self.ndim, self.num_channels
+        stats = {
+            "count": numpy.zeros(n),
+            "coord_sum": numpy.zeros((n, d)),
+            "coord_min": numpy.full((n, d), numpy.inf),
+            "coord_max": numpy.full((n, d), -numpy.inf),
+        }
+        if self._coordinateScatter:
+            stats["coord_m2"] = numpy.zeros((n, d, d))
+        for order in range(1, self._order + 1):
+            stats["sum" if order == 1 else f"m{order}"] = numpy.zeros((n, c))
+        if self._extrema:
+            stats["min"] = numpy.full((n, c), numpy.inf)
+            stats["max"] = numpy.full((n, c), -numpy.inf)
+        if self._channelScatter:
+            stats["m2_channels"] = numpy.zeros((n, c, c))
+        return stats
+
+    def update(self, labels: numpy.ndarray, image: numpy.ndarray, offset=(0, 0, 0)):
+        """
+        Add the pixels of a block.
+
+        :param labels: object ids of the block, xyz
+        :param image: raw data of the block, xyzc
+        :param offset: xyz coordinates of the first pixel of the block within the time slice
+        """
+        ids, block_stats = self._blockStatistics(labels, image, offset)
+        if len(ids) == 0:
+            return
+
+        with self._lock:
+            capacity = len(self._stats["count"])
+            if ids[-1] >= capacity:
+                grown = self._empty(max(ids[-1] + 1, 2 * capacity))
+                for key, values in self._stats.items():
+                    grown[key][: self._size] = values[: self._size]
+                self._stats = grown
+            self._size = max(self._size, ids[-1] + 1)
+
+            current = {key: values[ids] for key, values in self._stats.items()}
+            for key, values in _merged(current, block_stats).items():
+                self._stats[key][ids] = values
+
+    def _blockStatistics(self, labels, image, offset):
+        """The object ids (sorted) in the block, and the statistics of their pixels in the block"""
+        labels = numpy.asarray(labels)
+        mask = labels != 0
+        object_ids = labels[mask]
+        order = numpy.argsort(object_ids, kind="stable")
+        ids, starts, counts = numpy.unique(object_ids[order], return_index=True, return_counts=True)
+        if len(ids) == 0:
+            return ids, None
+
+        def sums(values):
+            return numpy.add.reduceat(values, starts, axis=0)
+
+        coords = numpy.stack(numpy.nonzero(mask), axis=1)[order][:, : self.ndim]
+        coords = coords + numpy.asarray(offset)[: self.ndim]
+        stats = {
+            "count": counts.astype(numpy.float64),
+            "coord_sum": sums(coords).astype(numpy.float64),
+            "coord_min": numpy.minimum.reduceat(coords, starts, axis=0).astype(numpy.float64),
+            "coord_max": numpy.maximum.reduceat(coords, starts, axis=0).astype(numpy.float64),
+        }
+        if self._coordinateScatter:
+            deviations = coords - numpy.repeat(stats["coord_sum"] / counts[:, None], counts, axis=0)
+            stats["coord_m2"] = sums(deviations[:, :, None] * deviations[:, None, :])
+
+        if self._order or self._extrema:
+            # Same precision as the in-memory computation
+            values = numpy.asarray(image)[mask][order].astype(numpy.float32).astype(numpy.float64)
+        if self._order:
+            stats["sum"] = sums(values)
+            deviations = values - numpy.repeat(stats["sum"] / counts[:, None], counts, axis=0)
+            for moment in range(2, self._order + 1):
+                stats[f"m{moment}"] = sums(deviations**moment)
+        if self._extrema:
+            stats["min"] = numpy.minimum.reduceat(values, starts, axis=0)
+            stats["max"] = numpy.maximum.reduceat(values, starts, axis=0)
+        if self._channelScatter:
+            stats["m2_channels"] = sums(deviations[:, :, None] * deviations[:, None, :])
+
+        return ids, stats
+
+    def features(self) -> Dict[str, numpy.ndarray]:
+        """
+        The features of the objects 1..max object id, as returned by the Standard Object Features plugin:
+        feature name -> 2D array with one row per object.
+        """
+        with self._lock:
+            stats = {key: values[1 : self._size] for key, values in self._stats.items()}
+
+        n = stats["count"][:, None]
+        num_objects = len(n)
+        result = {}
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            for name in self.feature_names:
+                if name == "Count":
+                    value = n
+                elif name == "RegionCenter":
+                    value = stats["coord_sum"] / n
+                elif name == "Coord<Minimum>":
+                    value = stats["coord_min"]
+                elif name == "Coord<Maximum>":
+                    value = stats["coord_max"] + 1
+                elif name == "RegionRadii":
+                    eigenvalues = numpy.linalg.eigvalsh(stats["coord_m2"] / n[:, :, None])
+                    value = numpy.sqrt(numpy.maximum(eigenvalues, 0))[:, ::-1]
+                elif name == "Sum":
+                    value = stats["sum"]
+                elif name == "Mean":
+                    value = stats["sum"] / n
+                elif name == "Variance":
+                    value = stats["m2"] / n
+                elif name == "Skewness":
+                    value = numpy.sqrt(n) * stats["m3"] / stats["m2"] ** 1.5
+                elif name == "Kurtosis":
+                    value = n * stats["m4"] / stats["m2"] ** 2 - 3
+                elif name == "Minimum":
+                    value = stats["min"]
+                elif name == "Maximum":
+                    value = stats["max"]
+                else:
+                    assert name == "Covariance"
+                    value = stats["m2_channels"] / n[:, :, None]
+                result[name] = value.reshape(num_objects, -1)
+        return result
+
+
+def _merged(a: Dict[str, numpy.ndarray], b: Dict[str, numpy.ndarray]) -> Dict[str, numpy.ndarray]:
+    """Statistics of the union of the (disjoint) pixels a and b of the same objects, all of which have pixels in b"""
+    na, nb = a["count"][:, None], b["count"][:, None]
+    n = na + nb
+    merged = {
+        "count": a["count"] + b["count"],
+        "coord_sum": a["coord_sum"] + b["coord_sum"],
+        "coord_min": numpy.minimum(a["coord_min"], b["coord_min"]),
+        "coord_max": numpy.maximum(a["coord_max"], b["coord_max"]),
+    }
+    if "coord_m2" in a:
+        delta = b["coord_sum"] / nb - a["coord_sum"] / numpy.maximum(na, 1)
+        merged["coord_m2"] = a["coord_m2"] + b["coord_m2"] + _outer(delta) * (na * nb / n)[:, :, None]
+
+    if "min" in a:
+        merged["min"] = numpy.minimum(a["min"], b["min"])
+        merged["max"] = numpy.maximum(a["max"], b["max"])
+
+    if "sum" not in a:
+        return merged
+    merged["sum"] = a["sum"] + b["sum"]
+    delta = b["sum"] / nb - a["sum"] / numpy.maximum(na, 1)
+    if "m2" in a:
+        merged["m2"] = a["m2"] + b["m2"] + delta**2 * na * nb / n
+    if "m3" in a:
+        merged["m3"] = (
+            a["m3"] + b["m3"] + delta**3 * na * nb * (na - nb) / n**2 + 3 * delta * (na * b["m2"] - nb * a["m2"]) / n
+        )
+    if "m4" in a:
+        merged["m4"] = (
+            a["m4"]
+            + b["m4"]
+            + delta**4 * na * nb * (na**2 - na * nb + nb**2) / n**3
+            + 6 * delta**2 * (na**2 * b["m2"] + nb**2 * a["m2"]) / n**2
+            + 4 * delta * (na * b["m3"] - nb * a["m3"]) / n
+        )
+    if "m2_channels" in a:
+        merged["m2_channels"] = a["m2_channels"] + b["m2_channels"] + _outer(delta) * (na * nb / n)[:, :, None]
+    return merged
+
+
+def _outer(vectors):
+    """Outer products of the rows of vectors"""
+    return vectors[:, :, None] * vectors[:, None, :]
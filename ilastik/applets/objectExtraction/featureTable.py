@@ -0,0 +1,148 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+# 		   http://ilastik.org/license.html
+###############################################################################
+"""
+Columnar storage of the object features of a time slice.
+
+OpRegionFeatures returns the features of a time slice as nested dicts,
+features[plugin name][feature name] = array with one row per object (row 0: background).
+Training and prediction need them as one feature matrix (objects x selected feature columns), which used
+to be assembled from the dicts (and copied) for every request. A :class:`FeatureTable` holds all feature
+columns of a time slice in one contiguous float32 array, so feature matrices are (cached) selections of it.
+
+The region features returned by OpRegionFeatures are :class:`RegionFeatures`, which build their table once,
+on first use, and share it with all consumers (see :func:`feature_table`).
+"""
+import threading
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy
+
+Column = Tuple[str, str]
+
+
+class FeatureTable(object):
+    """
+    The features of the objects of a time slice (see module docstring): one row per object (including the
+    background), the columns of each feature are adjacent. Features are ordered by plugin and feature name.
+    """
+
+    def __init__(self, features: Mapping[str, Mapping[str, numpy.ndarray]]):
+        """
+        :param features: features[plugin name][feature name] = array with one row per object
+        """
+        values = []
+        for plugin_name in sorted(features):
+            for feature_name in sorted(features[plugin_name]):
+                value = numpy.asarray(features[plugin_name][feature_name])
+                if value.dtype.kind not in "biuf":
+                    continue
+                values.append(((plugin_name, feature_name), value.reshape(len(value), -1)))
+
+        num_objects = max((len(value) for _, value in values), default=0)
+        # (plugin name, feature name) -> (first column, stop column)
+        self._ranges: Dict[Column, Tuple[int, int]] = {}
+        stop = 0
+        for name, value in values:
+            if len(value) != num_objects:
+                raise ValueError(f"Feature {name} has shape {value.shape}, expected {num_objects} rows")
+            self._ranges[name] = (stop, stop + value.shape[1])
+            stop += value.shape[1]
+
+        # Column-major: the columns of a feature (and of adjacent features) are contiguous
+        self.data = numpy.empty((num_objects, stop), dtype=numpy.float32, order="F")
+        for name, value in values:
+            self.data[:, slice(*self._ranges[name])] = value
+        self.data.flags.writeable = False
+
+        self._lock = threading.Lock()
+        self._selections = {}
+
+    @property
+    def num_objects(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def features(self) -> List[Column]:
+        """(plugin name, feature name) of the features in the table, in column order"""
+        return list(self._ranges)
+
+    def select(self, selected: Mapping[str, Mapping[str, dict]]) -> Tuple[numpy.ndarray, List[Column]]:
+        """
+        The feature matrix of the selected features (selected[plugin name] contains the feature names),
+        and the (plugin name, feature name) of each of its columns.
+
+        The matrix is read-only, it is a view into the table if the selected features are adjacent
+        and is cached otherwise.
+        """
+        key = tuple(sorted((plugin_name, tuple(sorted(names))) for plugin_name, names in selected.items()))
+        with self._lock:
+            selection = self._selections.get(key)
+        if selection is not None:
+            return selection
+
+        ranges = []
+        column_names = []
+        for plugin_name, feature_name in self._ranges:
+            if feature_name in selected.get(plugin_name, ()):
+                start, stop = self._ranges[(plugin_name, feature_name)]
+                if ranges and ranges[-1][1] == start:
+                    ranges[-1] = (ranges[-1][0], stop)
+                else:
+                    ranges.append((start, stop))
+                column_names.extend([(plugin_name, feature_name)] * (stop - start))
+
+        if len(ranges) == 1:
+            matrix = self.data[:, slice(*ranges[0])]
+        else:
+            columns = numpy.concatenate([numpy.arange(*r) for r in ranges]) if ranges else numpy.zeros(0, dtype=int)
+            matrix = numpy.asfortranarray(self.data[:, columns])
+            matrix.flags.writeable = False
+
+        with self._lock:
+            return self._selections.setdefault(key, (matrix, column_names))
+
+
+class RegionFeatures(dict):
+    """
+    The features of the objects of a time slice, features[plugin name][feature name] = array, whose
+    :class:`FeatureTable` is built on first use and then shared. The features must not be changed after that.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._table: Optional[FeatureTable] = None
+
+    @property
+    def table(self) -> FeatureTable:
+        if self._table is None:
+            self._table = FeatureTable(self)
+        return self._table
+
+    def __reduce__(self):
+        # The table is not pickled (or deep-copied), it is rebuilt when needed
+        return (RegionFeatures, (dict(self),))
+
+
+def feature_table(features: Mapping[str, Mapping[str, numpy.ndarray]]) -> FeatureTable:
+    """The (shared) table of RegionFeatures, or a new table for features given as plain dicts."""
+    if isinstance(features, RegionFeatures):
+        return features.table
+    return FeatureTable(features)
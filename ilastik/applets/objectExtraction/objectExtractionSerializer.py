@@ -21,6 +21,7 @@
 import logging
 from typing import Optional
 
+from ilastik.applets.objectExtraction.featureTable import RegionFeatures
 from ilastik.applets.objectExtraction.opObjectExtraction import OpObjectExtraction, OpObjectExtractionFromLabels
 from lazyflow.roi import roiToSlice
 import numpy
@@ -102,7 +103,7 @@ class SerialObjectFeaturesSlot(SerialSlot):
                 assert len(roi) == 2
                 assert len(roi[0]) == len(roi[1])
 
-                region_features = {}
+                region_features = RegionFeatures()
                 for key, val in roi_grp.items():
                     region_features[key] = {}
                     for featname, featval in val.items():
@@ -32,12 +32,15 @@ import vigra
 # lazyflow
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.request import Request, RequestPool
+from lazyflow.request import processPool
 from lazyflow.stype import Opaque
 from lazyflow.rtype import List, SubRegion
-from lazyflow.roi import roiToSlice
+from lazyflow.roi import getBlockBounds, getIntersectingBlocks, roiToSlice
 from lazyflow.operators.opLabelBase import OpLabelBase
 from lazyflow.operators.opRelabelConsecutive import OpRelabelConsecutive
 from lazyflow.operators import OpLabelVolume, OpCompressedCache, OpBlockedArrayCache
+from lazyflow.utility import Memory
+from lazyflow.utility.helpers import bigintprod
 from itertools import groupby, count
 
 import logging
@@ -48,6 +51,8 @@ from ilastik.plugins.manager import pluginManager
 
 
 from ilastik.applets.base.applet import DatasetConstraintError
+from ilastik.applets.objectExtraction.blockwiseRegionFeatures import PLUGIN_NAME, RegionStatistics, supports_blockwise
+from ilastik.applets.objectExtraction.featureTable import RegionFeatures
 
 # These features are always calculated, but not used for prediction.
 # They are needed by our gui, or by downstream applets.
@@ -487,6 +492,55 @@ class OpObjectExtraction(OpObjectExtractionBase):
         return opLabelVolume
 
 
+class _Axes(object):
+    """Indices of the x, y, z and c axes of a 4D image (picklable, unlike vigra.AxisTags)."""
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.x = keys.index("x")
+        self.y = keys.index("y")
+        self.z = keys.index("z")
+        self.c = keys.index("c")
+
+
+def _get_plugin_object(plugin_name, plugin_state):
+    plugin = pluginManager.getPluginByName(plugin_name, "ObjectFeatures")
+    assert plugin, f"object features plugin {plugin_name} missing!"
+    vars(plugin.plugin_object).update(plugin_state)
+    return plugin.plugin_object
+
+
+def _compute_global_features(plugin_name, plugin_state, image, labels, feature_dict, axes):
+    """
+    Kernel for the process pool (see OpRegionFeatures._extract): the global features of one plugin.
+    Also returns the plugin's attributes, which compute_global() may have changed.
+    """
+    plugin = _get_plugin_object(plugin_name, plugin_state)
+    image = vigra.taggedView(image, axes.keys)
+    labels = vigra.taggedView(labels, axes.keys.replace("c", ""))
+    features = plugin.compute_global(image, labels, feature_dict, axes)
+    return features, dict(vars(plugin))
+
+
+def _compute_local_features(
+    plugin_name, plugin_state, image, labels, mincoords, maxcoords, margin, feature_dict, axes, objects
+):
+    """
+    Kernel for the process pool (see OpRegionFeatures._extract): the local features of one plugin for the
+    given object indices.
+    """
+    plugin = _get_plugin_object(plugin_name, plugin_state)
+    image = vigra.taggedView(image, axes.keys)
+    labels = vigra.taggedView(labels, axes.keys.replace("c", ""))
+    return _compute_local_batch(plugin, image, labels, mincoords, maxcoords, margin, feature_dict, axes, objects)
+
+
+def _compute_local_batch(plugin, image, labels, mincoords, maxcoords, margin, feature_dict, axes, objects):
+    """The local features of the given object indices, computed in one batch by the plugin"""
+    batch = [(i + 1, OpRegionFeatures.compute_extent(i, image, mincoords, maxcoords, axes, margin)) for i in objects]
+    return plugin.compute_local_batch(image, labels, batch, feature_dict, axes)
+
+
 class OpRegionFeatures(Operator):
     """Produces region features for time-stacked 3d+c volumes
 
@@ -508,8 +562,26 @@ class OpRegionFeatures(Operator):
     * Output : a nested dictionary of features.
       Output[plugin name][feature name] = numpy.ndarray
 
+    If a lazyflow process pool is configured, plugins that are process_safe compute their features in the
+    pool's processes (see lazyflow.request.processPool).
+
+    Time slices that are too large to be processed in memory are processed blockwise, if only standard
+    features that can be merged over blocks are selected (see blockwiseRegionFeatures).
     """
 
+    processSafe = True
+
+    # Number of objects per process pool task (local features)
+    LOCAL_FEATURES_CHUNK_SIZE = 64
+    # Maximal number of objects per request (local features computed in this process)
+    LOCAL_FEATURES_BATCH_SIZE = 2048
+
+    # Time slices that would need more memory than this (in bytes, None: the RAM available for computations)
+    # to be processed in memory are processed blockwise, if all selected features support it.
+    BLOCKWISE_MIN_BYTES = None
+    # Block shape of the blockwise processing (see blockwiseRegionFeatures)
+    BLOCKWISE_BLOCK_SHAPE = {"x": 512, "y": 512, "z": 64}
+
     RawVolume = InputSlot()
     Atlas = InputSlot(optional=True)
     ObjectIDMapping = InputSlot(optional=True)
@@ -546,7 +618,13 @@ class OpRegionFeatures(Operator):
         t_ind = self.RawVolume.meta.axistags.index("t")
         assert t_ind < len(self.RawVolume.meta.shape)
 
+        use_blockwise = self._useBlockwise()
+
         def compute_features_for_time_slice(res_t_ind, t):
+            if use_blockwise:
+                result[res_t_ind] = self._extractBlockwise(t)
+                return
+
             axes4d = [k for k in self.RawVolume.meta.getTaggedShape().keys() if k in "xyzc"]
 
             # Process entire spatial volume
@@ -596,7 +674,8 @@ class OpRegionFeatures(Operator):
         pool.wait()
         return result
 
-    def compute_extent(self, i, image, mincoords, maxcoords, axes, margin):
+    @staticmethod
+    def compute_extent(i, image, mincoords, maxcoords, axes, margin):
         """Make a slicing to extract object i from the image."""
         # find the bounding box (margin is always 'xyz' order)
         result = [None] * 3
@@ -622,7 +701,8 @@ class OpRegionFeatures(Operator):
 
         return result
 
-    def compute_rawbbox(self, image, extent, axes):
+    @staticmethod
+    def compute_rawbbox(image, extent, axes):
         """essentially returns image[extent], preserving all channels."""
         key = copy(extent)
         key.insert(axes.c, slice(None))
@@ -674,6 +754,100 @@ class OpRegionFeatures(Operator):
             atlas_mapping[obj_idx] = atlas_value
         return atlas_mapping
 
+    def _useBlockwise(self) -> bool:
+        if not supports_blockwise(self.Features([]).wait()):
+            return False
+
+        tagged_shape = self.RawVolume.meta.getTaggedShape()
+        num_pixels = bigintprod(tagged_shape.get(k, 1) for k in "xyz")
+        # _extract() holds the raw and label volumes of a time slice and their float32/uint32 copies (vigra)
+        raw_bytes = tagged_shape.get("c", 1) * (numpy.dtype(self.RawVolume.meta.dtype).itemsize + 4)
+        label_bytes = numpy.dtype(self.LabelVolume.meta.dtype).itemsize + 4
+        min_bytes = self.BLOCKWISE_MIN_BYTES
+        if min_bytes is None:
+            min_bytes = Memory.getAvailableRamComputation()
+        return num_pixels * (raw_bytes + label_bytes) > min_bytes
+
+    def _extractBlockwise(self, t) -> Dict[str, Dict[str, numpy.ndarray]]:
+        """
+        The result of _extract() for time slice t, computed from the statistics of the objects in each block
+        of the time slice (see blockwiseRegionFeatures).
+        """
+        feature_names = self._augmentFeatureNames(deepcopy(self.Features([]).wait()))
+        tagged_shape = self.RawVolume.meta.getTaggedShape()
+        keys = list(tagged_shape.keys())
+        ndim = 3 if tagged_shape.get("z", 1) > 1 else 2
+        statistics = RegionStatistics(feature_names[PLUGIN_NAME], ndim, tagged_shape.get("c", 1))
+
+        def process_block(start, stop):
+            raw_req = self.RawVolume(start, stop)
+            raw_req.submit()
+            label_start, label_stop = list(start), list(stop)
+            if "c" in keys:
+                label_start[keys.index("c")], label_stop[keys.index("c")] = 0, 1
+            labels = self.LabelVolume(label_start, label_stop).wait()
+
+            labels = vigra.taggedView(labels, self.LabelVolume.meta.axistags).withAxes("x", "y", "z")
+            image = vigra.taggedView(raw_req.wait(), self.RawVolume.meta.axistags).withAxes("x", "y", "z", "c")
+            offset = [start[keys.index(k)] if k in keys else 0 for k in "xyz"]
+            statistics.update(labels, image, offset)
+
+        shape = self.RawVolume.meta.shape
+        block_shape = [self.BLOCKWISE_BLOCK_SHAPE.get(k, 1 if k == "t" else n) for k, n in tagged_shape.items()]
+        start, stop = [0] * len(shape), list(shape)
+        if "t" in keys:
+            start[keys.index("t")], stop[keys.index("t")] = t, t + 1
+
+        pool = RequestPool()
+        for block_start in getIntersectingBlocks(block_shape, (start, stop)):
+            pool.add(Request(partial(process_block, *getBlockBounds(shape, block_shape, block_start))))
+        pool.wait()
+
+        global_features = {PLUGIN_NAME: statistics.features()}
+
+        create_atlas_mapping = None
+        if self.Atlas.ready():
+            create_atlas_mapping = partial(self._atlasMappingBlockwise, t)
+
+        object_id_mapping = None
+        if self.ObjectIDMapping.ready():
+            object_id_mapping = self.ObjectIDMapping[t : t + 1].wait()[0]
+
+        extrafeats = self._defaultFeatures(feature_names, global_features, create_atlas_mapping, object_id_mapping)
+        return self._mergeFeatures(global_features, {}, extrafeats)
+
+    def _atlasMappingBlockwise(self, t, region_centers: numpy.ndarray) -> numpy.ndarray:
+        """_createAtlasMapping(), reading the atlas of time slice t only at the blocks that contain object centers"""
+        tagged_shape = self.Atlas.meta.getTaggedShape()
+        keys = list(tagged_shape.keys())
+        atlas_mapping = numpy.zeros((len(region_centers), tagged_shape.get("c", 1)), dtype=self.Atlas.meta.dtype)
+
+        # xyz coordinates of the centers (z = 0 in 2D)
+        coords = numpy.zeros((len(region_centers), 3), dtype=int)
+        coords[:, : region_centers.shape[1]] = region_centers.round()
+        block_shape = [self.BLOCKWISE_BLOCK_SHAPE[k] for k in "xyz"]
+        _, block_of_object = numpy.unique(coords // block_shape, axis=0, return_inverse=True)
+
+        def read_block(objects):
+            block_coords = coords[objects]
+            start, stop = [0] * len(keys), list(self.Atlas.meta.shape)
+            if "t" in keys:
+                start[keys.index("t")], stop[keys.index("t")] = t, t + 1
+            for axis, k in enumerate("xyz"):
+                if k in keys:
+                    start[keys.index(k)] = block_coords[:, axis].min()
+                    stop[keys.index(k)] = block_coords[:, axis].max() + 1
+            atlas = vigra.taggedView(self.Atlas(start, stop).wait(), self.Atlas.meta.axistags)
+            atlas = atlas.withAxes("x", "y", "z", "c")
+            block_coords = block_coords - block_coords.min(axis=0)
+            atlas_mapping[objects] = atlas[block_coords[:, 0], block_coords[:, 1], block_coords[:, 2]]
+
+        pool = RequestPool()
+        for block in range(block_of_object.max(initial=-1) + 1):
+            pool.add(Request(partial(read_block, numpy.flatnonzero(block_of_object == block))))
+        pool.wait()
+        return atlas_mapping
+
     def _extract(
         self, image, labels, atlas=None, object_id_mapping: Optional[dict[int, int]] = None
     ) -> Dict[str, Dict[str, numpy.ndarray]]:
@@ -689,14 +863,7 @@ class OpRegionFeatures(Operator):
                 "both images must be 4D. raw image shape: {} label image shape: {}".format(image.shape, labels.shape)
             )
 
-        # FIXME: maybe simplify? taggedShape should be easier here
-        class Axes(object):
-            x = image.axistags.index("x")
-            y = image.axistags.index("y")
-            z = image.axistags.index("z")
-            c = image.axistags.index("c")
-
-        axes = Axes()
+        axes = _Axes("".join(image.axistags.keys()))
 
         slc3d = [slice(None)] * 4  # FIXME: do not hardcode
         slc3d[axes.c] = 0
@@ -704,6 +871,12 @@ class OpRegionFeatures(Operator):
 
         labels = labels[slc3d]
 
+        # For plugins that compute their features in the process pool.
+        # (The volumes are only copied if the pool is used.)
+        use_process_pool = processPool.uses_process_pool(self)
+        shared_image = processPool.share(self, image)
+        shared_labels = processPool.share(self, labels)
+
         # These are the feature names, selected by the user and the default feature names.
         feature_names = deepcopy(self.Features([]).wait())
         feature_names = self._augmentFeatureNames(feature_names)
@@ -716,7 +889,22 @@ class OpRegionFeatures(Operator):
         def compute_for_one_plugin(plugin_name, feature_dict):
             plugin_inner = pluginManager.getPluginByName(plugin_name, "ObjectFeatures")
             assert plugin_inner, f"object features plugin {plugin_name} missing!"
-            global_features[plugin_name] = plugin_inner.plugin_object.compute_global(image, labels, feature_dict, axes)
+            plugin_object = plugin_inner.plugin_object
+            if use_process_pool and plugin_object.process_safe:
+                features, plugin_state = processPool.run_kernel(
+                    self,
+                    _compute_global_features,
+                    plugin_name,
+                    dict(vars(plugin_object)),
+                    shared_image,
+                    shared_labels,
+                    feature_dict,
+                    axes,
+                )
+                vars(plugin_object).update(plugin_state)
+                global_features[plugin_name] = features
+            else:
+                global_features[plugin_name] = plugin_object.compute_global(image, labels, feature_dict, axes)
 
         for plugin_name, feature_dict in feature_names.items():
             if plugin_name != default_features_key:
@@ -724,6 +912,83 @@ class OpRegionFeatures(Operator):
 
         pool.wait()
 
+        create_atlas_mapping = None if atlas is None else partial(self._createAtlasMapping, atlasImage=atlas)
+        extrafeats = self._defaultFeatures(feature_names, global_features, create_atlas_mapping, object_id_mapping)
+
+        # index in those have an -1 offset to object ids
+        mincoords = extrafeats["Coord<Minimum>"].astype(int)
+        maxcoords = extrafeats["Coord<Maximum>"].astype(int)
+        nobj = mincoords.shape[0]
+
+        local_features = collections.defaultdict(lambda: collections.defaultdict(list))
+        margin = max_margin(feature_names)
+
+        if numpy.any(margin):
+            for plugin_name, feature_dict in feature_names.items():
+                if not any("margin" in features for features in feature_dict.values()):
+                    continue
+
+                plugin = pluginManager.getPluginByName(plugin_name, "ObjectFeatures")
+                tmp_dicts = [None] * nobj
+
+                if use_process_pool and plugin.plugin_object.process_safe:
+                    # Chunks of objects, each in one process pool task
+                    def _calc_chunk(objects):
+                        tmp_dicts[objects.start : objects.stop] = processPool.run_kernel(
+                            self,
+                            _compute_local_features,
+                            plugin_name,
+                            dict(vars(plugin.plugin_object)),
+                            shared_image,
+                            shared_labels,
+                            mincoords,
+                            maxcoords,
+                            margin,
+                            feature_dict,
+                            axes,
+                            objects,
+                        )
+
+                    chunk_size = self.LOCAL_FEATURES_CHUNK_SIZE
+                    with RequestPool() as pool:
+                        for start in range(0, nobj, chunk_size):
+                            pool.add(Request(partial(_calc_chunk, range(start, min(start + chunk_size, nobj)))))
+                else:
+                    # Batches of objects, each in one request (objects start from 0,
+                    # we stripped the 0th background object in the global computation)
+                    def _calc_batch(objects):
+                        tmp_dicts[objects.start : objects.stop] = _compute_local_batch(
+                            plugin.plugin_object,
+                            image,
+                            labels,
+                            mincoords,
+                            maxcoords,
+                            margin,
+                            feature_dict,
+                            axes,
+                            objects,
+                        )
+
+                    num_workers = max(Request.global_thread_pool.num_workers, 1)
+                    batch_size = max(min(self.LOCAL_FEATURES_BATCH_SIZE, -(-nobj // num_workers)), 1)
+                    with RequestPool() as pool:
+                        for start in range(0, nobj, batch_size):
+                            pool.add(Request(partial(_calc_batch, range(start, min(start + batch_size, nobj)))))
+
+                # merge the results
+                for feature_dict in tmp_dicts:
+                    for feature_name, features in feature_dict.items():
+                        local_features[plugin_name][feature_name].append(features)
+
+        return self._mergeFeatures(global_features, local_features, extrafeats)
+
+    def _defaultFeatures(
+        self, feature_names, global_features, create_atlas_mapping=None, object_id_mapping=None
+    ) -> Dict[str, numpy.ndarray]:
+        """
+        Moves the default features out of the computed standard features (unless selected by the user),
+        and adds the atlas mapping (create_atlas_mapping(region_centers)) and original object ids.
+        """
         extrafeats = {}
         for feat_key in default_features:
             try:
@@ -740,8 +1005,8 @@ class OpRegionFeatures(Operator):
                 feature = global_features["Standard Object Features"][feat_key]
             extrafeats[feat_key] = feature
 
-        if atlas is not None:
-            extrafeats["AtlasMapping"] = self._createAtlasMapping(extrafeats["RegionCenter"], atlas)
+        if create_atlas_mapping is not None:
+            extrafeats["AtlasMapping"] = create_atlas_mapping(extrafeats["RegionCenter"])
 
         if object_id_mapping is not None:
             rev_mapping = {v: k for k, v in object_id_mapping.items()}
@@ -750,46 +1015,11 @@ class OpRegionFeatures(Operator):
             )
 
         extrafeats = dict((k.replace(" ", ""), v) for k, v in extrafeats.items())
+        return extrafeats
 
-        # index in those have an -1 offset to object ids
-        mincoords = extrafeats["Coord<Minimum>"].astype(int)
-        maxcoords = extrafeats["Coord<Maximum>"].astype(int)
-        nobj = mincoords.shape[0]
-
-        local_features = collections.defaultdict(lambda: collections.defaultdict(list))
-        margin = max_margin(feature_names)
-
-        if numpy.any(margin):
-            bboxes = {}
-            for plugin_name, feature_dict in feature_names.items():
-                if not any("margin" in features for features in feature_dict.values()):
-                    continue
-
-                plugin = pluginManager.getPluginByName(plugin_name, "ObjectFeatures")
-                tmp_dicts = [None] * nobj
-
-                def _calc_single(i, raw_bbox, binary_bbox):
-                    feats = plugin.plugin_object.compute_local(raw_bbox, binary_bbox, feature_dict, axes)
-                    tmp_dicts[i] = feats
-
-                with RequestPool() as pool:
-                    # starting from 0, we stripped 0th background object in global computation
-                    for i in range(nobj):
-                        logger.debug("processing object {}".format(i))
-                        if i not in bboxes:
-                            extent = self.compute_extent(i, image, mincoords, maxcoords, axes, margin)
-                            raw_bbox = self.compute_rawbbox(image, extent, axes)
-                            # it's i+1 here, because the background has label 0
-                            binary_bbox = labels[tuple(extent)] == i + 1
-                            bboxes[i] = (raw_bbox, binary_bbox)
-
-                        raw_bbox, binary_bbox = bboxes[i]
-                        pool.add(Request(partial(_calc_single, i, raw_bbox, binary_bbox)))
-
-                # merge the results
-                for feature_dict in tmp_dicts:
-                    for feature_name, features in feature_dict.items():
-                        local_features[plugin_name][feature_name].append(features)
+    def _mergeFeatures(self, global_features, local_features, extrafeats) -> Dict[str, Dict[str, numpy.ndarray]]:
+        """Merges the global, local and default features into the result of _extract()"""
+        nobj = extrafeats["Coord<Minimum>"].shape[0]
 
         logger.debug("computing done, removing failures")
         # remove local features that failed
@@ -833,7 +1063,7 @@ class OpRegionFeatures(Operator):
 
                 pfeats[key] = value
         logger.debug("merged, returning")
-        return all_features
+        return RegionFeatures(all_features)
 
     def propagateDirty(self, slot, subindex, roi):
         if slot is self.Features:
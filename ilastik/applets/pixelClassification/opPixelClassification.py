@@ -42,6 +42,7 @@ from lazyflow.operators import (
     OpPixelOperator,
     OpMaxChannelIndicatorOperator,
     OpCompressedUserLabelArray,
+    OpSparseUserLabelArray,
     OpFeatureMatrixCache,
 )
 from lazyflow.utility.data_semantics import ImageTypes
@@ -53,6 +54,7 @@ from lazyflow.classifiers import ParallelVigraRfLazyflowClassifierFactory
 
 # ilastik
 from ilastik.applets.base.applet import DatasetConstraintError
+from ilastik.config import cfg as ilastik_config
 from ilastik.utility.operatorSubView import OperatorSubView
 from ilastik.utility import OpMultiLaneWrapper
 from ilastik.utility.slottools import DtypeConvertFunction
@@ -204,6 +206,15 @@ class OpPixelClassification(Operator):
 
         self.LabelNames.notifyDirty(_updateNumClasses)
 
+        def _updateIncrementalTraining(*args):
+            """
+            While predictions are updated live, label changes only retrain a part of the classifier
+            (see ParallelVigraRfLazyflowClassifierFactory.update_and_train).
+            """
+            self.opTrain.IncrementalTraining.setValue(not self.FreezePredictions.value)
+
+        self.FreezePredictions.notifyDirty(_updateIncrementalTraining)
+
         # Prediction pipeline outputs -> Top-level outputs
         self.PredictionProbabilities.connect(self.opPredictionPipeline.PredictionProbabilities)
         self.PredictionProbabilitiesAutocontext.connect(self.opPredictionPipeline.PredictionProbabilitiesAutocontext)
@@ -425,7 +436,10 @@ class OpLabelPipeline(Operator):
     def __init__(self, *args, **kwargs):
         super(OpLabelPipeline, self).__init__(*args, **kwargs)
 
-        self.opLabelArray = OpCompressedUserLabelArray(parent=self)
+        if ilastik_config.getboolean("ilastik", "sparse_labels"):
+            self.opLabelArray = OpSparseUserLabelArray(parent=self)
+        else:
+            self.opLabelArray = OpCompressedUserLabelArray(parent=self)
         self.opLabelArray.Input.connect(self.LabelInput)
         self.opLabelArray.eraser.setValue(100)
 
@@ -14,7 +14,6 @@ from lazyflow.stype import Opaque
 
 from ilastik.applets.base.applet import DatasetConstraintError
 from ilastik.applets.objectExtraction.opObjectExtraction import (
-    default_features_key,
     OpRegionFeatures,
     OpAdaptTimeListRoi,
 )
@@ -24,7 +23,9 @@ from lazyflow.roi import sliceToRoi
 from .opRelabeledMergerFeatureExtraction import OpRelabeledMergerFeatureExtraction
 
 from functools import partial
-from lazyflow.request import Request, RequestPool
+from lazyflow.request import Request, RequestLock, RequestPool
+
+from .traxelStore import frame_traxels
 
 from hytra.core.jsongraph import (
     getMappingsBetweenUUIDsAndTraxels,
@@ -38,7 +39,6 @@ from hytra.core.ilastikhypothesesgraph import IlastikHypothesesGraph
 from hytra.core.fieldofview import FieldOfView
 from hytra.core.ilastikmergerresolver import IlastikMergerResolver
 from hytra.core.probabilitygenerator import ProbabilityGenerator
-from hytra.core.probabilitygenerator import Traxel
 from hytra.pluginsystem.plugin_manager import TrackingPluginManager
 from ilastik.utility.progress import DefaultProgressVisitor, CommandLineProgressVisitor
 
@@ -786,14 +786,8 @@ class OpConservationTracking(Operator):
 
         logger.info("generating traxels")
 
-        self.progressVisitor.showState("Object features")
-        self.progressVisitor.showProgress(0)
-
         traxelstore = ProbabilityGenerator()
 
-        logger.info("fetching region features and division probabilities")
-        feats = self.ObjectFeatures(time_range).wait()
-
         if with_div:
             if not self.DivisionProbabilities.ready() or len(self.DivisionProbabilities([0]).wait()[0]) == 0:
                 msgStr = (
@@ -802,12 +796,6 @@ class OpConservationTracking(Operator):
                     + "go back to the Division Detection applet and train it."
                 )
                 raise DatasetConstraintError("Tracking", msgStr)
-            self.progressVisitor.showState("Division probabilities")
-            self.progressVisitor.showProgress(0)
-            divProbs = self.DivisionProbabilities(time_range).wait()
-
-        if with_local_centers:
-            localCenters = self.RegionLocalCenters(time_range).wait()
 
         if with_classifier_prior:
             if not self.DetectionProbabilities.ready() or len(self.DetectionProbabilities([0]).wait()[0]) == 0:
@@ -816,158 +804,56 @@ class OpConservationTracking(Operator):
                     + "Go back to the Object Count Classification applet and train it."
                 )
                 raise DatasetConstraintError("Tracking", msgStr)
-            self.progressVisitor.showState("Detection probabilities")
-            self.progressVisitor.showProgress(0)
-            detProbs = self.DetectionProbabilities(time_range).wait()
 
         logger.info("filling traxelstore")
 
-        filtered_labels = {}
-        total_count = 0
-        empty_frame = False
-        numTimeStep = len(list(feats.keys()))
-        countT = 0
-
         stepStr = "Creating traxel store"
         self.progressVisitor.showState(stepStr + "                              ")
+        self.progressVisitor.showProgress(0)
 
-        for t in list(feats.keys()):
-            countT += 1
-            self.progressVisitor.showProgress(old_div(countT, float(numTimeStep)))
-
-            rc = feats[t][default_features_key]["RegionCenter"]
-            lower = feats[t][default_features_key]["Coord<Minimum>"]
-            upper = feats[t][default_features_key]["Coord<Maximum>"]
-            if rc.size:
-                rc = rc[1:, ...]
-                lower = lower[1:, ...]
-                upper = upper[1:, ...]
-
-            ct = feats[t][default_features_key]["Count"]
-            if ct.size:
-                ct = ct[1:, ...]
-
-            logger.debug("at timestep {}, {} traxels found".format(t, rc.shape[0]))
-            count = 0
-            filtered_labels_at = []
-            for idx in range(rc.shape[0]):
-                traxel = Traxel()
-
-                # for 2d data, set z-coordinate to 0:
-                if len(rc[idx]) == 2:
-                    x, y = rc[idx]
-                    z = 0
-                    x_lower, y_lower = lower[idx]
-                    x_upper, y_upper = upper[idx]
-                    z_lower = 0
-                    z_upper = 0
-                elif len(rc[idx]) == 3:
-                    x, y, z = rc[idx]
-                    x_lower, y_lower, z_lower = lower[idx]
-                    x_upper, y_upper, z_upper = upper[idx]
-                else:
-                    raise DatasetConstraintError(
-                        "Tracking", "The RegionCenter feature must have dimensionality 2 or 3."
-                    )
-
-                size = ct[idx]
-
-                if (
-                    x_upper < x_range[0]
-                    or x_lower >= x_range[1]
-                    or y_upper < y_range[0]
-                    or y_lower >= y_range[1]
-                    or z_upper < z_range[0]
-                    or z_lower >= z_range[1]
-                    or size < size_range[0]
-                    or size >= size_range[1]
-                ):
-                    filtered_labels_at.append(int(idx + 1))
-                    continue
-                else:
-                    count += 1
-
-                traxel.Id = int(idx + 1)
-                traxel.Timestep = int(t)
-                traxel.set_x_scale(x_scale)
-                traxel.set_y_scale(y_scale)
-                traxel.set_z_scale(z_scale)
-
-                # Expects always 3 coordinates, z=0 for 2d data
-                traxel.add_feature_array("com", 3)
-                for i, v in enumerate([x, y, z]):
-                    traxel.set_feature_value("com", i, float(v))
-
-                traxel.add_feature_array("CoordMinimum", 3)
-                for i, v in enumerate(lower[idx]):
-                    traxel.set_feature_value("CoordMinimum", i, float(v))
-                traxel.add_feature_array("CoordMaximum", 3)
-                for i, v in enumerate(upper[idx]):
-                    traxel.set_feature_value("CoordMaximum", i, float(v))
-
-                if with_div:
-                    traxel.add_feature_array("divProb", 2)
-                    # idx+1 because rc and ct start from 1, divProbs starts from 0
-                    prob = float(divProbs[t][idx + 1][1])
-                    prob = float(prob)
-                    if prob < 0.0000001:
-                        prob = 0.0000001
-                    if prob > 0.99999999:
-                        prob = 0.99999999
-                    traxel.set_feature_value("divProb", 0, 1.0 - prob)
-                    traxel.set_feature_value("divProb", 1, prob)
-
-                if with_classifier_prior:
-                    traxel.add_feature_array("detProb", len(detProbs[t][idx + 1]))
-                    for i, v in enumerate(detProbs[t][idx + 1]):
-                        val = float(v)
-                        if val < 0.0000001:
-                            val = 0.0000001
-                        if val > 0.99999999:
-                            val = 0.99999999
-                        traxel.set_feature_value("detProb", i, float(val))
-
-                # FIXME: check whether it is 2d or 3d data!
-                if with_local_centers:
-                    traxel.add_feature_array("localCentersX", len(localCenters[t][idx + 1]))
-                    traxel.add_feature_array("localCentersY", len(localCenters[t][idx + 1]))
-                    traxel.add_feature_array("localCentersZ", len(localCenters[t][idx + 1]))
-
-                    for i, v in enumerate(localCenters[t][idx + 1]):
-                        traxel.set_feature_value("localCentersX", i, float(v[0]))
-                        traxel.set_feature_value("localCentersY", i, float(v[1]))
-                        traxel.set_feature_value("localCentersZ", i, float(v[2]))
-
-                traxel.add_feature_array("count", 1)
-                traxel.set_feature_value("count", 0, float(size))
+        # Frames are independent: fetch the features and probabilities of each frame and build its traxels
+        # in a separate request
+        frames = {}
+        lock = RequestLock()
+
+        def generate_frame(t):
+            feats = self.ObjectFeatures([t]).wait()[t]
+            divProbs = self.DivisionProbabilities([t]).wait()[t] if with_div else None
+            detProbs = self.DetectionProbabilities([t]).wait()[t] if with_classifier_prior else None
+            localCenters = self.RegionLocalCenters([t]).wait()[t] if with_local_centers else None
+
+            frame = frame_traxels(
+                t,
+                feats,
+                x_range,
+                y_range,
+                z_range,
+                size_range,
+                (x_scale, y_scale, z_scale),
+                div_probs=divProbs,
+                det_probs=detProbs,
+                local_centers=localCenters,
+            )
+            with lock:
+                frames[t] = frame
+                self.progressVisitor.showProgress(len(frames) / float(len(time_range)))
+
+        pool = RequestPool()
+        for t in time_range:
+            pool.add(Request(partial(generate_frame, t)))
+        pool.wait()
 
-                if (
-                    x_upper < x_range[0]
-                    or x_lower >= x_range[1]
-                    or y_upper < y_range[0]
-                    or y_lower >= y_range[1]
-                    or z_upper < z_range[0]
-                    or z_lower >= z_range[1]
-                    or size < size_range[0]
-                    or size >= size_range[1]
-                ):
-                    logger.info("Omitting traxel with ID: {} {}".format(traxel.Id, t))
-                    print("Omitting traxel with ID: {} {}".format(traxel.Id, t))
-                else:
-                    logger.debug("Adding traxel with ID: {}  {}".format(traxel.Id, t))
-                    traxelstore.TraxelsPerFrame.setdefault(int(t), {})[int(idx + 1)] = traxel
+        filtered_labels = {}
+        for t in time_range:
+            traxels, filtered_labels_at = frames[t]
+            if traxels:
+                traxelstore.TraxelsPerFrame[int(t)] = traxels
+            else:
+                logger.info("Found empty frames for time {}".format(t))
 
             if len(filtered_labels_at) > 0:
                 filtered_labels[str(int(t) - time_range[0])] = filtered_labels_at
 
-            logger.debug("at timestep {}, {} traxels passed filter".format(t, count))
-
-            if count == 0:
-                empty_frame = True
-                logger.info("Found empty frames for time {}".format(t))
-
-            total_count += count
-
         self.parent.parent.trackingApplet.progressSignal(100)
         self.FilteredLabels.setValue(filtered_labels, check_changed=True)
 
@@ -0,0 +1,149 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+# 		   http://ilastik.org/license.html
+###############################################################################
+"""
+Traxels (tracking objects) of a frame, computed from the whole feature arrays of the frame.
+
+The objects of a frame are filtered by their bounding box and size with numpy masks, and the traxel
+features of all objects (center, bounding box, size, division and detection probabilities) are computed
+as arrays. Only the Traxel instances themselves are created per object. Frames are independent of each
+other, OpConservationTracking._generate_traxelstore builds them in parallel.
+"""
+import logging
+from typing import Dict, List, Mapping, Sequence, Tuple
+
+import numpy as np
+from hytra.core.probabilitygenerator import Traxel
+
+from ilastik.applets.base.applet import DatasetConstraintError
+from ilastik.applets.objectExtraction.opObjectExtraction import default_features_key
+
+logger = logging.getLogger(__name__)
+
+# Division and detection probabilities are clipped to this range
+MIN_PROBABILITY = 0.0000001
+MAX_PROBABILITY = 0.99999999
+
+
+def object_mask(
+    lower: np.ndarray,
+    upper: np.ndarray,
+    sizes: np.ndarray,
+    x_range: Sequence[int],
+    y_range: Sequence[int],
+    z_range: Sequence[int],
+    size_range: Sequence[int],
+) -> np.ndarray:
+    """
+    Which objects touch the x/y/z ranges (start inclusive, stop exclusive) and have a size within size_range.
+
+    :param lower: Coord<Minimum> of the objects, xyz (z = 0 for 2D data)
+    :param upper: Coord<Maximum> of the objects, xyz
+    :param sizes: Count of the objects
+    """
+    mask = (sizes >= size_range[0]) & (sizes < size_range[1])
+    for axis, (start, stop) in enumerate((x_range, y_range, z_range)):
+        mask &= (upper[:, axis] >= start) & (lower[:, axis] < stop)
+    return mask
+
+
+def _xyz(values, num_objects: int) -> np.ndarray:
+    """Coordinates of the objects (2 or 3 per object) as xyz, z = 0 for 2D data"""
+    values = np.asarray(values, dtype=np.float64).reshape(num_objects, -1)
+    if values.shape[1] not in (2, 3):
+        raise DatasetConstraintError("Tracking", "The RegionCenter feature must have dimensionality 2 or 3.")
+    xyz = np.zeros((num_objects, 3))
+    xyz[:, : values.shape[1]] = values
+    return xyz
+
+
+def frame_traxels(
+    t: int,
+    features: Mapping[str, Mapping[str, np.ndarray]],
+    x_range: Sequence[int],
+    y_range: Sequence[int],
+    z_range: Sequence[int],
+    size_range: Sequence[int],
+    scales: Sequence[float] = (1.0, 1.0, 1.0),
+    div_probs=None,
+    det_probs=None,
+    local_centers=None,
+) -> Tuple[Dict[int, Traxel], List[int]]:
+    """
+    The traxels of the objects of frame t that pass the filters (see object_mask), and the ids of the other objects.
+
+    :param features: object features of the frame, features[plugin name][feature name] (row 0: background)
+    :param scales: x, y and z scale of the traxels
+    :param div_probs: division probabilities of the objects of the frame (row 0: background), if divisions are tracked
+    :param det_probs: detection probabilities of the objects of the frame (row 0: background), if used as prior
+    :param local_centers: local centers (xyz) of each object of the frame (row 0: background), if used
+    :returns: object id -> traxel, and the list of filtered object ids
+    """
+    default_features = features[default_features_key]
+    num_objects = max(len(default_features["RegionCenter"]) - 1, 0)
+    logger.debug("at timestep {}, {} traxels found".format(t, num_objects))
+    if num_objects == 0:
+        return {}, []
+
+    centers = _xyz(default_features["RegionCenter"][1:], num_objects)
+    lower = _xyz(default_features["Coord<Minimum>"][1:], num_objects)
+    upper = _xyz(default_features["Coord<Maximum>"][1:], num_objects)
+    sizes = np.asarray(default_features["Count"], dtype=np.float64)[1:].reshape(num_objects)
+
+    mask = object_mask(lower, upper, sizes, x_range, y_range, z_range, size_range)
+    ids = np.flatnonzero(mask) + 1
+    filtered_ids = (np.flatnonzero(~mask) + 1).tolist()
+    if filtered_ids:
+        logger.debug("at timestep {}, omitting traxels with IDs {}".format(t, filtered_ids))
+
+    # Expects always 3 coordinates, z = 0 for 2d data
+    values = {
+        "com": centers[mask],
+        "CoordMinimum": lower[mask],
+        "CoordMaximum": upper[mask],
+        "count": sizes[mask, None],
+    }
+    if div_probs is not None:
+        prob = np.clip(np.asarray(div_probs, dtype=np.float64)[ids, 1], MIN_PROBABILITY, MAX_PROBABILITY)
+        values["divProb"] = np.stack([1.0 - prob, prob], axis=1)
+    if det_probs is not None:
+        values["detProb"] = np.clip(np.asarray(det_probs, dtype=np.float64)[ids], MIN_PROBABILITY, MAX_PROBABILITY)
+
+    traxels = {}
+    for row, object_id in enumerate(ids.tolist()):
+        traxel = Traxel()
+        traxel.Id = object_id
+        traxel.Timestep = int(t)
+        traxel.set_x_scale(scales[0])
+        traxel.set_y_scale(scales[1])
+        traxel.set_z_scale(scales[2])
+        for name, value in values.items():
+            traxel.Features[name] = value[row]
+
+        # FIXME: check whether it is 2d or 3d data!
+        if local_centers is not None:
+            object_centers = np.asarray(local_centers[object_id], dtype=np.float64).reshape(-1, 3)
+            for axis, name in enumerate(("localCentersX", "localCentersY", "localCentersZ")):
+                traxel.Features[name] = object_centers[:, axis].copy()
+
+        traxels[object_id] = traxel
+
+    logger.debug("at timestep {}, {} traxels passed filter".format(t, len(traxels)))
+    return traxels, filtered_ids
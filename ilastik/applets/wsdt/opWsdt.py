@@ -1,16 +1,23 @@
 from collections import OrderedDict
+from functools import partial
+import os
+import shutil
+import tempfile
+import threading
 import numpy as np
-from typing import Optional, Sequence
+from typing import Callable, Optional, Sequence
 
 from elf.segmentation.watershed import distance_transform_watershed
 from elf.parallel.common import get_blocking
 
 import vigra
+import zarr
+from numcodecs import Blosc
 
 from lazyflow.utility import OrderedSignal
-from lazyflow.request import Request
+from lazyflow.request import Request, RequestLock, RequestPool
 from lazyflow.graph import Operator, InputSlot, OutputSlot
-from lazyflow.roi import roiToSlice
+from lazyflow.roi import getBlockBounds, getIntersectingBlocks, getIntersection, roiToSlice
 from lazyflow.operators import OpBlockedArrayCache, OpMetadataInjector
 from lazyflow.operators.generic import OpPixelOperator
 from lazyflow.utility.timer import Timer
@@ -22,6 +29,40 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def default_block_shape(ndim: int):
+    """Block shape of the blockwise watershed: 512 for 2D, 128 for 3D in each spatial dimension"""
+    return (512 if ndim == 2 else 128,) * ndim
+
+
+def _watershed_block(
+    data: np.ndarray,
+    inner_local_slicing,
+    threshold: float,
+    sigma_seeds: float,
+    sigma_weights: float,
+    minsize: int,
+    alpha: float,
+    pixel_pitch: Sequence[float],
+    non_max_suppression: bool,
+):
+    """Watershed of a block with halo, cropped to the inner block (labels start at 1)."""
+    ws_outer, _ = distance_transform_watershed(
+        data,
+        threshold,
+        sigma_seeds,
+        sigma_weights,
+        minsize,
+        alpha,
+        pixel_pitch,
+        non_max_suppression,
+    )
+
+    # elf started returning uint64 in 0.46. Casting here is not dangerous.
+    # Up to now vigra is still used to produce the watershed in elf internally.
+    ws_outer = ws_outer.astype("uint32")
+    return vigra.analysis.labelMultiArray(ws_outer[inner_local_slicing])
+
+
 def parallel_watershed(
     data: np.ndarray,
     threshold: float,
@@ -61,9 +102,8 @@ def parallel_watershed(
 
     assert ndim in [2, 3], "Watershed segmentor will only work on 2D and 3D data"
 
-    base_block = 512 if ndim == 2 else 128
     # check for None arguments and set to default values
-    block_shape = (base_block,) * ndim if block_shape is None else block_shape
+    block_shape = default_block_shape(ndim) if block_shape is None else block_shape
     # nifty requires the halo shape to be of type list
     halo = [10] * ndim if halo is None else halo
 
@@ -90,9 +130,9 @@ def parallel_watershed(
         inner_local_slicing = roiToSlice(block.innerBlockLocal.begin, block.innerBlockLocal.end)
 
         with Timer() as btimer:
-            # write watershed result to the label array
-            ws_outer, _ = distance_transform_watershed(
+            ws_inner = _watershed_block(
                 data[outer_slicing],
+                inner_local_slicing,
                 threshold,
                 sigma_seeds,
                 sigma_weights,
@@ -106,11 +146,7 @@ def parallel_watershed(
             f"processing block {block_index} {block.outerBlock.begin}-{block.outerBlock.end} took {btimer.seconds()}"
         )
 
-        # elf started returning uint64 in 0.46. Casting here is not dangerous.
-        # Up to now vigra is still used to produce the watershed in elf internally.
-        ws_outer = ws_outer.astype("uint32")
-        ws_inner = vigra.analysis.labelMultiArray(ws_outer[inner_local_slicing])
-
+        # write watershed result to the label array
         labels[inner_slicing] = ws_inner
         # return the max-id for this block, that will be used as offset
         return ws_inner.max()
@@ -136,6 +172,168 @@ def parallel_watershed(
     return labels, offsets[-1]
 
 
+class OutOfCoreLabels:
+    """
+    Result of out_of_core_watershed: labels of a blockwise watershed in a chunked zarr array on disk.
+
+    Each block is stored with its own labels (starting at 1), the offset that makes them globally
+    unique is added when reading. So only the blocks that are read have to be in memory.
+    """
+
+    class Removed(Exception):
+        """read() was called after remove()"""
+
+    def __init__(self, directory: str, labels: zarr.Array, block_shape: Sequence[int], offsets: dict, max_id: int):
+        self.directory = directory
+        self.labels = labels
+        self.block_shape = tuple(block_shape)
+        # block start -> offset of the block's labels
+        self._offsets = offsets
+        self.max_id = max_id
+        # The directory is only deleted when no read() is in progress anymore
+        self._lock = threading.Lock()
+        self._readers = 0
+        self._removed = False
+
+    @property
+    def shape(self):
+        return self.labels.shape
+
+    def read(self, start: Sequence[int], stop: Sequence[int], out: Optional[np.ndarray] = None):
+        """Read the (globally unique) labels in the roi [start, stop).
+
+        Raises OutOfCoreLabels.Removed if remove() has been called before.
+        """
+        with self._lock:
+            if self._removed:
+                raise OutOfCoreLabels.Removed(self.directory)
+            self._readers += 1
+        try:
+            return self._read(start, stop, out)
+        finally:
+            with self._lock:
+                self._readers -= 1
+                delete = self._removed and self._readers == 0
+            if delete:
+                self._delete()
+
+    def _read(self, start, stop, out):
+        start = np.asarray(start)
+        stop = np.asarray(stop)
+        if out is None:
+            out = np.empty(tuple(stop - start), dtype=np.uint32)
+        for block_start in getIntersectingBlocks(self.block_shape, (start, stop)):
+            block_roi = getBlockBounds(self.shape, self.block_shape, block_start)
+            intersection = getIntersection((start, stop), block_roi)
+            block_data = self.labels[roiToSlice(*intersection)]
+            block_data += self._offsets[tuple(block_roi[0])]
+            out[roiToSlice(*np.subtract(intersection, start))] = block_data
+        return out
+
+    def remove(self):
+        """Delete the scratch directory, as soon as the reads in progress are finished"""
+        with self._lock:
+            self._removed = True
+            delete = self._readers == 0
+        if delete:
+            self._delete()
+
+    def _delete(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def out_of_core_watershed(
+    read_block: Callable[[Sequence[int], Sequence[int]], np.ndarray],
+    shape: Sequence[int],
+    threshold: float,
+    sigma_seeds: float,
+    sigma_weights: float,
+    minsize: int,
+    alpha: float,
+    pixel_pitch: Sequence[float],
+    non_max_suppression: bool,
+    block_shape: Optional[Sequence[int]] = None,
+    halo: Optional[Sequence[int]] = None,
+    directory: Optional[str] = None,
+) -> OutOfCoreLabels:
+    """Blockwise dt watershed for data that doesn't fit into memory.
+
+    Same result as parallel_watershed, but the data is read block by block (with halo) via read_block,
+    and the labels are written to a zarr array in a scratch directory. Only the labels of the blocks
+    that are currently processed are kept in memory. The offsets that make the labels globally unique
+    are computed from the maximum label of each block afterwards and added when reading the result.
+
+    Args:
+      read_block: function that returns the data in the roi [begin, end) as an ndarray with 2 or 3 dims
+      shape: shape of the data
+      threshold, sigma_seeds, sigma_weights, minsize, alpha, pixel_pitch, non_max_suppression:
+        see parallel_watershed
+      block_shape: size of blocks to process, defaults to 128 for 3D, 512 for 2D in each spacial dimension
+      halo: portion of each block to discard after processing for smoother boundary regions
+        if not specified: 10 voxels around the block in each direction
+      directory: scratch directory for the labels, a new temporary directory (in $TMPDIR) if not specified.
+        It is deleted by OutOfCoreLabels.remove.
+
+    """
+    ndim = len(shape)
+
+    assert ndim in [2, 3], "Watershed segmentor will only work on 2D and 3D data"
+
+    block_shape = default_block_shape(ndim) if block_shape is None else tuple(block_shape)
+    # nifty requires the halo shape to be of type list
+    halo = [10] * ndim if halo is None else halo
+    directory = tempfile.mkdtemp(prefix="ilastik-wsdt-") if directory is None else directory
+
+    # One chunk per block, so blocks can be written in parallel
+    labels = zarr.open_array(
+        os.path.join(directory, "labels.zarr"),
+        mode="w",
+        shape=tuple(shape),
+        chunks=block_shape,
+        dtype=np.uint32,
+        compressor=Blosc(cname="lz4", clevel=5, shuffle=Blosc.SHUFFLE),
+    )
+
+    blocking = get_blocking(labels, block_shape, roi=None, n_threads=1)
+    n_blocks = blocking.numberOfBlocks
+    max_ids = np.zeros(n_blocks, dtype=np.int64)
+
+    def ws_block(block_index):
+        block = blocking.getBlockWithHalo(blockIndex=block_index, halo=halo)
+        inner_slicing = roiToSlice(block.innerBlock.begin, block.innerBlock.end)
+        inner_local_slicing = roiToSlice(block.innerBlockLocal.begin, block.innerBlockLocal.end)
+
+        ws_inner = _watershed_block(
+            read_block(block.outerBlock.begin, block.outerBlock.end),
+            inner_local_slicing,
+            threshold,
+            sigma_seeds,
+            sigma_weights,
+            minsize,
+            alpha,
+            pixel_pitch,
+            non_max_suppression,
+        )
+        labels[inner_slicing] = ws_inner
+        max_ids[block_index] = ws_inner.max()
+
+    with Timer() as wstimer:
+        pool = RequestPool()
+        for block_index in range(n_blocks):
+            pool.add(Request(partial(ws_block, block_index)))
+        pool.wait()
+
+    logger.info(f"out-of-core ws of {n_blocks} blocks took {wstimer.seconds()} s")
+
+    # Offsets in block order, as in parallel_watershed
+    ends = np.cumsum(max_ids)
+    offsets = {
+        tuple(blocking.getBlock(block_index).begin): int(ends[block_index] - max_ids[block_index])
+        for block_index in range(n_blocks)
+    }
+    return OutOfCoreLabels(directory, labels, block_shape, offsets, int(ends[-1]))
+
+
 class OpWsdt(Operator):
     # Can be multi-channel (but you'll have to choose which channels you want to use)
     Input = InputSlot()
@@ -156,6 +354,10 @@ class OpWsdt(Operator):
 
     BlockwiseWatershed = InputSlot(value=True)
 
+    # Compute the (blockwise) watershed of the whole volume block by block, and keep the labels
+    # on disk (see out_of_core_watershed), for volumes that don't fit into memory.
+    OutOfCore = InputSlot(value=False)
+
     Superpixels = OutputSlot()
 
     def __init__(self, *args, **kwargs):
@@ -163,6 +365,11 @@ class OpWsdt(Operator):
         self.debug_results = None
         self.watershed_completed = OrderedSignal()
 
+        self._out_of_core_lock = RequestLock()
+        self._out_of_core_labels = None
+        # Incremented whenever the result becomes invalid
+        self._out_of_core_generation = 0
+
         self._opSelectedInput = OpSumChannels(parent=self)
         self._opSelectedInput.ChannelSelections.connect(self.ChannelSelections)
         self._opSelectedInput.InvertPixelProbabilities.connect(self.InvertPixelProbabilities)
@@ -178,6 +385,8 @@ class OpWsdt(Operator):
         self.Superpixels.meta.shape = self.Input.meta.shape[:-1] + (1,)
         self.Superpixels.meta.dtype = np.uint32
         self.Superpixels.meta.display_mode = "random-colortable"
+        if self.OutOfCore.value:
+            self.Superpixels.meta.ideal_blockshape = default_block_shape(len(self.Input.meta.shape) - 1) + (1,)
 
         self.debug_results = None
         if self.EnableDebugOutputs.value:
@@ -186,16 +395,22 @@ class OpWsdt(Operator):
     def execute(self, slot, subindex, roi, result):
         assert slot is self.Superpixels, "Unknown or unconnected output slot: {}".format(slot)
 
+        if self.OutOfCore.value:
+            while True:
+                labels = self._getOutOfCoreLabels()
+                try:
+                    labels.read(roi.start[:-1], roi.stop[:-1], out=result[..., 0])
+                    return
+                except OutOfCoreLabels.Removed:
+                    # The input changed after we got the labels
+                    continue
+
         pmap = self._opSelectedInput.Output(roi.start, roi.stop).wait()
 
         if self.debug_results:
             self.debug_results.clear()
 
-        # distance_transform_watershed expects a default value of None for pixel_pitch.
-        if self.PixelPitch.value == []:
-            pixel_pitch_to_pass = None
-        else:
-            pixel_pitch_to_pass = self.PixelPitch.value
+        pixel_pitch_to_pass = self._pixelPitch()
 
         max_workers = max(1, Request.global_thread_pool.num_workers)
 
@@ -233,8 +448,58 @@ class OpWsdt(Operator):
 
         self.watershed_completed()
 
+    def _pixelPitch(self):
+        # distance_transform_watershed expects a default value of None for pixel_pitch.
+        if self.PixelPitch.value == []:
+            return None
+        return self.PixelPitch.value
+
+    def _getOutOfCoreLabels(self):
+        """Compute the out-of-core watershed of the whole volume, unless there is a valid result already."""
+        computed = False
+        with self._out_of_core_lock:
+            while self._out_of_core_labels is None:
+                generation = self._out_of_core_generation
+
+                def read_block(begin, end):
+                    return self._opSelectedInput.Output(tuple(begin) + (0,), tuple(end) + (1,)).wait()[..., 0]
+
+                labels = out_of_core_watershed(
+                    read_block,
+                    self._opSelectedInput.Output.meta.shape[:-1],
+                    self.Threshold.value,
+                    self.Sigma.value,
+                    self.Sigma.value,
+                    self.MinSize.value,
+                    self.Alpha.value,
+                    self._pixelPitch(),
+                    self.ApplyNonmaxSuppression.value,
+                )
+                if generation == self._out_of_core_generation:
+                    self._out_of_core_labels = labels
+                    computed = True
+                else:
+                    # The input changed while we were computing
+                    labels.remove()
+            labels = self._out_of_core_labels
+
+        if computed:
+            self.watershed_completed()
+        return labels
+
+    def _discardOutOfCoreLabels(self):
+        self._out_of_core_generation += 1
+        labels, self._out_of_core_labels = self._out_of_core_labels, None
+        if labels is not None:
+            labels.remove()
+
+    def cleanUp(self):
+        self._discardOutOfCoreLabels()
+        super().cleanUp()
+
     def propagateDirty(self, slot, subindex, roi):
         if slot is not self.EnableDebugOutputs:
+            self._discardOutOfCoreLabels()
             self.Superpixels.setDirty()
 
 
@@ -256,6 +521,7 @@ class OpCachedWsdt(Operator):
     EnableDebugOutputs = InputSlot(value=False)
 
     BlockwiseWatershed = InputSlot(value=True)
+    OutOfCore = InputSlot(value=False)
 
     Superpixels = OutputSlot()
 
@@ -289,6 +555,7 @@ class OpCachedWsdt(Operator):
         self._opWsdt.InvertPixelProbabilities.connect(self.InvertPixelProbabilities)
         self._opWsdt.EnableDebugOutputs.connect(self.EnableDebugOutputs)
         self._opWsdt.BlockwiseWatershed.connect(self.BlockwiseWatershed)
+        self._opWsdt.OutOfCore.connect(self.OutOfCore)
 
         self._opCache = OpBlockedArrayCache(parent=self)
         self._opCache.fixAtCurrent.connect(self.FreezeCache)
@@ -317,6 +584,13 @@ class OpCachedWsdt(Operator):
         self.ThresholdedInput.connect(self._opThreshold.Output)
 
     def setupOutputs(self):
+        ndim = len(self.Input.meta.shape)
+        if self.OutOfCore.value:
+            # Cache (and save) the superpixels block by block, not the whole volume at once.
+            self._opCache.BlockShape.setValue(default_block_shape(ndim - 1) + (1,))
+        else:
+            self._opCache.BlockShape.setValue((None,) * ndim)
+
         threshold = self.Threshold.value
         if threshold != self._opThreshold._last_threshold:
             self._opThreshold._last_threshold = threshold
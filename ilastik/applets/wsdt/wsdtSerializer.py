@@ -71,6 +71,7 @@ class WsdtSerializer(AppletSerializer):
             SerialSlot(operator.Alpha),
             SerialSlot(operator.PixelPitch),
             SerialDefaultSlot(operator.BlockwiseWatershed, default=False),
+            SerialSlot(operator.OutOfCore),
             SerialBlockSlot(
                 operator.Superpixels,
                 operator.SuperpixelCacheInput,
@@ -50,10 +50,17 @@ debug: false
 plugin_directories: ~/.ilastik/plugins,
 output_filename_format: {dataset_dir}/{nickname}_{result_type}
 output_format: compressed hdf5
+sparse_labels: false
+lazy_project_loading: true
 
 [lazyflow]
 threads: -1
+processes: 0
 total_ram_mb: 0
+feature_cache_dir:
+feature_cache_max_mb: 10240
+chunk_cache_max_mb:
+prefetch_blocks:
 """
 
 
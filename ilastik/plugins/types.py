@@ -31,6 +31,11 @@ class ObjectFeaturesPlugin(IPlugin):
 
     name = "Base object features plugin"
 
+    # Plugins that set this to True may compute their features in a separate process
+    # (see lazyflow.request.processPool). The plugin's instance attributes are pickled
+    # and copied to the process, so they must be picklable.
+    process_safe = False
+
     # TODO for now, only one margin will be set in the dialog. however, it
     # should be repeated for each feature, because in the future it
     # might be different, or each feature might take other parameters.
@@ -80,6 +85,30 @@ class ObjectFeaturesPlugin(IPlugin):
         """
         return dict()
 
+    def compute_local_batch(self, image, labels, objects, features, axes):
+        """Calculate features on a batch of objects.
+
+        Plugins may override this to process many (small) objects at
+        once. By default, compute_local is called for each object.
+
+        :param image: np.ndarray - the whole image
+        :param labels: np.ndarray - the whole label image, without channel axis
+        :param objects: list of (label, extent), where extent is the
+            slicing of the expanded bounding box of the object in labels
+        :param features: which features to compute
+        :param axes: axis tags
+
+        :returns: a list with the result of compute_local for each object
+
+        """
+        results = []
+        for label, extent in objects:
+            key = list(extent)
+            key.insert(axes.c, slice(None))
+            # image[key] is a view, only the binary bounding box is copied
+            results.append(self.compute_local(image[tuple(key)], labels[tuple(extent)] == label, features, axes))
+        return results
+
     def fill_properties(self, feature_dict):
         """
         For every feature in the feature dictionary, fill in its properties,
@@ -68,6 +68,7 @@ class VigraObjFeats(ObjectFeaturesPlugin):
     local_out_suffixes = [local_suffix, " in object and neighborhood"]
 
     ndim = None
+    process_safe = True
 
     def availableFeatures(self, image, labels):
         names = vigra.analysis.supportedRegionFeatures(image, labels)
@@ -277,13 +278,16 @@ class VigraObjFeats(ObjectFeaturesPlugin):
 
         return self._do_4d(image, labels, features, axes)
 
-    def compute_local(self, image, binary_bbox, feature_dict, axes):
-        """helper that deals with individual objects"""
-
+    def _local_feature_names(self, feature_dict):
         featurenames = list(feature_dict.keys())
         local = [x + self.local_suffix for x in self.local_features]
         featurenames = list(set(featurenames) & set(local))
-        featurenames = [x.split(" ")[0] for x in featurenames]
+        return [x.split(" ")[0] for x in featurenames]
+
+    def compute_local(self, image, binary_bbox, feature_dict, axes):
+        """helper that deals with individual objects"""
+
+        featurenames = self._local_feature_names(feature_dict)
         results = []
         margin = ilastik.applets.objectExtraction.opObjectExtraction.max_margin({"": feature_dict})
         # FIXME: this is done globally as if all the features have the same margin
@@ -295,3 +299,55 @@ class VigraObjFeats(ObjectFeaturesPlugin):
             result = self._do_4d(image, label, featurenames, axes)
             results.append(self.update_keys(result, suffix=suffix))
         return self.combine_dicts(results)
+
+    def compute_local_batch(self, image, labels, objects, feature_dict, axes):
+        """
+        All local features are statistics of the intensities in the object neighborhoods, so the
+        neighborhood pixels of all objects are packed into one image and computed in one vigra call.
+        """
+        featurenames = self._local_feature_names(feature_dict)
+        if "Histogram" in featurenames:
+            # The histogram range is taken from all pixels of the bounding box of each object
+            return super().compute_local_batch(image, labels, objects, feature_dict, axes)
+
+        margin = ilastik.applets.objectExtraction.opObjectExtraction.max_margin({"": feature_dict})
+        # suffix -> intensities (pixels x channels) in the region of each object
+        regions = {suffix: [] for suffix in self.local_out_suffixes}
+        for label, extent in objects:
+            key = list(extent)
+            key.insert(axes.c, slice(None))
+            raw_bbox = np.moveaxis(np.asarray(image[tuple(key)]), axes.c, -1)
+            binary_bbox = labels[tuple(extent)] == label
+            passed, excl = ilastik.applets.objectExtraction.opObjectExtraction.make_bboxes(binary_bbox, margin)
+            for mask, suffix in zip([excl, passed], self.local_out_suffixes):
+                regions[suffix].append(raw_bbox[mask.reshape(raw_bbox.shape[:-1])])
+
+        results = [{} for _ in objects]
+        for suffix, values in regions.items():
+            for i, features in enumerate(self._do_packed(values, featurenames)):
+                results[i].update(self.update_keys(features, suffix=suffix))
+        return results
+
+    def _do_packed(self, values, features):
+        """_do_4d() for the pixels (pixels x channels) of each object, in one call"""
+        counts = np.array([len(v) for v in values])
+        nobj = len(values)
+        if counts.sum() == 0:
+            return [dict((cleanup_key(f), np.zeros((0, 1), dtype=np.float32)) for f in features) for _ in values]
+
+        image = np.concatenate(values).astype(np.float32)[:, None, :]
+        labels = np.repeat(np.arange(1, nobj + 1, dtype=np.uint32), counts)[:, None]
+        result = vigra.analysis.extractRegionFeatures(
+            vigra.taggedView(image, "xyc"), vigra.taggedView(labels, "xy"), features, ignoreLabel=0
+        )
+        # rows of objects 1..(last object with pixels)
+        cleaned = cleanup(result, result[features[0]].shape[0], features)
+
+        per_object = []
+        for i, count in enumerate(counts):
+            if count == 0:
+                # like _do_4d: no rows for objects without pixels in the region
+                per_object.append(dict((k, v[:0]) for k, v in cleaned.items()))
+            else:
+                per_object.append(dict((k, v[i : i + 1]) for k, v in cleaned.items()))
+        return per_object
@@ -54,6 +54,7 @@ class VigraConvexHullObjFeats(ObjectFeaturesPlugin):
     local_preffix = "Convex Hull "  # note the space at the end, it's important
 
     ndim = None
+    process_safe = True
 
     def availableFeatures(self, image, labels):
         if labels.ndim == 2:
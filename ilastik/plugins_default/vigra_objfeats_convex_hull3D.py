@@ -35,6 +35,7 @@ class VigraConvexHullObjFeats3D(ObjectFeaturesPlugin):
     local_preffix = "Convex Hull "  # note the space at the end, it's important
 
     ndim = None
+    process_safe = True
 
     def availableFeatures(self, image, labels):
 
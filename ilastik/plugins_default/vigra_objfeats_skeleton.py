@@ -51,6 +51,7 @@ class VigraSkeletonObjFeats(ObjectFeaturesPlugin):
     local_preffix = "Skeleton "  # note the space at the end, it's important
 
     ndim = None
+    process_safe = True
 
     def availableFeatures(self, image, labels):
         names = vigra.analysis.supportedSkeletonFeatures(labels)
@@ -131,6 +131,8 @@ class CountingWorkflow(Workflow):
         # This means the classifier will be marked 'dirty' even though it is still usable.
         # Before that happens, let's store the classifier, so we can restore it at the end of connectLane(), below.
         opCounting = self.countingApplet.topLevelOperator
+        # (In headless mode, the classifier may not have been loaded from the project file yet)
+        opCounting.classifier_cache.Output.loadDeferred()
         if opCounting.classifier_cache.Output.ready() and not opCounting.classifier_cache._dirty:
             self.stored_classifier = opCounting.classifier_cache.Output.value
         else:
@@ -185,6 +187,8 @@ class CountingWorkflow(Workflow):
             if csv_path:
                 self.dataExportApplet.topLevelOperator.CsvFilepath.setValue(csv_path)
 
+            # Load the classifier now if it has been deferred, so that we know whether there is one
+            self.countingApplet.topLevelOperator.classifier_cache.Output.loadDeferred()
             if self.countingApplet.topLevelOperator.classifier_cache._dirty:
                 logger.warning("Your project file has no classifier. A new classifier will be trained for this run.")
 
@@ -226,6 +226,8 @@ class NewAutocontextWorkflowBase(Workflow):
         self.stored_classifers = []
         for pcApplet in self.pcApplets:
             opPixelClassification = pcApplet.topLevelOperator
+            # (In headless mode, the classifier may not have been loaded from the project file yet)
+            opPixelClassification.classifier_cache.Output.loadDeferred()
             if (
                 opPixelClassification.classifier_cache.Output.ready()
                 and not opPixelClassification.classifier_cache._dirty
@@ -458,6 +460,8 @@ class NewAutocontextWorkflowBase(Workflow):
 
         if self._batch_input_args:
             for pcApplet in self.pcApplets:
+                # Load the classifier now if it has been deferred, so that we know whether there is one
+                pcApplet.topLevelOperator.classifier_cache.Output.loadDeferred()
                 if pcApplet.topLevelOperator.classifier_cache._dirty:
                     logger.warning(
                         "At least one of your classifiers is not yet trained.  "
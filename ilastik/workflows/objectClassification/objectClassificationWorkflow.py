@@ -243,6 +243,8 @@ class ObjectClassificationWorkflow(Workflow):
 
     def prepareForNewLane(self, laneIndex):
         opObjectClassification = self.objectClassificationApplet.topLevelOperator
+        # (In headless mode, the classifier may not have been loaded from the project file yet)
+        opObjectClassification.classifier_cache.Output.loadDeferred()
         if (
             opObjectClassification.classifier_cache.Output.ready()
             and not opObjectClassification.classifier_cache._dirty
@@ -634,6 +636,7 @@ class ObjectClassificationWorkflowPixel(ObjectClassificationWorkflow):
 
     def prepareForNewLane(self, laneIndex):
         opPixelClassification = self.pcApplet.topLevelOperator
+        opPixelClassification.classifier_cache.Output.loadDeferred()
         if opPixelClassification.classifier_cache.Output.ready() and not opPixelClassification.classifier_cache._dirty:
             self.stored_pixel_classifier = opPixelClassification.classifier_cache.Output.value
         else:
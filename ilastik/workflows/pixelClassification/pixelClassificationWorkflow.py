@@ -223,6 +223,8 @@ class PixelClassificationWorkflow(Workflow):
         # This means the classifier will be marked 'dirty' even though it is still usable.
         # Before that happens, let's store the classifier, so we can restore it in handleNewLanesAdded(), below.
         opPixelClassification = self.pcApplet.topLevelOperator
+        # (In headless mode, the classifier may not have been loaded from the project file yet)
+        opPixelClassification.classifier_cache.Output.loadDeferred()
         if opPixelClassification.classifier_cache.Output.ready() and not opPixelClassification.classifier_cache._dirty:
             self.stored_classifier = opPixelClassification.classifier_cache.Output.value
         else:
@@ -374,8 +376,11 @@ class PixelClassificationWorkflow(Workflow):
         if self._batch_export_args:
             self.dataExportApplet.configure_operator_with_parsed_args(self._batch_export_args)
 
-        if self._batch_input_args and self.pcApplet.topLevelOperator.classifier_cache._dirty:
-            logger.warning("Your project file has no classifier.  A new classifier will be trained for this run.")
+        if self._batch_input_args:
+            # Load the classifier now if it has been deferred, so that we know whether there is one
+            self.pcApplet.topLevelOperator.classifier_cache.Output.loadDeferred()
+            if self.pcApplet.topLevelOperator.classifier_cache._dirty:
+                logger.warning("Your project file has no classifier.  A new classifier will be trained for this run.")
 
         if self._headless and self._batch_input_args and self._batch_export_args:
             logger.info("Beginning Batch Processing")
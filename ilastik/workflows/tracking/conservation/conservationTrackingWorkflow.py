@@ -196,6 +196,8 @@ class ConservationTrackingWorkflowBase(Workflow):
         # Store division and cell classifiers
         if self.divisionDetectionApplet:
             opDivisionClassification = self.divisionDetectionApplet.topLevelOperator
+            # (In headless mode, the classifier may not have been loaded from the project file yet)
+            opDivisionClassification.classifier_cache.Output.loadDeferred()
             if (
                 opDivisionClassification.classifier_cache.Output.ready()
                 and not opDivisionClassification.classifier_cache._dirty
@@ -205,6 +207,7 @@ class ConservationTrackingWorkflowBase(Workflow):
                 self.stored_division_classifier = None
 
         opCellClassification = self.cellClassificationApplet.topLevelOperator
+        opCellClassification.classifier_cache.Output.loadDeferred()
         if opCellClassification.classifier_cache.Output.ready() and not opCellClassification.classifier_cache._dirty:
             self.stored_cell_classifier = opCellClassification.classifier_cache.Output.value
         else:
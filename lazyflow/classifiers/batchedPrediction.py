@@ -0,0 +1,199 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+import collections
+import logging
+
+import numpy
+
+from lazyflow.request import Request, RequestLock, RequestPool
+
+logger = logging.getLogger(__name__)
+
+
+class _Submission(object):
+    __slots__ = ("features", "out", "done", "error", "wakeup")
+
+    def __init__(self, features, num_classes):
+        self.features = features
+        self.out = numpy.empty((len(features), num_classes), dtype=numpy.float32)
+        self.done = False
+        self.error = None
+        # Held until the submission is done, or its caller has to take over the batching.
+        self.wakeup = RequestLock()
+        self.wakeup.acquire()
+
+
+class BatchedForestPredictor(object):
+    """
+    Predicts with a forest-of-forests, coalescing concurrent calls into batches.
+
+    Blocks that are predicted concurrently (e.g. by OpVectorwiseClassifierPredict) each call
+    :py:meth:`predict_probabilities` with a small feature matrix. Only one batch is predicted at a time:
+    calls that arrive meanwhile are queued, and as soon as the running batch is finished, all queued
+    feature matrices are copied into one contiguous matrix and predicted together, with one request per
+    forest. Each forest writes into its own slice of a preallocated float32 buffer, so there is no
+    locking while the forests run. The weighted average is written directly into the result array of
+    each call.
+
+    Batches are capped at ``max_batch_bytes`` of features (a single bigger call is predicted on its own).
+    Buffers up to ``max_batch_bytes`` are reused between batches, bigger ones are freed after the batch.
+    """
+
+    DEFAULT_MAX_BATCH_BYTES = 256 * 1024**2
+
+    def __init__(self, forests, max_batch_bytes=DEFAULT_MAX_BATCH_BYTES):
+        self._forests = forests
+        tree_counts = numpy.array([forest.treeCount() for forest in forests], dtype=numpy.float32)
+        self._weights = tree_counts / tree_counts.sum()
+        self._num_classes = forests[0].labelCount()
+        self._max_batch_bytes = max_batch_bytes
+
+        self._lock = RequestLock()
+        self._queue = collections.deque()
+        self._busy = False
+        self._leader = None
+
+        # Reused between batches (only one batch runs at a time)
+        self._feature_buffer = None
+        self._forest_buffer = None
+
+    def predict_probabilities(self, X):
+        X = numpy.ascontiguousarray(X, dtype=numpy.float32)
+        assert X.ndim == 2
+        submission = _Submission(X, self._num_classes)
+
+        with self._lock:
+            self._queue.append(submission)
+            leader = not self._busy
+            self._busy = True
+            if leader:
+                self._leader = submission
+
+        if not leader:
+            try:
+                submission.wakeup.acquire()
+            except Request.CancellationException:
+                self._abandon(submission)
+                raise
+            with self._lock:
+                leader = self._leader is submission
+
+        if leader:
+            try:
+                while not submission.done:
+                    self._predict_next_batch(submission)
+            finally:
+                self._handOver()
+
+        if submission.error is not None:
+            raise submission.error
+        return submission.out
+
+    def _predict_next_batch(self, leader):
+        with self._lock:
+            batch = [self._queue.popleft()]
+            rows = len(batch[0].features)
+            row_bytes = 4 * batch[0].features.shape[1]
+            while self._queue and (rows + len(self._queue[0].features)) * row_bytes <= self._max_batch_bytes:
+                batch.append(self._queue.popleft())
+                rows += len(batch[-1].features)
+
+        try:
+            self._predict_batch(batch, rows)
+        except Request.CancellationException:
+            # Only the leader was cancelled, the other callers still want their results.
+            with self._lock:
+                self._queue.extendleft(reversed([s for s in batch if s is not leader]))
+            leader.done = True
+            raise
+        except Exception as ex:
+            for submission in batch:
+                submission.error = ex
+
+        for submission in batch:
+            submission.done = True
+            submission.features = None
+            if submission is not leader:
+                submission.wakeup.release()
+
+    def _predict_batch(self, batch, rows):
+        num_features = batch[0].features.shape[1]
+        if len(batch) == 1:
+            features = batch[0].features
+        else:
+            features = self._buffer("_feature_buffer", rows * num_features).reshape((rows, num_features))
+            start = 0
+            for submission in batch:
+                stop = start + len(submission.features)
+                features[start:stop] = submission.features
+                start = stop
+
+        buffer_size = len(self._forests) * rows * self._num_classes
+        forest_predictions = self._buffer("_forest_buffer", buffer_size).reshape(
+            (len(self._forests), rows, self._num_classes)
+        )
+
+        pool = RequestPool()
+        for forest, out in zip(self._forests, forest_predictions):
+            pool.add(Request(lambda forest=forest, out=out: forest.predictProbabilities(features, out=out)))
+        pool.wait()
+
+        start = 0
+        for submission in batch:
+            stop = start + len(submission.out)
+            numpy.einsum("f,frc->rc", self._weights, forest_predictions[:, start:stop], out=submission.out)
+            start = stop
+
+        logger.debug(f"Predicted {len(batch)} blocks ({rows} rows) in one batch")
+
+    def _buffer(self, name, size):
+        """
+        A float32 array of the given size, backed by the buffer stored in attribute name.
+        The buffer is only kept (and grown) up to max_batch_bytes, bigger arrays are allocated for this batch only.
+        """
+        if 4 * size > self._max_batch_bytes:
+            return numpy.empty(size, dtype=numpy.float32)
+        buffer = getattr(self, name)
+        if buffer is None or buffer.size < size:
+            buffer = numpy.empty(size, dtype=numpy.float32)
+            setattr(self, name, buffer)
+        return buffer[:size]
+
+    def _handOver(self):
+        """Let the oldest waiting caller predict the next batch (or become idle)."""
+        with self._lock:
+            if self._queue:
+                self._leader = self._queue[0]
+                self._leader.wakeup.release()
+            else:
+                self._leader = None
+                self._busy = False
+
+    def _abandon(self, submission):
+        with self._lock:
+            try:
+                self._queue.remove(submission)
+            except ValueError:
+                pass
+            promoted = self._leader is submission
+        if promoted:
+            self._handOver()
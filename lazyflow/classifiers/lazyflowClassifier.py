@@ -58,6 +58,14 @@ class LazyflowVectorwiseClassifierFactoryABC(abc.ABC):
         """
         raise NotImplementedError
 
+    def update_and_train(self, previous_classifier, X, y, feature_names=None):
+        """
+        Create a classifier for the (updated) feature matrix X and label vector y,
+        reusing parts of previous_classifier (trained by this factory on an older version of the data) if possible.
+        Factories that cannot train incrementally simply train a new classifier.
+        """
+        return self.create_and_train(X, y, feature_names)
+
     @abc.abstractproperty
     def description(self):
         """
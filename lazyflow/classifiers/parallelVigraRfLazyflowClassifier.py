@@ -32,8 +32,9 @@ import random
 
 from lazyflow import USER_LOGLEVEL
 from lazyflow.utility import Timer
-from lazyflow.request import Request, RequestPool, RequestLock
+from lazyflow.request import Request, RequestPool
 from .lazyflowClassifier import LazyflowVectorwiseClassifierABC, LazyflowVectorwiseClassifierFactoryABC
+from .batchedPrediction import BatchedForestPredictor
 
 import logging
 
@@ -48,6 +49,9 @@ class ParallelVigraRfLazyflowClassifierFactory(LazyflowVectorwiseClassifierFacto
     VERSION = 2  # This is used to determine compatibility of pickled classifier factories.
     # You must bump this if any instance members are added/removed/renamed.
 
+    # Fraction of the forests that update_and_train() retrains
+    INCREMENTAL_REFIT_FRACTION = 0.25
+
     def __init__(
         self,
         num_trees_total=100,
@@ -107,26 +111,7 @@ class ParallelVigraRfLazyflowClassifierFactory(LazyflowVectorwiseClassifierFacto
 
         # Save for future reference
         known_labels, label_counts = numpy.unique(y, return_counts=True)
-
-        X = numpy.asarray(X, numpy.float32)
-        y = numpy.asarray(y, numpy.uint32)
-        if y.ndim == 1:
-            y = y[:, numpy.newaxis]
-
-        assert X.ndim == 2
-        assert len(X) == len(y)
-
-        # Sample X and y
-        if self._label_proportion:
-            proportion = self._label_proportion
-            row_num = int(proportion * X.shape[0])
-            idx = random.sample(list(range(X.shape[0])), row_num)
-            X = X[idx, :]
-            y = y[idx]
-            assert (numpy.unique(y) == known_labels).all(), (
-                "Sampled labels are not representative of the complete set: some label values are missing!\n"
-                "Sampled labels include {}, but complete set has {}".format(numpy.unique(y), known_labels)
-            )
+        X, y = self._prepare_training_data(X, y, known_labels)
 
         # Create N forests to train
         # (treecount of each might differ)
@@ -158,6 +143,72 @@ class ParallelVigraRfLazyflowClassifierFactory(LazyflowVectorwiseClassifierFacto
         )
         return ParallelVigraRfLazyflowClassifier(forests, oobs, known_labels, feature_names, named_importances)
 
+    def update_and_train(self, previous_classifier, X, y, feature_names=None):
+        """
+        Retrain only INCREMENTAL_REFIT_FRACTION of the forests of previous_classifier (round robin) with the
+        updated data, and keep the others. Falls back to training all forests if the set of label classes
+        or the features changed, or if feature importances are requested.
+        """
+        known_labels, label_counts = numpy.unique(y, return_counts=True)
+        if not self._can_update(previous_classifier, X, known_labels, feature_names):
+            return self.create_and_train(X, y, feature_names)
+
+        X, y = self._prepare_training_data(X, y, known_labels)
+
+        forests = list(previous_classifier._forests)
+        oobs = list(previous_classifier.oobs)
+        num_refit = max(1, int(numpy.ceil(len(forests) * self.INCREMENTAL_REFIT_FRACTION)))
+        refit_indices = [(previous_classifier._next_refit + i) % len(forests) for i in range(num_refit)]
+        logger.debug(f"Retraining forests {refit_indices} of {len(forests)}")
+
+        new_forests = [vigra.learning.RandomForest(forests[i].treeCount(), **self._kwargs) for i in refit_indices]
+        new_oobs = self._train_forests(new_forests, X, y)
+        for i, forest, oob in zip(refit_indices, new_forests, new_oobs):
+            forests[i] = forest
+            oobs[i] = oob
+
+        logger.log(
+            USER_LOGLEVEL,
+            f"Updated {num_refit} of {len(forests)} forests. Label counts: ({', '.join(map(str, label_counts))})."
+            f" Average OOB: {numpy.average(oobs):.3f}",
+        )
+        classifier = ParallelVigraRfLazyflowClassifier(forests, oobs, known_labels, feature_names)
+        classifier._next_refit = (refit_indices[-1] + 1) % len(forests)
+        return classifier
+
+    def _can_update(self, previous_classifier, X, known_labels, feature_names):
+        return (
+            isinstance(previous_classifier, ParallelVigraRfLazyflowClassifier)
+            and not self._variable_importance_enabled
+            and len(previous_classifier._forests) == min(self._num_forests, self._num_trees)
+            and previous_classifier._num_trees == self._num_trees
+            and numpy.array_equal(previous_classifier.known_classes, known_labels)
+            and previous_classifier.feature_count == numpy.shape(X)[1]
+            and previous_classifier.feature_names == feature_names
+        )
+
+    def _prepare_training_data(self, X, y, known_labels):
+        X = numpy.asarray(X, numpy.float32)
+        y = numpy.asarray(y, numpy.uint32)
+        if y.ndim == 1:
+            y = y[:, numpy.newaxis]
+
+        assert X.ndim == 2
+        assert len(X) == len(y)
+
+        # Sample X and y
+        if self._label_proportion:
+            proportion = self._label_proportion
+            row_num = int(proportion * X.shape[0])
+            idx = random.sample(list(range(X.shape[0])), row_num)
+            X = X[idx, :]
+            y = y[idx]
+            assert (numpy.unique(y) == known_labels).all(), (
+                "Sampled labels are not representative of the complete set: some label values are missing!\n"
+                "Sampled labels include {}, but complete set has {}".format(numpy.unique(y), known_labels)
+            )
+        return X, y
+
     @staticmethod
     def _train_forests(forests, X, y):
         """
@@ -318,6 +369,11 @@ class ParallelVigraRfLazyflowClassifier(LazyflowVectorwiseClassifierABC):
         # Named importances for the variable importance table
         self._named_importances = named_importances
 
+        self._batched_predictor = BatchedForestPredictor(self._forests)
+
+        # The forest that is retrained first by ParallelVigraRfLazyflowClassifierFactory.update_and_train
+        self._next_refit = 0
+
     def predict_probabilities(self, X):
         logger.debug("Predicting with parallel vigra RF")
         X = numpy.asarray(X, dtype=numpy.float32)
@@ -331,30 +387,8 @@ class ParallelVigraRfLazyflowClassifier(LazyflowVectorwiseClassifierABC):
                 X.shape[1], len(self._feature_names), self._feature_names
             )
 
-        # As each forest completes, aggregate results in a shared array.
-        # (Must put in a list so we can update it in this closure.)
-        total_predictions = [None]
-        prediction_lock = RequestLock()
-
-        def update_predictions(forest, forest_predictions):
-            forest_predictions *= forest.treeCount()
-            with prediction_lock:
-                if total_predictions[0] is None:
-                    total_predictions[0] = forest_predictions
-                else:
-                    total_predictions[0] += forest_predictions
-
-        # Create a request for each forest
-        pool = RequestPool()
-        for forest in self._forests:
-            req = Request(partial(forest.predictProbabilities, X))
-            req.notify_finished(partial(update_predictions, forest))
-            pool.add(req)
-        del req
-        pool.wait()
-
-        total_predictions[0] /= self._num_trees
-        return total_predictions[0]
+        # Concurrent calls (e.g. for neighbouring blocks) are predicted together
+        return self._batched_predictor.predict_probabilities(X)
 
     @property
     def oobs(self):
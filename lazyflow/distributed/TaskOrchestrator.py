@@ -1,14 +1,27 @@
-from mpi4py import MPI
+import collections
 import enum
-from typing import Iterable, TypeVar, Generic, Callable, Tuple
-import uuid
+import statistics
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
 import logging
 
+try:
+    from mpi4py import MPI
+
+    ANY_SOURCE = MPI.ANY_SOURCE
+except ImportError:
+    # Allows running the orchestrator on a fake (in-process) communicator, e.g. in tests
+    MPI = None
+    ANY_SOURCE = -1
+
 logger = logging.getLogger(__name__)
 
 # message payload to signal a worker that it should terminate. Value is arbitrary but should be universally unique
 COMMAND_STOP_WORKER = "COMMAND_STOP_WORKER-eb23ae13-709e-4ac3-931d-99ab059ef0c2"
 UNIT_OF_WORK = TypeVar("UNIT_OF_WORK")
+ORCHESTRATOR_RANK = 0
 
 
 @enum.unique
@@ -16,7 +29,79 @@ class Tags(enum.IntEnum):
     """Tags are arbitrary ints used to identify the type/purpose of a message in MPI"""
 
     TASK_DONE = 1  # workers send messages tagged with TASK_DONE when they finished processing a unit of work
-    WORK = enum.auto()  # units of work are tagged with "WORK" and sent to workers for processing
+    WORK = enum.auto()  # batches of units of work are tagged with "WORK" and sent to workers for processing
+
+
+class TaskOrchestratorError(Exception):
+    pass
+
+
+@dataclass
+class TaskError:
+    """An exception raised by the worker target while processing a unit of work"""
+
+    rank: int
+    exc_type: str
+    message: str
+    traceback: str
+
+    def __str__(self):
+        return f"{self.exc_type}: {self.message} (on rank {self.rank})"
+
+
+@dataclass
+class _TaskResult:
+    """Message sent from a worker to the orchestrator for every processed unit of work"""
+
+    task_id: int
+    rank: int
+    compute_time: float
+    result: Any = None
+    error: Optional[TaskError] = None
+
+
+@dataclass
+class RankStats:
+    """Per-worker statistics collected by the orchestrator"""
+
+    rank: int
+    completed: int = 0
+    failed: int = 0
+    duplicates: int = 0  # results for units that had already been completed by another worker
+    compute_time: float = 0.0  # seconds spent in the worker target, as reported by the worker
+    first_dispatch: Optional[float] = None
+    last_result: Optional[float] = None
+
+    @property
+    def throughput(self) -> float:
+        """Completed units of work per second (wall clock)"""
+        if not self.completed or self.first_dispatch is None or self.last_result is None:
+            return 0.0
+        return self.completed / max(self.last_result - self.first_dispatch, 1e-9)
+
+
+@dataclass
+class OrchestrationReport:
+    """Outcome of TaskOrchestrator.orchestrate. Units of work are identified by their position in the input."""
+
+    results: Dict[int, Any] = field(default_factory=dict)
+    errors: Dict[int, TaskError] = field(default_factory=dict)
+    rank_stats: Dict[int, RankStats] = field(default_factory=dict)
+
+    @property
+    def succeeded(self) -> bool:
+        return not self.errors
+
+
+class _Task(Generic[UNIT_OF_WORK]):
+    __slots__ = ("task_id", "unit_of_work", "attempts", "ranks", "done")
+
+    def __init__(self, task_id: int, unit_of_work: UNIT_OF_WORK):
+        self.task_id = task_id
+        self.unit_of_work = unit_of_work
+        self.attempts = 0  # number of failed attempts
+        self.ranks = set()  # workers this task is currently dispatched to
+        self.done = False
 
 
 class _Worker(Generic[UNIT_OF_WORK]):
@@ -26,13 +111,24 @@ class _Worker(Generic[UNIT_OF_WORK]):
         self.comm = comm  # MPI communication channel
         self.rank = rank  # mpi worker rank, analogous to a worker ID
         self.stopped = False
+        self.outstanding: Dict[int, _Task] = collections.OrderedDict()  # tasks sent, but not answered yet
+        self.last_heard = None  # time of the last message from (or the first dispatch to) this worker
+        self.suspect = False  # didn't answer within the task timeout, no more work is sent to it
 
-    def send(self, unit_of_work: UNIT_OF_WORK):
-        logger.debug(f"Sending unit_of_work {unit_of_work} to worker {self.rank}...")
-        self.comm.send(unit_of_work, dest=self.rank, tag=Tags.WORK)
+    def send(self, tasks: List[_Task]):
+        logger.debug(f"Sending units of work {[t.task_id for t in tasks]} to worker {self.rank}...")
+        if not self.outstanding:
+            self.last_heard = time.monotonic()
+        for task in tasks:
+            self.outstanding[task.task_id] = task
+            task.ranks.add(self.rank)
+        self.comm.send([(t.task_id, t.unit_of_work) for t in tasks], dest=self.rank, tag=Tags.WORK)
 
     def stop(self):
-        self.send(COMMAND_STOP_WORKER)
+        try:
+            self.comm.send(COMMAND_STOP_WORKER, dest=self.rank, tag=Tags.WORK)
+        except Exception:
+            logger.warning(f"Could not stop worker {self.rank}", exc_info=True)
         self.stopped = True
 
 
@@ -40,62 +136,239 @@ class TaskOrchestrator(Generic[UNIT_OF_WORK]):
     """Coordinates work amongst MPI processes.
 
     In order to use this class, applications must be launched with mpirun: e.g.: mpirun -N <num_workers> ilastik.py
+
+    The orchestrator (rank 0) keeps ``units_in_flight`` units of work queued at every worker, so that workers don't
+    idle while waiting for the next unit. Return values (or exceptions) of the worker target are sent back to the
+    orchestrator and collected in an :class:`OrchestrationReport`.
+
+    Units of work may be processed more than once (but only the first result is kept), so processing them should
+    be idempotent:
+
+    * units whose processing raised an exception are re-dispatched up to ``max_retries`` times,
+    * if ``task_timeout`` is set, a worker that doesn't answer for that long is considered dead: its units are
+      re-dispatched to other workers, and it doesn't get new work unless it answers again,
+    * once there are no new units left, idle workers get copies of units stuck on workers that have been silent for
+      more than ``straggler_factor`` times the median processing time of a unit (and at least
+      ``MIN_STRAGGLER_TIME`` seconds). Workers are only stopped once they have answered all units sent to them
+      (or did not answer within ``task_timeout``).
     """
 
-    def __init__(self, comm=None):
-        self.comm = comm or MPI.COMM_WORLD
+    MIN_STRAGGLER_TIME = 1.0
+
+    def __init__(
+        self,
+        comm=None,
+        units_in_flight: int = 2,
+        max_retries: int = 2,
+        task_timeout: Optional[float] = None,
+        straggler_factor: Optional[float] = 3.0,
+    ):
+        if comm is None:
+            if MPI is None:
+                raise ImportError("mpi4py is required to orchestrate tasks without an explicit communicator")
+            comm = MPI.COMM_WORLD
+        self.comm = comm
         self.rank = self.comm.Get_rank()
         num_workers = self.comm.size - 1
         if num_workers <= 0:
-            raise ValueError("Trying to orchestrate tasks with {num_workers} workers")
+            raise ValueError(f"Trying to orchestrate tasks with {num_workers} workers")
         self.workers = {rank: _Worker(self.comm, rank) for rank in range(1, num_workers + 1)}
+        self.units_in_flight = max(1, units_in_flight)
+        self.max_retries = max_retries
+        self.task_timeout = task_timeout
+        self.straggler_factor = straggler_factor
 
-    def _get_finished_worker(self) -> _Worker[UNIT_OF_WORK]:
-        status = MPI.Status()
-        self.comm.recv(source=MPI.ANY_SOURCE, tag=Tags.TASK_DONE, status=status)
-        return self.workers[status.Get_source()]
+    def _poll_result(self, timeout: float) -> Optional[_TaskResult]:
+        """Wait up to timeout seconds for a message from any worker"""
+        deadline = time.monotonic() + timeout
+        delay = 0.0005
+        while True:
+            if self.comm.iprobe(source=ANY_SOURCE, tag=Tags.TASK_DONE):
+                return self.comm.recv(source=ANY_SOURCE, tag=Tags.TASK_DONE)
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(delay)
+            delay = min(delay * 2, 0.02)
 
-    def orchestrate(self, work_units: Iterable[UNIT_OF_WORK]):
+    def orchestrate(self, work_units: Iterable[UNIT_OF_WORK]) -> OrchestrationReport:
         """Sends work units from work_units to workers as they become free. Usually ran in the process with mpi rank 0
 
         Blocks until all work units have been consumed and processed by the workers.
         Automatically terminates all workers when all work units have been consumed."""
 
-        logger.info(f"ORCHESTRATOR: Starting orchestration of {len(self.workers)}...")
-        num_busy_workers = 0
-        for worker in self.workers.values():
-            try:
-                worker.send(next(work_units))
-                num_busy_workers += 1
-            except StopIteration:
-                break
+        logger.info(f"ORCHESTRATOR: Starting orchestration of {len(self.workers)} workers...")
+        work_units = enumerate(work_units)
+        report = OrchestrationReport(rank_stats={rank: RankStats(rank) for rank in self.workers})
+        pending: Deque[_Task] = collections.deque()  # tasks that have to be (re)dispatched
+        compute_times: List[float] = []
+        num_open = 0  # tasks that are neither completed nor failed for good
+        exhausted = False
 
-        while True:
-            worker = self._get_finished_worker()
-            try:
-                worker.send(next(work_units))
-            except StopIteration:
-                worker.stop()
-                num_busy_workers -= 1
-                if num_busy_workers == 0:
+        def next_tasks(count: int) -> List[_Task]:
+            nonlocal exhausted, num_open
+            tasks = []
+            while len(tasks) < count:
+                if pending:
+                    task = pending.popleft()
+                    if not task.done:
+                        tasks.append(task)
+                    continue
+                if exhausted:
                     break
+                try:
+                    task_id, unit_of_work = next(work_units)
+                except StopIteration:
+                    exhausted = True
+                    break
+                tasks.append(_Task(task_id, unit_of_work))
+                num_open += 1
+            return tasks
+
+        def refill():
+            for worker in self.workers.values():
+                free_slots = self.units_in_flight - len(worker.outstanding)
+                if worker.suspect or free_slots <= 0:
+                    continue
+                tasks = next_tasks(free_slots)
+                if not tasks:
+                    return
+                stats = report.rank_stats[worker.rank]
+                if stats.first_dispatch is None:
+                    stats.first_dispatch = time.monotonic()
+                worker.send(tasks)
+
+        def handle(message: _TaskResult):
+            nonlocal num_open
+            now = time.monotonic()
+            worker = self.workers[message.rank]
+            worker.last_heard = now
+            if worker.suspect:
+                logger.info(f"ORCHESTRATOR: worker {worker.rank} is responding again")
+                worker.suspect = False
+            task = worker.outstanding.pop(message.task_id, None)
+            if task is not None:
+                task.ranks.discard(worker.rank)
+            stats = report.rank_stats[worker.rank]
+            stats.compute_time += message.compute_time
+            stats.last_result = now
+            if task is None or task.done:
+                stats.duplicates += 1
+            elif message.error is None:
+                stats.completed += 1
+                compute_times.append(message.compute_time)
+                report.results[task.task_id] = message.result
+                task.done = True
+                task.unit_of_work = None
+                num_open -= 1
+            else:
+                stats.failed += 1
+                task.attempts += 1
+                if task.attempts > self.max_retries:
+                    logger.error(f"ORCHESTRATOR: unit of work {task.task_id} failed: {message.error}")
+                    report.errors[task.task_id] = message.error
+                    task.done = True
+                    task.unit_of_work = None
+                    num_open -= 1
+                elif not task.ranks:
+                    logger.warning(f"ORCHESTRATOR: retrying unit of work {task.task_id} after {message.error}")
+                    pending.append(task)
+
+        def check_timeouts(now: float):
+            if self.task_timeout is None:
+                return
+            for worker in self.workers.values():
+                if worker.suspect or not worker.outstanding or now - worker.last_heard < self.task_timeout:
+                    continue
+                logger.warning(
+                    f"ORCHESTRATOR: worker {worker.rank} did not respond for {self.task_timeout}s, "
+                    f"re-dispatching its {len(worker.outstanding)} units of work"
+                )
+                worker.suspect = True
+                for task in worker.outstanding.values():
+                    if not task.done and not any(not self.workers[r].suspect for r in task.ranks if r != worker.rank):
+                        pending.append(task)
+            if all(w.suspect for w in self.workers.values()):
+                for w in self.workers.values():
+                    w.stop()
+                raise TaskOrchestratorError(f"No worker responded for {self.task_timeout}s")
+
+        def speculate(now: float):
+            if self.straggler_factor is None or not exhausted or pending or not compute_times:
+                return
+            threshold = max(self.straggler_factor * statistics.median(compute_times), self.MIN_STRAGGLER_TIME)
+            idle_workers = [w for w in self.workers.values() if not w.suspect and not w.outstanding]
+            stragglers = [
+                task
+                for w in self.workers.values()
+                if w.outstanding and now - w.last_heard > threshold
+                for task in w.outstanding.values()
+                if not task.done and len(task.ranks) == 1
+            ]
+            for worker, task in zip(idle_workers, stragglers):
+                logger.info(f"ORCHESTRATOR: speculatively re-dispatching unit of work {task.task_id} to {worker.rank}")
+                worker.send([task])
 
-        for worker in self.workers.values():
-            if not worker.stopped:
-                worker.stop()
+        refill()
+        while num_open > 0 or not exhausted:
+            message = self._poll_result(timeout=0.1)
+            if message is not None:
+                handle(message)
+            now = time.monotonic()
+            check_timeouts(now)
+            refill()
+            speculate(now)
 
-    def start_as_worker(self, target: Callable[[UNIT_OF_WORK, int], None]):
+        # Workers may still process speculative copies of finished units. Receive their (duplicate) results
+        # before stopping them: a worker blocked in sending a result would never see the stop command.
+        draining = list(self.workers.values())
+        while draining:
+            now = time.monotonic()
+            for worker in draining:
+                timed_out = self.task_timeout is not None and now - worker.last_heard >= self.task_timeout
+                if not worker.outstanding or timed_out:
+                    worker.stop()
+            draining = [worker for worker in draining if not worker.stopped]
+            if draining:
+                message = self._poll_result(timeout=0.1)
+                if message is not None:
+                    handle(message)
+
+        for stats in report.rank_stats.values():
+            logger.info(
+                f"ORCHESTRATOR: worker {stats.rank}: {stats.completed} units of work "
+                f"({stats.throughput:.2f}/s, {stats.compute_time:.1f}s computing), "
+                f"{stats.failed} failed attempts, {stats.duplicates} duplicates"
+            )
+        return report
+
+    def start_as_worker(self, target: Callable[[UNIT_OF_WORK, int], Any]):
         """Synchronously runs 'target' on every work unit passed in by the orchestrating intance of this class
         (usually the process with mpi rank == 0, which should be executing the 'orchestrate' method)
 
+        The return value of 'target' (or the exception it raised) is sent back to the orchestrator,
+        so it should be small and picklable.
+
         Blocks until the orchestrator version of this object sends the termination command COMMAND_STOP_WORKER
         """
 
         logger.info(f"WORKER {self.rank}: Started")
+        queue: Deque[Tuple[int, UNIT_OF_WORK]] = collections.deque()
         while True:
-            status = MPI.Status()
-            unit_of_work = self.comm.recv(source=MPI.ANY_SOURCE, tag=Tags.WORK, status=status)
-            if unit_of_work == COMMAND_STOP_WORKER:
-                break
-            self.comm.send(target(unit_of_work, self.rank), dest=status.Get_source(), tag=Tags.TASK_DONE)
-        logger.info(f"WORKER {self.rank}: Terminated")
+            # Receive everything the orchestrator sent so far, but only block if there is nothing to do
+            while not queue or self.comm.iprobe(source=ORCHESTRATOR_RANK, tag=Tags.WORK):
+                batch = self.comm.recv(source=ORCHESTRATOR_RANK, tag=Tags.WORK)
+                if batch == COMMAND_STOP_WORKER:
+                    logger.info(f"WORKER {self.rank}: Terminated")
+                    return
+                queue.extend(batch)
+
+            task_id, unit_of_work = queue.popleft()
+            start = time.monotonic()
+            try:
+                message = _TaskResult(task_id, self.rank, 0.0, result=target(unit_of_work, self.rank))
+            except Exception as e:
+                logger.exception(f"WORKER {self.rank}: failed to process unit of work {task_id}")
+                error = TaskError(self.rank, type(e).__name__, str(e), traceback.format_exc())
+                message = _TaskResult(task_id, self.rank, 0.0, error=error)
+            message.compute_time = time.monotonic() - start
+            self.comm.send(message, dest=ORCHESTRATOR_RANK, tag=Tags.TASK_DONE)
@@ -189,6 +189,10 @@ class Operator(metaclass=OperatorMetaClass):
     description = ""
     category = "lazyflow"
 
+    # Set to True if the kernels this operator passes to lazyflow.request.processPool.run_kernel()
+    # may run in a separate process (i.e. they are picklable and have no side effects).
+    processSafe = False
+
     inputs: InputDict
     outputs: OutputDict
 
@@ -0,0 +1,217 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Eviction policies for the cache memory manager.
+
+A policy decides in which order the entries reported by the managed caches are freed
+once the cache memory limit is exceeded. Entries are described by
+:class:`BlockStats` (last access time, access count,
+time it took to compute the block and its size in bytes).
+"""
+import threading
+from dataclasses import dataclass
+from typing import Callable, Hashable, Iterable, Iterator, Optional
+
+
+@dataclass
+class BlockStats:
+    """
+    Bookkeeping information about a single cache block, used by eviction policies
+    """
+
+    block_id: Hashable
+    # python timestamp of the last access
+    last_access_time: float
+    # number of times the block was requested (including the initial computation)
+    access_count: int = 1
+    # seconds it took to compute the block (None if unknown)
+    compute_time: Optional[float] = None
+    # size of the block in bytes (None if unknown)
+    size: Optional[int] = None
+
+
+class CacheCounters(object):
+    """
+    Thread-safe hit/miss/eviction counters of a cache
+
+    Counters can be added up, e.g. to get the statistics of all caches combined.
+    """
+
+    def __init__(self, hits=0, misses=0, evictions=0, evicted_bytes=0):
+        self._lock = threading.Lock()
+        self.hits = hits
+        self.misses = misses
+        self.evictions = evictions
+        self.evicted_bytes = evicted_bytes
+
+    def countHit(self):
+        with self._lock:
+            self.hits += 1
+
+    def countMiss(self):
+        with self._lock:
+            self.misses += 1
+
+    def countEviction(self, nbytes):
+        with self._lock:
+            self.evictions += 1
+            self.evicted_bytes += nbytes
+
+    @property
+    def requests(self):
+        return self.hits + self.misses
+
+    @property
+    def hitRate(self):
+        return self.hits / self.requests if self.requests else 0.0
+
+    @property
+    def missRate(self):
+        return self.misses / self.requests if self.requests else 0.0
+
+    @property
+    def evictionRate(self):
+        """evictions per cache miss (i.e. per stored block)"""
+        return self.evictions / self.misses if self.misses else 0.0
+
+    def __add__(self, other):
+        return CacheCounters(
+            self.hits + other.hits,
+            self.misses + other.misses,
+            self.evictions + other.evictions,
+            self.evicted_bytes + other.evicted_bytes,
+        )
+
+    def __repr__(self):
+        return "CacheCounters(hits={}, misses={}, evictions={}, evicted_bytes={})".format(
+            self.hits, self.misses, self.evictions, self.evicted_bytes
+        )
+
+
+@dataclass
+class CacheEntry:
+    """A freeable unit (a whole cache or one of its blocks), as seen by the memory manager."""
+
+    #: identifies the entry across cleanups, e.g. (id(cache), block_id)
+    key: Hashable
+    #: human readable description for logging
+    info: str
+    stats: BlockStats
+    #: frees the entry and returns the number of bytes freed
+    free: Callable[[], int]
+
+
+class EvictionPolicy:
+    """Base class of eviction policies.
+
+    Subclasses implement :meth:`evictionOrder`. The memory manager consumes the returned
+    iterator lazily and stops as soon as enough memory has been freed.
+    """
+
+    name = None
+
+    def evictionOrder(self, entries: Iterable[CacheEntry]) -> Iterator[CacheEntry]:
+        raise NotImplementedError()
+
+
+class LRUEvictionPolicy(EvictionPolicy):
+    """Free least recently used entries first (the classic lazyflow behaviour)."""
+
+    name = "lru"
+
+    def evictionOrder(self, entries):
+        return iter(sorted(entries, key=lambda entry: entry.stats.last_access_time))
+
+
+class LFUEvictionPolicy(EvictionPolicy):
+    """Free least frequently used entries first; ties are broken by last access time."""
+
+    name = "lfu"
+
+    def evictionOrder(self, entries):
+        return iter(sorted(entries, key=lambda entry: (entry.stats.access_count, entry.stats.last_access_time)))
+
+
+class CostAwareEvictionPolicy(EvictionPolicy):
+    """GreedyDual-Size: free the bytes that are cheapest to recompute first.
+
+    Every entry has a value ``H = L + cost / size``, which is (re)computed whenever the entry
+    has been accessed since the last cleanup. The entry with the lowest ``H`` is freed first and
+    the "inflation" ``L`` is raised to its ``H``, so that entries which have not been touched for
+    a long time eventually get evicted, no matter how expensive they were.
+
+    The cost of a byte is measured in seconds of computation. Entries whose compute time or size
+    is unknown get the mean cost per byte of the other entries, so they are neither always kept nor
+    always evicted first (if no entry reports both, all entries cost the same).
+    """
+
+    name = "cost"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflation = 0.0
+        # key -> (last access time seen, H)
+        self._values = {}
+
+    @staticmethod
+    def _costPerByte(stats: BlockStats) -> Optional[float]:
+        """seconds of computation per byte, None if unknown"""
+        if stats.compute_time is None or not stats.size:
+            return None
+        return stats.compute_time / stats.size
+
+    def evictionOrder(self, entries):
+        entries = list(entries)
+        costs = [self._costPerByte(entry.stats) for entry in entries]
+        known_costs = [cost for cost in costs if cost is not None]
+        unknown_cost = sum(known_costs) / len(known_costs) if known_costs else 1.0
+
+        with self._lock:
+            values = {}
+            for entry, cost in zip(entries, costs):
+                last_seen, value = self._values.get(entry.key, (None, None))
+                if last_seen != entry.stats.last_access_time:
+                    value = self._inflation + (cost if cost is not None else unknown_cost)
+                values[entry.key] = (entry.stats.last_access_time, value)
+            # Forget about entries that no longer exist.
+            self._values = values
+
+        ordered = sorted(entries, key=lambda entry: (values[entry.key][1], entry.stats.last_access_time))
+        return self._evict(ordered)
+
+    def _evict(self, ordered):
+        for entry in ordered:
+            with self._lock:
+                _, value = self._values.pop(entry.key, (None, self._inflation))
+                self._inflation = max(self._inflation, value)
+            yield entry
+
+
+_policies = {policy.name: policy for policy in (LRUEvictionPolicy, LFUEvictionPolicy, CostAwareEvictionPolicy)}
+
+
+def createEvictionPolicy(name: str) -> EvictionPolicy:
+    """Create an eviction policy by name ("lru", "lfu" or "cost")."""
+    try:
+        return _policies[name]()
+    except KeyError:
+        raise ValueError(f"Unknown eviction policy {name!r}, choose one of {sorted(_policies)}") from None
@@ -72,6 +72,14 @@ class _CacheMemoryManager(threading.Thread):
 
     the interval is measured in seconds. Each change of refresh interval
     triggers cleanup.
+
+    The order in which cache blocks are freed is determined by an eviction
+    policy (see cacheEvictionPolicies.py), least recently used by default::
+
+        cache_mem_manager.setEvictionPolicy("cost")
+
+    Hit/miss counts of all caches and the evictions performed by the manager
+    are available through getCounters().
     """
 
     totalCacheMemory = OrderedSignal()
@@ -97,6 +105,13 @@ class _CacheMemoryManager(threading.Thread):
         # target usage fraction
         self._target_usage = 0.90
 
+        # late import to prevent import loop
+        from lazyflow.operators.cacheEvictionPolicies import LRUEvictionPolicy
+        from lazyflow.operators.cacheEvictionPolicies import CacheCounters
+
+        self._eviction_policy = LRUEvictionPolicy()
+        self._eviction_counters = CacheCounters()
+
         self._stopped = False
         self.start()
         atexit.register(self.stop)
@@ -153,6 +168,33 @@ class _CacheMemoryManager(threading.Thread):
         elif isinstance(cache, ManagedCache):
             self._managed_caches.add(cache)
 
+    def setEvictionPolicy(self, policy):
+        """
+        set the eviction policy, either an EvictionPolicy instance or its name ("lru", "lfu", "cost")
+        """
+        from lazyflow.operators.cacheEvictionPolicies import createEvictionPolicy
+
+        if isinstance(policy, str):
+            policy = createEvictionPolicy(policy)
+        with self._disable_lock:
+            self._eviction_policy = policy
+
+    def getEvictionPolicy(self):
+        return self._eviction_policy
+
+    def getCounters(self):
+        """
+        get combined CacheCounters: hits and misses of all caches, evictions done by the manager
+        """
+        from lazyflow.operators.cacheEvictionPolicies import CacheCounters
+
+        total = CacheCounters()
+        for cache in list(self._managed_blocked_caches) + list(self._managed_caches):
+            counters = cache.getCounters() if hasattr(cache, "getCounters") else None
+            if counters is not None:
+                total = total + CacheCounters(counters.hits, counters.misses)
+        return total + self._eviction_counters
+
     def run(self):
         """
         main loop
@@ -170,7 +212,8 @@ class _CacheMemoryManager(threading.Thread):
         """
         clean up once
         """
-        from lazyflow.operators.opCache import ObservableCache
+        from lazyflow.operators.opCache import ObservableCache, BlockStats
+        from lazyflow.operators.cacheEvictionPolicies import CacheEntry
 
         try:
             # notify subscribed functions about current cache memory
@@ -204,26 +247,36 @@ class _CacheMemoryManager(threading.Thread):
             if total <= self._max_usage * cache_memory:
                 return
 
-            cache_entries = []
-            cache_entries += [
-                (cache.lastAccessTime(), cache.name, cache.freeMemory) for cache in list(self._managed_caches)
+            cache_entries = [
+                CacheEntry(
+                    key=id(cache),
+                    info=cache.name,
+                    stats=BlockStats(cache.name, cache.lastAccessTime(), size=int(cache.usedMemory())),
+                    free=cache.freeMemory,
+                )
+                for cache in list(self._managed_caches)
             ]
             cache_entries += [
-                (lastAccessTime, f"{cache.name}: {blockKey}", functools.partial(cache.freeBlock, blockKey))
+                CacheEntry(
+                    key=(id(cache), stats.block_id),
+                    info=f"{cache.name}: {stats.block_id}",
+                    stats=stats,
+                    free=functools.partial(cache.freeBlock, stats.block_id),
+                )
                 for cache in list(self._managed_blocked_caches)
-                for blockKey, lastAccessTime in cache.getBlockAccessTimes()
+                for stats in cache.getBlockStats()
             ]
-            cache_entries.sort(key=lambda entry: entry[0])
 
-            for lastAccessTime, info, cleanupFun in cache_entries:
+            for entry in self._eviction_policy.evictionOrder(cache_entries):
                 if total <= self._target_usage * cache_memory:
                     break
-                mem = cleanupFun()
-                logger.debug(f"Cleaned up {info} ({Memory.format(mem)})")
+                mem = entry.free()
+                self._eviction_counters.countEviction(mem)
+                logger.debug(f"Cleaned up {entry.info} ({Memory.format(mem)})")
                 total -= mem
 
             # Remove references to cache entries before triggering garbage collection.
-            cleanupFun = None
+            entry = None
             cache_entries = None
             gc.collect()
 
@@ -300,3 +353,11 @@ def addFirstClassCache(cache):
 
 def setRefreshInterval(seconds):
     _cache_memory_manager.setRefreshInterval(seconds)
+
+
+def setEvictionPolicy(policy):
+    _cache_memory_manager.setEvictionPolicy(policy)
+
+
+def getCounters():
+    return _cache_memory_manager.getCounters()
@@ -32,6 +32,7 @@ import numpy
 # lazyflow
 from lazyflow.graph import Operator, InputSlot, OutputSlot, OrderedSignal, OperatorWrapper
 from lazyflow.roi import sliceToRoi, roiToSlice, getIntersection, roiFromShape, nonzero_bounding_box, enlargeRoiForHalo
+from lazyflow.request import RequestLock
 from lazyflow.utility import Timer
 from lazyflow.classifiers import (
     LazyflowVectorwiseClassifierABC,
@@ -59,6 +60,7 @@ class OpTrainClassifierBlocked(Operator):
     ClassifierFactory = InputSlot()
     nonzeroLabelBlocks = InputSlot(level=1)  # Used only in the pixelwise case.
     MaxLabel = InputSlot()
+    IncrementalTraining = InputSlot(value=False)  # Used only in the vectorwise case.
 
     Classifier = OutputSlot()
 
@@ -73,6 +75,7 @@ class OpTrainClassifierBlocked(Operator):
         self._opVectorwiseTrain.Labels.connect(self.Labels)
         self._opVectorwiseTrain.ClassifierFactory.connect(self.ClassifierFactory)
         self._opVectorwiseTrain.MaxLabel.connect(self.MaxLabel)
+        self._opVectorwiseTrain.IncrementalTraining.connect(self.IncrementalTraining)
         self._opVectorwiseTrain.progressSignal.subscribe(self.progressSignal)
 
         # Fully connect the pixelwise training operator
@@ -146,9 +149,20 @@ class OpTrainPixelwiseClassifierBlocked(Operator):
             if index in self._touched_slots:
                 self.Classifier.setDirty()
                 self._touched_slots.remove(index)
+            with self._cache_lock:
+                self._lane_caches.pop(index, None)
+                self._lane_caches = {i - (i > index): cache for i, cache in self._lane_caches.items()}
+                self._lane_generations = {i - (i > index): g for i, g in self._lane_generations.items()}
 
         self.Labels.notifyRemove(handle_remove_lane)
 
+        # The (padded) label and image data of each nonzero label block, so that only blocks whose labels
+        # (or image) changed have to be requested again for the next training: {lane: {block roi: (labels, image)}}
+        self._cache_lock = RequestLock()
+        self._lane_caches = {}
+        # Incremented whenever a lane becomes dirty, so that blocks requested before can't enter the cache afterwards
+        self._lane_generations = {}
+
     def setupOutputs(self):
         for slot in [self.Images, self.Labels]:
             assert all(
@@ -175,51 +189,33 @@ class OpTrainPixelwiseClassifierBlocked(Operator):
         # Accumulate all non-zero blocks of each image into lists
         label_data_blocks = []
         image_data_blocks = []
-        for image_slot, label_slot, nonzero_block_slot in zip(self.Images, self.Labels, self.nonzeroLabelBlocks):
+        lanes = zip(self.Images, self.Labels, self.nonzeroLabelBlocks)
+        for lane_index, (image_slot, label_slot, nonzero_block_slot) in enumerate(lanes):
+            with self._cache_lock:
+                generation = self._lane_generations.get(lane_index, 0)
+                cached_blocks = dict(self._lane_caches.get(lane_index, {}))
+
+            lane_blocks = {}
             block_slicings = nonzero_block_slot.value
             for block_slicing in block_slicings:
-                # Get labels
                 block_label_roi = sliceToRoi(block_slicing, label_slot.meta.shape)
-                block_label_data = label_slot(*block_label_roi).wait()
-
-                # Shrink roi to bounding box of actual label pixels
-                bb_roi_within_block = nonzero_bounding_box(block_label_data)
-                block_label_bb_roi = bb_roi_within_block + block_label_roi[0]
-
-                # Double-check that there is at least 1 non-zero label in the block.
-                if (block_label_bb_roi[1] > block_label_bb_roi[0]).all():
-                    # Ask for the halo needed by the classifier
-                    axiskeys = image_slot.meta.getAxisKeys()
-                    halo_shape = classifier_factory.get_halo_shape(axiskeys)
-                    assert len(halo_shape) == len(block_label_roi[0])
-                    assert halo_shape[-1] == 0, "Didn't expect a non-zero halo for channel dimension."
-
-                    # Expand block by halo, but keep clipped to image bounds
-                    padded_label_roi, bb_roi_within_padded = enlargeRoiForHalo(
-                        *block_label_bb_roi,
-                        shape=label_slot.meta.shape,
-                        sigma=halo_shape,
-                        window=1,
-                        return_result_roi=True,
+                block_key = (tuple(block_label_roi[0]), tuple(block_label_roi[1]))
+                if block_key in cached_blocks:
+                    lane_blocks[block_key] = cached_blocks[block_key]
+                else:
+                    lane_blocks[block_key] = self._get_training_block(
+                        image_slot, label_slot, block_label_roi, classifier_factory
                     )
 
-                    # Copy labels to new array, which has size == bounding-box + halo
-                    padded_label_data = numpy.zeros(padded_label_roi[1] - padded_label_roi[0], label_slot.meta.dtype)
-                    padded_label_data[roiToSlice(*bb_roi_within_padded)] = block_label_data[
-                        roiToSlice(*bb_roi_within_block)
-                    ]
-
-                    padded_image_roi = numpy.array(padded_label_roi)
-                    assert (padded_image_roi[:, -1] == [0, 1]).all()
-                    num_channels = image_slot.meta.shape[-1]
-                    padded_image_roi[:, -1] = [0, num_channels]
-
-                    # Ensure the results are plain ndarray, not VigraArray,
-                    #  which some classifiers might have trouble with.
-                    padded_image_data = numpy.asarray(image_slot(*padded_image_roi).wait())
+            with self._cache_lock:
+                if self._lane_generations.get(lane_index, 0) == generation:
+                    # Blocks that are no longer in the nonzero blocks are dropped, too.
+                    self._lane_caches[lane_index] = lane_blocks
 
-                    label_data_blocks.append(padded_label_data)
-                    image_data_blocks.append(padded_image_data)
+            for block in lane_blocks.values():
+                if block is not None:
+                    label_data_blocks.append(block[0])
+                    image_data_blocks.append(block[1])
 
         if len(image_data_blocks) == 0:
             result[0] = None
@@ -237,7 +233,77 @@ class OpTrainPixelwiseClassifierBlocked(Operator):
                     "".format(type(classifier))
                 )
 
+    def _get_training_block(self, image_slot, label_slot, block_label_roi, classifier_factory):
+        """
+        Request the labels of the given block and the image data in their bounding box (plus the classifier's halo).
+        Returns (padded_label_data, padded_image_data) or None, if there are no labels in the block.
+        """
+        block_label_data = label_slot(*block_label_roi).wait()
+
+        # Shrink roi to bounding box of actual label pixels
+        bb_roi_within_block = nonzero_bounding_box(block_label_data)
+        block_label_bb_roi = bb_roi_within_block + block_label_roi[0]
+
+        # Double-check that there is at least 1 non-zero label in the block.
+        if not (block_label_bb_roi[1] > block_label_bb_roi[0]).all():
+            return None
+
+        # Ask for the halo needed by the classifier
+        axiskeys = image_slot.meta.getAxisKeys()
+        halo_shape = classifier_factory.get_halo_shape(axiskeys)
+        assert len(halo_shape) == len(block_label_roi[0])
+        assert halo_shape[-1] == 0, "Didn't expect a non-zero halo for channel dimension."
+
+        # Expand block by halo, but keep clipped to image bounds
+        padded_label_roi, bb_roi_within_padded = enlargeRoiForHalo(
+            *block_label_bb_roi,
+            shape=label_slot.meta.shape,
+            sigma=halo_shape,
+            window=1,
+            return_result_roi=True,
+        )
+
+        # Copy labels to new array, which has size == bounding-box + halo
+        padded_label_data = numpy.zeros(padded_label_roi[1] - padded_label_roi[0], label_slot.meta.dtype)
+        padded_label_data[roiToSlice(*bb_roi_within_padded)] = block_label_data[roiToSlice(*bb_roi_within_block)]
+
+        padded_image_roi = numpy.array(padded_label_roi)
+        assert (padded_image_roi[:, -1] == [0, 1]).all()
+        num_channels = image_slot.meta.shape[-1]
+        padded_image_roi[:, -1] = [0, num_channels]
+
+        # Ensure the results are plain ndarray, not VigraArray,
+        #  which some classifiers might have trouble with.
+        padded_image_data = numpy.asarray(image_slot(*padded_image_roi).wait())
+
+        return padded_label_data, padded_image_data
+
+    def _invalidate_cached_blocks(self, slot, subindex, roi):
+        with self._cache_lock:
+            if slot is self.ClassifierFactory:
+                # The halo may have changed
+                self._lane_caches.clear()
+                self._lane_generations = {lane: g + 1 for lane, g in self._lane_generations.items()}
+                return
+            if not subindex:
+                return
+            lane_index = subindex[0]
+            self._lane_generations[lane_index] = self._lane_generations.get(lane_index, 0) + 1
+            lane_cache = self._lane_caches.get(lane_index)
+            if not lane_cache:
+                return
+            if slot is self.Images:
+                del self._lane_caches[lane_index]
+            elif slot is self.Labels:
+                # Our blocks are keyed by label roi (1 channel)
+                dirty_roi = (tuple(roi.start[:-1]) + (0,), tuple(roi.stop[:-1]) + (1,))
+                for block_key in list(lane_cache.keys()):
+                    if getIntersection(block_key, dirty_roi, assertIntersect=False) is not None:
+                        del lane_cache[block_key]
+
     def propagateDirty(self, slot, subindex, roi):
+        if slot in (self.Images, self.Labels, self.ClassifierFactory):
+            self._invalidate_cached_blocks(slot, subindex, roi)
         if slot in [self.ClassifierFactory, self.MaxLabel] or (subindex and subindex[0] in self._touched_slots):
             self.propagateDirtyIfNewModTime()
 
@@ -256,6 +322,7 @@ class OpTrainVectorwiseClassifierBlocked(Operator):
     Labels = InputSlot(level=1)
     ClassifierFactory = InputSlot()
     MaxLabel = InputSlot()
+    IncrementalTraining = InputSlot(value=False)
 
     Classifier = OutputSlot()
 
@@ -279,6 +346,7 @@ class OpTrainVectorwiseClassifierBlocked(Operator):
         self._opTrainFromFeatures.ClassifierFactory.connect(self.ClassifierFactory)
         self._opTrainFromFeatures.LabelAndFeatureMatrix.connect(self._opConcatenateFeatureMatrices.ConcatenatedOutput)
         self._opTrainFromFeatures.MaxLabel.connect(self.MaxLabel)
+        self._opTrainFromFeatures.IncrementalTraining.connect(self.IncrementalTraining)
 
         self.Classifier.connect(self._opTrainFromFeatures.Classifier)
 
@@ -317,11 +385,15 @@ class OpTrainClassifierFromFeatureVectors(Operator):
     LabelAndFeatureMatrix = InputSlot()
 
     MaxLabel = InputSlot()
+    # If True, the previous classifier is passed to the factory's update_and_train(),
+    # which may retrain only parts of it.
+    IncrementalTraining = InputSlot(value=False)
     Classifier = OutputSlot()
 
     def __init__(self, *args, **kwargs):
         super(OpTrainClassifierFromFeatureVectors, self).__init__(*args, **kwargs)
         self.trainingCompleteSignal = OrderedSignal()
+        self._previous_classifier = None
 
         # TODO: Progress...
         # self.progressSignal = OrderedSignal()
@@ -353,8 +425,16 @@ class OpTrainClassifierFromFeatureVectors(Operator):
             "".format(type(classifier_factory))
         )
 
-        logger.debug("Training new classifier: {}".format(classifier_factory.description))
-        classifier = classifier_factory.create_and_train(featMatrix, labelsMatrix[:, 0], channel_names)
+        previous_classifier = self._previous_classifier
+        if self.IncrementalTraining.value and previous_classifier is not None:
+            logger.debug("Updating classifier: {}".format(classifier_factory.description))
+            classifier = classifier_factory.update_and_train(
+                previous_classifier, featMatrix, labelsMatrix[:, 0], channel_names
+            )
+        else:
+            logger.debug("Training new classifier: {}".format(classifier_factory.description))
+            classifier = classifier_factory.create_and_train(featMatrix, labelsMatrix[:, 0], channel_names)
+        self._previous_classifier = classifier
         result[0] = classifier
         if classifier is not None:
             assert issubclass(type(classifier), LazyflowVectorwiseClassifierABC), (
@@ -366,6 +446,8 @@ class OpTrainClassifierFromFeatureVectors(Operator):
         return result
 
     def propagateDirty(self, slot, subindex, roi):
+        if slot is self.ClassifierFactory:
+            self._previous_classifier = None
         self.Classifier.setDirty()
 
 
@@ -337,7 +337,10 @@ class OpFormattedDataExport(Operator):
                 ds[...] = 1  # FIXME: for some reason setting to 0 does nothing
 
             cutout = self.get_roi()
-            orchestrator.orchestrate(cutout.split(block_shape=block_shape))
+            report = orchestrator.orchestrate(cutout.split(block_shape=block_shape))
+            if not report.succeeded:
+                failed = "\n".join(f"{task_id}: {error}" for task_id, error in sorted(report.errors.items()))
+                raise RuntimeError(f"Distributed export failed for {len(report.errors)} blocks:\n{failed}")
         else:
 
             def process_tile(tile: Slice5D, rank: int):
@@ -33,8 +33,13 @@ import z5py
 import os
 
 from lazyflow.graph import Operator, InputSlot, OutputSlot
+from lazyflow.request import processPool
+from lazyflow.roi import roiToSlice
 from lazyflow.utility import Timer
 from lazyflow.utility.helpers import get_default_axisordering, bigintprod
+from lazyflow.utility.io_util.chunkCache import fileSourceKey, getDefaultChunkCache
+from lazyflow.utility.io_util.parallelHdf5Reader import read_in_processes, supports_parallel_reads
+from lazyflow.utility.prefetcher import Prefetcher
 
 logger = logging.getLogger(__name__)
 
@@ -60,6 +65,17 @@ def _find_or_infer_axistags(file: Union[h5py.File, z5py.N5File], internalPath: s
     return vigra.defaultAxistags(str(axisorder))
 
 
+def _chunk_source_key(file: Union[h5py.File, z5py.N5File], internalPath: str):
+    """Key of the dataset in the shared chunk cache, None if the file may be written to (or is not chunked)."""
+    if file[internalPath].chunks is None:
+        return None
+    if isinstance(file, h5py.File):
+        return fileSourceKey(file.filename, internalPath) if file.mode == "r" else None
+    if getattr(file, "mode", None) == "r":
+        return fileSourceKey(file.path, internalPath)
+    return None
+
+
 class OpStreamingH5N5Reader(Operator):
     """
     The top-level operator for the data selection applet.
@@ -68,6 +84,10 @@ class OpStreamingH5N5Reader(Operator):
     name = "OpStreamingH5N5Reader"
     category = "Reader"
 
+    # If a process pool is configured, compressed datasets of read-only HDF5 files are read (and decompressed)
+    # in its worker processes (see lazyflow.utility.io_util.parallelHdf5Reader).
+    processSafe = True
+
     # The project hdf5 File object (already opened)
     H5N5File = InputSlot(stype="h5N5File")
 
@@ -89,6 +109,9 @@ class OpStreamingH5N5Reader(Operator):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._h5N5File = None
+        self._parallelReads = False
+        self._chunkSource = None
+        self._prefetcher = None
 
     def setupOutputs(self):
         # Read the dataset meta-info from the HDF5 dataset
@@ -129,6 +152,14 @@ class OpStreamingH5N5Reader(Operator):
         if chunks:
             self.OutputImage.meta.ideal_blockshape = chunks
 
+        self._parallelReads = supports_parallel_reads(dataset)
+        self._chunkSource = _chunk_source_key(self._h5N5File, internalPath)
+
+        # Sequentially requested blocks are read ahead into the chunk cache
+        if self._prefetcher is not None:
+            self._prefetcher.cancel()
+        self._prefetcher = Prefetcher(dataset.shape, self._prefetchChunks) if self._chunkSource is not None else None
+
     def execute(self, slot, subindex, roi, result):
         t = time.time()
         assert self._h5N5File is not None
@@ -136,6 +167,7 @@ class OpStreamingH5N5Reader(Operator):
         key = roi.toSlice()
         h5N5File = self._h5N5File
         internalPath = self.InternalPath.value
+        chunkCache = getDefaultChunkCache()
 
         timer = None
         if logger.isEnabledFor(logging.DEBUG):
@@ -143,7 +175,15 @@ class OpStreamingH5N5Reader(Operator):
             timer = Timer()
             timer.unpause()
 
-        if result.flags.c_contiguous:
+        if self._parallelReads and processPool.uses_process_pool(self):
+            read_in_processes(processPool.get_process_pool(), h5N5File[internalPath], roi.start, roi.stop, result)
+        elif self._chunkSource is not None and chunkCache is not None:
+            self._prefetcher.observe(roi.start, roi.stop)
+            dataset = h5N5File[internalPath]
+            chunkCache.read(
+                self._chunkSource, dataset.shape, dataset.chunks, roi.start, roi.stop, self._readChunk, result
+            )
+        elif result.flags.c_contiguous:
             h5N5File[internalPath].read_direct(result[...], key)
         else:
             result[...] = h5N5File[internalPath][key]
@@ -155,7 +195,18 @@ class OpStreamingH5N5Reader(Operator):
             timer.pause()
             logger.debug(f"Completed HDF5 read in {timer.seconds()} seconds: [{roi.start}, {roi.stop}]")
 
+    def _readChunk(self, chunk_start, chunk_stop):
+        return self._h5N5File[self.InternalPath.value][roiToSlice(chunk_start, chunk_stop)]
+
+    def _prefetchChunks(self, start, stop):
+        chunkCache = getDefaultChunkCache()
+        if chunkCache is not None and self._chunkSource is not None:
+            dataset = self._h5N5File[self.InternalPath.value]
+            chunkCache.prefetch(self._chunkSource, dataset.shape, dataset.chunks, start, stop, self._readChunk)
+
     def propagateDirty(self, slot, subindex, roi):
+        if self._prefetcher is not None:
+            self._prefetcher.cancel()
         if slot == self.H5N5File or slot == self.InternalPath:
             self.OutputImage.setDirty(slice(None))
 
@@ -31,6 +31,7 @@ from lazyflow.graph import InputSlot, Operator, OutputSlot
 from lazyflow.roi import roiToSlice
 from lazyflow.utility.helpers import get_default_axisordering
 from lazyflow.utility.io_util import tiff_encoding
+from lazyflow.utility.io_util.chunkCache import fileSourceKey, getDefaultChunkCache
 
 logger = logging.getLogger(__name__)
 
@@ -119,7 +120,27 @@ class OpTiffReader(Operator):
         """
         Use tifffile to read the result.
         This allows us to support JPEG-compressed TIFFs.
+
+        Pages are always decoded as a whole, so they are read through the shared chunk cache (if enabled).
         """
+        chunkCache = getDefaultChunkCache()
+        if chunkCache is not None:
+            num_non_page_axes = len(self._non_page_shape)
+            page_chunk_shape = (1,) * num_non_page_axes + tuple(self._page_shape)
+            with tifffile.TiffFile(self._filepath, mode="r") as f:
+                chunkCache.read(
+                    fileSourceKey(self._filepath),
+                    self.Output.meta.shape,
+                    page_chunk_shape,
+                    roi.start,
+                    roi.stop,
+                    lambda page_start, page_stop: self._read_page(f, page_start[:num_non_page_axes]).reshape(
+                        page_chunk_shape
+                    ),
+                    result,
+                )
+            return
+
         num_page_axes = len(self._page_shape)
         roi = numpy.array([roi.start, roi.stop])
         # page axes are assumed to be last in roi
@@ -133,19 +154,20 @@ class OpTiffReader(Operator):
 
         with tifffile.TiffFile(self._filepath, mode="r") as f:
             for roi_page_ndindex in numpy.ndindex(*page_index_roi_shape):
-                key = None
-                if self._non_page_shape:
-                    tiff_page_ndindex = page_index_roi[0] + roi_page_ndindex
-                    key = int(numpy.ravel_multi_index(tiff_page_ndindex, self._non_page_shape))
-                    logger.debug(...)
+                page_data = self._read_page(f, page_index_roi[0] + roi_page_ndindex)
+                result[roi_page_ndindex] = page_data[roiToSlice(*roi_within_page)]
 
-                page_data = f.series[0].asarray(key=key, maxworkers=1)
+    def _read_page(self, f: tifffile.TiffFile, tiff_page_ndindex) -> numpy.ndarray:
+        key = None
+        if self._non_page_shape:
+            key = int(numpy.ravel_multi_index(tiff_page_ndindex, self._non_page_shape))
 
-                assert page_data.shape == self._page_shape, "Unexpected page shape: {} vs {}".format(
-                    page_data.shape, self._page_shape
-                )
+        page_data = f.series[0].asarray(key=key, maxworkers=1)
 
-                result[roi_page_ndindex] = page_data[roiToSlice(*roi_within_page)]
+        assert page_data.shape == self._page_shape, "Unexpected page shape: {} vs {}".format(
+            page_data.shape, self._page_shape
+        )
+        return page_data
 
     def _set_pixel_size(self, axes: str, tifftags: tifffile.TiffTags, ij_meta: Dict, ome_meta: str):
         if ome_meta:
@@ -47,6 +47,7 @@ class OpBlockedArrayCache(Operator, ManagedBlockedCache):
     # If not provided, will be set to Input.meta.shape
     BypassModeEnabled = InputSlot(value=False)
     CompressionEnabled = InputSlot(value=False)
+    SpillEnabled = InputSlot(value=False)  # See OpUnblockedArrayCache
 
     Output = OutputSlot(allow_mask=True)
     CleanBlocks = OutputSlot()  # A list of slicings indicating which blocks are stored in the cache and clean.
@@ -72,6 +73,7 @@ class OpBlockedArrayCache(Operator, ManagedBlockedCache):
 
         self._opSimpleBlockedArrayCache = OpSimpleBlockedArrayCache(parent=self)
         self._opSimpleBlockedArrayCache.CompressionEnabled.connect(self.CompressionEnabled)
+        self._opSimpleBlockedArrayCache.SpillEnabled.connect(self.SpillEnabled)
         self._opSimpleBlockedArrayCache.Input.connect(self._opCacheFixer.Output)
         self._opSimpleBlockedArrayCache.BlockShape.connect(self.BlockShape)
         self._opSimpleBlockedArrayCache.BypassModeEnabled.connect(self.BypassModeEnabled)
@@ -110,6 +112,12 @@ class OpBlockedArrayCache(Operator, ManagedBlockedCache):
     def getBlockAccessTimes(self):
         return self._opSimpleBlockedArrayCache.getBlockAccessTimes()
 
+    def getBlockStats(self):
+        return self._opSimpleBlockedArrayCache.getBlockStats()
+
+    def getCounters(self):
+        return self._opSimpleBlockedArrayCache.getCounters()
+
     def freeMemory(self):
         return self._opSimpleBlockedArrayCache.freeMemory()
 
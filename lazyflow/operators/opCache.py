@@ -26,6 +26,7 @@ from abc import abstractmethod, ABCMeta
 
 # lazyflow
 from lazyflow.operators import cacheMemoryManager
+from lazyflow.operators.cacheEvictionPolicies import BlockStats
 from future.utils import with_metaclass
 
 
@@ -188,6 +189,22 @@ class ManagedBlockedCache(ManagedCache):
         """
         raise NotImplementedError("No default implementation for getBlockAccessTimes()")
 
+    def getBlockStats(self):
+        """
+        get a list of BlockStats for all blocks
+
+        Used by cost aware eviction policies. The default implementation only
+        knows about access times, caches should override it to also report
+        access counts, compute times and block sizes.
+        """
+        return [BlockStats(block_id, access_time) for block_id, access_time in self.getBlockAccessTimes()]
+
+    def getCounters(self):
+        """
+        get the CacheCounters of this cache, or None if the cache does not count hits and misses
+        """
+        return None
+
     @abstractmethod
     def freeBlock(self, block_id):
         """
@@ -29,6 +29,7 @@ from builtins import map
 import logging
 from functools import partial
 import collections
+import hashlib
 import itertools
 import time
 
@@ -56,6 +57,47 @@ def get_storage_size(h5dataset):
     return h5py.h5d.DatasetID.get_storage_size(h5dataset.id)
 
 
+class _UniformBlock(object):
+    """
+    A cache block whose pixels all have the same value, stored as just that value and the block's shape.
+    Can be read like an h5py dataset.
+    """
+
+    __slots__ = ("value", "shape", "dtype")
+
+    def __init__(self, value, shape, dtype):
+        self.dtype = numpy.dtype(dtype)
+        self.value = self.dtype.type(value)
+        self.shape = shape
+
+    @property
+    def size(self):
+        return bigintprod(self.shape)
+
+    def __getitem__(self, slicing):
+        return numpy.broadcast_to(self.value, self.shape)[slicing].copy()
+
+
+class _Payload(object):
+    """The compressed in-memory hdf5 file of a block, shared by all blocks with identical contents."""
+
+    __slots__ = ("key", "file", "refcount")
+
+    def __init__(self, key, mem_file):
+        self.key = key
+        self.file = mem_file
+        self.refcount = 0
+
+
+class _SharedBlock(object):
+    """A cache block that refers to a (possibly shared) payload."""
+
+    __slots__ = ("payload",)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+
 class OpUnmanagedCompressedCache(Operator):
     """
     A blockwise cache that stores each block as a separate in-memory hdf5 file with a compressed dataset.
@@ -69,6 +111,12 @@ class OpUnmanagedCompressedCache(Operator):
         3. Automatically determined shape with t=1, c=1 and xyz such that the
            blocks are smaller than 1MiB (raw)
 
+    Blocks are deduplicated (except for masked data):
+        * A block whose pixels all have the same value is stored as that value (no hdf5 file at all).
+        * Blocks with identical contents share one compressed file (found via a hash of the contents).
+          usedMemory() splits the size of a shared file among the blocks that refer to it.
+    A deduplicated block is copied into its own file before it is modified (see _getCacheFile()).
+
     Note: This class is not managed by the memory manager, so there can be non-managed subclasses.
           The "managed" version is OpCompressedCache, defined below.
 
@@ -103,7 +151,10 @@ class OpUnmanagedCompressedCache(Operator):
     def _init_cache(self, new_blockshape):
         with self._lock:
             self._blockshape = new_blockshape
+            # Values are h5py.Files (private to the block), _UniformBlocks or _SharedBlocks
             self._cacheFiles = {}
+            # Index of the shared payloads: (content hash, shape, dtype) -> _Payload
+            self._payloads = {}
             self._dirtyBlocks = set()
             self._blockLocks = {}
             self._chunkshape = self._chooseChunkshape(self._blockshape)
@@ -242,7 +293,17 @@ class OpUnmanagedCompressedCache(Operator):
         self._ensureCached(block_roi)
         dataset = self._getBlockDataset(block_roi)
         assert str(block_roi) not in destination, "destination hdf5 group already has a dataset with this block's name"
-        destination.copy(dataset, str(block_roi))
+        if isinstance(dataset, _UniformBlock):
+            destination.create_dataset(
+                str(block_roi),
+                shape=dataset.shape,
+                dtype=dataset.dtype,
+                fillvalue=dataset.value,
+                chunks=self._blockChunkshape(dataset.shape),
+                compression="lzf",
+            )
+        else:
+            destination.copy(dataset, str(block_roi))
         return destination
 
     def propagateDirty(self, slot, subindex, roi):
@@ -368,7 +429,14 @@ class OpUnmanagedCompressedCache(Operator):
             group = self._cacheFiles[key]
         except KeyError:
             # entry was removed, ignore it
-            return 0
+            return 0, 0
+        if isinstance(group, _UniformBlock):
+            return group.dtype.itemsize, group.size * group.dtype.itemsize
+        if isinstance(group, _SharedBlock):
+            payload = group.payload
+            ds = payload.file["data"]
+            # Each block that refers to the payload accounts for its share
+            return get_storage_size(ds) / max(payload.refcount, 1), ds.size * self._getDtypeBytes(ds.dtype)
         tot = 0
         unc = 0
         if "data" in group:
@@ -385,44 +453,146 @@ class OpUnmanagedCompressedCache(Operator):
 
     def _getCacheFile(self, entire_block_roi):
         """
-        Get the cache file for the block that starts at block_start.
+        Get the (private, writable) cache file for the block that starts at block_start.
         If it doesn't exist yet, create it first.
+        A deduplicated block gets its own copy of the data first.
         """
         block_start = tuple(entire_block_roi[0])
-        if block_start in self._cacheFiles:
-            return self._cacheFiles[block_start]
+        block_file = self._cacheFiles.get(block_start)
+        if isinstance(block_file, h5py.File):
+            return block_file
         with self._lock:
-            if block_start not in self._cacheFiles:
-                # Create an in-memory hdf5 file with a unique name
-                # (the counter ensures that even blocks that have been deleted previously get a unique name when they are re-created).
+            entry = self._cacheFiles.get(block_start)
+            if isinstance(entry, h5py.File):
+                return entry
+            if entry is None:
                 logger.debug("Creating a cache file for block: {}".format(list(block_start)))
-                filename = (
-                    str(id(self)) + str(id(self._cacheFiles)) + str(block_start) + str(next(self._block_id_counter))
-                )
-                mem_file = h5py.File(filename, driver="core", backing_store=False, mode="w")
-
-                # h5py will crash if the chunkshape is larger than the dataset shape.
-                datashape = tuple(entire_block_roi[1] - entire_block_roi[0])
-                chunkshape = numpy.minimum(numpy.array(datashape), self._chunkshape)
-                chunkshape = tuple(chunkshape)
-
-                # Make a compressed dataset
-                mem_file.create_dataset(
-                    "data", shape=datashape, dtype=self.Output.meta.dtype, chunks=chunkshape, compression="lzf"
-                )  # lzf should be faster than gzip,
-                # with a slightly worse compression ratio
-                # Add mask information if needed.
-                if self.Output.meta.has_mask:
-                    mem_file.create_dataset(
-                        "mask", shape=datashape, dtype=bool, chunks=chunkshape, compression="lzf"
-                    )  # lzf should be faster than gzip,
-                    # with a slightly worse compression ratio
-                    mem_file.create_dataset("fill_value", shape=tuple(), dtype=self.Output.meta.dtype)
+                mem_file = self._createCacheFile(entire_block_roi)
+                self._blockLocks[block_start] = RequestLock()
+                self._dirtyBlocks.add(block_start)
+            elif isinstance(entry, _UniformBlock):
+                # Unwritten chunks take no space
+                mem_file = self._createCacheFile(entire_block_roi, fillvalue=entry.value)
+            elif entry.payload.refcount == 1:
+                # The payload isn't shared (anymore), so this block can take it over.
+                del self._payloads[entry.payload.key]
+                mem_file = entry.payload.file
+            else:
+                entry.payload.refcount -= 1
+                mem_file = self._createCacheFile(entire_block_roi, copy_from=entry.payload.file["data"])
+            self._cacheFiles[block_start] = mem_file
+            return mem_file
+
+    def _createCacheFile(self, entire_block_roi, fillvalue=None, copy_from=None):
+        block_start = tuple(entire_block_roi[0])
+        # Create an in-memory hdf5 file with a unique name
+        # (the counter ensures that even blocks that have been deleted previously get a unique name when they are re-created).
+        filename = str(id(self)) + str(id(self._cacheFiles)) + str(block_start) + str(next(self._block_id_counter))
+        mem_file = h5py.File(filename, driver="core", backing_store=False, mode="w")
 
+        datashape = tuple(entire_block_roi[1] - entire_block_roi[0])
+        chunkshape = self._blockChunkshape(datashape)
+
+        if copy_from is not None:
+            # Copies the compressed chunks
+            mem_file.copy(copy_from, "data")
+        else:
+            # Make a compressed dataset
+            mem_file.create_dataset(
+                "data",
+                shape=datashape,
+                dtype=self.Output.meta.dtype,
+                chunks=chunkshape,
+                compression="lzf",
+                fillvalue=fillvalue,
+            )  # lzf should be faster than gzip,
+            # with a slightly worse compression ratio
+        # Add mask information if needed.
+        if self.Output.meta.has_mask:
+            mem_file.create_dataset(
+                "mask", shape=datashape, dtype=bool, chunks=chunkshape, compression="lzf"
+            )  # lzf should be faster than gzip,
+            # with a slightly worse compression ratio
+            mem_file.create_dataset("fill_value", shape=tuple(), dtype=self.Output.meta.dtype)
+        return mem_file
+
+    def _blockChunkshape(self, datashape):
+        # h5py will crash if the chunkshape is larger than the dataset shape.
+        return tuple(numpy.minimum(numpy.array(datashape), self._chunkshape))
+
+    def _ensureBlock(self, entire_block_roi):
+        """
+        Add the block to the cache (as dirty) if it isn't there yet.
+        (Without creating a file, unless the data is masked.)
+        """
+        block_start = tuple(entire_block_roi[0])
+        if block_start in self._cacheFiles:
+            return
+        if self.Output.meta.has_mask:
+            self._getCacheFile(entire_block_roi)
+            return
+        with self._lock:
+            if block_start not in self._cacheFiles:
+                datashape = tuple(int(x) for x in numpy.subtract(entire_block_roi[1], entire_block_roi[0]))
+                self._cacheFiles[block_start] = _UniformBlock(0, datashape, self.Output.meta.dtype)
                 self._blockLocks[block_start] = RequestLock()
-                self._cacheFiles[block_start] = mem_file
                 self._dirtyBlocks.add(block_start)
-            return self._cacheFiles[block_start]
+
+    def _storeBlock(self, entire_block_roi, data):
+        """
+        Replace the contents of an entire (non-masked) block, deduplicated:
+        Uniform data is stored as a single value, data that is already stored for another block shares its payload.
+        """
+        block_start = tuple(entire_block_roi[0])
+        data = numpy.asarray(data)
+        first_value = data.flat[0]
+        if (data == first_value).all():
+            entry = _UniformBlock(first_value, data.shape, data.dtype)
+        else:
+            data = numpy.ascontiguousarray(data)
+            digest = hashlib.blake2b(data.data.cast("B"), digest_size=16).digest()
+            key = (digest, data.shape, data.dtype.str)
+            with self._lock:
+                payload = self._payloads.get(key)
+                if payload is not None:
+                    payload.refcount += 1
+            if payload is None:
+                # Compress outside of the lock
+                mem_file = self._createCacheFile(entire_block_roi)
+                mem_file["data"][...] = data
+                with self._lock:
+                    payload = self._payloads.get(key)
+                    if payload is None:
+                        payload = self._payloads[key] = _Payload(key, mem_file)
+                    else:
+                        # Someone stored the same data in the meantime
+                        mem_file.close()
+                    payload.refcount += 1
+            entry = _SharedBlock(payload)
+
+        with self._lock:
+            old_entry = self._cacheFiles.get(block_start)
+            self._cacheFiles[block_start] = entry
+            if block_start not in self._blockLocks:
+                self._blockLocks[block_start] = RequestLock()
+            self._releaseEntry(old_entry)
+
+    def _releaseEntry(self, entry):
+        """Close the file of a block that was removed from the cache (unless it's shared). Call with self._lock held."""
+        if isinstance(entry, h5py.File):
+            entry.close()
+        elif isinstance(entry, _SharedBlock):
+            payload = entry.payload
+            payload.refcount -= 1
+            if payload.refcount == 0:
+                del self._payloads[payload.key]
+                payload.file.close()
+
+    def _removeBlock(self, block_start):
+        with self._lock:
+            entry = self._cacheFiles.pop(block_start, None)
+            self._blockLocks.pop(block_start, None)
+            self._releaseEntry(entry)
 
     def _ensureCached(self, entire_block_roi):
         """
@@ -430,7 +600,7 @@ class OpUnmanagedCompressedCache(Operator):
         (Refresh it if it's dirty.)
         """
         block_start = tuple(entire_block_roi[0])
-        block_file = self._getCacheFile(entire_block_roi)
+        self._ensureBlock(entire_block_roi)
         if block_start in self._dirtyBlocks:
             updated_cache = False
             with self._blockLocks[block_start]:
@@ -441,18 +611,17 @@ class OpUnmanagedCompressedCache(Operator):
                     #  h5py.dataset.__getitem__ creates a copy, not a view.
                     # We must use a temporary numpy array to hold the data.
                     data = self.Input(*entire_block_roi).wait()
-                    block_file["data"][...] = data
                     if self.Output.meta.has_mask:
+                        block_file = self._getCacheFile(entire_block_roi)
+                        block_file["data"][...] = data
                         block_file["mask"][...] = data.mask
                         block_file["fill_value"][...] = data.fill_value
+                    else:
+                        self._storeBlock(entire_block_roi, data)
 
                     if logger.isEnabledFor(logging.DEBUG):
                         uncompressed_size = bigintprod(data.shape) * self._getDtypeBytes(data.dtype)
-                        storage_size = block_file["data"].id.get_storage_size()
-                        if "mask" in block_file:
-                            storage_size += block_file["mask"].id.get_storage_size()
-                        if "fill_value" in block_file:
-                            storage_size += block_file["fill_value"].id.get_storage_size()
+                        storage_size, _ = self._memoryForBlock(block_start)
                         logger.debug(
                             "Storage for block: {} is {}. ({}% of original)".format(
                                 block_start, storage_size, 100 * storage_size / uncompressed_size
@@ -516,9 +685,15 @@ class OpUnmanagedCompressedCache(Operator):
                 #  don't bother creating if we're just going to fill it with zeros.
                 # (This feature is used by the OpCompressedUserLabelArray)
                 pass
+            elif not self.Output.meta.has_mask and (intersecting_roi == numpy.asarray(entire_block_roi)).all():
+                # The entire block is replaced: no need for a private copy of the old data
+                self._storeBlock(entire_block_roi, new_block_data)
+                entry = self._cacheFiles.get(block_start)
+                if not store_zero_blocks and isinstance(entry, _UniformBlock) and entry.value == 0:
+                    self._removeBlock(block_start)
             else:
                 # Copy from source to block
-                dataset = self._getBlockDataset(entire_block_roi)
+                dataset = self._getWritableBlockDataset(entire_block_roi)
                 if self.Output.meta.has_mask:
                     dataset["data"][block_relative_intersection_slicing] = new_block_data.data
                     dataset["mask"][block_relative_intersection_slicing] = new_block_data.mask
@@ -537,11 +712,8 @@ class OpUnmanagedCompressedCache(Operator):
 
                     # If we can, remove this block entirely.
                     if not store_zero_blocks and new_block_sum == 0 and (dataset[:] == 0).all():
-                        with self._lock:
-                            with self._blockLocks[block_start]:
-                                self._cacheFiles[block_start].close()
-                                del self._cacheFiles[block_start]
-                            del self._blockLocks[block_start]
+                        with self._blockLocks[block_start]:
+                            self._removeBlock(block_start)
 
             # Here, we assume that if this function is used to update ANY PART of a
             #  block, he is responsible for updating the ENTIRE block.
@@ -612,7 +784,20 @@ class OpUnmanagedCompressedCache(Operator):
 
     def _getBlockDataset(self, entire_block_roi):
         """
-        Get the correct cache file and return the *dataset* handle,
+        Get the block's *dataset* handle for reading (not a numpy array of its contents).
+        Don't write into it: deduplicated blocks share their datasets (use _getWritableBlockDataset()).
+        """
+        self._ensureBlock(entire_block_roi)
+        entry = self._cacheFiles.get(tuple(entire_block_roi[0]))
+        if isinstance(entry, _UniformBlock):
+            return entry
+        if isinstance(entry, _SharedBlock):
+            return entry.payload.file["data"]
+        return self._getWritableBlockDataset(entire_block_roi)
+
+    def _getWritableBlockDataset(self, entire_block_roi):
+        """
+        Get the block's private cache file and return the *dataset* handle,
         not a numpy array of its contents.
         """
         block_file = self._getCacheFile(entire_block_roi)
@@ -625,9 +810,13 @@ class OpUnmanagedCompressedCache(Operator):
         logger.debug("Closing all caches")
         cacheFiles = self._cacheFiles
         for k, v in list(cacheFiles.items()):
-            with self._blockLocks[k]:
-                v.close()
+            if isinstance(v, h5py.File):
+                with self._blockLocks[k]:
+                    v.close()
         with self._lock:
+            for payload in self._payloads.values():
+                payload.file.close()
+            self._payloads = {}
             self._blockLocks = {}
             self._cacheFiles = {}
 
@@ -655,7 +844,12 @@ class OpCompressedCache(OpUnmanagedCompressedCache, ManagedBlockedCache):
         super(OpCompressedCache, self).generateReport(report)
         report.dtype = self.Output.meta.dtype
         f = self._compression_factor
-        report.info = "Compression factor: {:.2f}".format(f)
+        entries = list(self._cacheFiles.values())
+        uniform = sum(isinstance(entry, _UniformBlock) for entry in entries)
+        shared = sum(isinstance(entry, _SharedBlock) for entry in entries)
+        report.info = "Compression factor: {:.2f}, {} uniform blocks, {} blocks share {} payloads".format(
+            f, uniform, shared, len(self._payloads)
+        )
 
     def freeMemory(self):
         mem = self.usedMemory()
@@ -683,16 +877,15 @@ class OpCompressedCache(OpUnmanagedCompressedCache, ManagedBlockedCache):
             except KeyError:
                 # this file was deleted
                 return 0
-            if "data" not in f:
+            if isinstance(f, h5py.File) and "data" not in f:
                 return 0
-            ds = f["data"]
             # use actual size, not number of bytes in
             # *uncompressed* array
-            mem = get_storage_size(ds)
-            f.close()
+            mem, _ = self._memoryForBlock(block_id)
             with self._lock:
                 del self._cacheFiles[block_id]
-                del self._last_access_times[block_id]
+                self._last_access_times.pop(block_id, None)
+                self._releaseEntry(f)
             return mem
 
     def getBlockAccessTimes(self):
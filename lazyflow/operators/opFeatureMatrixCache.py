@@ -34,6 +34,110 @@ from lazyflow.utility import OrderedSignal
 from lazyflow.roi import getBlockBounds, getIntersectingBlocks, determineBlockShape
 
 
+class FeatureMatrixBuffer(object):
+    """
+    The label & feature matrices of all blocks, stored contiguously in one growing array.
+
+    - New (or grown) blocks are appended in place; the capacity grows geometrically.
+    - A block whose number of rows didn't change is overwritten in place.
+    - Removed blocks leave a gap, which is closed (in place) when the matrix is read next.
+
+    :py:meth:`matrix` returns a read-only view without copying. Views that have been handed out
+    are never modified: rows that have been exported are copied before they are changed.
+    """
+
+    MIN_CAPACITY = 1024
+
+    def __init__(self):
+        self._data = None
+        self._ranges = {}  # block -> [start, stop]
+        self._end = 0
+        self._has_gaps = False
+        self._exported_end = 0  # rows [0, _exported_end) of _data are visible in a view we handed out
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def __contains__(self, block):
+        return block in self._ranges
+
+    def keys(self):
+        return list(self._ranges.keys())
+
+    def set(self, block, matrix):
+        if self._data is not None and matrix.shape[1] != self._data.shape[1]:
+            # The number of features changed. All blocks will be replaced.
+            self.__init__()
+
+        block_range = self._ranges.get(block)
+        if block_range is not None and block_range[1] - block_range[0] == len(matrix):
+            if block_range[0] < self._exported_end:
+                self._unshare()
+            self._data[block_range[0] : block_range[1]] = matrix
+            return
+
+        self.remove(block)
+        if len(matrix) == 0:
+            return
+        self._reserve(self._end + len(matrix), matrix.shape[1], matrix.dtype)
+        if self._end < self._exported_end:
+            # The tail was removed, but its rows are still visible in a view we handed out
+            self._unshare()
+        self._data[self._end : self._end + len(matrix)] = matrix
+        self._ranges[block] = [self._end, self._end + len(matrix)]
+        self._end += len(matrix)
+
+    def remove(self, block):
+        block_range = self._ranges.pop(block, None)
+        if block_range is None:
+            return
+        if block_range[1] == self._end:
+            self._end = block_range[0]
+        else:
+            self._has_gaps = True
+
+    def matrix(self, num_columns, dtype=numpy.float32):
+        """
+        The rows of all blocks, as a read-only view.
+        (An empty matrix with num_columns columns if there are no blocks.)
+        """
+        if self._data is None:
+            return numpy.ndarray(shape=(0, num_columns), dtype=dtype)
+        if self._has_gaps:
+            self._compact()
+        view = self._data[: self._end]
+        view.flags.writeable = False
+        self._exported_end = max(self._exported_end, self._end)
+        return view
+
+    def _reserve(self, rows, num_columns, dtype):
+        if self._data is not None and rows <= len(self._data):
+            return
+        capacity = max(rows, self.MIN_CAPACITY, 2 * (0 if self._data is None else len(self._data)))
+        data = numpy.empty((capacity, num_columns), dtype=dtype)
+        if self._data is not None:
+            data[: self._end] = self._data[: self._end]
+        self._data = data
+        self._exported_end = 0
+
+    def _unshare(self):
+        self._data = self._data.copy()
+        self._exported_end = 0
+
+    def _compact(self):
+        write = 0
+        for block_range in sorted(self._ranges.values()):
+            start, stop = block_range
+            if start != write:
+                if write < self._exported_end:
+                    self._unshare()
+                self._data[write : write + stop - start] = self._data[start:stop]
+                block_range[:] = [write, write + stop - start]
+            write += stop - start
+        self._end = write
+        self._has_gaps = False
+
+
 class OpFeatureMatrixCache(Operator):
     """
     - Request features and labels in blocks
@@ -71,7 +175,7 @@ class OpFeatureMatrixCache(Operator):
 
         self._blockshape = None
         self._dirty_blocks = set()
-        self._blockwise_feature_matrices = {}
+        self._blockwise_feature_matrices = FeatureMatrixBuffer()
         self._block_locks = {}  # One lock per stored block
 
         self._init_blocks(None, None)
@@ -130,7 +234,7 @@ class OpFeatureMatrixCache(Operator):
                 # A block should never span multiple time slices.
                 # For txy volumes, that could lead to lots of extra features being computed.
                 tagged_shape["t"] = 1
-            blockshape = determineBlockShape(list(tagged_shape.values()), 40 ** 3)
+            blockshape = determineBlockShape(list(tagged_shape.values()), 40**3)
 
         # Don't span more than 256 px along any axis
         blockshape = tuple(min(x, 256) for x in blockshape)
@@ -185,26 +289,14 @@ class OpFeatureMatrixCache(Operator):
                 labels_and_features_matrix = req.result
                 self._dirty_blocks.remove(block_start)
 
-                if labels_and_features_matrix.shape[0] > 0:
-                    # Update the block entry with the new matrix.
-                    self._blockwise_feature_matrices[block_start] = labels_and_features_matrix
-                else:
-                    # All labels were removed from the block,
-                    # So the new feature matrix is empty.
-                    # Just delete its entry from our list.
-                    try:
-                        del self._blockwise_feature_matrices[block_start]
-                    except KeyError:
-                        pass
-
-        # Concatenate the all blockwise results
-        if self._blockwise_feature_matrices:
-            total_feature_matrix = numpy.concatenate(list(self._blockwise_feature_matrices.values()), axis=0)
-        else:
-            # No label points at all.
-            # Return an empty label&feature matrix (of the correct shape)
+                # Update the block entry with the new matrix (appended or overwritten in place).
+                # If all labels were removed from the block, the new matrix is empty and the block is removed.
+                self._blockwise_feature_matrices.set(block_start, labels_and_features_matrix)
+
+            # The rows of all blocks are already stored contiguously.
+            # (If there are no label points at all, this is an empty matrix of the correct shape.)
             num_feature_channels = self.FeatureImage.meta.shape[-1]
-            total_feature_matrix = numpy.ndarray(shape=(0, 1 + num_feature_channels), dtype=numpy.float32)
+            total_feature_matrix = self._blockwise_feature_matrices.matrix(1 + num_feature_channels)
 
         self.progressSignal(100.0)
         logger.debug("After update, there are {} clean blocks".format(len(self._blockwise_feature_matrices)))
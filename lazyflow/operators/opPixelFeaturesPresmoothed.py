@@ -25,6 +25,7 @@ import math
 import numpy
 import vigra
 
+from collections import namedtuple
 from functools import partial
 
 from lazyflow import roi
@@ -32,6 +33,7 @@ from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.request import RequestPool
 from lazyflow.roi import sliceToRoi, roiToSlice
 from lazyflow.rtype import SubRegion
+from lazyflow.utility.featureBlockStore import getDefaultFeatureStore
 
 from .operators import OpArrayPiper
 from .filterOperators import (
@@ -49,8 +51,22 @@ if WITH_FAST_FILTERS:
 
 logger = logging.getLogger(__name__)
 
+# Bump this whenever the feature computation changes, to invalidate persistently stored feature blocks.
+FEATURE_STORE_VERSION = 1
+
+# One feature (row i, scale j) of a request, restricted to channels begin:end of that feature
+_FeatureTask = namedtuple("_FeatureTask", ["i", "j", "oslot", "begin", "end", "subtarget", "filter_target_slice"])
+
 
 class OpPixelFeaturesPresmoothed(Operator):
+    """
+    Computes all selected features of the input image, pre-smoothing the input once per scale.
+
+    If a persistent feature store is configured (see lazyflow.utility.featureBlockStore),
+    computed feature blocks are stored there and reused for identical input blocks, e.g.
+    when a project is reopened or a headless batch is rerun with the same feature selection.
+    """
+
     name = "OpPixelFeaturesPresmoothed"
     category = "Vigra filter"
 
@@ -386,11 +402,47 @@ class OpPixelFeaturesPresmoothed(Operator):
                 del source
                 source = sourceF
 
+            feature_tasks = self._get_feature_tasks(slot_roi, target, full_output_slice, filter_target_slice)
+
+            feature_store = getDefaultFeatureStore()
+            if feature_store is not None:
+                # Blocks are keyed by the content of the input they are computed from,
+                # together with all parameters that influence the result.
+                source_digest = feature_store.digest(source)
+                store_keys = [
+                    feature_store.makeKey(
+                        FEATURE_STORE_VERSION,
+                        WITH_FAST_FILTERS,
+                        source_digest,
+                        tuple(map(int, input_smooth_start)),
+                        tuple(map(int, input_smooth_stop)),
+                        axes2enlarge,
+                        self.FeatureIds.value[task.i],
+                        float(self.scales[task.j]),
+                        bool(self.ComputeIn2d.value[task.j]),
+                        (task.begin, task.end),
+                        (int(full_output_start[0]), int(full_output_stop[0])),
+                        tuple(map(int, output_start)),
+                        tuple(map(int, output_stop)),
+                    )
+                    for task in feature_tasks
+                ]
+                uncached = [
+                    (task, key)
+                    for task, key in zip(feature_tasks, store_keys)
+                    if feature_store.get(key, out=task.subtarget) is None
+                ]
+                feature_tasks = [task for task, _ in uncached]
+                store_keys = [key for _, key in uncached]
+                if not feature_tasks:
+                    logger.debug(f"OpPixelFeaturesPresmoothed: all features of {slot_roi.pprint()} found in store")
+                    return
+
             sourceV = source.view(vigra.VigraArray)
             sourceV.axistags = copy.copy(self.Input.meta.axistags)
 
             dimCol = len(self.scales)
-            dimRow = self.matrix.shape[0]
+            needed_scales = {task.j for task in feature_tasks}
 
             presmoothed_source = [None] * dimCol
 
@@ -401,12 +453,8 @@ class OpPixelFeaturesPresmoothed(Operator):
             ) + source_smooth_shape
             try:
                 for j in range(dimCol):
-                    for i in range(dimRow):
-                        if self.matrix[i, j]:
-                            # There is at least one filter op with this scale
-                            break
-                    else:
-                        # There is no filter op at this scale
+                    if j not in needed_scales:
+                        # There is no (uncached) filter op at this scale
                         continue
 
                     if self.scales[j] > 1.0:
@@ -442,54 +490,26 @@ class OpPixelFeaturesPresmoothed(Operator):
                 logger.debug("Failed to free array memory.")
             del source
 
-            cnt = 0
-            written = 0
-            closures = []
-            # connect individual operators
-            for i in range(dimRow):
-                for j in range(dimCol):
-                    if self.matrix[i, j]:
-                        oslot = self.featureOps[i][j].Output
-                        req = None
-                        slices = oslot.meta.shape[1]
-                        if (
-                            cnt + slices >= slot_roi.start[1]
-                            and slot_roi.start[1] - cnt < slices
-                            and slot_roi.start[1] + written < slot_roi.stop[1]
-                        ):
-                            begin = 0
-                            if cnt < slot_roi.start[1]:
-                                begin = slot_roi.start[1] - cnt
-                            end = slices
-                            if cnt + end > slot_roi.stop[1]:
-                                end = slot_roi.stop[1] - cnt
-
-                            # feature slice in output frame
-                            feature_slice = (slice(None), slice(written, written + end - begin)) + (slice(None),) * 3
-
-                            subtarget = target[feature_slice]
-                            # readjust the roi for the new source array
-                            full_filter_target_slice = [full_output_slice[0], slice(begin, end), *filter_target_slice]
-                            filter_target_roi = SubRegion(oslot, pslice=full_filter_target_slice)
-
-                            closure = partial(
-                                oslot.operator.call_execute,
-                                oslot,
-                                (),
-                                filter_target_roi,
-                                subtarget,
-                                sourceArray=presmoothed_source[j],
-                            )
-                            closures.append(closure)
-
-                            written += end - begin
-                        cnt += slices
             pool = RequestPool()
-            for c in closures:
-                pool.request(c)
+            for task in feature_tasks:
+                filter_target_roi = SubRegion(task.oslot, pslice=task.filter_target_slice)
+                pool.request(
+                    partial(
+                        task.oslot.operator.call_execute,
+                        task.oslot,
+                        (),
+                        filter_target_roi,
+                        task.subtarget,
+                        sourceArray=presmoothed_source[task.j],
+                    )
+                )
             pool.wait()
             pool.clean()
 
+            if feature_store is not None:
+                for task, key in zip(feature_tasks, store_keys):
+                    feature_store.put(key, task.subtarget)
+
             for i in range(len(presmoothed_source)):
                 if presmoothed_source[i] is not None:
                     try:
@@ -497,6 +517,42 @@ class OpPixelFeaturesPresmoothed(Operator):
                     except Exception:
                         presmoothed_source[i] = None
 
+    def _get_feature_tasks(self, slot_roi, target, full_output_slice, filter_target_slice):
+        """
+        Split the requested output channels into the features (and their channels) they belong to.
+        """
+        feature_tasks = []
+        cnt = 0
+        written = 0
+        for i in range(self.matrix.shape[0]):
+            for j in range(len(self.scales)):
+                if self.matrix[i, j]:
+                    oslot = self.featureOps[i][j].Output
+                    slices = oslot.meta.shape[1]
+                    if (
+                        cnt + slices >= slot_roi.start[1]
+                        and slot_roi.start[1] - cnt < slices
+                        and slot_roi.start[1] + written < slot_roi.stop[1]
+                    ):
+                        begin = 0
+                        if cnt < slot_roi.start[1]:
+                            begin = slot_roi.start[1] - cnt
+                        end = slices
+                        if cnt + end > slot_roi.stop[1]:
+                            end = slot_roi.stop[1] - cnt
+
+                        # feature slice in output frame
+                        feature_slice = (slice(None), slice(written, written + end - begin)) + (slice(None),) * 3
+
+                        subtarget = target[feature_slice]
+                        # readjust the roi for the new source array
+                        full_filter_target_slice = [full_output_slice[0], slice(begin, end), *filter_target_slice]
+                        feature_tasks.append(_FeatureTask(i, j, oslot, begin, end, subtarget, full_filter_target_slice))
+
+                        written += end - begin
+                    cnt += slices
+        return feature_tasks
+
     def _computeGaussianSmoothing(self, vol, sigma, roi, in2d):
         if WITH_FAST_FILTERS:
             # Use fast filters (if available)
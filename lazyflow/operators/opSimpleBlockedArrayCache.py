@@ -9,6 +9,7 @@ from lazyflow.request import Request, RequestPool
 from lazyflow.roi import getIntersectingRois, roiToSlice
 from lazyflow.rtype import SubRegion
 from lazyflow.utility.helpers import get_ram_per_element
+from lazyflow.utility.prefetcher import Prefetcher
 
 
 class OpSimpleBlockedArrayCache(OpUnblockedArrayCache):
@@ -20,6 +21,7 @@ class OpSimpleBlockedArrayCache(OpUnblockedArrayCache):
     def __init__(self, *args, **kwargs):
         super(OpSimpleBlockedArrayCache, self).__init__(*args, **kwargs)
         self._blockshape = None
+        self._prefetcher = None
 
     def setupOutputs(self):
         super(OpSimpleBlockedArrayCache, self).setupOutputs()
@@ -50,6 +52,18 @@ class OpSimpleBlockedArrayCache(OpUnblockedArrayCache):
 
         self.Output.meta.ram_usage_per_requested_pixel = ram_per_pixel
 
+        # Read ahead when the blocks are requested in a predictable order (e.g. by the BigRequestStreamer)
+        if self._prefetcher is not None:
+            self._prefetcher.cancel()
+        self._prefetcher = Prefetcher(self.Input.meta.shape, self._prefetchBlock, block_shape=self._blockshape)
+
+    def _prefetchBlock(self, start, stop):
+        block_roi = self._standardize_roi(start, stop)
+        with self._lock:
+            cached = block_roi in self._block_data
+        if not cached:
+            self._fetch_and_store_block(block_roi, out=None)
+
     def _execute_Output(self, slot, subindex, roi, result):
         """
         Overridden from OpUnblockedArrayCache
@@ -96,6 +110,10 @@ class OpSimpleBlockedArrayCache(OpUnblockedArrayCache):
         clipped_block_rois = getIntersectingRois(self.Input.meta.shape, self._blockshape, (roi.start, roi.stop), True)
         full_block_rois = getIntersectingRois(self.Input.meta.shape, self._blockshape, (roi.start, roi.stop), False)
 
+        if not self.BypassModeEnabled.value and not self.Input.meta.dontcache:
+            for full_block_roi in full_block_rois:
+                self._prefetcher.observe(*full_block_roi)
+
         pool = RequestPool()
         for full_block_roi, clipped_block_roi in zip(full_block_rois, clipped_block_rois):
             req = Request(partial(copy_block, full_block_roi, clipped_block_roi))
@@ -105,4 +123,6 @@ class OpSimpleBlockedArrayCache(OpUnblockedArrayCache):
     def propagateDirty(self, slot, subindex, roi):
         if slot in (self.BypassModeEnabled, self.BlockShape):
             return
+        if self._prefetcher is not None:
+            self._prefetcher.cancel()
         super(OpSimpleBlockedArrayCache, self).propagateDirty(slot, subindex, roi)
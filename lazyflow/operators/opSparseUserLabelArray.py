@@ -0,0 +1,383 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+# Built-in
+import logging
+import collections
+
+# Third-party
+import numpy
+import vigra
+
+# Lazyflow
+from lazyflow.graph import Operator, InputSlot, OutputSlot
+from lazyflow.request import RequestLock
+from lazyflow.roi import TinyVector, getIntersectingRois, getBlockBounds, roiToSlice, roiFromShape
+from lazyflow.rtype import SubRegion
+from lazyflow.utility.data_semantics import ImageTypes
+
+logger = logging.getLogger(__name__)
+
+
+class _SparseBlock(object):
+    """
+    The labeled pixels of one block:
+    indexes: sorted raveled (C order) indexes of the pixels, relative to the block
+    values: their (nonzero) label values
+    """
+
+    __slots__ = ("indexes", "values")
+
+    def __init__(self, indexes, values):
+        self.indexes = indexes
+        self.values = values
+
+
+class OpSparseUserLabelArray(Operator):
+    """
+    A drop-in alternative to OpCompressedUserLabelArray that stores only the labeled pixels.
+
+    User labels are usually very sparse, so each block is stored as the list of its labeled pixels
+    (raveled indexes and values) instead of a compressed dense array.
+    Dense data is produced on demand for the requested roi only.
+    Writing labels, clearLabel(), mergeLabels() and deleting labels cost O(labeled pixels) instead of O(block volume).
+
+    The slots (and the meaning of the written pixel values, including the eraser value) are the same as in
+    OpCompressedUserLabelArray, so the data is serialized through nonzeroBlocks/Output exactly like before.
+    Masked input data is not supported.
+    """
+
+    Input = InputSlot()
+    shape = InputSlot(optional=True)  # Should not be used.
+    eraser = InputSlot()
+    deleteLabel = InputSlot(optional=True)
+    blockShape = InputSlot()  # If the blockshape is changed after labels have been stored, all cache data is lost.
+
+    Output = OutputSlot()
+    # A list of rois (tuples) of the blocks that contain labels
+    CleanBlocks = OutputSlot()
+    nonzeroBlocks = OutputSlot()
+
+    Projection2D = OutputSlot()  # See OpCompressedUserLabelArray.Projection2D
+
+    def __init__(self, *args, **kwargs):
+        super(OpSparseUserLabelArray, self).__init__(*args, **kwargs)
+        self._lock = RequestLock()
+        self._label_to_purge = 0
+        self._shape = None
+        self._blockshape = None
+        self._blocks = {}  # block start -> _SparseBlock
+
+    def clearLabel(self, label_value):
+        """
+        Clear (reset to 0) all pixels of the given label value.
+        Unlike using the deleteLabel slot, this function does not "shift down" all labels above this label value.
+        """
+        self._purge_label(label_value, False)
+
+    def mergeLabels(self, from_label, into_label):
+        self._purge_label(from_label, True, into_label)
+
+    def setupOutputs(self):
+        assert not self.Input.meta.has_mask, "OpSparseUserLabelArray doesn't support masked data"
+        self.Output.meta.assignFrom(self.Input.meta)
+        self.Output.meta.dtype = numpy.uint8
+        self.Output.meta.shape = self.Input.meta.shape[:-1] + (1,)
+        self.Output.meta.drange = (0, 255)
+        self.Output.meta.data_semantics = ImageTypes.Labels
+
+        self.CleanBlocks.meta.dtype = object
+        self.CleanBlocks.meta.shape = (1,)
+        self.nonzeroBlocks.meta.dtype = object
+        self.nonzeroBlocks.meta.shape = (1,)
+
+        shape = tuple(self.Output.meta.shape)
+        blockshape = tuple(self.blockShape.value)
+        if len(blockshape) != len(shape):
+            for slot in (self.Output, self.CleanBlocks, self.nonzeroBlocks, self.Projection2D):
+                slot.meta.NOTREADY = True
+            with self._lock:
+                self._shape = None
+                self._blocks = {}
+            return
+
+        # Clip blockshape to image bounds
+        blockshape = tuple(map(int, numpy.minimum(blockshape, shape)))
+        with self._lock:
+            if shape != self._shape:
+                # The labels can't be kept for a different volume.
+                self._shape = shape
+                self._blocks = {}
+            elif blockshape != self._blockshape and self._blocks:
+                raise RuntimeError(
+                    "You are not permitted to reconfigure the labeling operator after you've already stored labels in it."
+                )
+            self._blockshape = blockshape
+
+        # is_blocked_cache attribute indicates that this cache gives block-wise
+        # updates when written to. Attribute used in PixelLabelExplorerWidget.
+        self.Output.meta.is_blocked_cache = True
+        self.Output.meta.ideal_blockshape = self._blockshape
+
+        self.Projection2D.meta.assignFrom(self.Output.meta)
+        self.Projection2D.meta.dtype = numpy.float32
+        self.Projection2D.meta.drange = (0.0, 1.0)
+
+        self._eraser_magic_value = self.eraser.value
+
+    def execute(self, slot, subindex, roi, destination):
+        if slot == self.Output:
+            self._executeOutput(roi, destination)
+        elif slot == self.CleanBlocks:
+            destination[0] = [list(map(TinyVector, block_roi)) for block_roi in self._storedBlockRois()]
+        elif slot == self.nonzeroBlocks:
+            destination[0] = [roiToSlice(*block_roi) for block_roi in self._storedBlockRois()]
+        elif slot == self.Projection2D:
+            self._executeProjection2D(roi, destination)
+        else:
+            raise AssertionError("Unknown slot: {}".format(slot.name))
+        return destination
+
+    def _storedBlockRois(self):
+        with self._lock:
+            block_starts = sorted(self._blocks.keys())
+        return [getBlockBounds(self._shape, self._blockshape, block_start) for block_start in block_starts]
+
+    def _labeledPixels(self, start, stop):
+        """
+        Coordinates (tuple of arrays, absolute) and values of the labeled pixels in the roi [start, stop).
+        """
+        start, stop = numpy.asarray(start), numpy.asarray(stop)
+        with self._lock:
+            blocks = list(self._blocks.items())
+
+        all_coords = []
+        all_values = []
+        for block_start, block in blocks:
+            block_start, block_stop = map(numpy.asarray, getBlockBounds(self._shape, self._blockshape, block_start))
+            if (block_start >= stop).any() or (block_stop <= start).any():
+                continue
+            coords = numpy.array(numpy.unravel_index(block.indexes, block_stop - block_start))
+            coords += block_start[:, None]
+            values = block.values
+            if (block_start < start).any() or (block_stop > stop).any():
+                inside = ((coords >= start[:, None]) & (coords < stop[:, None])).all(axis=0)
+                coords, values = coords[:, inside], values[inside]
+            all_coords.append(coords)
+            all_values.append(values)
+
+        if not all_coords:
+            return tuple(numpy.zeros((len(start), 0), dtype=numpy.intp)), numpy.zeros((0,), dtype=numpy.uint8)
+        return tuple(numpy.concatenate(all_coords, axis=1)), numpy.concatenate(all_values)
+
+    def _executeOutput(self, roi, destination):
+        assert len(roi.stop) == len(
+            self.Output.meta.shape
+        ), "roi: {} has the wrong number of dimensions for Output shape: {}".format(roi, self.Output.meta.shape)
+        assert numpy.less_equal(
+            roi.stop, self.Output.meta.shape
+        ).all(), "roi: {} is out-of-bounds for Output shape: {}".format(roi, self.Output.meta.shape)
+
+        coords, values = self._labeledPixels(roi.start, roi.stop)
+        destination[...] = 0
+        destination[tuple(c - s for c, s in zip(coords, roi.start))] = values
+        return destination
+
+    def _executeProjection2D(self, roi, destination):
+        assert sum(TinyVector(destination.shape) > 1) <= 2, "Projection result must be exactly 2D"
+
+        # Infer the projection axis from the shape of the roi (see OpCompressedUserLabelArray)
+        tagged_input_shape = self.Output.meta.getTaggedShape()
+        tagged_result_shape = collections.OrderedDict(list(zip(list(tagged_input_shape.keys()), destination.shape)))
+        nonprojection_axes = []
+        for key in list(tagged_input_shape.keys()):
+            if key == "c" or tagged_input_shape[key] == 1 or tagged_result_shape[key] > 1:
+                nonprojection_axes.append(key)
+
+        possible_projection_axes = set(tagged_input_shape) - set(nonprojection_axes)
+        if len(possible_projection_axes) == 0:
+            # If the image is 2D to begin with,
+            #   then the projection is simply the same as the normal output,
+            #   EXCEPT it is made binary
+            self.Output(roi.start, roi.stop).writeInto(destination).wait()
+
+            # make binary
+            numpy.greater(destination, 0, out=destination)
+            return
+
+        for k in "zyxt":
+            if k in possible_projection_axes:
+                projection_axis_key = k
+                break
+
+        projection_axis_index = self.Output.meta.getAxisKeys().index(projection_axis_key)
+        projection_length = tagged_input_shape[projection_axis_key]
+        input_start = numpy.array(roi.start)
+        input_stop = numpy.array(roi.stop)
+        input_start[projection_axis_index] = 0
+        input_stop[projection_axis_index] = projection_length
+
+        # The first labeled slice under each pixel
+        coords, _ = self._labeledPixels(input_start, input_stop)
+        first_slice = numpy.full(destination.shape, projection_length, dtype=numpy.int64)
+        destination_coords = [c - s for c, s in zip(coords, input_start)]
+        destination_coords[projection_axis_index] = numpy.zeros_like(coords[projection_axis_index])
+        numpy.minimum.at(first_slice, tuple(destination_coords), coords[projection_axis_index])
+
+        # Same colors as OpCompressedUserLabelArray: increasing values for increasing slices, above 1/256.
+        labeled = first_slice < projection_length
+        color = (1.0 - first_slice[labeled] / float(projection_length)) * (1.0 - (1.0 / 255)) + (1.0 / 255.0)
+        destination[...] = 0.0
+        destination[labeled] = 1.0 - color
+
+    def _purge_label(self, label_to_purge, decrement_remaining, replacement_value=0):
+        """
+        Scan through all labeled pixels.
+        (1) Reassign all pixels of the given value (set to replacement_value)
+        (2) If decrement_remaining=True, decrement all labels above that
+            value so the set of stored labels remains consecutive.
+            Note that the decrement is performed AFTER replacement.
+        """
+        changed_block_starts = []
+        with self._lock:
+            for block_start, block in list(self._blocks.items()):
+                matching = block.values == label_to_purge
+                if not matching.any() and not (decrement_remaining and (block.values > label_to_purge).any()):
+                    continue
+
+                values = block.values.copy()
+                values[matching] = replacement_value
+                if decrement_remaining:
+                    values[values > label_to_purge] -= numpy.uint8(1)
+
+                keep = values != 0
+                if keep.any():
+                    self._blocks[block_start] = _SparseBlock(block.indexes[keep], values[keep])
+                else:
+                    del self._blocks[block_start]
+                changed_block_starts.append(block_start)
+
+        for block_start in changed_block_starts:
+            self.Output.setDirty(*getBlockBounds(self._shape, self._blockshape, block_start))
+
+    def propagateDirty(self, slot, subindex, roi):
+        # The other way to make the  Output dirty is via _setInSlot()
+        if slot is self.deleteLabel and slot.ready():
+            # Are we being told to delete a label?
+            new_purge_label = self.deleteLabel.value
+            if self._label_to_purge != new_purge_label:
+                self._label_to_purge = new_purge_label
+                if self._label_to_purge > 0:
+                    self._purge_label(self._label_to_purge, True)
+
+    def _setInSlot(self, slot, subindex, roi, new_pixels):
+        if slot is self.Input:
+            self._setInSlotInput(slot, subindex, roi, new_pixels)
+        else:
+            assert False, "Unsupported slot for _setInSlot: {}".format(slot.name)
+
+    def _setInSlotInput(self, slot, subindex, roi, new_pixels):
+        """
+        Since this is a label array, inserting pixels has a special meaning:
+        We only overwrite the new non-zero pixels. In the new data, zeros mean "don't change".
+
+        So, here's what each pixel we're adding means:
+        0: don't change
+        1: change to 1
+        2: change to 2
+        ...
+        N: change to N
+        eraser_magic_value: change to 0
+        """
+        if isinstance(new_pixels, vigra.VigraArray):
+            new_pixels = new_pixels.view(numpy.ndarray)
+        new_pixels = numpy.asarray(new_pixels)
+
+        block_rois = getIntersectingRois(self._shape, self._blockshape, (roi.start, roi.stop))
+
+        max_label = 0
+        for start, stop in block_rois:
+            roi_within_data = numpy.array((start, stop)) - roi.start
+            new_block_pixels = new_pixels[roiToSlice(*roi_within_data)]
+            coords = numpy.nonzero(new_block_pixels)
+            if len(coords[0]) == 0:
+                # Shortcut: Nothing to change if this block is all zeros.
+                continue
+
+            block_start = numpy.subtract(start, numpy.mod(start, self._blockshape))
+            block_start, block_stop = getBlockBounds(self._shape, self._blockshape, block_start)
+            block_start = tuple(map(int, block_start))
+            offset = numpy.subtract(start, block_start)
+            # (C order of the new pixels is also increasing in the block's raveled indexes)
+            new_indexes = numpy.ravel_multi_index(
+                tuple(c + o for c, o in zip(coords, offset)), tuple(numpy.subtract(block_stop, block_start))
+            )
+            new_values = new_block_pixels[coords].astype(numpy.uint8)
+            not_erased = new_values != self._eraser_magic_value
+
+            with self._lock:
+                block = self._blocks.get(block_start)
+                if block is None:
+                    indexes, values = new_indexes[not_erased], new_values[not_erased]
+                else:
+                    # The new pixels replace the old ones
+                    keep = ~numpy.isin(block.indexes, new_indexes, assume_unique=True)
+                    indexes = numpy.concatenate([block.indexes[keep], new_indexes[not_erased]])
+                    values = numpy.concatenate([block.values[keep], new_values[not_erased]])
+                    order = numpy.argsort(indexes, kind="stable")
+                    indexes, values = indexes[order], values[order]
+
+                if len(indexes) > 0:
+                    self._blocks[block_start] = _SparseBlock(indexes, values)
+                    max_label = max(max_label, values.max())
+                else:
+                    self._blocks.pop(block_start, None)
+
+            # Only the touched blocks are dirty (see OpCompressedUserLabelArray._setInSlotInput)
+            self.Output.setDirty(start, stop)
+
+        return max_label  # Internal use: Return max label
+
+    def ingestData(self, slot):
+        """
+        Read the data from the given slot and copy it into this cache.
+        The rules about special pixel meanings apply here, just like _setInSlot
+
+        Returns: the max label found in the slot.
+        """
+        assert self._blockshape is not None
+        assert self.Output.meta.shape[:-1] == slot.meta.shape[:-1], "{} != {}".format(
+            self.Output.meta.shape, slot.meta.shape
+        )
+        max_label = 0
+
+        # Write each block
+        for block_roi in getIntersectingRois(self._shape, self._blockshape, roiFromShape(self._shape)):
+            # Request the block data
+            block_data = slot(*block_roi).wait()
+
+            # Write into the array
+            subregion_roi = SubRegion(self.Output, *block_roi)
+            cleaned_block_max = self._setInSlotInput(self.Input, (), subregion_roi, block_data)
+
+            max_label = max(max_label, cleaned_block_max)
+
+        return max_label
@@ -21,6 +21,7 @@
 ###############################################################################
 
 import time
+import uuid
 import collections
 from itertools import starmap
 from typing import Tuple, Union
@@ -30,9 +31,11 @@ import numpy.typing as npt
 import vigra
 
 from lazyflow.graph import Operator, InputSlot, OutputSlot
+from lazyflow.operators.cacheEvictionPolicies import BlockStats, CacheCounters
 from lazyflow.operators.opCache import ManagedBlockedCache
 from lazyflow.request import RequestLock
 from lazyflow.roi import getIntersection, roiFromShape, roiToSlice, containing_rois
+from lazyflow.utility.blockSpill import CompressedBlock, getDiskSpillStore
 
 import logging
 
@@ -51,6 +54,10 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
         be stored multiple times, except for the special case where the new request happens
         to fall ENTIRELY within an existing block of data.
     - If any portion of a stored block is marked dirty, the entire block is discarded.
+    - If SpillEnabled is set, blocks freed by the memory manager are not discarded right away.
+        They are compressed in memory first, and moved to the shared scratch directory
+        (see lazyflow.utility.blockSpill) the next time the memory manager wants to free them.
+        Spilled blocks are transparently restored when they are requested again.
 
     Unlike other caches, this cache does not impose its own blocking on the data.
     Instead, it is assumed that the downstream operators have chosen some reasonable blocking.
@@ -60,6 +67,7 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
 
     Input = InputSlot(allow_mask=True)
     CompressionEnabled = InputSlot(value=False)  # If True, compression will be enabled for certain dtypes
+    SpillEnabled = InputSlot(value=False)  # If True, evicted blocks are compressed/spilled instead of discarded
     Output = OutputSlot(allow_mask=True)
 
     CleanBlocks = OutputSlot()  # A list of slicings indicating which blocks are stored in the cache and clean.
@@ -67,6 +75,8 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
     def __init__(self, *args, **kwargs):
         super(OpUnblockedArrayCache, self).__init__(*args, **kwargs)
         self._lock = RequestLock()
+        self._counters = CacheCounters()
+        self._spill_owner = uuid.uuid4().hex
         self._resetBlocks()
 
         self.Input.notifyUnready(self._resetBlocks)
@@ -108,7 +118,19 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
                 # Data is already in the cache. Just extract it.
                 block_relative_roi = numpy.array(request_roi) - block_roi[0]
                 self.Output.stype.copy_data(result, self._block_data[block_roi][roiToSlice(*block_relative_roi)])
-                return
+            else:
+                spilled_block_roi = self._get_containing_spilled_block_roi(request_roi)
+
+        if block_roi is not None:
+            self._countBlockHit(block_roi)
+            return
+
+        if spilled_block_roi is not None:
+            # Restore the whole block, then extract the requested part
+            block_data = self._fetch_and_store_block(spilled_block_roi, out=None)
+            block_relative_roi = numpy.array(request_roi) - spilled_block_roi[0]
+            self.Output.stype.copy_data(result, block_data[roiToSlice(*block_relative_roi)])
+            return
 
         if self.Input.meta.dontcache:
             # Data isn't in the cache, but we don't want to cache it anyway.
@@ -128,6 +150,35 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
             return block_roi
         return None
 
+    def _spilled_block_rois(self):
+        return list(self._compressed_blocks.keys()) + getDiskSpillStore().keys(self._spill_owner)
+
+    def _get_containing_spilled_block_roi(self, request_roi):
+        if not self._compressed_blocks and not self.SpillEnabled.value:
+            return None
+        outer_rois = containing_rois(self._spilled_block_rois(), request_roi)
+        if len(outer_rois) > 0:
+            return self._standardize_roi(*outer_rois[0])
+        return None
+
+    def _rehydrate_block(self, block_roi):
+        """
+        Move a compressed or spilled block back into memory and return its data (None if not available).
+        The block_lock is not obtained here, so lock it before you call this.
+        """
+        with self._lock:
+            compressed = self._compressed_blocks.pop(block_roi, None)
+        if compressed is None:
+            compressed = getDiskSpillStore().pop(self._spill_owner, block_roi)
+        if compressed is None:
+            return None
+
+        block_data = compressed.decompress()
+        with self._lock:
+            if block_roi in self._block_locks:
+                self._block_data[block_roi] = block_data
+        return block_data
+
     def _fetch_and_store_block(self, block_roi, out):
         if out is not None:
             roi_shape = numpy.array(block_roi[1]) - block_roi[0]
@@ -143,6 +194,7 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
         # without preventing parallel requests for different blocks.
         with block_lock:
             if block_roi in self._block_data:
+                self._countBlockHit(block_roi)
                 if out is None:
                     # Extra [:] here is in case we are decompressing from a chunkedarray
                     return self._block_data[block_roi][:]
@@ -151,17 +203,42 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
                     self.Output.stype.copy_data(out, self._block_data[block_roi][:])
                     return out
 
+            block_data = self._rehydrate_block(block_roi)
+            if block_data is not None:
+                self._countBlockHit(block_roi)
+                if out is None:
+                    return block_data
+                self.Output.stype.copy_data(out, block_data)
+                return out
+
+            self._counters.countMiss()
             req = self.Input(*block_roi)
             if out is not None:
                 req.writeInto(out)
+            start_time = time.perf_counter()
             block_data = req.wait()
-            self._store_block_data(block_roi, block_data)
+            compute_time = time.perf_counter() - start_time
+            self._store_block_data(block_roi, block_data, compute_time)
         return block_data
 
-    def _store_block_data(self, block_roi, block_data):
+    def _countBlockHit(self, block_roi):
+        """
+        Count a cache hit of the given block.
+        Obtains self._lock, so don't call this while holding it.
+        """
+        self._counters.countHit()
+        with self._lock:
+            if block_roi in self._block_data:
+                self._access_counts[block_roi] += 1
+                self._last_access_times[block_roi] = time.time()
+
+    def _store_block_data(self, block_roi, block_data, compute_time=None):
         """
         Copy block_data and store it into the cache.
         The block_lock is not obtained here, so lock it before you call this.
+
+        compute_time is the time (in seconds) it took to produce block_data, if known.
+        It is reported to the memory manager for cost aware eviction.
         """
         with self._lock:
             if self.CompressionEnabled.value and numpy.dtype(block_data.dtype) in [
@@ -183,12 +260,15 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
             # (Could have happened via propagateDirty() or eventually the arrayCacheMemoryMgr)
             if block_roi in self._block_locks:
                 self._block_data[block_roi] = block_storage_data
+                self._access_counts[block_roi] = 1
+                if compute_time is not None:
+                    self._compute_times[block_roi] = compute_time
 
         self._last_access_times[block_roi] = time.time()
 
     def _execute_CleanBlocks(self, slot, subindex, roi, result):
         with self._lock:
-            block_rois = sorted(self._block_data.keys())
+            block_rois = sorted(set(self._block_data.keys()) | set(self._spilled_block_rois()))
             block_slicings = list(starmap(roiToSlice, block_rois))
             result[0] = block_slicings
 
@@ -207,6 +287,10 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
     def propagateDirty(self, slot, subindex, roi):
         if slot is self.CompressionEnabled:
             return
+        if slot is self.SpillEnabled:
+            if not self.SpillEnabled.value:
+                self._dropSpilledBlocks()
+            return
 
         dirty_roi = self._standardize_roi(roi.start, roi.stop)
         maximum_roi = roiFromShape(self.Input.meta.shape)
@@ -219,9 +303,9 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
         else:
             # FIXME: This is O(N) for now.
             #        We should speed this up by maintaining a bookkeeping data structure in execute().
-            for block_roi in list(self._block_data.keys()):
+            for block_roi in list(self._block_locks.keys()):
                 if getIntersection(block_roi, dirty_roi, assertIntersect=False):
-                    self.freeBlock(block_roi)
+                    self._discardBlock(block_roi)
 
         self.Output.setDirty(roi.start, roi.stop)
 
@@ -242,6 +326,8 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
                 #    much memory it ouccupies)
                 portion = 0.0
             total += portion
+        for compressed in list(self._compressed_blocks.values()):
+            total += compressed.nbytes
         return total
 
     def fractionOfUsedMemoryDirty(self):
@@ -258,6 +344,35 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
             l = [(k, self._last_access_times[k]) for k in self._last_access_times]
         return l
 
+    def getBlockStats(self):
+        with self._lock:
+            stats = []
+            for k in list(self._block_data.keys()):
+                block = self._block_data[k]
+                stats.append(
+                    BlockStats(
+                        k,
+                        self._last_access_times[k],
+                        access_count=self._access_counts[k],
+                        compute_time=self._compute_times.get(k),
+                        size=block.size * numpy.dtype(block.dtype).itemsize,
+                    )
+                )
+            for k, compressed in self._compressed_blocks.items():
+                stats.append(
+                    BlockStats(
+                        k,
+                        self._last_access_times[k],
+                        access_count=self._access_counts[k],
+                        compute_time=self._compute_times.get(k),
+                        size=compressed.nbytes,
+                    )
+                )
+        return stats
+
+    def getCounters(self):
+        return self._counters
+
     def freeMemory(self):
         used = self.usedMemory()
         self._resetBlocks()
@@ -267,19 +382,73 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
         with self._lock:
             if key not in self._block_locks:
                 return 0
-            block = self._block_data[key]
-            bytes_per_pixel = numpy.dtype(block.dtype).itemsize
-            mem = block.size * bytes_per_pixel
-            del self._block_data[key]
-            del self._block_locks[key]
-            del self._last_access_times[key]
-            return mem
+            if not self.SpillEnabled.value:
+                return self._forgetBlock(key)
+
+            if key in self._block_data:
+                # First tier: keep the block compressed in memory
+                block = self._block_data[key]
+                mem = block.size * numpy.dtype(block.dtype).itemsize
+                if isinstance(block, numpy.ma.MaskedArray) or numpy.dtype(block.dtype).kind not in "biufc":
+                    return self._forgetBlock(key)
+                # Extra [:] here is in case we are decompressing from a chunkedarray
+                compressed = CompressedBlock.compress(block[:])
+                del self._block_data[key]
+                self._compressed_blocks[key] = compressed
+                return max(mem - compressed.nbytes, 0)
+
+            if key in self._compressed_blocks:
+                # Second tier: move it to the scratch directory
+                compressed = self._compressed_blocks.pop(key)
+                if not getDiskSpillStore().put(self._spill_owner, key, compressed):
+                    self._forgetBlock(key)
+                return compressed.nbytes
+
+            if not getDiskSpillStore().contains(self._spill_owner, key):
+                # The block was dropped from the scratch directory
+                self._forgetBlock(key)
+            return 0
+
+    def _discardBlock(self, key):
+        """
+        Remove the block from all tiers, e.g. because it became dirty.
+        """
+        with self._lock:
+            return self._forgetBlock(key)
+
+    def _forgetBlock(self, key):
+        """
+        Remove all data and bookkeeping of the block, return the amount of memory freed.
+        The cache lock must be held by the caller.
+        """
+        mem = 0
+        block = self._block_data.pop(key, None)
+        if block is not None:
+            mem += block.size * numpy.dtype(block.dtype).itemsize
+        compressed = self._compressed_blocks.pop(key, None)
+        if compressed is not None:
+            mem += compressed.nbytes
+        getDiskSpillStore().discard(self._spill_owner, key)
+        self._block_locks.pop(key, None)
+        self._last_access_times.pop(key, None)
+        self._access_counts.pop(key, None)
+        self._compute_times.pop(key, None)
+        return mem
+
+    def _dropSpilledBlocks(self):
+        with self._lock:
+            for key in self._spilled_block_rois():
+                self._forgetBlock(key)
 
     def freeDirtyMemory(self):
         return 0.0
 
     def _resetBlocks(self, *_):
         with self._lock:
+            getDiskSpillStore().discardOwner(self._spill_owner)
+            self._compressed_blocks = {}
             self._block_data = {}
             self._block_locks = {}
             self._last_access_times = collections.defaultdict(float)
+            self._access_counts = collections.defaultdict(int)
+            self._compute_times = {}
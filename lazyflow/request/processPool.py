@@ -0,0 +1,311 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Opt-in process pool for the CPU-bound, pure-Python parts of operators.
+
+Requests run on greenlets within a single process, so pure-Python code (e.g. object feature plugins)
+serializes on the GIL. Operators that set ``processSafe = True`` can hand such work to
+:py:func:`run_kernel`. If a process pool was configured with :py:func:`reset_process_pool`, the kernel
+runs in one of the pool's processes; otherwise (the default) it is simply called in place.
+
+A kernel is a picklable (i.e. module-level) function. Its arguments and return value are pickled,
+except for :py:class:`SharedArray` arguments, which are passed by name: the worker process maps the same
+shared memory block, so the data is never copied or pickled. Big numpy arrays passed to
+:py:meth:`ProcessPool.run` are copied into shared memory automatically.
+
+While the kernel runs, the calling request is suspended (its worker thread is free to do other work).
+If the request is cancelled, the kernel is cancelled if it hasn't started yet and the request raises
+:py:class:`Request.CancellationException` right away. A kernel that is already running can't be
+interrupted; its result is discarded.
+"""
+import concurrent.futures
+import itertools
+import logging
+import multiprocessing
+import threading
+import weakref
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy
+
+from .request import Request, RequestLock
+
+logger = logging.getLogger(__name__)
+
+
+class SharedArray(object):
+    """
+    A numpy array in a :py:class:`multiprocessing.shared_memory.SharedMemory` block.
+
+    Pickling a SharedArray only transfers the name of the block (plus shape and dtype),
+    so the unpickled copy in another process refers to the same memory.
+    The memory is freed by :py:meth:`release` or, at the latest, when the SharedArray that created it is
+    garbage collected.
+    """
+
+    def __init__(self, shm, shape, dtype, owner):
+        self._name = shm.name
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+        self.array = numpy.ndarray(self.shape, self.dtype, buffer=shm.buf)
+        # Frees the memory when the SharedArray is garbage collected (if not released before)
+        self._finalizer = weakref.finalize(self, SharedArray._free, shm, owner)
+
+    @classmethod
+    def empty(cls, shape, dtype):
+        nbytes = int(numpy.prod(shape, dtype=numpy.int64)) * numpy.dtype(dtype).itemsize
+        shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        return cls(shm, shape, dtype, owner=True)
+
+    @classmethod
+    def copy_of(cls, array):
+        array = numpy.asarray(array)
+        shared = cls.empty(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def _attach(cls, name, shape, dtype):
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype, owner=False)
+
+    def __reduce__(self):
+        return (SharedArray._attach, (self._name, self.shape, self.dtype.str))
+
+    def release(self):
+        """Unmap the memory and, if this process created it, free the block."""
+        self.array = None
+        self._finalizer()
+
+    @staticmethod
+    def _free(shm, unlink):
+        try:
+            shm.close()
+        except BufferError:
+            # Someone still holds a view of the array. The memory is unmapped when it's garbage collected.
+            pass
+        if unlink:
+            shm.unlink()
+
+
+def _call_kernel(fn, args, kwargs):
+    """Runs in the worker process: hand the kernel plain arrays instead of SharedArrays."""
+    shared = []
+
+    def unwrap(arg):
+        if isinstance(arg, SharedArray):
+            shared.append(arg)
+            return arg.array
+        return arg
+
+    try:
+        return fn(*map(unwrap, args), **{k: unwrap(v) for k, v in kwargs.items()})
+    finally:
+        for arg in shared:
+            arg.release()
+
+
+class _CancellationMonitor(object):
+    """
+    Requests that wait for a kernel are suspended and only notice a cancellation when they are woken up.
+    This thread polls the waiting requests and wakes up the cancelled ones.
+    """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._watched = {}
+        self._ids = itertools.count()
+        self._thread = None
+
+    def watch(self, request, future, wake):
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ProcessPoolCancellationMonitor", daemon=True)
+                self._thread.start()
+            key = next(self._ids)
+            self._watched[key] = (request, future, wake)
+            self._condition.notify()
+        return key
+
+    def unwatch(self, key):
+        with self._condition:
+            self._watched.pop(key, None)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._watched:
+                    self._condition.wait()
+                watched = list(self._watched.values())
+
+            for request, future, wake in watched:
+                if request.cancelled:
+                    future.cancel()
+                    wake()
+
+            with self._condition:
+                self._condition.wait(self.POLL_INTERVAL)
+
+
+_cancellation_monitor = _CancellationMonitor()
+
+
+def wait_for_future(future):
+    """
+    Wait for a :py:class:`concurrent.futures.Future` and return its result.
+
+    Within a request, the request is suspended while waiting (instead of blocking its worker thread),
+    and a cancellation of the request raises :py:class:`Request.CancellationException`.
+    """
+    request = Request._current_request()
+    if request is None:
+        return future.result()
+
+    wakeup = RequestLock()
+    wakeup.acquire()
+    woken = threading.Lock()
+
+    def wake(*args):
+        # Called by the future and/or the cancellation monitor, but only the first call releases the lock.
+        if woken.acquire(False):
+            wakeup.release()
+
+    future.add_done_callback(wake)
+    key = _cancellation_monitor.watch(request, future, wake)
+    try:
+        # Raises a CancellationException if the request was cancelled in the meantime.
+        wakeup.acquire()
+    finally:
+        _cancellation_monitor.unwatch(key)
+    return future.result()
+
+
+class ProcessPool(object):
+    """
+    A pool of worker processes that run kernels for requests (see module docstring).
+
+    Worker processes are started with 'forkserver' where available: forking the (multithreaded) main
+    process is unsafe.
+    """
+
+    # Numpy arrays of at least this size are passed to kernels via shared memory.
+    SHARE_THRESHOLD = 64 * 1024
+
+    def __init__(self, num_processes):
+        assert num_processes > 0
+        self.num_processes = num_processes
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self._executor = self._create_executor()
+        self._lock = threading.Lock()
+
+    def _create_executor(self):
+        return concurrent.futures.ProcessPoolExecutor(self.num_processes, mp_context=self._context)
+
+    def submit(self, fn, *args, **kwargs):
+        """Start fn(*args, **kwargs) in a worker process and return its Future."""
+        with self._lock:
+            return self._executor.submit(_call_kernel, fn, args, kwargs)
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) in a worker process and wait for the result (see :py:func:`wait_for_future`).
+
+        Numpy arrays of at least SHARE_THRESHOLD bytes are copied into shared memory for the duration of
+        the call. (Subclasses like VigraArray arrive as plain numpy arrays.)
+        """
+        Request.raise_if_cancelled()
+        shared = []
+
+        def share(arg):
+            if isinstance(arg, numpy.ndarray) and arg.nbytes >= self.SHARE_THRESHOLD:
+                shared.append(SharedArray.copy_of(arg))
+                return shared[-1]
+            return arg
+
+        try:
+            future = self.submit(fn, *map(share, args), **{k: share(v) for k, v in kwargs.items()})
+            return wait_for_future(future)
+        except BrokenProcessPool:
+            logger.error("A worker process died unexpectedly. Restarting the process pool.")
+            with self._lock:
+                self._executor.shutdown(wait=False)
+                self._executor = self._create_executor()
+            raise
+        finally:
+            for arg in shared:
+                arg.release()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_process_pool = None
+
+
+def reset_process_pool(num_processes=0):
+    """
+    Replace the global process pool. With num_processes=0 (the default), no pool is used and all
+    kernels run in the calling request.
+    """
+    global _process_pool
+    old_pool, _process_pool = _process_pool, None
+    if old_pool is not None:
+        old_pool.shutdown(wait=False)
+    if num_processes > 0:
+        _process_pool = ProcessPool(num_processes)
+
+
+def get_process_pool():
+    """The global ProcessPool, or None if kernels run in place."""
+    return _process_pool
+
+
+def uses_process_pool(operator):
+    """True if kernels of the given operator run in the process pool."""
+    return _process_pool is not None and operator.processSafe
+
+
+def run_kernel(operator, fn, *args, **kwargs):
+    """
+    Compute fn(*args, **kwargs) for the given operator: in the process pool if there is one and the
+    operator is process-safe, otherwise in place.
+    SharedArray arguments are passed to fn as numpy arrays in both cases.
+    """
+    pool = _process_pool
+    if pool is not None and operator.processSafe:
+        return pool.run(fn, *args, **kwargs)
+    unwrap = lambda arg: arg.array if isinstance(arg, SharedArray) else arg
+    return fn(*map(unwrap, args), **{k: unwrap(v) for k, v in kwargs.items()})
+
+
+def share(operator, array):
+    """
+    Copy the array to shared memory if the operator's kernels run in the process pool (otherwise return it as is).
+    Passing the result to several kernels avoids copying the array for each call.
+    """
+    if uses_process_pool(operator):
+        return SharedArray.copy_of(array)
+    return array
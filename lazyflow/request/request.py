@@ -141,7 +141,7 @@ class Request(object):
     active_count = 0
 
     @classmethod
-    def reset_thread_pool(cls, num_workers=min(multiprocessing.cpu_count(), 8)):
+    def reset_thread_pool(cls, num_workers=min(multiprocessing.cpu_count(), 8), work_stealing=False):
         """
         Change the number of threads allocated to the request system.
 
@@ -150,6 +150,9 @@ class Request(object):
                             workers, even on machines with many CPUs.
                             For more details, see:
                             https://github.com/ilastik/ilastik/issues/1458
+        :param work_stealing: If True, use a :class:`~lazyflow.request.threadPool.WorkStealingThreadPool`
+                              (per-worker queues, idle workers steal unstarted requests)
+                              instead of a single shared queue. Recommended for many workers.
 
         As a special case, you may set ``num_workers`` to 0.
         In that case, the normal thread pool is not used at all.
@@ -165,7 +168,10 @@ class Request(object):
 
             if cls.global_thread_pool is not None:
                 cls.global_thread_pool.stop()
-            cls.global_thread_pool = threadPool.ThreadPool(num_workers)
+            if work_stealing:
+                cls.global_thread_pool = threadPool.WorkStealingThreadPool(num_workers)
+            else:
+                cls.global_thread_pool = threadPool.ThreadPool(num_workers)
 
     class CancellationException(Exception):
         """
@@ -21,8 +21,11 @@
 ###############################################################################
 
 import atexit
+import heapq
+import itertools
 import logging
 import queue
+import random
 import threading
 from typing import Callable, List
 
@@ -40,7 +43,7 @@ class ThreadPool:
         """Start all workers."""
         self.unassigned_tasks = queue.PriorityQueue()
 
-        self.workers = {_Worker(self, i) for i in range(num_workers)}
+        self.workers = {self._create_worker(i) for i in range(num_workers)}
         for w in self.workers:
             w.start()
 
@@ -50,6 +53,9 @@ class ThreadPool:
     def num_workers(self):
         return len(self.workers)
 
+    def _create_worker(self, index: int) -> "_Worker":
+        return _Worker(self, index)
+
     def wake_up(self, task: Callable[[], None]) -> None:
         """Schedule the given task on the worker that is assigned to it.
 
@@ -182,3 +188,189 @@ class _Worker(threading.Thread):
                 # You may have to wrap it in a custom class first.
                 task.assigned_worker = self
                 return task
+
+
+class WorkStealingThreadPool(ThreadPool):
+    """ThreadPool variant in which every worker owns a queue of not yet started tasks.
+
+    * Tasks submitted from within a worker thread are put on that worker's own queue,
+      tasks submitted from other threads are distributed round-robin.
+    * Only a single idle worker is woken up per submitted task (no thundering herd).
+    * Idle workers steal unstarted tasks from other workers' queues.
+      Tasks that already have an assigned worker still resume only on that worker.
+
+    Within each worker queue, tasks are ordered by priority (``__lt__``), like in ThreadPool.
+    """
+
+    def __init__(self, num_workers: int):
+        self._idle_lock = threading.Lock()
+        self._idle_workers = []
+        # Incremented whenever a task is queued; lets workers detect submissions that
+        # happened while they were scanning the queues for work.
+        self._epoch = 0
+        self._round_robin = itertools.count()
+        self._worker_list = []
+        super().__init__(num_workers)
+        self._worker_list = sorted(self.workers, key=lambda w: w.index)
+
+    def _create_worker(self, index: int) -> "_StealingWorker":
+        return _StealingWorker(self, index)
+
+    def wake_up(self, task: Callable[[], None]) -> None:
+        """Schedule the given task on the worker that is assigned to it.
+
+        If it has no assigned worker yet, queue it on the current (or next round-robin) worker,
+        from where it may be stolen by any idle worker.
+        """
+        if hasattr(task, "assigned_worker") and task.assigned_worker is not None:
+            task.assigned_worker.wake_up(task)
+            return
+
+        current = threading.current_thread()
+        if isinstance(current, _StealingWorker) and current.thread_pool is self:
+            target = current
+        else:
+            target = self._worker_list[next(self._round_robin) % len(self._worker_list)]
+
+        target.push_unassigned(task)
+        self._notify_one(preferred=target)
+
+    def stop(self) -> None:
+        super().stop()
+        with self._idle_lock:
+            self._idle_workers.clear()
+
+    def _notify_one(self, preferred: "_StealingWorker") -> None:
+        """Wake up a single idle worker (preferably ``preferred``), if any worker is idle."""
+        with self._idle_lock:
+            self._epoch += 1
+            if not self._idle_workers:
+                return
+            if preferred in self._idle_workers:
+                self._idle_workers.remove(preferred)
+                worker = preferred
+            else:
+                # Most recently idled worker first, its caches are most likely to be warm.
+                worker = self._idle_workers.pop()
+        worker.signal()
+
+    def _notify_worker(self, worker: "_StealingWorker") -> None:
+        """Wake up the given worker if it is idle."""
+        with self._idle_lock:
+            if worker not in self._idle_workers:
+                return
+            self._idle_workers.remove(worker)
+        worker.signal()
+
+    def _mark_idle(self, worker: "_StealingWorker", epoch: int) -> bool:
+        """Register the worker as idle, unless tasks have been queued since ``epoch``."""
+        with self._idle_lock:
+            if self._epoch != epoch:
+                return False
+            self._idle_workers.append(worker)
+            return True
+
+    def _unmark_idle(self, worker: "_StealingWorker") -> None:
+        with self._idle_lock:
+            if worker in self._idle_workers:
+                self._idle_workers.remove(worker)
+
+    def _steal(self, thief: "_StealingWorker"):
+        """Take an unstarted task from some other worker's queue, or return None."""
+        victims = self._worker_list
+        if len(victims) < 2:
+            return None
+        start = random.randrange(len(victims))
+        for offset in range(len(victims)):
+            victim = victims[(start + offset) % len(victims)]
+            if victim is thief:
+                continue
+            task = victim.pop_unassigned()
+            if task is not None:
+                return task
+        return None
+
+
+class _StealingWorker(_Worker):
+    """Worker of a WorkStealingThreadPool.
+
+    Keeps two priority queues: ``job_queue`` holds tasks that are bound to this worker
+    (e.g. suspended greenlets), ``local_tasks`` holds unstarted tasks that may be stolen.
+    """
+
+    def __init__(self, thread_pool, index):
+        super().__init__(thread_pool, index)
+        self.index = index
+        self.local_tasks = []
+        self._signalled = False
+
+    def stop(self):
+        self.stopped = True
+        self.signal()
+
+    def signal(self):
+        with self.job_queue_condition:
+            self._signalled = True
+            self.job_queue_condition.notify()
+
+    def wake_up(self, task):
+        """Add this task to the queue of tasks that are ready to be processed.
+
+        The task may or not be started already.
+        """
+        assert task.assigned_worker is self
+        with self.job_queue_condition:
+            self.job_queue.put_nowait(task)
+        self.thread_pool._notify_worker(self)
+
+    def push_unassigned(self, task):
+        with self.job_queue_condition:
+            heapq.heappush(self.local_tasks, task)
+
+    def pop_unassigned(self):
+        with self.job_queue_condition:
+            if not self.local_tasks:
+                return None
+            return heapq.heappop(self.local_tasks)
+
+    def _get_next_job(self):
+        """Get the next available job: own bound tasks, own unstarted tasks, or stolen ones.
+
+        If necessary, block until a task is available (return it) or the worker has been stopped (might return None).
+        """
+        pool = self.thread_pool
+        while not self.stopped:
+            epoch = pool._epoch
+            task = self._pop_job()
+            if task is None:
+                task = pool._steal(self)
+                if task is not None:
+                    task.assigned_worker = self
+            if task is not None:
+                return task
+
+            with self.job_queue_condition:
+                self._signalled = False
+                if not pool._mark_idle(self, epoch):
+                    continue
+                # Bound tasks only ever get pushed while holding our condition, so this check can't miss one.
+                if not self.job_queue.empty() or self.local_tasks:
+                    pool._unmark_idle(self)
+                    continue
+                while not self._signalled and not self.stopped:
+                    self.job_queue_condition.wait()
+        return None
+
+    def _pop_job(self):
+        """Non-blocking: get a job from our own queues, or None."""
+        with self.job_queue_condition:
+            try:
+                return self.job_queue.get_nowait()
+            except queue.Empty:
+                pass
+            if not self.local_tasks:
+                return None
+            task = heapq.heappop(self.local_tasks)
+        # See _Worker._pop_job: the task must allow setting this attribute.
+        task.assigned_worker = self
+        return task
@@ -218,6 +218,9 @@ class Slot(object):
 
         self._resizing = False
 
+        # Functions to call before data is requested from this slot (see deferUntilRequested)
+        self._deferredLoads = []
+
         # Allow slots to be sorted by their order of creation for
         # debug output and diagramming purposes.
         self._global_slot_id = next(Slot._global_counter)
@@ -372,6 +375,31 @@ class Slot(object):
         """
         return self._notifyGeneric(self._sig_inserted, function, **kwargs)
 
+    def deferUntilRequested(self, function):
+        """
+        Call function() before data is requested from this slot the next time, e.g. to postpone
+        loading the slot's contents from a file until somebody actually needs them.
+        The function is called (without arguments) by each thread that requests data,
+        until the first call has returned, so it must be idempotent and thread-safe.
+
+        Only takes effect on slots that compute their data (i.e. not on slots that are
+        connected to an upstream slot or have a value): register it on the slot at the
+        upstream end of a connection to catch requests from all downstream slots.
+        """
+        self._deferredLoads.append(function)
+
+    def loadDeferred(self):
+        """
+        Call the functions registered with deferUntilRequested() now, without requesting any data,
+        e.g. to inspect the state of the slot's contents after they have been loaded.
+        """
+        for load in list(self._deferredLoads):
+            load()
+            try:
+                self._deferredLoads.remove(load)
+            except ValueError:
+                pass  # (another thread finished it, too)
+
     def unregisterDirty(self, function):
         """
         unregister a dirty callback
@@ -843,6 +871,8 @@ class Slot(object):
                     self._type != "input"
                 ), "This inputSlot has no value and no upstream_slot.  You can't ask for its data yet!"
             # normal (outputslot) case
+            self.loadDeferred()
+
             # --> construct heavy request object..
             if self._debug_logger:
                 self._debug_logger.debug(f"Getting data for {roi=}")
@@ -0,0 +1,256 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+import collections
+import logging
+import threading
+import time
+
+import numpy
+
+from lazyflow.roi import getIntersectingBlocks, getIntersection
+from lazyflow.utility.helpers import bigintprod
+from .memory import Memory
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveStreamingController:
+    """
+    Feedback controller for :py:class:`BigRequestStreamer<lazyflow.utility.bigRequestStreamer.BigRequestStreamer>`
+    in adaptive mode.
+
+    Instead of trusting the static RAM estimate of the output slot, the controller measures
+    the process memory (RSS) and the throughput (pixels per second) whenever a block finishes,
+    and adjusts
+
+    * the number of blocks in flight: increased by one while the memory budget allows it and
+      throughput keeps improving, halved when the budget is exceeded (AIMD), and
+    * the shape of blocks that have not been issued yet: the big blocks chosen up front are
+      subdivided (halving the largest splittable axis) if even a single block in flight exceeds
+      the budget, and merged back once there is plenty of headroom again.
+    """
+
+    #: Only increase the in-flight count if the predicted memory usage stays below this fraction of the budget
+    INCREASE_HEADROOM = 0.9
+    #: Undo an increase of the in-flight count if the throughput got worse by more than this fraction
+    THROUGHPUT_TOLERANCE = 0.05
+    #: Weight of the newest sample in the running estimate of bytes per in-flight pixel
+    SMOOTHING = 0.5
+
+    def __init__(
+        self,
+        blockshape,
+        initial_in_flight,
+        max_in_flight,
+        memory_budget=None,
+        ram_usage_per_pixel=None,
+        unsplittable_axes=(),
+        memory_probe=Memory.getMemoryUsage,
+        clock=time.perf_counter,
+    ):
+        """
+        :param blockshape: The (largest) blockshape, as chosen by the streamer.
+        :param initial_in_flight: The number of blocks to request in parallel at first.
+        :param max_in_flight: Never request more blocks than this in parallel.
+        :param memory_budget: Maximum RSS of the process in bytes (default: Memory.getAvailableRam()).
+        :param ram_usage_per_pixel: Prior estimate of the RAM needed per requested pixel (if known).
+        :param unsplittable_axes: Indices of axes along which blocks must never be subdivided (e.g. channels).
+        :param memory_probe: Callable returning the current memory usage in bytes (for testing).
+        :param clock: Callable returning the current time in seconds (for testing).
+        """
+        self._lock = threading.Lock()
+        self._max_blockshape = numpy.array(blockshape)
+        self._blockshape = numpy.array(blockshape)
+        self._splittable = numpy.array([i not in unsplittable_axes for i in range(len(blockshape))])
+        self._max_in_flight = max(1, max_in_flight)
+        self._in_flight_limit = min(max(1, initial_in_flight), self._max_in_flight)
+        self._memory_budget = memory_budget or Memory.getAvailableRam()
+        self._memory_probe = memory_probe
+        self._clock = clock
+
+        self._baseline_memory = memory_probe()
+        self._bytes_per_pixel = ram_usage_per_pixel
+        self._started = {}
+        self._in_flight_pixels = 0
+
+        self._window_start = clock()
+        self._window_pixels = 0
+        self._window_count = 0
+        self._last_throughput = None
+        self._last_action = None
+        self._hold_windows = 0
+
+        self.peak_memory = self._baseline_memory
+        self.completed_blocks = 0
+        self.inFlightLimitChanged = None
+
+    @property
+    def in_flight_limit(self):
+        return self._in_flight_limit
+
+    @property
+    def blockshape(self):
+        return tuple(int(s) for s in self._blockshape)
+
+    def subdivide(self, roi_iterator):
+        """
+        Generator: split every roi from the given iterator into blocks of the current blockshape.
+        Blocks that are still pending when the blockshape shrinks are split further before they are handed out.
+        Blocks are recorded as started when they are handed out.
+        """
+        for roi in roi_iterator:
+            pending = collections.deque([(numpy.asarray(roi[0]), numpy.asarray(roi[1]))])
+            while pending:
+                start, stop = pending.popleft()
+                with self._lock:
+                    blockshape = numpy.minimum(self._blockshape, stop - start)
+                if (blockshape < stop - start).any():
+                    pending.extendleft(reversed(self._split((start, stop), blockshape)))
+                    continue
+                self.blockStarted((start, stop))
+                yield start, stop
+
+    @staticmethod
+    def _split(roi, blockshape):
+        start, stop = roi
+        offset_roi = (numpy.zeros_like(start), stop - start)
+        blocks = []
+        for block_start in getIntersectingBlocks(blockshape, offset_roi):
+            block = getIntersection((block_start, block_start + blockshape), offset_roi)
+            blocks.append((block[0] + start, block[1] + start))
+        return blocks
+
+    def blockStarted(self, roi):
+        with self._lock:
+            self._started[self._key(roi)] = self._clock()
+            self._in_flight_pixels += self._pixels(roi)
+
+    def blockFinished(self, roi, *args):
+        """
+        Update the estimates after a block has finished and adjust the in-flight count / blockshape.
+        Extra arguments (the block's result) are ignored, so this can subscribe to the resultSignal directly.
+        """
+        new_limit = None
+        with self._lock:
+            now = self._clock()
+            pixels = self._pixels(roi)
+            self._started.pop(self._key(roi), None)
+
+            memory = self._memory_probe()
+            self.peak_memory = max(self.peak_memory, memory)
+            used = max(0, memory - self._baseline_memory)
+            if self._in_flight_pixels > 0:
+                sample = used / self._in_flight_pixels
+                if self._bytes_per_pixel is None:
+                    self._bytes_per_pixel = sample
+                else:
+                    self._bytes_per_pixel += self.SMOOTHING * (sample - self._bytes_per_pixel)
+            self._in_flight_pixels -= pixels
+            self.completed_blocks += 1
+
+            self._window_pixels += pixels
+            self._window_count += 1
+
+            old_limit = self._in_flight_limit
+            if memory > self._memory_budget:
+                self._decrease()
+                self._resetWindow(now)
+            elif self._window_count >= max(2, self._in_flight_limit):
+                self._adjust(now, memory)
+                self._resetWindow(now)
+
+            if self._in_flight_limit != old_limit:
+                new_limit = self._in_flight_limit
+
+        if new_limit is not None and self.inFlightLimitChanged is not None:
+            self.inFlightLimitChanged(new_limit)
+
+    def _decrease(self):
+        if self._in_flight_limit > 1:
+            self._in_flight_limit = max(1, self._in_flight_limit // 2)
+            logger.info(f"Memory budget exceeded, reducing blocks in flight to {self._in_flight_limit}")
+        else:
+            self._shrinkBlockshape()
+        self._last_action = "decrease"
+        self._hold_windows = 2
+
+    def _adjust(self, now, memory):
+        elapsed = max(now - self._window_start, 1e-9)
+        throughput = self._window_pixels / elapsed
+
+        block_bytes = (self._bytes_per_pixel or 0) * bigintprod(self._blockshape)
+        headroom = self.INCREASE_HEADROOM * self._memory_budget - memory
+
+        if (
+            self._last_action == "increase"
+            and self._last_throughput is not None
+            and throughput < (1 - self.THROUGHPUT_TOLERANCE) * self._last_throughput
+        ):
+            # More parallelism didn't help, go back and stay there for a while.
+            self._in_flight_limit = max(1, self._in_flight_limit - 1)
+            self._last_action = "revert"
+            self._hold_windows = 4
+        elif self._hold_windows > 0:
+            self._hold_windows -= 1
+            self._last_action = None
+        elif self._in_flight_limit < self._max_in_flight and block_bytes < headroom:
+            self._in_flight_limit += 1
+            self._last_action = "increase"
+        elif self._in_flight_limit >= self._max_in_flight and 2 * block_bytes * self._in_flight_limit < headroom:
+            self._growBlockshape()
+            self._last_action = None
+        else:
+            self._last_action = None
+
+        self._last_throughput = throughput
+
+    def _shrinkBlockshape(self):
+        candidates = numpy.where(self._splittable & (self._blockshape > 1), self._blockshape, 0)
+        if not candidates.any():
+            return
+        axis = int(numpy.argmax(candidates))
+        self._blockshape[axis] = (self._blockshape[axis] + 1) // 2
+        logger.info(f"Memory budget exceeded, reducing blockshape to {self.blockshape}")
+
+    def _growBlockshape(self):
+        candidates = numpy.where(
+            self._splittable & (self._blockshape < self._max_blockshape), self._max_blockshape - self._blockshape, 0
+        )
+        if not candidates.any():
+            return
+        # Grow the axis that was shrunk the most
+        axis = int(numpy.argmax(candidates))
+        self._blockshape[axis] = min(self._blockshape[axis] * 2, self._max_blockshape[axis])
+        logger.info(f"Enlarging blockshape to {self.blockshape}")
+
+    def _resetWindow(self, now):
+        self._window_start = now
+        self._window_pixels = 0
+        self._window_count = 0
+
+    @staticmethod
+    def _key(roi):
+        return tuple(map(int, roi[0])), tuple(map(int, roi[1]))
+
+    @staticmethod
+    def _pixels(roi):
+        return bigintprod(numpy.subtract(roi[1], roi[0]))
@@ -39,6 +39,7 @@ from lazyflow.roi import (
 import logging
 import warnings
 from .memory import Memory
+from .adaptiveStreaming import AdaptiveStreamingController
 
 logger = logging.getLogger(__name__)
 
@@ -95,7 +96,15 @@ class BigRequestStreamer(object):
     """
 
     def __init__(
-        self, outputSlot, roi, blockshape=None, batchSize=None, blockAlignment="absolute", allowParallelResults=False
+        self,
+        outputSlot,
+        roi,
+        blockshape=None,
+        batchSize=None,
+        blockAlignment="absolute",
+        allowParallelResults=False,
+        adaptive=False,
+        memoryBudget=None,
     ):
         """
         Constructor.
@@ -107,6 +116,12 @@ class BigRequestStreamer(object):
         :param blockAlignment: Determines how block the requests. Choices are 'absolute' or 'relative'.
         :param allowParallelResults: If False, The resultSignal will not be called in parallel.
                                      In that case, your handler function has no need for locks.
+        :param adaptive: If True, measure memory usage and throughput while streaming and adjust the number of
+                         requests in parallel (starting at batchSize, up to twice the number of threads) and the
+                         blockshape of requests that have not been launched yet (never larger than blockshape).
+                         See :py:class:`AdaptiveStreamingController<lazyflow.utility.adaptiveStreaming.AdaptiveStreamingController>`.
+        :param memoryBudget: Only used if adaptive: maximum memory usage of the process in bytes
+                             (default: ``Memory.getAvailableRam()``).
         """
         self._outputSlot = outputSlot
         self._bigRoi = roi
@@ -174,7 +189,31 @@ class BigRequestStreamer(object):
                         logger.debug("Requesting Roi: {}".format(block_bounds))
                         yield block_intersecting_portion
 
-        self._requestBatch = RoiRequestBatch(self._outputSlot, roiGen(), totalVolume, batchSize, allowParallelResults)
+        self._controller = None
+        roiIterator = roiGen()
+        if adaptive:
+            axiskeys = outputSlot.meta.getAxisKeys()
+            self._controller = AdaptiveStreamingController(
+                blockshape,
+                initial_in_flight=batchSize,
+                max_in_flight=max(batchSize, 2 * self._num_threads),
+                memory_budget=memoryBudget,
+                ram_usage_per_pixel=outputSlot.meta.ram_usage_per_requested_pixel,
+                unsplittable_axes=[axiskeys.index(k) for k in "tc" if k in axiskeys],
+            )
+            roiIterator = self._controller.subdivide(roiIterator)
+
+        self._requestBatch = RoiRequestBatch(
+            self._outputSlot, roiIterator, totalVolume, batchSize, allowParallelResults
+        )
+
+        if self._controller is not None:
+            # Subscribe first, so the controller sees the memory usage before client handlers release the result.
+            self._requestBatch.resultSignal.subscribe(self._controller.blockFinished)
+            self._controller.inFlightLimitChanged = self._setBatchSize
+
+    def _setBatchSize(self, batchSize):
+        self._requestBatch.batchSize = batchSize
 
     def _determine_blockshape(self, outputSlot):
         """
@@ -289,6 +328,15 @@ class BigRequestStreamer(object):
         :py:obj:`resultSignal`.
         """
         self._requestBatch.execute()
+        if self._controller is not None:
+            logger.info(
+                "Adaptive streaming finished {} blocks, peak memory usage {}, final batch size {}, final blockshape {}".format(
+                    self._controller.completed_blocks,
+                    Memory.format(self._controller.peak_memory),
+                    self._controller.in_flight_limit,
+                    self._controller.blockshape,
+                )
+            )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,217 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Second tier storage for cache blocks that the cache memory manager wants to free.
+
+Instead of discarding a block, a cache can first keep it compressed in memory
+(:class:`CompressedBlock`) and, if memory is still needed, move the compressed
+bytes to a scratch directory (:class:`DiskSpillStore`), which is bounded in size.
+Only blocks that fall out of the scratch directory have to be recomputed.
+"""
+import atexit
+import collections
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import zlib
+
+import numpy
+
+try:
+    from numcodecs import Blosc
+
+    _blosc_codec = Blosc(cname="lz4", clevel=5, shuffle=Blosc.SHUFFLE)
+except ImportError:
+    _blosc_codec = None
+
+logger = logging.getLogger(__name__)
+
+
+class CompressedBlock(object):
+    """
+    A numpy array, compressed in memory (blosc/lz4 if available, zlib otherwise)
+    """
+
+    __slots__ = ("payload", "shape", "dtype", "codec")
+
+    def __init__(self, payload, shape, dtype, codec):
+        self.payload = payload
+        self.shape = shape
+        self.dtype = dtype
+        self.codec = codec
+
+    @classmethod
+    def compress(cls, array):
+        array = numpy.ascontiguousarray(array)
+        if _blosc_codec is not None:
+            payload, codec = bytes(_blosc_codec.encode(array)), "blosc"
+        else:
+            payload, codec = zlib.compress(array.tobytes(), 1), "zlib"
+        return cls(payload, array.shape, array.dtype, codec)
+
+    def decompress(self):
+        if self.codec == "blosc":
+            raw = _blosc_codec.decode(self.payload)
+        else:
+            raw = zlib.decompress(self.payload)
+        return numpy.frombuffer(raw, dtype=self.dtype).reshape(self.shape).copy()
+
+    @property
+    def nbytes(self):
+        return len(self.payload)
+
+
+class DiskSpillStore(object):
+    """
+    Size-bounded store for CompressedBlocks in a scratch directory, shared by all caches.
+
+    Entries are keyed by (owner, key). When the total size exceeds ``max_bytes``, the least
+    recently spilled entries are dropped. Setting ``max_bytes`` to 0 disables the disk tier.
+    """
+
+    def __init__(self, directory=None, max_bytes=4 * 1024**3):
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # (owner, key) -> (path, header, nbytes)
+        self._total_bytes = 0
+        self._counter = 0
+        self._owns_directory = directory is None
+        self._directory = directory
+        self.max_bytes = max_bytes
+
+    @property
+    def directory(self):
+        with self._lock:
+            if self._directory is None:
+                self._directory = tempfile.mkdtemp(prefix="lazyflow-spill-")
+            return self._directory
+
+    @property
+    def totalBytes(self):
+        return self._total_bytes
+
+    def put(self, owner, key, block):
+        """
+        Write the compressed block to disk. Returns False if the block could not be stored.
+        """
+        if block.nbytes > self.max_bytes:
+            return False
+
+        directory = self.directory
+        with self._lock:
+            self._discard((owner, key))
+            while self._entries and self._total_bytes + block.nbytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+            self._counter += 1
+            path = os.path.join(directory, "{}-{}.blk".format(owner, self._counter))
+            try:
+                with open(path, "wb") as f:
+                    f.write(block.payload)
+            except OSError:
+                logger.warning("Could not spill cache block to {}".format(path), exc_info=True)
+                self._remove_file(path)
+                return False
+
+            header = CompressedBlock(None, block.shape, block.dtype, block.codec)
+            self._entries[(owner, key)] = (path, header, block.nbytes)
+            self._total_bytes += block.nbytes
+        return True
+
+    def pop(self, owner, key):
+        """
+        Remove the block from the store and return it (or None if it is not stored, or no longer).
+        """
+        with self._lock:
+            entry = self._entries.pop((owner, key), None)
+            if entry is None:
+                return None
+            path, header, nbytes = entry
+            self._total_bytes -= nbytes
+            try:
+                with open(path, "rb") as f:
+                    payload = f.read()
+            except OSError:
+                logger.warning("Could not read spilled cache block {}".format(path), exc_info=True)
+                return None
+            finally:
+                self._remove_file(path)
+        return CompressedBlock(payload, header.shape, header.dtype, header.codec)
+
+    def contains(self, owner, key):
+        with self._lock:
+            return (owner, key) in self._entries
+
+    def keys(self, owner):
+        with self._lock:
+            return [key for entry_owner, key in self._entries if entry_owner == owner]
+
+    def discard(self, owner, key):
+        with self._lock:
+            self._discard((owner, key))
+
+    def discardOwner(self, owner):
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[0] == owner]:
+                self._discard(entry_key)
+
+    def _discard(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            path, _, nbytes = entry
+            self._total_bytes -= nbytes
+            self._remove_file(path)
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def cleanup(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            if self._owns_directory and self._directory is not None:
+                shutil.rmtree(self._directory, ignore_errors=True)
+                self._directory = None
+
+
+_disk_spill_store = DiskSpillStore()
+atexit.register(lambda: _disk_spill_store.cleanup())
+
+
+def getDiskSpillStore():
+    return _disk_spill_store
+
+
+def setDiskSpillStore(directory=None, max_bytes=4 * 1024**3):
+    """
+    Replace the shared scratch store, e.g. to move it to a fast local disk or to change its size cap.
+    Blocks spilled to the previous store are dropped.
+    """
+    global _disk_spill_store
+    old_store = _disk_spill_store
+    _disk_spill_store = DiskSpillStore(directory, max_bytes)
+    old_store.cleanup()
@@ -0,0 +1,197 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Persistent, content-addressed store for computed feature blocks.
+
+Blocks are stored as single-chunk zarr arrays in a local directory, one array per key.
+Keys are derived from the content of the input data a block was computed from
+(see :meth:`FeatureBlockStore.digest`) and all parameters that influence the result,
+so entries never have to be invalidated: changed inputs or parameters simply map to new keys.
+The store is bounded in size, least recently used entries are removed first.
+
+The store survives the process, so reopened projects and repeated headless runs on the
+same data can skip the feature computation.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy
+import zarr
+from numcodecs import Blosc
+
+logger = logging.getLogger(__name__)
+
+
+class FeatureBlockStore(object):
+    """
+    Size-bounded, content-addressed block store in a local directory.
+    """
+
+    #: Temporary directories of unfinished writes are removed on startup once they are this old (in seconds).
+    #: Younger ones may belong to another process that shares the store and is still writing.
+    STALE_TMP_SECONDS = 3600
+
+    def __init__(self, path, max_bytes=10 * 1024**3):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.max_bytes = max_bytes
+        self._compressor = Blosc(cname="lz4", clevel=5, shuffle=Blosc.SHUFFLE)
+        self._lock = threading.Lock()
+        # key -> [size in bytes, last access time]
+        self._index = {}
+        self._total_bytes = 0
+        os.makedirs(self.path, exist_ok=True)
+        self._scan()
+
+    @staticmethod
+    def digest(array):
+        """
+        Content hash of an array (data, shape and dtype).
+        """
+        array = numpy.ascontiguousarray(array)
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr((array.shape, array.dtype.str)).encode())
+        h.update(memoryview(array).cast("B"))
+        return h.hexdigest()
+
+    @staticmethod
+    def makeKey(*parts):
+        """
+        Combine a digest and the parameters of the computation into a store key.
+        All parts must have a stable repr().
+        """
+        return hashlib.blake2b(repr(parts).encode(), digest_size=20).hexdigest()
+
+    @property
+    def totalBytes(self):
+        return self._total_bytes
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def get(self, key, out=None):
+        """
+        Read the block stored under key (into out, if given).
+        Returns None if there is no such block.
+        """
+        if key not in self._index:
+            return None
+        try:
+            data = zarr.open_array(self._entry_path(key), mode="r")[...]
+        except Exception:
+            logger.debug(f"Could not read feature block {key}", exc_info=True)
+            self._remove(key)
+            return None
+
+        with self._lock:
+            if key in self._index:
+                self._index[key][1] = time.time()
+        if out is not None:
+            out[...] = data
+            return out
+        return data
+
+    def put(self, key, data):
+        """
+        Store data under key (no-op if the key is already present).
+        """
+        if key in self._index:
+            return
+        data = numpy.asarray(data)
+        # Write to a temporary location first and rename, so that readers never see partial entries.
+        tmp_path = os.path.join(self.path, ".tmp-" + uuid.uuid4().hex)
+        try:
+            zarr.save_array(tmp_path, data, chunks=data.shape, compressor=self._compressor)
+            size = self._directory_size(tmp_path)
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError:
+            # Most likely another thread or process wrote the same key concurrently.
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return
+
+        with self._lock:
+            self._index[key] = [size, time.time()]
+            self._total_bytes += size
+        self._evict()
+
+    def clear(self):
+        for key in list(self._index):
+            self._remove(key)
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        with self._lock:
+            by_age = sorted(self._index, key=lambda k: self._index[k][1])
+        # Free a little more than necessary, so that we don't have to evict on every put.
+        target = 0.9 * self.max_bytes
+        for key in by_age:
+            if self._total_bytes <= target:
+                break
+            self._remove(key)
+
+    def _remove(self, key):
+        with self._lock:
+            entry = self._index.pop(key, None)
+            if entry is None:
+                return
+            self._total_bytes -= entry[0]
+        shutil.rmtree(self._entry_path(key), ignore_errors=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key)
+
+    def _scan(self):
+        for entry in os.scandir(self.path):
+            if not entry.is_dir():
+                continue
+            if entry.name.startswith(".tmp-"):
+                if time.time() - entry.stat().st_mtime > self.STALE_TMP_SECONDS:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            size = self._directory_size(entry.path)
+            self._index[entry.name] = [size, entry.stat().st_mtime]
+            self._total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def _directory_size(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+_default_store = None
+
+
+def getDefaultFeatureStore():
+    """
+    The store used by feature operators that have not been configured with a store explicitly (None: disabled)
+    """
+    return _default_store
+
+
+def setDefaultFeatureStore(store):
+    global _default_store
+    _default_store = store
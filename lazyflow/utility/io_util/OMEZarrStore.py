@@ -39,7 +39,9 @@ from zarr.storage import FSStore, LRUStoreCache
 
 from lazyflow import rtype
 from lazyflow.base import Axiskey
+from lazyflow.roi import roiToSlice
 from lazyflow.utility import Timer, Memory
+from lazyflow.utility.io_util.chunkCache import getDefaultChunkCache
 from lazyflow.utility.io_util.multiscaleStore import MultiscaleStore, DEFAULT_SCALE_KEY, Scale
 
 logger = logging.getLogger(__name__)
@@ -651,8 +653,21 @@ class OMEZarrStore(MultiscaleStore):
 
     def request(self, roi: rtype.Roi, scale_key=DEFAULT_SCALE_KEY):
         scale_key = scale_key if scale_key != DEFAULT_SCALE_KEY else self.lowest_resolution_key
-        data = self._scale_data[scale_key]["zarray"][roi.toSlice()]
-        return data
+        zarray = self._scale_data[scale_key]["zarray"]
+        chunk_cache = getDefaultChunkCache()
+        if chunk_cache is None:
+            return zarray[roi.toSlice()]
+        # Decoded chunks are shared by neighbouring (misaligned) requests, the LRUStoreCache only saves the download
+        data = numpy.empty(numpy.subtract(roi.stop, roi.start), dtype=zarray.dtype)
+        return chunk_cache.read(
+            (self.base_uri, scale_key),
+            zarray.shape,
+            zarray.chunks,
+            roi.start,
+            roi.stop,
+            lambda chunk_start, chunk_stop: zarray[roiToSlice(chunk_start, chunk_stop)],
+            data,
+        )
 
     def get_zarr_array(self, scale_key: str):
         """
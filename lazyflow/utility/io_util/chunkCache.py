@@ -0,0 +1,236 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Shared cache of decoded storage chunks for the file readers.
+
+The blocks of the caches downstream of a reader are often misaligned with the chunks the file is
+stored in, so neighbouring requests used to decode (decompress) the same chunk several times.
+Readers of chunked data pass their reads through :meth:`ChunkCache.read` instead, which
+
+* splits the read into whole storage chunks,
+* decodes each chunk at most once while it is cached, also for concurrent requests for the same chunk,
+* keeps the decoded chunks in a size-bounded LRU cache that is registered with the cache memory manager,
+  which accounts for and evicts them like the blocks of any other cache.
+
+Chunks are keyed by a ``source`` that identifies the stored data (see :func:`fileSourceKey`), so
+only data that doesn't change while it is read (e.g. files opened read-only) should be read through the cache.
+"""
+import collections
+import logging
+import os
+import threading
+import time
+from typing import Callable, Hashable, Optional, Sequence
+
+import numpy
+
+from lazyflow.operators.cacheEvictionPolicies import BlockStats, CacheCounters
+from lazyflow.operators.opCache import ManagedBlockedCache
+from lazyflow.request import RequestLock
+from lazyflow.roi import roiToSlice
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 256 * 1024**2
+
+
+def fileSourceKey(path, *parts) -> Hashable:
+    """
+    Source key for data stored in the file at path, e.g. fileSourceKey(path, internal_path).
+    The key changes when the file is modified, so outdated chunks are never returned.
+    """
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size) + parts
+
+
+class ChunkCache(ManagedBlockedCache):
+    """
+    Size-bounded LRU cache of decoded chunks, shared by all readers (see module docstring).
+    """
+
+    name = "ChunkCache"
+    parent = None
+    children = ()
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # (source, chunk index) -> decoded chunk, least recently used first
+        self._chunks = collections.OrderedDict()
+        self._stats = {}
+        self._chunk_locks = {}
+        self._used_bytes = 0
+        self._counters = CacheCounters()
+        self.registerWithMemoryManager()
+
+    def read(
+        self,
+        source: Hashable,
+        shape: Sequence[int],
+        chunk_shape: Sequence[int],
+        start: Sequence[int],
+        stop: Sequence[int],
+        read_chunk: Callable[[numpy.ndarray, numpy.ndarray], numpy.ndarray],
+        out: numpy.ndarray,
+    ) -> numpy.ndarray:
+        """
+        Fill out with data[start:stop] of a chunked source of the given shape.
+
+        :param read_chunk: read_chunk(chunk_start, chunk_stop) reads and decodes a single chunk from storage
+        """
+        start, stop = numpy.asarray(start), numpy.asarray(stop)
+        for key, chunk_start, chunk_stop in self._chunksOf(source, shape, chunk_shape, start, stop):
+            chunk = self._getChunk(key, chunk_start, chunk_stop, read_chunk)
+
+            read_start = numpy.maximum(start, chunk_start)
+            read_stop = numpy.minimum(stop, chunk_stop)
+            out[roiToSlice(read_start - start, read_stop - start)] = chunk[
+                roiToSlice(read_start - chunk_start, read_stop - chunk_start)
+            ]
+        return out
+
+    def prefetch(self, source, shape, chunk_shape, start, stop, read_chunk):
+        """
+        Make sure that the chunks of data[start:stop] are cached, so that reading them later is fast (see read()).
+        """
+        for key, chunk_start, chunk_stop in self._chunksOf(source, shape, chunk_shape, start, stop):
+            self._getChunk(key, chunk_start, chunk_stop, read_chunk)
+
+    @staticmethod
+    def _chunksOf(source, shape, chunk_shape, start, stop):
+        """(key, start, stop) of the chunks intersecting the roi [start, stop)"""
+        start, stop = numpy.asarray(start), numpy.asarray(stop)
+        shape, chunk_shape = numpy.asarray(shape), numpy.asarray(chunk_shape)
+        if (stop <= start).any():
+            return
+
+        first_chunk = start // chunk_shape
+        num_chunks = (stop - 1) // chunk_shape - first_chunk + 1
+        for offset in numpy.ndindex(*num_chunks):
+            index = first_chunk + offset
+            chunk_start = index * chunk_shape
+            yield (source, tuple(index.tolist())), chunk_start, numpy.minimum(chunk_start + chunk_shape, shape)
+
+    def _getChunk(self, key, chunk_start, chunk_stop, read_chunk):
+        with self._lock:
+            chunk = self._lookup(key)
+            if chunk is not None:
+                return chunk
+            chunk_lock = self._chunk_locks.setdefault(key, RequestLock())
+
+        # Handle simultaneous requests for the same chunk without
+        # preventing parallel requests for different chunks.
+        with chunk_lock:
+            with self._lock:
+                chunk = self._lookup(key)
+            if chunk is None:
+                self._counters.countMiss()
+                start_time = time.perf_counter()
+                chunk = numpy.asarray(read_chunk(chunk_start, chunk_stop))
+                self._store(key, chunk, time.perf_counter() - start_time)
+
+        with self._lock:
+            if self._chunk_locks.get(key) is chunk_lock:
+                del self._chunk_locks[key]
+        return chunk
+
+    def _lookup(self, key) -> Optional[numpy.ndarray]:
+        """The cached chunk, or None. Obtain self._lock before you call this."""
+        chunk = self._chunks.get(key)
+        if chunk is not None:
+            self._chunks.move_to_end(key)
+            stats = self._stats[key]
+            stats.last_access_time = time.time()
+            stats.access_count += 1
+            self._counters.countHit()
+        return chunk
+
+    def _store(self, key, chunk, compute_time):
+        if chunk.nbytes > self.max_bytes:
+            return
+        # Cached chunks are handed out to all readers
+        chunk.flags.writeable = False
+        with self._lock:
+            self._chunks[key] = chunk
+            self._stats[key] = BlockStats(key, time.time(), compute_time=compute_time, size=chunk.nbytes)
+            self._used_bytes += chunk.nbytes
+            while self._used_bytes > self.max_bytes:
+                self._pop(next(iter(self._chunks)))
+
+    def _pop(self, key) -> int:
+        """Remove a chunk and return its size. Obtain self._lock before you call this."""
+        chunk = self._chunks.pop(key, None)
+        if chunk is None:
+            return 0
+        del self._stats[key]
+        self._used_bytes -= chunk.nbytes
+        return chunk.nbytes
+
+    def usedMemory(self):
+        return self._used_bytes
+
+    def fractionOfUsedMemoryDirty(self):
+        # Chunks of changed sources are never looked up again, they just age out
+        return 0.0
+
+    def getBlockAccessTimes(self):
+        with self._lock:
+            return [(key, stats.last_access_time) for key, stats in self._stats.items()]
+
+    def getBlockStats(self):
+        with self._lock:
+            return [BlockStats(**vars(stats)) for stats in self._stats.values()]
+
+    def getCounters(self):
+        return self._counters
+
+    def freeBlock(self, block_id):
+        with self._lock:
+            return self._pop(block_id)
+
+    def freeMemory(self):
+        with self._lock:
+            freed = self._used_bytes
+            self._chunks.clear()
+            self._stats.clear()
+            self._used_bytes = 0
+        return freed
+
+    def freeDirtyMemory(self):
+        return 0
+
+
+_default_cache = ChunkCache()
+
+
+def getDefaultChunkCache() -> Optional[ChunkCache]:
+    """
+    The chunk cache shared by the file readers (None: disabled)
+    """
+    return _default_cache
+
+
+def setDefaultChunkCache(cache: Optional[ChunkCache]):
+    global _default_cache
+    if _default_cache is not None:
+        _default_cache.freeMemory()
+    _default_cache = cache
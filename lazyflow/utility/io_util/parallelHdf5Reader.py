@@ -0,0 +1,111 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Parallel reads of compressed HDF5 datasets in the worker processes of the lazyflow process pool.
+
+h5py serializes all calls behind a global lock, so threads that read (and decompress) chunks of a dataset
+just queue up. Here, each worker process of the :py:mod:`lazyflow.request.processPool` opens the file
+itself (once, read-only), and a read is split into chunk-aligned parts that the workers decompress in
+parallel, directly into a shared memory buffer.
+"""
+import logging
+import os
+from typing import List, Sequence, Tuple
+
+import h5py
+import numpy
+
+from lazyflow.request.processPool import ProcessPool, SharedArray, wait_for_future
+from lazyflow.roi import roiToSlice
+
+logger = logging.getLogger(__name__)
+
+# In each worker process: (path, modification time, size) -> open h5py.File
+_open_files = {}
+
+
+def _get_file(filepath: str) -> h5py.File:
+    """The (cached) read-only handle of this process for the given file, reopened if the file has changed"""
+    stat = os.stat(filepath)
+    key = (filepath, stat.st_mtime_ns, stat.st_size)
+    h5_file = _open_files.get(key)
+    if h5_file is None:
+        for outdated in [k for k in _open_files if k[0] == filepath]:
+            _open_files.pop(outdated).close()
+        h5_file = _open_files[key] = h5py.File(filepath, "r")
+    return h5_file
+
+
+def read_part(filepath: str, internal_path: str, out: numpy.ndarray, offset, start, stop):
+    """Kernel: read dataset[start:stop] into out, which holds the data starting at offset"""
+    offset = numpy.asarray(offset)
+    dataset = _get_file(filepath)[internal_path]
+    dataset.read_direct(out, roiToSlice(start, stop), roiToSlice(start - offset, stop - offset))
+
+
+def chunk_aligned_parts(start, stop, chunks, max_parts: int) -> List[Tuple[numpy.ndarray, numpy.ndarray]]:
+    """
+    Split the roi [start, stop) into at most max_parts slabs of whole chunk rows (along the axis with the
+    most chunks), so that no chunk has to be read (and decompressed) for more than one part.
+    """
+    start, stop, chunks = numpy.asarray(start), numpy.asarray(stop), numpy.asarray(chunks)
+    first_chunk = start // chunks
+    num_chunks = -(-stop // chunks) - first_chunk
+    axis = int(numpy.argmax(num_chunks))
+
+    parts = []
+    rows = numpy.arange(first_chunk[axis], first_chunk[axis] + num_chunks[axis])
+    for part_rows in numpy.array_split(rows, min(max_parts, num_chunks[axis])):
+        part_start, part_stop = start.copy(), stop.copy()
+        part_start[axis] = max(start[axis], part_rows[0] * chunks[axis])
+        part_stop[axis] = min(stop[axis], (part_rows[-1] + 1) * chunks[axis])
+        parts.append((part_start, part_stop))
+    return parts
+
+
+def supports_parallel_reads(dataset) -> bool:
+    """Reading the dataset in several processes pays off for compressed datasets of files that aren't written to."""
+    return (
+        isinstance(dataset, h5py.Dataset)
+        and dataset.file.mode == "r"
+        and dataset.chunks is not None
+        and dataset.compression is not None
+    )
+
+
+def read_in_processes(pool: ProcessPool, dataset: h5py.Dataset, start: Sequence[int], stop: Sequence[int], result):
+    """Read dataset[start:stop] into result, in the worker processes of the pool (see module docstring)."""
+    start, stop = numpy.asarray(start), numpy.asarray(stop)
+    shared = SharedArray.empty(stop - start, dataset.dtype)
+    futures = []
+    try:
+        for part_start, part_stop in chunk_aligned_parts(start, stop, dataset.chunks, pool.num_processes):
+            futures.append(
+                pool.submit(read_part, dataset.file.filename, dataset.name, shared, start, part_start, part_stop)
+            )
+        for future in futures:
+            wait_for_future(future)
+        result[...] = shared.array
+    finally:
+        for future in futures:
+            future.cancel()
+        shared.release()
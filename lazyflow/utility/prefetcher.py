@@ -0,0 +1,236 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Read-ahead for sequential access patterns.
+
+Headless export (:py:class:`BigRequestStreamer<lazyflow.utility.bigRequestStreamer.BigRequestStreamer>`)
+walks the blocks of a volume in raster order, but the I/O of each block only starts when that block
+is requested. A :class:`Prefetcher` watches the rois requested from an operator, detects sequential
+or strided access on a block grid and requests the next blocks ahead of time, at lower priority
+than all regular requests. Read-aheads that are no longer predicted when the pattern changes are cancelled.
+
+Prefetching is disabled by default, see :func:`setPrefetchDepth`.
+"""
+import collections
+import logging
+import queue
+import threading
+from functools import partial
+
+import numpy
+
+from lazyflow.request import Request
+
+logger = logging.getLogger(__name__)
+
+# Number of recent accesses the pattern is detected from
+HISTORY_LENGTH = 8
+# Minimal number of accesses that have to follow the pattern
+MIN_PATTERN_LENGTH = 4
+# Root priority of read-ahead requests (regular root requests have [0])
+PREFETCH_PRIORITY = [1]
+
+
+class Prefetcher(object):
+    """
+    Detects sequential and strided access to the blocks of a grid and reads ahead (see module docstring).
+
+    Blocks are numbered in C order, so a raster walk over the blocks is sequential, including the jumps
+    to the next row. A strided pattern is detected as long as the recent accesses are a (possibly
+    incomplete) arithmetic sequence, so requests that finish out of order don't break the pattern.
+    """
+
+    def __init__(self, shape, fetch, block_shape=None, depth=None):
+        """
+        :param shape: shape of the data
+        :param fetch: fetch(start, stop) reads the block with the given roi (e.g. into a cache);
+            it runs in a low priority request.
+        :param block_shape: block grid of the access pattern.
+            If None, the grid is learned from the observed rois.
+        :param depth: number of blocks to read ahead (default: :func:`getPrefetchDepth`)
+        """
+        self._shape = numpy.asarray(shape)
+        self._fetch = fetch
+        self._learnGrid = block_shape is None
+        self._blockShape = None if block_shape is None else numpy.asarray(block_shape)
+        self._origin = numpy.zeros_like(self._shape)
+        self._depth = depth
+        self._lock = threading.Lock()
+        self._history = collections.deque(maxlen=HISTORY_LENGTH)
+        # flat block index -> _PrefetchTask
+        self._pending = {}
+
+    @property
+    def depth(self):
+        return getPrefetchDepth() if self._depth is None else self._depth
+
+    def observe(self, start, stop):
+        """
+        Record an access to the roi [start, stop) and read ahead if the recent accesses follow a pattern.
+        """
+        depth = self.depth
+        if depth <= 0:
+            self.cancel()
+            return
+
+        start, stop = numpy.asarray(start), numpy.asarray(stop)
+        if (stop <= start).any():
+            return
+        tasks = []
+        with self._lock:
+            index = self._blockIndex(start, stop)
+            if index is None:
+                self._history.clear()
+                predicted = []
+            else:
+                self._pending.pop(index, None)
+                self._history.append(index)
+                predicted = self._predict(depth)
+
+            stale = [self._pending.pop(i) for i in list(self._pending) if i not in predicted]
+            for i in predicted:
+                if i not in self._pending and i not in self._history:
+                    self._pending[i] = _PrefetchTask(partial(self._fetch, *self._blockRoi(i)))
+                    tasks.append(self._pending[i])
+
+        for task in stale:
+            task.cancel()
+        for task in tasks:
+            _dispatcher.submit(task)
+
+    def cancel(self):
+        """
+        Cancel all outstanding read-aheads and forget the access history.
+        """
+        with self._lock:
+            stale = list(self._pending.values())
+            self._pending.clear()
+            self._history.clear()
+        for task in stale:
+            task.cancel()
+
+    def _gridShape(self):
+        return -(-(self._shape - self._origin) // self._blockShape)
+
+    def _blockIndex(self, start, stop):
+        """Flat index of the block [start, stop) on the grid, or None. Obtain self._lock before you call this."""
+        if self._learnGrid and (self._blockShape is None or not self._isBlock(start, stop)):
+            # (Re)learn the grid from the current roi, which is its first block
+            self._blockShape = stop - start
+            self._origin = start % numpy.maximum(self._blockShape, 1)
+            self._history.clear()
+        if (self._blockShape <= 0).any() or not self._isBlock(start, stop):
+            return None
+        return int(numpy.ravel_multi_index(tuple((start - self._origin) // self._blockShape), tuple(self._gridShape())))
+
+    def _isBlock(self, start, stop):
+        return ((start - self._origin) % self._blockShape == 0).all() and (stop == self._blockRoiFrom(start)[1]).all()
+
+    def _blockRoiFrom(self, start):
+        return start, numpy.minimum(start + self._blockShape, self._shape)
+
+    def _blockRoi(self, index):
+        block_index = numpy.array(numpy.unravel_index(index, tuple(self._gridShape())))
+        return self._blockRoiFrom(self._origin + block_index * self._blockShape)
+
+    def _predict(self, depth):
+        """The blocks to read ahead, according to the access history. Obtain self._lock before you call this."""
+        indices = sorted(set(self._history))
+        if len(indices) < MIN_PATTERN_LENGTH:
+            return []
+        deltas = numpy.diff(indices)
+        step = int(deltas.min())
+        if (deltas % step).any() or (indices[-1] - indices[0]) // step >= 2 * HISTORY_LENGTH:
+            return []
+        num_blocks = int(numpy.prod(self._gridShape()))
+        return [i for i in range(indices[-1] + step, indices[-1] + step * (depth + 1), step) if i < num_blocks]
+
+
+class _PrefetchTask(object):
+    def __init__(self, fn):
+        self._fn = fn
+        self._lock = threading.Lock()
+        self._request = None
+        self.cancelled = False
+
+    def start(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self._request = Request(self._fn, root_priority=PREFETCH_PRIORITY)
+            self._request.notify_failed(self._logFailure)
+        self._request.submit()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            request = self._request
+        if request is not None:
+            request.cancel()
+
+    def _logFailure(self, exc, exc_info):
+        logger.debug(f"Read-ahead failed: {exc!r}")
+
+
+class _Dispatcher(object):
+    """
+    Starts read-ahead requests from a thread of its own.
+    Requests created within a request become its children: they would inherit its priority and
+    could not be cancelled while it is running.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, task):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="PrefetchDispatcher", daemon=True)
+                self._thread.start()
+        self._queue.put(task)
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            try:
+                task.start()
+            except Exception as exc:
+                # Only raised here if the requests are executed synchronously (no worker threads)
+                logger.debug(f"Read-ahead failed: {exc!r}")
+
+
+_dispatcher = _Dispatcher()
+_prefetch_depth = 0
+
+
+def getPrefetchDepth():
+    """
+    Number of blocks read ahead by prefetchers that have not been configured with a depth explicitly (0: disabled)
+    """
+    return _prefetch_depth
+
+
+def setPrefetchDepth(depth):
+    global _prefetch_depth
+    _prefetch_depth = depth
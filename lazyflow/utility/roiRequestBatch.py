@@ -147,6 +147,20 @@ class RoiRequestBatch:
         """
         return self._progressSignal
 
+    @property
+    def batchSize(self):
+        """
+        The maximum number of requests to launch in parallel.
+        May be changed while the batch is executing (e.g. from a resultSignal handler).
+        The new value is taken into account the next time an active request completes.
+        """
+        return self._batchSize
+
+    @batchSize.setter
+    def batchSize(self, batchSize):
+        assert batchSize >= 1, "batchSize must be positive"
+        self._batchSize = batchSize
+
     def execute(self):
         """
         Execute the batch of requests and wait for all of them to complete.
@@ -176,7 +190,7 @@ class RoiRequestBatch:
                 # Wait for at least one active request to finish
                 with self._condition:
                     while (
-                        not self._failure_excinfo and (self._activated_count - self._completed_count) == self._batchSize
+                        not self._failure_excinfo and (self._activated_count - self._completed_count) >= self._batchSize
                     ):
                         self._condition.wait()
 
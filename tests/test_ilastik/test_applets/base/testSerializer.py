@@ -338,13 +338,14 @@ class TestSerialObjectFeatureNamesSlot(unittest.TestCase):
 
 
 class TestSerialBlockSlot(unittest.TestCase):
-    def _init_objects(self):
+    def _init_objects(self, num_lanes=1):
         raw_data = numpy.zeros((100, 100, 100, 1), dtype=numpy.uint32)
         raw_data = vigra.taggedView(raw_data, "zyxc")
 
         opLabelArrays = OperatorWrapper(OpCompressedUserLabelArray, graph=Graph())
-        opLabelArrays.Input.resize(1)
-        opLabelArrays.Input[0].setValue(raw_data)
+        opLabelArrays.Input.resize(num_lanes)
+        for lane in range(num_lanes):
+            opLabelArrays.Input[lane].setValue(raw_data)
         opLabelArrays.shape.setValue(raw_data.shape)
         opLabelArrays.eraser.setValue(255)
         opLabelArrays.deleteLabel.setValue(-1)
@@ -493,6 +494,120 @@ class TestSerialBlockSlot(unittest.TestCase):
         os.remove(h5_filepath)
         shutil.rmtree(tmp_dir)
 
+    def testIncremental(self):
+        tmp_dir = tempfile.mkdtemp()
+        h5_filepath = os.path.join(tmp_dir, "serial_blockslot_test.h5")
+
+        opLabelArrays, slotSerializer = self._init_objects()
+        opLabelArrays.Input[0][10:11, 10:20, 10:20, 0:1] = 1 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+        opLabelArrays.Input[0][30:31, 30:40, 30:40, 0:1] = 2 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+        opLabelArrays.Input[0][50:51, 50:60, 50:60, 0:1] = 3 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+
+        with h5py.File(h5_filepath, "w") as f:
+            label_group = f.create_group("label_data")
+            slotSerializer.serialize(label_group)
+            lane_group = label_group[slotSerializer.name]["0000"]
+            assert len(lane_group) == 3
+            for block in lane_group.values():
+                block.attrs["untouched"] = True
+
+            # Nothing changed
+            assert not slotSerializer.shouldSerialize(label_group)
+
+            # Edit one block, erase another one and add a new one
+            opLabelArrays.Input[0][10:11, 10:20, 10:20, 0:1] = 4 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+            opLabelArrays.Input[0][30:31, 30:40, 30:40, 0:1] = 255 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+            opLabelArrays.Input[0][70:71, 70:80, 70:80, 0:1] = 5 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+            assert slotSerializer.shouldSerialize(label_group)
+            slotSerializer.serialize(label_group)
+
+            lane_group = label_group[slotSerializer.name]["0000"]
+            blockSlices = {block.attrs["blockSlice"]: block for block in lane_group.values()}
+            assert len(blockSlices) == 3
+            assert blockSlices["[50:60,50:60,50:60,0:1]"].attrs.get("untouched")
+            assert not blockSlices["[10:20,10:20,10:20,0:1]"].attrs.get("untouched")
+            assert not blockSlices["[70:80,70:80,70:80,0:1]"].attrs.get("untouched")
+
+        # A fresh serializer reads the same data back.
+        opLabelArrays, slotSerializer = self._init_objects()
+
+        with h5py.File(h5_filepath, "r") as f:
+            label_group = f["label_data"]
+            slotSerializer.deserialize(label_group)
+
+        assert (opLabelArrays.Output[0][10:11, 10:20, 10:20, 0:1].wait() == 4).all()
+        assert (opLabelArrays.Output[0][30:31, 30:40, 30:40, 0:1].wait() == 0).all()
+        assert (opLabelArrays.Output[0][50:51, 50:60, 50:60, 0:1].wait() == 3).all()
+        assert (opLabelArrays.Output[0][70:71, 70:80, 70:80, 0:1].wait() == 5).all()
+
+        os.remove(h5_filepath)
+        shutil.rmtree(tmp_dir)
+
+    def testLegacyFileWithSeveralLanes(self):
+        tmp_dir = tempfile.mkdtemp()
+        h5_filepath = os.path.join(tmp_dir, "serial_blockslot_test.h5")
+
+        opLabelArrays, slotSerializer = self._init_objects(num_lanes=3)
+        opLabelArrays.Input[0][10:11, 10:20, 10:20, 0:1] = 1 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+        opLabelArrays.Input[1][30:31, 30:40, 30:40, 0:1] = 2 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+
+        with h5py.File(h5_filepath, "w") as f:
+            label_group = f.create_group("label_data")
+            slotSerializer.serialize(label_group)
+
+            # Files written before incremental saving don't have block keys
+            for lane_group in label_group[slotSerializer.name].values():
+                for block in lane_group.values():
+                    del block.attrs["blockKey"]
+
+        opLabelArrays, slotSerializer = self._init_objects(num_lanes=3)
+
+        with h5py.File(h5_filepath, "r") as f:
+            label_group = f["label_data"]
+            slotSerializer.deserialize(label_group)
+
+        assert (opLabelArrays.Output[0][10:11, 10:20, 10:20, 0:1].wait() == 1).all()
+        assert (opLabelArrays.Output[1][30:31, 30:40, 30:40, 0:1].wait() == 2).all()
+        # The next save rewrites everything
+        assert slotSerializer._blockNames is None
+
+        os.remove(h5_filepath)
+        shutil.rmtree(tmp_dir)
+
+    def testDeferredDeserialization(self):
+        tmp_dir = tempfile.mkdtemp()
+        h5_filepath = os.path.join(tmp_dir, "serial_blockslot_test.h5")
+
+        opLabelArrays, slotSerializer = self._init_objects()
+        opLabelArrays.Input[0][10:11, 10:20, 10:20, 0:1] = 1 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+
+        with h5py.File(h5_filepath, "w") as f:
+            AppletSerializer("Labels", [slotSerializer]).serializeToHdf5(f, h5_filepath)
+
+        opLabelArrays, slotSerializer = self._init_objects()
+        serializer = AppletSerializer("Labels", [slotSerializer])
+
+        with h5py.File(h5_filepath, "r") as f, mock.patch.object(
+            slotSerializer, "_deserialize", wraps=slotSerializer._deserialize
+        ) as deserialize:
+            serializer.deserializeFromHdf5(f, h5_filepath, headless=True)
+            assert not deserialize.called
+
+            # Nothing to save, without loading the labels
+            assert not serializer.shouldSerialize(f)
+            assert not deserialize.called
+
+            # Loaded when requested
+            assert (opLabelArrays.Output[0][10:11, 10:20, 10:20, 0:1].wait() == 1).all()
+            assert deserialize.call_count == 1
+            assert not serializer.isDirty()
+
+            assert opLabelArrays.nonzeroBlocks[0].value
+            assert deserialize.call_count == 1
+
+        os.remove(h5_filepath)
+        shutil.rmtree(tmp_dir)
+
 
 @pytest.fixture
 def opLabelArray():
@@ -0,0 +1,90 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+#           http://ilastik.org/license.html
+###############################################################################
+import numpy as np
+import pytest
+
+from ilastik.applets.base.applet import DatasetConstraintError
+from ilastik.applets.objectExtraction.opObjectExtraction import default_features_key
+from ilastik.applets.tracking.conservation.traxelStore import frame_traxels
+
+
+def features_2d():
+    # background and three objects, the third one is too large
+    return {
+        default_features_key: {
+            "RegionCenter": np.array([[0, 0], [2.5, 3.5], [10.0, 1.0], [7.0, 7.0]], dtype=np.float32),
+            "Coord<Minimum>": np.array([[0, 0], [2, 3], [9, 0], [3, 3]], dtype=np.float32),
+            "Coord<Maximum>": np.array([[0, 0], [3, 4], [11, 2], [11, 11]], dtype=np.float32),
+            "Count": np.array([[100], [4], [6], [64]], dtype=np.float32),
+        }
+    }
+
+
+RANGES = dict(x_range=(0, 20), y_range=(0, 20), z_range=(0, 1), size_range=(2, 50))
+
+
+def test_filter_and_features():
+    traxels, filtered = frame_traxels(3, features_2d(), scales=(1.0, 2.0, 3.0), **RANGES)
+
+    assert sorted(traxels) == [1, 2]
+    assert filtered == [3]
+
+    traxel = traxels[2]
+    assert traxel.Id == 2
+    assert traxel.Timestep == 3
+    np.testing.assert_array_equal(traxel.Features["com"], [10.0, 1.0, 0.0])
+    np.testing.assert_array_equal(traxel.Features["CoordMinimum"], [9, 0, 0])
+    np.testing.assert_array_equal(traxel.Features["CoordMaximum"], [11, 2, 0])
+    np.testing.assert_array_equal(traxel.Features["count"], [6])
+
+
+def test_roi_filter():
+    ranges = dict(RANGES, x_range=(5, 20), size_range=(0, 100))
+    traxels, filtered = frame_traxels(0, features_2d(), **ranges)
+
+    # object 1 ends before x = 5
+    assert sorted(traxels) == [2, 3]
+    assert filtered == [1]
+
+
+def test_probabilities_are_clipped():
+    div_probs = np.array([[1, 0], [0.0, 1.0], [0.7, 0.3], [0.5, 0.5]])
+    det_probs = np.array([[1, 0, 0], [0.0, 1.0, 0.0], [0.2, 0.5, 0.3], [0, 0, 1]])
+    traxels, _ = frame_traxels(0, features_2d(), div_probs=div_probs, det_probs=det_probs, **RANGES)
+
+    np.testing.assert_allclose(traxels[1].Features["divProb"], [1 - 0.99999999, 0.99999999])
+    np.testing.assert_allclose(traxels[2].Features["divProb"], [0.7, 0.3])
+    np.testing.assert_allclose(traxels[1].Features["detProb"], [1e-7, 0.99999999, 1e-7])
+
+
+def test_empty_frame():
+    features = {default_features_key: {name: np.zeros((0, 2)) for name in features_2d()[default_features_key]}}
+    assert frame_traxels(0, features, **RANGES) == ({}, [])
+
+
+def test_invalid_dimensionality():
+    features = features_2d()
+    for name, value in features[default_features_key].items():
+        if name != "Count":
+            features[default_features_key][name] = np.zeros((len(value), 4))
+
+    with pytest.raises(DatasetConstraintError):
+        frame_traxels(0, features, **RANGES)
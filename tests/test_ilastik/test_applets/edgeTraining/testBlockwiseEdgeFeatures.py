@@ -0,0 +1,94 @@
+from collections import defaultdict
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+import vigra
+
+from ilastikrag import Rag
+from ilastikrag.util import generate_random_voronoi
+
+from ilastik.applets.edgeTraining.blockwiseEdgeFeatures import (
+    BLOCKWISE_EDGE_FEATURES,
+    EdgeLookup,
+    EdgeStatistics,
+    compute_edge_features_blockwise,
+    supports_blockwise,
+)
+
+FEATURES = list(BLOCKWISE_EDGE_FEATURES)
+
+
+def brute_force_edge_values(labels, data):
+    values = defaultdict(list)
+    for axis in range(labels.ndim):
+        first = tuple(slice(0, -1) if a == axis else slice(None) for a in range(labels.ndim))
+        second = tuple(slice(1, None) if a == axis else slice(None) for a in range(labels.ndim))
+        for sp1, sp2, v1, v2 in zip(labels[first].flat, labels[second].flat, data[first].flat, data[second].flat):
+            if sp1 != sp2:
+                values[(min(sp1, sp2), max(sp1, sp2))].append((v1 + v2) / 2)
+    return values
+
+
+def test_edge_statistics_merge():
+    values = np.random.random(1000)
+    groups = np.random.randint(0, 10, size=1000)
+    total = EdgeStatistics.of_values(groups, 10, values)
+
+    merged = EdgeStatistics(10)
+    for part in np.array_split(np.arange(1000), 7):
+        edges, part_groups = np.unique(groups[part], return_inverse=True)
+        merged.merge(EdgeStatistics.of_values(part_groups, len(edges), values[part]), edges)
+
+    for name in ["count", "sum", "minimum", "maximum", "mean", "variance"]:
+        np.testing.assert_allclose(getattr(merged, name), getattr(total, name))
+    np.testing.assert_allclose(merged.variance, [values[groups == g].var() for g in range(10)])
+
+
+@pytest.mark.parametrize("block_shape", [(7, 9), (20, 30), (4, 100)])
+def test_against_brute_force(block_shape):
+    labels = np.zeros((20, 30), dtype=np.uint32)
+    labels[:, 10:] = 1
+    labels[8:, 5:] = 2
+    labels[15:, 20:] = 3
+    data = np.random.random((20, 30, 2)).astype(np.float32)
+
+    reference = brute_force_edge_values(labels, data[..., 1])
+    edge_ids = np.array(sorted(reference), dtype=np.uint32)
+    rag = SimpleNamespace(label_img=labels, edge_ids=edge_ids)
+
+    read_block = lambda start, stop: data[tuple(slice(a, b) for a, b in zip(start, stop))]
+    (df,) = compute_edge_features_blockwise(rag, read_block, [(1, FEATURES)], block_shape=block_shape)
+
+    assert list(df.columns) == FEATURES
+    for row, edge in enumerate(map(tuple, edge_ids)):
+        values = np.array(reference[edge], dtype=np.float64)
+        expected = [len(values), values.sum(), values.min(), values.max(), values.mean(), values.var()]
+        np.testing.assert_allclose(df.iloc[row].values, expected, rtol=1e-5)
+
+
+def test_identical_to_rag():
+    superpixels = generate_random_voronoi((60, 70, 80), 100)
+    rag = Rag(superpixels)
+    voxel_data = vigra.taggedView(np.random.random(superpixels.shape).astype(np.float32), superpixels.axistags)
+
+    features = ["standard_edge_mean", "standard_edge_count", "standard_edge_variance", "standard_edge_maximum"]
+    assert supports_blockwise(features)
+    assert not supports_blockwise(features + ["standard_edge_quantiles_50"])
+
+    expected = rag.compute_features(voxel_data, features).iloc[:, 2:]
+    read_block = lambda start, stop: voxel_data.view(np.ndarray)[tuple(slice(a, b) for a, b in zip(start, stop))][
+        ..., None
+    ]
+    (df,) = compute_edge_features_blockwise(rag, read_block, [(0, features)], block_shape=(32, 32, 32))
+
+    pd.testing.assert_frame_equal(df, expected.reset_index(drop=True), check_dtype=False, rtol=1e-5)
+
+
+def test_edge_lookup():
+    edge_ids = np.array([[1, 2], [1, 5], [0, 7], [3, 4]], dtype=np.uint32)
+    lookup = EdgeLookup(edge_ids)
+    rows = lookup(np.array([3, 0, 1, 1, 2, 9]), np.array([4, 7, 2, 3, 5, 10]))
+    np.testing.assert_array_equal(rows, [3, 2, 0, -1, -1, -1])
+    np.testing.assert_array_equal(EdgeLookup(np.zeros((0, 2)))(np.array([1]), np.array([2])), [-1])
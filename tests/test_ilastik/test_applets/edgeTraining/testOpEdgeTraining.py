@@ -1,4 +1,5 @@
 import numpy as np
+import pandas as pd
 import pytest
 
 from ilastikrag.util import generate_random_voronoi
@@ -114,3 +115,73 @@ class TestOpEdgeTraining:
         # ON
         assert edge_prob_dict1[edge_12] > 0.5, "Expected > 0.5, got {}".format(edge_prob_dict1[edge_12])
         assert edge_prob_dict1[edge_13] > 0.5, "Expected > 0.5, got {}".format(edge_prob_dict1[edge_13])
+
+    def test_local_superpixel_change(self, graph, superpixels):
+        voxel_data = superpixels.astype(np.float32)
+        superpixels = superpixels.copy()
+
+        multilane_op = OpEdgeTraining(graph=graph)
+        multilane_op.VoxelData.resize(1)
+        op_view = multilane_op.getLane(0)
+
+        op_view.VoxelData.setValue(voxel_data, extra_meta={"channel_names": ["Grayscale"]})
+        op_view.Superpixels.setValue(superpixels)
+        op_view.WatershedSelectedInput.setValue(voxel_data)
+        op_view.TrainRandomForest.setValue(True)
+        multilane_op.FeatureNames.setValue({"Grayscale": ["standard_edge_mean", "standard_edge_count"]})
+
+        rag = op_view.Rag.value
+        changed_sps = set(np.unique(superpixels[:12, :12, :12]).tolist())
+        edges = [tuple(edge) for edge in rag.edge_ids]
+        near_edge = next(edge for edge in edges if edge[0] in changed_sps)
+        far_edge = next(edge for edge in edges if edge[0] not in changed_sps and edge[1] not in changed_sps)
+        op_view.EdgeLabelsDict.setValue({near_edge: 1, far_edge: 2})
+
+        # Replace a corner of the volume with a new superpixel
+        superpixels[:10, :10, :10] = superpixels.max() + 1
+        op_view.Superpixels.setDirty((0, 0, 0, 0), (10, 10, 10, 1))
+
+        assert op_view.EdgeLabelsDict.value == {far_edge: 2}
+
+        features = multilane_op.opEdgeFeaturesCache.Output[0].value
+
+        # Same result as computing everything from scratch
+        fresh_op = OpEdgeTraining(graph=graph)
+        fresh_op.VoxelData.resize(1)
+        fresh_view = fresh_op.getLane(0)
+        fresh_view.VoxelData.setValue(voxel_data, extra_meta={"channel_names": ["Grayscale"]})
+        fresh_view.Superpixels.setValue(superpixels.copy())
+        fresh_view.WatershedSelectedInput.setValue(voxel_data)
+        fresh_view.TrainRandomForest.setValue(True)
+        fresh_op.FeatureNames.setValue({"Grayscale": ["standard_edge_mean", "standard_edge_count"]})
+        expected = fresh_op.opEdgeFeaturesCache.Output[0].value
+
+        pd.testing.assert_frame_equal(features, expected, check_dtype=False, rtol=1e-5)
+
+    def test_reused_superpixel_id(self, graph, superpixels):
+        voxel_data = superpixels.astype(np.float32)
+        superpixels = superpixels.copy()
+
+        multilane_op = OpEdgeTraining(graph=graph)
+        multilane_op.VoxelData.resize(1)
+        op_view = multilane_op.getLane(0)
+
+        op_view.VoxelData.setValue(voxel_data, extra_meta={"channel_names": ["Grayscale"]})
+        op_view.Superpixels.setValue(superpixels)
+        op_view.WatershedSelectedInput.setValue(voxel_data)
+        op_view.TrainRandomForest.setValue(True)
+        multilane_op.FeatureNames.setValue({"Grayscale": ["standard_edge_mean", "standard_edge_count"]})
+
+        rag = op_view.Rag.value
+        changed_sps = set(np.unique(superpixels[:12, :12, :12]).tolist())
+        edges = [tuple(edge) for edge in rag.edge_ids if not set(edge) & changed_sps]
+        reused_edge = edges[0]
+        other_edge = next(edge for edge in edges if reused_edge[0] not in edge)
+        op_view.EdgeLabelsDict.setValue({reused_edge: 1, other_edge: 2})
+
+        # The new superpixel in the corner gets the id of a superpixel elsewhere
+        superpixels[:10, :10, :10] = reused_edge[0]
+        op_view.Superpixels.setDirty((0, 0, 0, 0), (10, 10, 10, 1))
+        op_view.Rag.value
+
+        assert op_view.EdgeLabelsDict.value == {other_edge: 2}
@@ -0,0 +1,135 @@
+from types import SimpleNamespace
+
+import nifty
+import numpy as np
+import pytest
+
+from ilastik.applets.multicut import opMulticut
+from ilastik.applets.multicut.opMulticut import (
+    DEFAULT_SOLVER_NAME,
+    OpMulticutAgglomerator,
+    attractive_components,
+    solve,
+    warm_start_kernighan_lin,
+)
+
+
+@pytest.fixture
+def problem():
+    rng = np.random.default_rng(42)
+    node_count = 3000
+    edge_ids = np.sort(rng.integers(1, node_count, size=(9000, 2)), axis=1)
+    edge_ids = np.unique(edge_ids[edge_ids[:, 0] != edge_ids[:, 1]], axis=0)
+    edge_weights = rng.normal(-0.5, 1.0, size=len(edge_ids))
+    return edge_ids, edge_weights, node_count
+
+
+def energy(edge_ids, edge_weights, node_labels):
+    cut = node_labels[edge_ids[:, 0]] != node_labels[edge_ids[:, 1]]
+    return edge_weights[cut].sum()
+
+
+def test_attractive_components():
+    edge_ids = np.array([[0, 1], [1, 2], [2, 3], [3, 4]])
+    edge_weights = np.array([1.0, -1.0, 2.0, 0.5])
+    components = attractive_components(edge_ids, edge_weights, 6)
+    assert components[0] == components[1]
+    assert components[2] == components[3] == components[4]
+    assert len(set(components[[0, 2, 5]])) == 3
+
+
+def test_decomposition_separates_components(problem, monkeypatch):
+    edge_ids, edge_weights, node_count = problem
+    monkeypatch.setattr(opMulticut, "MIN_SUBPROBLEM_EDGES", 100)
+    labels = solve(edge_ids, edge_weights, node_count, DEFAULT_SOLVER_NAME, decompose=True)
+    assert labels.shape == (node_count,)
+
+    components = attractive_components(edge_ids, edge_weights, node_count)
+    # No segment spans two components
+    for segment in np.unique(labels):
+        assert len(np.unique(components[labels == segment])) == 1
+
+
+def same_partition(labels_a, labels_b):
+    pairs = np.unique(np.stack([labels_a, labels_b], axis=1), axis=0)
+    return len(pairs) == len(np.unique(labels_a)) == len(np.unique(labels_b))
+
+
+def chain_components(sizes):
+    """Edges of chains of nodes with the given numbers of edges, all attractive"""
+    edges = []
+    first = 1
+    for size in sizes:
+        nodes = np.arange(first, first + size + 1)
+        edges.append(np.stack([nodes[:-1], nodes[1:]], axis=1))
+        first += size + 1
+    return np.concatenate(edges), first
+
+
+@pytest.mark.parametrize(
+    "sizes",
+    [
+        [3 * opMulticut.MIN_SUBPROBLEM_EDGES],  # one giant component
+        [5, 20, 3, 2 * opMulticut.MIN_SUBPROBLEM_EDGES],  # the last component is the largest
+    ],
+)
+def test_decomposition_of_large_components(sizes):
+    edge_ids, node_count = chain_components(sizes)
+    # An extra node with repulsive edges to the first and the last component
+    edge_ids = np.concatenate([edge_ids, [[1, node_count], [node_count - 1, node_count]]])
+    node_count += 1
+    edge_weights = np.ones(len(edge_ids))
+    edge_weights[-2:] = -1.0
+
+    labels = solve(edge_ids, edge_weights, node_count, DEFAULT_SOLVER_NAME, decompose=True)
+    expected = solve(edge_ids, edge_weights, node_count, DEFAULT_SOLVER_NAME, decompose=False)
+    assert labels.shape == (node_count,)
+    assert same_partition(labels, expected)
+
+
+def test_warm_start_is_not_worse_than_cold(problem):
+    edge_ids, edge_weights, node_count = problem
+    graph = nifty.graph.UndirectedGraph(node_count)
+    graph.insertEdges(edge_ids)
+    cold = solve(edge_ids, edge_weights, node_count, DEFAULT_SOLVER_NAME)
+
+    # Starting from a bad labeling (everything separate) must not lead to a worse solution
+    warm = warm_start_kernighan_lin(graph, edge_weights, np.arange(node_count))
+    assert energy(edge_ids, edge_weights, warm) <= energy(edge_ids, edge_weights, cold) + 1e-9
+
+    # Starting from the solution itself keeps it
+    warm = warm_start_kernighan_lin(graph, edge_weights, cold)
+    assert energy(edge_ids, edge_weights, warm) <= energy(edge_ids, edge_weights, cold) + 1e-9
+
+
+def test_agglomerator_reuses_solutions(graph, problem, monkeypatch):
+    edge_ids, _, node_count = problem
+    rag = SimpleNamespace(edge_ids=edge_ids, num_edges=len(edge_ids), max_sp=node_count - 1)
+    probabilities = np.random.default_rng(0).random(len(edge_ids))
+
+    calls = []
+    solve_orig = opMulticut.solve
+
+    def counting_solve(*args, **kwargs):
+        calls.append(kwargs.get("initial_labels"))
+        return solve_orig(*args, **kwargs)
+
+    monkeypatch.setattr(opMulticut, "solve", counting_solve)
+
+    op = OpMulticutAgglomerator(graph=graph)
+    op.Rag.setValue(rag)
+    op.EdgeProbabilities.setValue(probabilities)
+    op.SolverName.setValue(DEFAULT_SOLVER_NAME)
+    op.ProbabilityThreshold.setValue(0.5)
+
+    op.Beta.setValue(0.5)
+    labels_05 = op.NodeLabels.value
+    assert len(calls) == 1 and calls[0] is None
+
+    op.Beta.setValue(0.6)
+    op.NodeLabels.value
+    assert len(calls) == 2 and calls[1] is not None  # warm-started
+
+    op.Beta.setValue(0.5)
+    np.testing.assert_array_equal(op.NodeLabels.value, labels_05)
+    assert len(calls) == 2  # cached
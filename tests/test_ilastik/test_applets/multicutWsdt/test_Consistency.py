@@ -107,3 +107,19 @@ def test_consistency(input_data, get_result_function, get_result_operator):
     assert (
         np.sum(np.not_equal(ws, wsdt_result[..., 0])) == 0
     ), "Inconsistent results between function and operator wrapper of function!"
+
+
+def test_out_of_core_consistency(input_data, get_result_function):
+    ws, max_id = get_result_function
+
+    input_data = vigra.VigraArray(input_data, axistags=vigra.defaultAxistags(AXIS_TAGS))
+
+    graph = Graph()
+    with Pipeline(graph=graph) as get_wsdt:
+        get_wsdt.add(OpArrayPiper, Input=input_data)
+        get_wsdt.add(OpCachedWsdt, FreezeCache=False, OutOfCore=True)
+        wsdt_result = get_wsdt[-1].outputs["Superpixels"][:].wait()
+        wsdt_part = get_wsdt[-1].outputs["Superpixels"][5:20, 10:40].wait()
+
+    assert (ws == wsdt_result[..., 0]).all(), "Out-of-core result differs from the in-memory result"
+    assert (ws[5:20, 10:40] == wsdt_part[..., 0]).all()
@@ -4,7 +4,7 @@ import pytest
 from elf.parallel.common import get_blocking
 from lazyflow.roi import roiToSlice
 
-from ilastik.applets.wsdt.opWsdt import parallel_watershed
+from ilastik.applets.wsdt.opWsdt import OutOfCoreLabels, out_of_core_watershed, parallel_watershed
 
 
 @pytest.fixture
@@ -49,3 +49,60 @@ def test_parallel_watershed_consistency(data):
         block_data = ws[inner_slicing]
         assert block_data.min() == running_max
         running_max = block_data.max() + 1
+
+
+def test_out_of_core_watershed_matches_parallel_watershed(data, tmp_path):
+    params = dict(
+        threshold=0.5,
+        sigma_seeds=0.7,
+        sigma_weights=0.7,
+        minsize=1,
+        alpha=0.9,
+        pixel_pitch=None,
+        non_max_suppression=False,
+        block_shape=(32, 32, 32),
+        halo=[10, 10, 10],
+    )
+    ws, max_label = parallel_watershed(data=data, max_workers=None, **params)
+
+    read_block = lambda begin, end: data[roiToSlice(begin, end)]
+    labels = out_of_core_watershed(read_block, data.shape, directory=str(tmp_path), **params)
+
+    assert labels.max_id == max_label
+    numpy.testing.assert_array_equal(labels.read((0, 0, 0), data.shape), ws)
+    numpy.testing.assert_array_equal(labels.read((20, 30, 0), (40, 64, 10)), ws[20:40, 30:64, 0:10])
+    labels.remove()
+    assert not tmp_path.exists()
+
+
+def test_out_of_core_labels_are_removed_after_reads(data, tmp_path):
+    read_block = lambda begin, end: data[roiToSlice(begin, end)]
+    params = dict(
+        threshold=0.5,
+        sigma_seeds=0.7,
+        sigma_weights=0.7,
+        minsize=1,
+        alpha=0.9,
+        pixel_pitch=None,
+        non_max_suppression=False,
+        block_shape=(32, 32, 32),
+    )
+    labels = out_of_core_watershed(read_block, data.shape, directory=str(tmp_path), **params)
+    expected = labels.read((0, 0, 0), data.shape)
+
+    class RemoveWhileReading:
+        def __init__(self, array):
+            self.array = array
+            self.shape = array.shape
+
+        def __getitem__(self, key):
+            labels.remove()
+            assert tmp_path.exists()  # postponed until the read is finished
+            return self.array[key]
+
+    labels.labels = RemoveWhileReading(labels.labels)
+    numpy.testing.assert_array_equal(labels.read((0, 0, 0), data.shape), expected)
+    assert not tmp_path.exists()
+
+    with pytest.raises(OutOfCoreLabels.Removed):
+        labels.read((0, 0, 0), data.shape)
@@ -94,6 +94,21 @@ class TestOpRelabelSegmentation(unittest.TestCase):
         assert np.all(img[1, 10:20, 10:20, 10:20, 0] == 60)
         assert np.all(img[1, 20:25, 20:25, 20:25, 0] == 70)
 
+    def test_changed_map_and_missing_objects(self):
+        self.op.Image.setValue(segImage())
+        self.op.ObjectMap.setValue({0: np.array([0, 20, 30]), 1: np.array([0, 50])})
+        self.op.Features._setReady()  # hack because we do not use features
+        self.op.RELABEL_CHUNK_SIZE = 1000
+        img = self.op.Output.value
+        assert np.all(img[1, 10:20, 10:20, 10:20, 0] == 0)
+        assert np.all(img[1, 20:25, 20:25, 20:25, 0] == 0)
+
+        # cached lookup tables are dropped when the map becomes dirty
+        self.op.ObjectMap.setValue({0: np.array([0, 21, 31]), 1: np.array([0, 51, 61, 71])})
+        img = self.op.Output.value
+        assert np.all(img[0, 0:10, 0:10, 0:10, 0] == 21)
+        assert np.all(img[1, 20:25, 20:25, 20:25, 0] == 71)
+
 
 class TestOpMultiRelabelSegmentation(unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,98 @@
+import itertools
+
+import numpy
+import pytest
+
+from ilastik.applets.objectExtraction.blockwiseRegionFeatures import (
+    MERGEABLE_FEATURES,
+    RegionStatistics,
+    supports_blockwise,
+)
+
+
+@pytest.fixture
+def volume():
+    rng = numpy.random.default_rng(42)
+    labels = numpy.zeros((30, 20, 10), dtype=numpy.uint32)
+    labels[2:25, 3:9, 1:8] = 1  # spans many blocks
+    labels[12:14, 12:19, 4:5] = 2
+    labels[27, 18, 9] = 3  # single pixel
+    labels[0:8, 10:20, 0:10] = 4
+    image = rng.normal(100, 20, size=labels.shape + (2,))
+    return labels, image
+
+
+def expected_features(labels, image):
+    """Features of each object, computed from all of its pixels at once"""
+    features = {name: [] for name in MERGEABLE_FEATURES}
+    for i in range(1, labels.max() + 1):
+        coords = numpy.argwhere(labels == i).astype(float)
+        values = image[labels == i].astype(numpy.float32).astype(float)
+        n = len(values)
+        mean = values.mean(axis=0)
+        m2, m3, m4 = (((values - mean) ** k).sum(axis=0) for k in (2, 3, 4))
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            features["Count"].append([n])
+            features["Sum"].append(values.sum(axis=0))
+            features["Mean"].append(mean)
+            features["Variance"].append(m2 / n)
+            features["Skewness"].append(numpy.sqrt(n) * m3 / m2**1.5)
+            features["Kurtosis"].append(n * m4 / m2**2 - 3)
+            features["Minimum"].append(values.min(axis=0))
+            features["Maximum"].append(values.max(axis=0))
+            features["Covariance"].append(numpy.cov(values, rowvar=False, bias=True).ravel())
+            features["Coord<Minimum>"].append(coords.min(axis=0))
+            features["Coord<Maximum>"].append(coords.max(axis=0) + 1)
+            features["RegionCenter"].append(coords.mean(axis=0))
+            scatter = numpy.cov(coords, rowvar=False, bias=True)
+            features["RegionRadii"].append(numpy.sqrt(numpy.maximum(numpy.linalg.eigvalsh(scatter), 0))[::-1])
+    return {name: numpy.array(values) for name, values in features.items()}
+
+
+@pytest.mark.parametrize("block_shape", [(30, 20, 10), (7, 6, 5), (4, 20, 3)])
+def test_blockwise_statistics_equal_whole_volume(volume, block_shape):
+    labels, image = volume
+    statistics = RegionStatistics(MERGEABLE_FEATURES, ndim=3, num_channels=2)
+    blocks = [range(0, s, b) for s, b in zip(labels.shape, block_shape)]
+    for start in itertools.product(*blocks):
+        block = tuple(slice(s, s + b) for s, b in zip(start, block_shape))
+        statistics.update(labels[block], image[block], start)
+
+    features = statistics.features()
+    expected = expected_features(labels, image)
+    assert set(features) == MERGEABLE_FEATURES
+    for name, values in expected.items():
+        assert features[name].shape == (4, values.shape[1]), name
+        numpy.testing.assert_allclose(features[name], values, rtol=1e-9, atol=1e-9, err_msg=name)
+
+
+def test_2d_coordinates():
+    labels = numpy.zeros((6, 4, 1), dtype=numpy.uint8)
+    labels[1:3, 2:4] = 2
+    statistics = RegionStatistics(["Count", "RegionCenter", "Coord<Maximum>"], ndim=2, num_channels=1)
+    statistics.update(labels[:3], numpy.zeros((3, 4, 1, 1)))
+    statistics.update(labels[3:], numpy.zeros((3, 4, 1, 1)), (3, 0, 0))
+
+    features = statistics.features()
+    numpy.testing.assert_array_equal(features["Count"], [[0], [4]])
+    numpy.testing.assert_array_equal(features["RegionCenter"][1], [1.5, 2.5])
+    numpy.testing.assert_array_equal(features["Coord<Maximum>"][1], [3, 4])
+
+
+def test_growing_object_ids():
+    # Each block adds a new largest object id
+    labels = numpy.arange(1, 11, dtype=numpy.uint32).reshape(10, 1, 1)
+    statistics = RegionStatistics(["Count", "Coord<Minimum>"], ndim=2, num_channels=1)
+    for x in range(10):
+        statistics.update(labels[x : x + 1], numpy.zeros((1, 1, 1, 1)), (x, 0, 0))
+
+    features = statistics.features()
+    numpy.testing.assert_array_equal(features["Count"], numpy.ones((10, 1)))
+    numpy.testing.assert_array_equal(features["Coord<Minimum>"][:, 0], numpy.arange(10))
+
+
+def test_supports_blockwise():
+    assert supports_blockwise({"Standard Object Features": {"Mean": {}, "Count": {}}})
+    assert not supports_blockwise({"Standard Object Features": {"Histogram": {}}})
+    assert not supports_blockwise({"Standard Object Features": {"Mean in neighborhood": {"margin": 5}}})
+    assert not supports_blockwise({"Standard Object Features": {"Mean": {}}, "Convex Hull Features": {"Area": {}}})
@@ -0,0 +1,63 @@
+import copy
+import pickle
+
+import numpy
+import pytest
+
+from ilastik.applets.objectExtraction.featureTable import FeatureTable, RegionFeatures, feature_table
+
+
+@pytest.fixture
+def features():
+    rng = numpy.random.default_rng(0)
+    return {
+        "Standard Object Features": {
+            "Mean": rng.random((5, 2)),
+            "Count": rng.random((5, 1)).astype(numpy.float32),
+            "RegionRadii": rng.random((5, 3)),
+        },
+        "Convex Hull Features": {"HullVolume": rng.random((5, 1))},
+        "Default features": {"Count": rng.random((5, 1)), "original_oid": numpy.arange(5).reshape(5, 1)},
+    }
+
+
+def test_select_adjacent_features_returns_view(features):
+    table = FeatureTable(features)
+    matrix, column_names = table.select({"Standard Object Features": ["Mean", "RegionRadii"]})
+
+    assert (
+        column_names == [("Standard Object Features", "Mean")] * 2 + [("Standard Object Features", "RegionRadii")] * 3
+    )
+    numpy.testing.assert_array_equal(
+        matrix, numpy.hstack([features["Standard Object Features"][k] for k in ("Mean", "RegionRadii")]).astype("f4")
+    )
+    assert numpy.shares_memory(matrix, table.data)
+    assert not matrix.flags.writeable
+
+
+def test_select_is_ordered_and_cached(features):
+    table = FeatureTable(features)
+    selected = {"Standard Object Features": {"RegionRadii": {}, "Count": {}}, "Convex Hull Features": ["HullVolume"]}
+    matrix, column_names = table.select(selected)
+
+    assert [name for _, name in column_names] == ["HullVolume", "Count", "RegionRadii", "RegionRadii", "RegionRadii"]
+    numpy.testing.assert_array_equal(matrix[:, 1], features["Standard Object Features"]["Count"][:, 0])
+    assert table.select(selected)[0] is matrix
+    assert table.select({"Plugin": ["Feature"]})[0].shape == (5, 0)
+
+
+def test_region_features_share_their_table(features):
+    region_features = RegionFeatures(features)
+    assert feature_table(region_features) is feature_table(region_features)
+    assert feature_table(features) is not feature_table(features)
+
+    for duplicate in (copy.deepcopy(region_features), pickle.loads(pickle.dumps(region_features))):
+        assert isinstance(duplicate, RegionFeatures)
+        assert duplicate.keys() == region_features.keys()
+        numpy.testing.assert_array_equal(duplicate.table.data, region_features.table.data)
+
+
+def test_rows_must_match(features):
+    features["Convex Hull Features"]["HullVolume"] = numpy.zeros((4, 1))
+    with pytest.raises(ValueError):
+        FeatureTable(features)
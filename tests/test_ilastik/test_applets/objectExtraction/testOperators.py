@@ -28,7 +28,10 @@ import numpy as np
 import vigra
 from lazyflow.graph import Graph
 from lazyflow.operators import OpLabelVolume
+from lazyflow.request import processPool
 from ilastik.applets.objectExtraction.opObjectExtraction import OpAdaptTimeListRoi, OpRegionFeatures, OpObjectExtraction
+from ilastik.applets.objectExtraction.opObjectExtraction import _Axes, max_margin
+from ilastik.plugins import ObjectFeaturesPlugin
 from ilastik.plugins.manager import pluginManager
 
 import warnings
@@ -211,3 +214,90 @@ class TestOpRegionFeaturesAgainstNumpy(unittest.TestCase):
                 # that means bounding box centers can differ with a maximum of 0.5
                 bbox_center = mins[iobj] + ((maxs[iobj] - mins[iobj]) / 2.0)
                 np.testing.assert_allclose(centers[iobj], bbox_center, atol=0.5)
+
+
+class TestOpRegionFeaturesInProcessPool(TestOpRegionFeaturesAgainstNumpy):
+    """Same results if the plugins compute their features in worker processes."""
+
+    def setUp(self):
+        processPool.reset_process_pool(2)
+        super().setUp()
+
+    def tearDown(self):
+        processPool.reset_process_pool(0)
+
+
+class TestOpRegionFeaturesBlockwise(unittest.TestCase):
+    """Time slices processed blockwise have the same features as time slices processed in memory."""
+
+    def setUp(self):
+        g = Graph()
+        self.features = {
+            NAME: {
+                "Count": {},
+                "RegionCenter": {},
+                "RegionRadii": {},
+                "Mean": {},
+                "Sum": {},
+                "Variance": {},
+                "Skewness": {},
+                "Kurtosis": {},
+                "Minimum": {},
+                "Maximum": {},
+            }
+        }
+        rawimage = vigra.taggedView(
+            np.random.default_rng(0).normal(100, 10, size=(2, 50, 50, 50, 1)).astype(np.float32), "txyzc"
+        )
+        self.labelop = OpLabelVolume(graph=g)
+        self.labelop.Input.setValue(binaryImage())
+        self.op = OpRegionFeatures(graph=g)
+        self.op.LabelVolume.connect(self.labelop.Output)
+        self.op.RawVolume.setValue(rawimage)
+        self.op.Features.setValue(self.features)
+
+    def test(self):
+        opAdapt = OpAdaptTimeListRoi(graph=self.op.graph)
+        opAdapt.Input.connect(self.op.Output)
+        in_memory = opAdapt.Output([0, 1]).wait()
+
+        self.op.BLOCKWISE_MIN_BYTES = 0
+        self.op.BLOCKWISE_BLOCK_SHAPE = {"x": 16, "y": 12, "z": 7}
+        self.op.Output.setDirty()
+        blockwise = opAdapt.Output([0, 1]).wait()
+
+        for t in range(2):
+            assert set(blockwise[t]) == set(in_memory[t])
+            for plugin_name, features in in_memory[t].items():
+                assert set(blockwise[t][plugin_name]) == set(features)
+                for name, values in features.items():
+                    assert blockwise[t][plugin_name][name].shape == values.shape, name
+                    np.testing.assert_allclose(blockwise[t][plugin_name][name], values, rtol=1e-4, err_msg=name)
+
+
+class TestLocalFeatureBatches(unittest.TestCase):
+    """Local features computed in batches equal the features computed for each object."""
+
+    def test_batch_equals_single_objects(self):
+        plugin = pluginManager.getPluginByName(NAME, "ObjectFeatures").plugin_object
+        feature_dict = {
+            "Mean in neighborhood": {"margin": (5, 5, 2)},
+            "Variance in neighborhood": {"margin": (5, 5, 2)},
+            "Maximum in neighborhood": {"margin": (5, 5, 2)},
+        }
+        raw = rawImage()[0] + np.random.default_rng(0).random((50, 50, 50, 1), dtype=np.float32)
+        labels = vigra.analysis.labelVolumeWithBackground(binaryImage()[0, ..., 0].astype(np.uint8))
+        axes = _Axes("xyzc")
+
+        bounds = plugin.compute_global(raw, labels, {"Coord<Minimum>": {}, "Coord<Maximum>": {}}, axes)
+        mins, maxs = bounds["Coord<Minimum>"].astype(int), bounds["Coord<Maximum>"].astype(int)
+        margin = max_margin({NAME: feature_dict})
+        objects = [(i + 1, OpRegionFeatures.compute_extent(i, raw, mins, maxs, axes, margin)) for i in range(len(mins))]
+
+        batch = plugin.compute_local_batch(raw, labels, objects, feature_dict, axes)
+        single = ObjectFeaturesPlugin.compute_local_batch(plugin, raw, labels, objects, feature_dict, axes)
+        assert len(batch) == len(single) == 3
+        for batch_features, single_features in zip(batch, single):
+            assert set(batch_features) == set(single_features)
+            for name, values in single_features.items():
+                np.testing.assert_allclose(batch_features[name], values, rtol=1e-5, err_msg=name)
@@ -30,9 +30,9 @@ logger.setLevel(logging.DEBUG)
 pytest_plugins = ["pytester"]
 
 try:
-    from lazyflow.distributed.TaskOrchestrator import TaskOrchestrator
+    from lazyflow.distributed.TaskOrchestrator import MPI
 
-    MPI_DEPENDENCIES_MET = bool(shutil.which("mpiexec"))
+    MPI_DEPENDENCIES_MET = MPI is not None and bool(shutil.which("mpiexec"))
 except ImportError:
     MPI_DEPENDENCIES_MET = False
 
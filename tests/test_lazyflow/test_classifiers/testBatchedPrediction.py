@@ -0,0 +1,109 @@
+import threading
+
+import numpy
+import pytest
+
+from lazyflow.classifiers.batchedPrediction import BatchedForestPredictor
+from lazyflow.request import Request, RequestPool
+from lazyflow.request.request import RequestError
+
+
+class FakeForest(object):
+    """Predicts fixed per-class weights of the first feature, counts calls."""
+
+    def __init__(self, tree_count, class_weights):
+        self._tree_count = tree_count
+        self._class_weights = numpy.asarray(class_weights, dtype=numpy.float32)
+        self.calls = 0
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def treeCount(self):
+        return self._tree_count
+
+    def labelCount(self):
+        return len(self._class_weights)
+
+    def predictProbabilities(self, features, out):
+        with self._lock:
+            self.calls += 1
+            self.rows += len(features)
+        out[:] = features[:, :1] * self._class_weights
+        return out
+
+
+def expected(forests, X):
+    total = sum(f.treeCount() for f in forests)
+    return sum(f.treeCount() * (X[:, :1] * f._class_weights) for f in forests) / total
+
+
+@pytest.fixture
+def forests():
+    return [FakeForest(3, [0.1, 0.9]), FakeForest(1, [0.5, 0.5])]
+
+
+def test_single_call(forests):
+    predictor = BatchedForestPredictor(forests)
+    X = numpy.random.random((10, 3))
+    probabilities = predictor.predict_probabilities(X)
+    assert probabilities.dtype == numpy.float32
+    assert probabilities.shape == (10, 2)
+    numpy.testing.assert_allclose(probabilities, expected(forests, X), rtol=1e-6)
+
+
+def test_concurrent_calls_are_batched(forests):
+    predictor = BatchedForestPredictor(forests)
+    blocks = [numpy.random.random((100 + i, 4)).astype(numpy.float32) for i in range(64)]
+    results = [None] * len(blocks)
+
+    def predict(i):
+        results[i] = predictor.predict_probabilities(blocks[i])
+
+    pool = RequestPool()
+    for i in range(len(blocks)):
+        pool.add(Request(lambda i=i: predict(i)))
+    pool.wait()
+
+    for X, probabilities in zip(blocks, results):
+        numpy.testing.assert_allclose(probabilities, expected(forests, X), rtol=1e-6)
+
+    for forest in forests:
+        assert forest.rows == sum(len(X) for X in blocks)
+        if Request.global_thread_pool.num_workers > 1:
+            assert forest.calls < len(blocks)
+
+
+def test_batch_size_is_capped(forests):
+    # Room for two rows per batch
+    predictor = BatchedForestPredictor(forests, max_batch_bytes=2 * 4 * 4)
+    blocks = [numpy.random.random((1, 4)) for _ in range(16)]
+    pool = RequestPool()
+    for X in blocks:
+        pool.add(Request(lambda X=X: predictor.predict_probabilities(X)))
+    pool.wait()
+    assert forests[0].calls >= len(blocks) // 2
+
+
+def test_oversized_buffers_are_not_kept(forests):
+    predictor = BatchedForestPredictor(forests, max_batch_bytes=1024)
+    small = numpy.random.random((8, 4))
+    numpy.testing.assert_allclose(predictor.predict_probabilities(small), expected(forests, small), rtol=1e-6)
+    kept = predictor._forest_buffer
+    assert kept is not None
+
+    big = numpy.random.random((1000, 4))
+    numpy.testing.assert_allclose(predictor.predict_probabilities(big), expected(forests, big), rtol=1e-6)
+    assert predictor._forest_buffer is kept
+
+
+def test_errors_are_propagated():
+    class BrokenForest(FakeForest):
+        def predictProbabilities(self, features, out):
+            raise ValueError("broken")
+
+    predictor = BatchedForestPredictor([BrokenForest(1, [1.0])])
+    with pytest.raises(RequestError):
+        predictor.predict_probabilities(numpy.zeros((2, 1)))
+    # The predictor is usable (and fails) again
+    with pytest.raises(RequestError):
+        predictor.predict_probabilities(numpy.zeros((2, 1)))
@@ -56,6 +56,30 @@ class TestParallelVigraRfLazyflowClassifier(object):
         assert (0 <= probabilities).all() and (probabilities <= 1.0).all()
         assert (numpy.argmax(probabilities, axis=-1) + 1 == self.expected_classes).all()
 
+    def test_update_and_train(self):
+        factory = ParallelVigraRfLazyflowClassifierFactory(8, num_forests=4)
+        classifier = factory.create_and_train(self.training_feature_matrix, self.training_labels)
+
+        # One of the four forests is retrained, the others are kept.
+        updated = factory.update_and_train(classifier, self.training_feature_matrix, self.training_labels)
+        assert updated._forests[0] is not classifier._forests[0]
+        assert updated._forests[1:] == classifier._forests[1:]
+
+        # The next update retrains the next forest.
+        updated_again = factory.update_and_train(updated, self.training_feature_matrix, self.training_labels)
+        assert updated_again._forests[0] is updated._forests[0]
+        assert updated_again._forests[1] is not updated._forests[1]
+
+        probabilities = updated_again.predict_probabilities(self.prediction_data)
+        assert (numpy.argmax(probabilities, axis=-1) + 1 == self.expected_classes).all()
+
+        # A new label class requires retraining everything.
+        labels = self.training_labels.copy()
+        labels[:5] = 3
+        retrained = factory.update_and_train(updated_again, self.training_feature_matrix, labels)
+        assert not set(retrained._forests) & set(updated_again._forests)
+        assert list(retrained.known_classes) == [1, 2, 3]
+
     def test_pickle_fields(self):
         """
         Classifier factories are meant to be pickled and restored, but that only
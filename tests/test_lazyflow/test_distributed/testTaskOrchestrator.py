@@ -0,0 +1,171 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+import pickle
+import threading
+import time
+
+import pytest
+
+from lazyflow.distributed.TaskOrchestrator import ANY_SOURCE, TaskOrchestrator
+
+
+class FakeComm:
+    """In-process stand-in for an MPI communicator: one instance per rank, sharing mailboxes."""
+
+    def __init__(self, rank, size, mailboxes=None, condition=None):
+        self.rank = rank
+        self.size = size
+        self._mailboxes = mailboxes if mailboxes is not None else {r: [] for r in range(size)}
+        self._condition = condition or threading.Condition()
+
+    def for_rank(self, rank):
+        return FakeComm(rank, self.size, self._mailboxes, self._condition)
+
+    def Get_rank(self):
+        return self.rank
+
+    def send(self, obj, dest, tag):
+        with self._condition:
+            self._mailboxes[dest].append((self.rank, tag, pickle.dumps(obj)))
+            self._condition.notify_all()
+
+    def _find(self, source, tag):
+        for index, (msg_source, msg_tag, _) in enumerate(self._mailboxes[self.rank]):
+            if msg_tag == tag and source in (ANY_SOURCE, msg_source):
+                return index
+        return None
+
+    def iprobe(self, source, tag):
+        with self._condition:
+            return self._find(source, tag) is not None
+
+    def recv(self, source, tag):
+        with self._condition:
+            while (index := self._find(source, tag)) is None:
+                self._condition.wait()
+            return pickle.loads(self._mailboxes[self.rank].pop(index)[2])
+
+
+def run(target, work_units, num_workers=3, **kwargs):
+    comm = FakeComm(0, num_workers + 1)
+    threads = [
+        threading.Thread(target=TaskOrchestrator(comm.for_rank(rank)).start_as_worker, args=(target,), daemon=True)
+        for rank in range(1, num_workers + 1)
+    ]
+    for t in threads:
+        t.start()
+    report = TaskOrchestrator(comm, **kwargs).orchestrate(work_units)
+    return report, threads
+
+
+def test_results_are_gathered():
+    report, threads = run(lambda unit, rank: unit * 2, iter(range(20)), units_in_flight=3)
+    for t in threads:
+        t.join(timeout=5)
+        assert not t.is_alive()
+
+    assert report.succeeded
+    assert report.results == {i: i * 2 for i in range(20)}
+    assert sum(stats.completed for stats in report.rank_stats.values()) == 20
+    assert all(stats.throughput > 0 for stats in report.rank_stats.values() if stats.completed)
+
+
+def test_no_work():
+    report, _ = run(lambda unit, rank: unit, iter([]))
+    assert report.results == {}
+
+
+def test_failed_units_are_retried_and_reported():
+    attempts = []
+    lock = threading.Lock()
+
+    def target(unit, rank):
+        with lock:
+            attempts.append(unit)
+            first_attempt = attempts.count(unit) == 1
+        if unit == 3 and first_attempt:
+            raise ValueError("flaky")
+        if unit == 5:
+            raise ValueError("broken")
+        return unit
+
+    report, _ = run(target, range(8), max_retries=1)
+
+    assert not report.succeeded
+    assert report.results == {i: i for i in range(8) if i != 5}
+    assert list(report.errors) == [5]
+    assert report.errors[5].exc_type == "ValueError"
+    assert "broken" in report.errors[5].traceback
+    assert attempts.count(5) == 2
+
+
+def test_units_of_dead_worker_are_redispatched():
+    release = threading.Event()
+
+    def target(unit, rank):
+        if rank == 1:
+            release.wait()
+        return rank
+
+    try:
+        report, _ = run(target, range(10), task_timeout=0.5, straggler_factor=None)
+    finally:
+        release.set()
+
+    assert sorted(report.results) == list(range(10))
+    assert 1 not in report.results.values()
+    assert report.rank_stats[1].completed == 0
+
+
+def test_stragglers_are_speculatively_redispatched():
+    release = threading.Event()
+    stuck = []
+
+    def target(unit, rank):
+        if unit == 0 and not stuck:
+            stuck.append(rank)
+            release.wait()
+        else:
+            time.sleep(0.01)
+        return rank
+
+    # The straggler finishes after the speculative copy
+    timer = threading.Timer(2 * TaskOrchestrator.MIN_STRAGGLER_TIME, release.set)
+    timer.start()
+    try:
+        report, threads = run(target, range(10), units_in_flight=1, straggler_factor=3.0)
+    finally:
+        timer.cancel()
+        release.set()
+
+    assert sorted(report.results) == list(range(10))
+    assert report.results[0] != stuck[0]
+    # The orchestrator waited for the result of the straggler before stopping it
+    assert report.rank_stats[stuck[0]].duplicates == 1
+    for t in threads:
+        t.join(timeout=5)
+        assert not t.is_alive()
+
+
+def test_requires_workers():
+    with pytest.raises(ValueError):
+        TaskOrchestrator(FakeComm(0, 1))
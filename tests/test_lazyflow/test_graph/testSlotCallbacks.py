@@ -269,3 +269,36 @@ class TestSlot_notifyMetaChanged(object):
         assert upval[0] == True
 
         upval[0] = False
+
+
+class TestSlot_deferUntilRequested(object):
+    def setup_method(self, method):
+        self.g = Graph()
+
+    def test_deferred_load(self):
+        ops = OpS(graph=self.g)
+        opa = OpA(graph=self.g)
+        opa.Input1.connect(ops.Output1)
+
+        loads = []
+        ops.Output1.deferUntilRequested(lambda: loads.append(1))
+        assert loads == []
+
+        # Requests through downstream slots end up in the upstream slot
+        opa.Input1[:].wait()
+        assert loads == [1]
+
+        # Only called once
+        ops.Output1[:].wait()
+        assert loads == [1]
+
+    def test_load_deferred_without_request(self):
+        ops = OpS(graph=self.g)
+
+        loads = []
+        ops.Output1.deferUntilRequested(lambda: loads.append(1))
+        ops.Output1.loadDeferred()
+        assert loads == [1]
+
+        ops.Output1[:].wait()
+        assert loads == [1]
@@ -0,0 +1,175 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+import numpy
+import pytest
+import vigra
+
+from lazyflow.graph import Graph
+from lazyflow.operators.cacheEvictionPolicies import (
+    BlockStats,
+    CacheCounters,
+    CacheEntry,
+    CostAwareEvictionPolicy,
+    LFUEvictionPolicy,
+    LRUEvictionPolicy,
+    createEvictionPolicy,
+)
+from lazyflow.operators.opBlockedArrayCache import OpBlockedArrayCache
+from lazyflow.utility import Memory
+from lazyflow.utility.testing import OpArrayPiperWithAccessCount
+
+
+def make_entry(name, **stats):
+    return CacheEntry(key=name, info=name, stats=BlockStats(name, **stats), free=lambda: 0)
+
+
+def eviction_order(policy, entries):
+    return [entry.key for entry in policy.evictionOrder(entries)]
+
+
+def test_lru_policy():
+    entries = [
+        make_entry("a", last_access_time=3),
+        make_entry("b", last_access_time=1),
+        make_entry("c", last_access_time=2),
+    ]
+    assert eviction_order(LRUEvictionPolicy(), entries) == ["b", "c", "a"]
+
+
+def test_lfu_policy():
+    entries = [
+        make_entry("a", last_access_time=1, access_count=5),
+        make_entry("b", last_access_time=2, access_count=1),
+        make_entry("c", last_access_time=3, access_count=1),
+    ]
+    assert eviction_order(LFUEvictionPolicy(), entries) == ["b", "c", "a"]
+
+
+def test_cost_aware_policy_evicts_cheap_bytes_first():
+    entries = [
+        make_entry("unknown", last_access_time=1),
+        make_entry("features", last_access_time=1, compute_time=10.0, size=1000),
+        make_entry("raw", last_access_time=3, compute_time=0.01, size=1000),
+    ]
+    assert eviction_order(CostAwareEvictionPolicy(), entries) == ["raw", "unknown", "features"]
+
+
+def test_cost_aware_policy_unknown_cost_is_average():
+    # Entries without compute time are neither always kept nor always evicted first
+    entries = [
+        make_entry("unknown", last_access_time=1, size=1000),
+        make_entry("cheap", last_access_time=1, compute_time=0.001, size=1000),
+        make_entry("expensive", last_access_time=1, compute_time=1.0, size=1000),
+    ]
+    assert eviction_order(CostAwareEvictionPolicy(), entries) == ["cheap", "unknown", "expensive"]
+
+
+def test_cost_aware_policy_ages_untouched_entries():
+    policy = CostAwareEvictionPolicy()
+    expensive = make_entry("expensive", last_access_time=0, compute_time=0.01, size=100)
+
+    # Every round, a freshly computed cheap block competes with the expensive block,
+    # which is never accessed again. Only the first entry of each round is evicted.
+    evicted = []
+    for i in range(10):
+        cheap = make_entry(f"cheap{i}", last_access_time=i + 1, compute_time=0.003, size=100)
+        evicted.append(next(policy.evictionOrder([expensive, cheap])).key)
+        if evicted[-1] == "expensive":
+            break
+
+    assert evicted[0] == "cheap0"
+    assert evicted[-1] == "expensive"
+
+
+def test_create_eviction_policy():
+    assert isinstance(createEvictionPolicy("lru"), LRUEvictionPolicy)
+    assert isinstance(createEvictionPolicy("cost"), CostAwareEvictionPolicy)
+    with pytest.raises(ValueError):
+        createEvictionPolicy("random")
+
+
+def test_cache_counters():
+    counters = CacheCounters()
+    counters.countMiss()
+    counters.countHit()
+    counters.countHit()
+    counters.countEviction(10)
+
+    assert counters.hitRate == pytest.approx(2 / 3)
+    assert counters.evictionRate == 1.0
+
+    total = counters + CacheCounters(hits=1)
+    assert (total.hits, total.misses, total.evictions, total.evicted_bytes) == (3, 1, 1, 10)
+
+
+@pytest.fixture
+def blocked_cache():
+    data = numpy.random.randint(0, 255, size=(100, 100)).astype(numpy.uint8)
+    data = vigra.taggedView(data, "xy")
+
+    graph = Graph()
+    op_provider = OpArrayPiperWithAccessCount(graph=graph)
+    op_provider.Input.setValue(data)
+
+    op_cache = OpBlockedArrayCache(graph=graph)
+    op_cache.Input.connect(op_provider.Output)
+    op_cache.BlockShape.setValue((50, 50))
+    return op_cache
+
+
+def test_blocked_cache_reports_block_stats(blocked_cache):
+    blocked_cache.Output[:50, :50].wait()
+    blocked_cache.Output[:50, :50].wait()
+    blocked_cache.Output[50:, :50].wait()
+
+    stats = {s.block_id: s for s in blocked_cache.getBlockStats()}
+    assert len(stats) == 2
+
+    first_block = stats[((0, 0), (50, 50))]
+    assert first_block.access_count == 2
+    assert first_block.size == 50 * 50
+    assert first_block.compute_time is not None
+
+    counters = blocked_cache.getCounters()
+    assert counters.hits == 1
+    assert counters.misses == 2
+
+
+@pytest.mark.parametrize("policy", ["lru", "lfu", "cost"])
+def test_memory_manager_evicts_with_policy(cacheMemoryManager, blocked_cache, policy):
+    cacheMemoryManager.disable()
+    cacheMemoryManager.addCache(blocked_cache)
+    cacheMemoryManager.setEvictionPolicy(policy)
+
+    blocked_cache.Output[:].wait()
+    assert len(blocked_cache.getBlockStats()) == 4
+
+    Memory.setAvailableRamCaches(0)
+    try:
+        cacheMemoryManager._cleanup()
+    finally:
+        Memory.setAvailableRamCaches(-1)
+
+    assert len(blocked_cache.getBlockStats()) == 0
+    counters = cacheMemoryManager.getCounters()
+    assert counters.evictions >= 4
+    assert counters.evicted_bytes >= 100 * 100
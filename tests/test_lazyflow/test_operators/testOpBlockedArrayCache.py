@@ -26,6 +26,7 @@ from builtins import object
 
 import weakref
 import gc
+import time
 import unittest
 
 import numpy
@@ -37,6 +38,7 @@ from lazyflow.roi import sliceToRoi, roiToSlice
 from lazyflow.operators.opBlockedArrayCache import OpBlockedArrayCache
 from lazyflow.operators.opCache import MemInfoNode
 
+from lazyflow.utility import prefetcher
 from lazyflow.utility.testing import OpArrayPiperWithAccessCount
 from functools import reduce
 
@@ -461,6 +463,29 @@ class TestOpBlockedArrayCache:
         opCache.Output(req_key).wait()
         assert opProvider.accessCount == 1
 
+    def testPrefetch(self):
+        opCache = self.opCache
+        opProvider = self.opProvider
+
+        # Raster walk over the first blocks: (20, 20, 20, 20, 20) blocks of the (1,100,100,10,1) input
+        prefetcher.setPrefetchDepth(2)
+        try:
+            for y in range(4):
+                opCache.Output(make_key[:, 0:20, y * 20 : (y + 1) * 20, :, :]).wait()
+
+            # The next two blocks (the rest of the row and the start of the next one) are read ahead
+            deadline = time.time() + 10
+            while opProvider.accessCount < 6 and time.time() < deadline:
+                time.sleep(0.01)
+            assert opProvider.accessCount == 6
+
+            prefetcher.setPrefetchDepth(0)
+            data = opCache.Output(make_key[:, 0:40, 80:100, :, :]).wait()
+            assert (data == self.data[:, 0:40, 80:100, :, :]).all()
+            assert opProvider.accessCount == 7
+        finally:
+            prefetcher.setPrefetchDepth(0)
+
     def testBypassMode(self):
         opCache = self.opCache
         opProvider = self.opProvider
@@ -693,6 +693,76 @@ class TestOpCompressedCache(object):
             sampleData.nbytes / expected_factor
         ), "Compression of all-zeroes should be better than factor {}".format(expected_factor)
 
+    def testUniformBlocks(self):
+        graph = Graph()
+        sampleData = numpy.zeros((100, 100), dtype=numpy.uint32)
+        sampleData[50:] = 7
+        sampleData = vigra.taggedView(sampleData, axistags="xy")
+
+        opData = OpArrayPiper(graph=graph)
+        opData.Input.setValue(sampleData)
+
+        op = OpCompressedCache(parent=None, graph=graph)
+        op.BlockShape.setValue((50, 50))
+        op.Input.connect(opData.Output)
+
+        assert_array_equal(op.Output[...].wait(), sampleData.view(numpy.ndarray))
+        assert_array_equal(op.Output[40:60, 10:20].wait(), sampleData[40:60, 10:20].view(numpy.ndarray))
+        # Uniform blocks are stored as a single value each
+        assert op.usedMemory() == 4 * sampleData.itemsize
+
+    def testDuplicateBlocks(self):
+        graph = Graph()
+        tile = numpy.random.randint(0, 256, size=(25, 25, 25)).astype(numpy.uint8)
+        sampleData = numpy.tile(tile, (2, 2, 2))
+        sampleData = vigra.taggedView(sampleData, axistags="xyz")
+
+        opData = OpArrayPiper(graph=graph)
+        opData.Input.setValue(sampleData)
+
+        op = OpCompressedCache(parent=None, graph=graph)
+        op.BlockShape.setValue((25, 25, 25))
+        op.Input.connect(opData.Output)
+
+        op.Output[:25, :25, :25].wait()
+        single_block_memory = op.usedMemory()
+        assert single_block_memory > 0
+
+        # All 8 blocks share the data of the first one
+        assert_array_equal(op.Output[...].wait(), sampleData.view(numpy.ndarray))
+        assert op.usedMemory() == pytest.approx(single_block_memory)
+
+        # Writing into one of them doesn't change the others
+        op.Input[:10, :10, :10] = numpy.zeros((10, 10, 10), dtype=numpy.uint8)
+        expected = sampleData.view(numpy.ndarray).copy()
+        expected[:10, :10, :10] = 0
+        assert_array_equal(op.Output[...].wait(), expected)
+        assert op.usedMemory() > single_block_memory
+
+        # Freeing a block doesn't free the data of the others
+        keys = [x[0] for x in op.getBlockAccessTimes()]
+        for key in keys[:-1]:
+            op.freeBlock(key)
+        assert_array_equal(op.Output[25:, 25:, 25:].wait(), tile)
+
+    def testHDF5_uniform(self):
+        sampleData = numpy.full((50, 60), 3, dtype=numpy.float32)
+        sampleData = vigra.taggedView(sampleData, axistags="xy")
+
+        graph = Graph()
+        opData = OpArrayPiper(graph=graph)
+        opData.Input.setValue(sampleData)
+
+        op = OpCompressedCache(parent=None, graph=graph)
+        op.BlockShape.setValue([50, 60])
+        op.Input.connect(opData.Output)
+
+        with h5py.File("uniform.h5", "w", driver="core", backing_store=False) as h5_file:
+            op.OutputHdf5[...].writeInto(h5_file).wait()
+            dataset = h5_file[str([[0, 0], [50, 60]])]
+            assert dataset.dtype == numpy.float32
+            assert_array_equal(dataset[()], sampleData.view(numpy.ndarray))
+
     def testChangeBlockshape_masked(self):
         logger.info("Generating sample data...")
         sampleData = numpy.indices((100, 200, 150), dtype=numpy.float32).sum(0)
@@ -26,15 +26,17 @@ import numpy
 import vigra
 from lazyflow.graph import Graph
 from lazyflow.operators.opArrayPiper import OpArrayPiper
-from lazyflow.operators import OpCompressedUserLabelArray
+from lazyflow.operators import OpCompressedUserLabelArray, OpSparseUserLabelArray
 
 from lazyflow.utility.slicingtools import slicing2shape
 
 
 class TestOpCompressedUserLabelArray(object):
+    OpLabelArray = OpCompressedUserLabelArray
+
     def setup_method(self):
         graph = Graph()
-        op = OpCompressedUserLabelArray(graph=graph)
+        op = self.OpLabelArray(graph=graph)
         arrayshape = (1, 100, 100, 10, 1)
         op.inputs["shape"].setValue(arrayshape)
         blockshape = (1, 10, 10, 10, 1)  # Why doesn't this work if blockshape is an ndarray?
@@ -304,6 +306,50 @@ class TestOpCompressedUserLabelArray(object):
         assert ((summed_projection != 0) == (projected_data != 0)).all()
 
 
+class TestOpSparseUserLabelArray(TestOpCompressedUserLabelArray):
+    OpLabelArray = OpSparseUserLabelArray
+
+    def testMergeAndClearLabels(self):
+        op = self.op
+        expected_data = self.data.copy()
+
+        op.mergeLabels(2, 1)
+        expected_data[expected_data == 2] = 1
+        assert (op.Output[:].wait() == expected_data).all()
+
+        op.clearLabel(1)
+        assert not op.Output[:].wait().any()
+        assert op.nonzeroBlocks.value == []
+
+    def testSameAsCompressed(self):
+        """
+        Random strokes (with eraser) produce the same output, nonzero blocks and projected pixels in both backends.
+        """
+        rng = numpy.random.default_rng(0)
+        compressed = OpCompressedUserLabelArray(graph=self.op.graph)
+        sparse = OpSparseUserLabelArray(graph=self.op.graph)
+        for op in (compressed, sparse):
+            op.Input.setValue(self.op.Input.value)
+            op.blockShape.setValue((1, 10, 10, 10, 1))
+            op.eraser.setValue(100)
+
+        for _ in range(20):
+            start = rng.integers(0, (1, 90, 90, 8, 1))
+            stop = start + rng.integers(1, (2, 25, 25, 3, 2))
+            stop = numpy.minimum(stop, (1, 100, 100, 10, 1))
+            pixels = rng.choice(numpy.array([0, 0, 1, 2, 3, 100], dtype=numpy.uint8), size=tuple(stop - start))
+            for op in (compressed, sparse):
+                op.Input[tuple(slice(a, b) for a, b in zip(start, stop))] = pixels
+
+        assert (compressed.Output[:].wait() == sparse.Output[:].wait()).all()
+        assert (compressed.Output[:, 15:47, 3:61, 2:5, :].wait() == sparse.Output[:, 15:47, 3:61, 2:5, :].wait()).all()
+        assert sorted(map(str, compressed.nonzeroBlocks.value)) == sorted(map(str, sparse.nonzeroBlocks.value))
+
+        projection = sparse.Projection2D[:, 0:100, 0:100, 4:5, :].wait()
+        expected_projection = compressed.Projection2D[:, 0:100, 0:100, 4:5, :].wait()
+        assert ((projection != 0) == (expected_projection != 0)).all()
+
+
 class TestOpCompressedUserLabelArray_masked(object):
     def setup_method(self):
         graph = Graph()
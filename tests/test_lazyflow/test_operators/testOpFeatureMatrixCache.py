@@ -3,7 +3,7 @@ import numpy
 import vigra
 
 from lazyflow.graph import Graph
-from lazyflow.operators.opFeatureMatrixCache import OpFeatureMatrixCache
+from lazyflow.operators.opFeatureMatrixCache import FeatureMatrixBuffer, OpFeatureMatrixCache
 from lazyflow.operators.opBlockedArrayCache import OpBlockedArrayCache
 
 
@@ -51,3 +51,61 @@ class TestOpFeatureMatrixCache(object):
         # Just check that all features are present, regardless of order.
         for feature_vec in [[10.5, 10.5], [10.5, 11.5], [20.5, 20.5], [20.5, 21.5]]:
             assert feature_vec in labels_and_features[:, 1:]
+
+
+class TestFeatureMatrixBuffer(object):
+    def rows(self, label, count):
+        return numpy.full((count, 3), label, dtype=numpy.float32)
+
+    def testAppendOverwriteRemove(self):
+        buf = FeatureMatrixBuffer()
+        assert buf.matrix(3).shape == (0, 3)
+
+        buf.set((0, 0), self.rows(1, 2))
+        buf.set((0, 10), self.rows(2, 3))
+        buf.set((0, 20), self.rows(3, 1))
+        assert len(buf) == 3
+        assert list(buf.matrix(3)[:, 0]) == [1, 1, 2, 2, 2, 3]
+
+        # Same number of rows: overwritten in place
+        buf.set((0, 10), self.rows(4, 3))
+        assert list(buf.matrix(3)[:, 0]) == [1, 1, 4, 4, 4, 3]
+
+        # Different number of rows: moved to the end
+        buf.set((0, 0), self.rows(5, 1))
+        assert list(buf.matrix(3)[:, 0]) == [4, 4, 4, 3, 5]
+
+        # Empty matrix removes the block
+        buf.set((0, 10), self.rows(6, 0))
+        assert (0, 10) not in buf
+        assert list(buf.matrix(3)[:, 0]) == [3, 5]
+
+        buf.remove((0, 20))
+        buf.remove((0, 0))
+        assert len(buf) == 0
+        assert buf.matrix(3).shape == (0, 3)
+
+    def testExportedMatricesAreNotModified(self):
+        buf = FeatureMatrixBuffer()
+        buf.set((0,), self.rows(1, 2))
+        buf.set((1,), self.rows(2, 2))
+        exported = buf.matrix(3)
+        assert not exported.flags.writeable
+
+        buf.set((0,), self.rows(3, 2))
+        buf.remove((1,))
+        buf.set((2,), self.rows(4, 5000))
+        assert list(exported[:, 0]) == [1, 1, 2, 2]
+        assert list(buf.matrix(3)[:2, 0]) == [3, 3]
+        assert buf.matrix(3).shape == (5002, 3)
+
+    def testExportedMatricesAreNotModifiedWhenTailIsReplaced(self):
+        buf = FeatureMatrixBuffer()
+        buf.set((0,), self.rows(1, 5))
+        buf.set((1,), self.rows(2, 3))
+        exported = buf.matrix(3)
+
+        # The last block is replaced by one with more rows, which is appended where the old one was
+        buf.set((1,), self.rows(9, 4))
+        assert list(exported[:, 0]) == [1] * 5 + [2] * 3
+        assert list(buf.matrix(3)[:, 0]) == [1] * 5 + [9] * 4
@@ -2,7 +2,8 @@ import numpy
 import vigra
 
 from lazyflow.graph import Graph
-from lazyflow.operators import OpPixelFeaturesPresmoothed
+from lazyflow.operators import OpPixelFeaturesPresmoothed, opPixelFeaturesPresmoothed
+from lazyflow.utility.featureBlockStore import FeatureBlockStore
 
 DEBUG = False
 
@@ -75,3 +76,36 @@ class TestOpPixelFeaturesPresmoothed(object):
 
         assert computed_whole.shape == computed_per_slice.shape
         assert numpy.allclose(computed_whole, computed_per_slice), abs(computed_whole - computed_per_slice).max()
+
+    def test_feature_store(self, tmp_path, monkeypatch):
+        store = FeatureBlockStore(str(tmp_path / "features"))
+        monkeypatch.setattr(opPixelFeaturesPresmoothed, "getDefaultFeatureStore", lambda: store)
+
+        def make_op():
+            op = OpPixelFeaturesPresmoothed(graph=Graph())
+            op.Scales.setValue([0.7, 1.6])
+            op.FeatureIds.setValue(["GaussianSmoothing", "HessianOfGaussianEigenvalues"])
+            op.SelectionMatrix.setValue(numpy.array([[True, True], [False, True]]))
+            op.ComputeIn2d.setValue([False, False])
+            op.Input.setValue(self.data)
+            return op
+
+        expected = make_op().Output[:].wait()
+        assert store.totalBytes > 0
+
+        # A new operator (e.g. after reopening the project) must not compute anything
+        op = make_op()
+        smoothing_calls = []
+        original_smoothing = op._computeGaussianSmoothing
+        monkeypatch.setattr(
+            op,
+            "_computeGaussianSmoothing",
+            lambda *args, **kwargs: smoothing_calls.append(args) or original_smoothing(*args, **kwargs),
+        )
+        numpy.testing.assert_array_equal(op.Output[:].wait(), expected)
+        assert smoothing_calls == []
+
+        # Changed input data must not be served from the store
+        op.Input.setValue(self.data + 1)
+        numpy.testing.assert_allclose(op.Output[:, :1].wait(), expected[:, :1] + 1, rtol=1e-5)
+        assert len(smoothing_calls) > 0
@@ -168,3 +168,49 @@ class TestOpUnblockedArrayCacheCache(object):
         cache_data = opCache.Output(*inner_roi).wait()
         assert (cache_data == data[roiToSlice(*inner_roi)]).all()
         assert opDataProvider.accessCount == 0
+
+    def testSpill(self):
+        graph = Graph()
+        opDataProvider = OpArrayPiperWithAccessCount(graph=graph)
+        opCache = OpUnblockedArrayCache(graph=graph)
+        opCache.SpillEnabled.setValue(True)
+
+        data = np.zeros((100, 100, 100), dtype=np.float32)
+        data[40:60] = np.random.random((20, 100, 100))
+        opDataProvider.Input.setValue(vigra.taggedView(data, "zyx"))
+        opCache.Input.connect(opDataProvider.Output)
+
+        roi = ((30, 30, 30), (50, 50, 50))
+        opCache.Output(*roi).wait()
+        assert opDataProvider.accessCount == 1
+        uncompressed_size = opCache.usedMemory()
+
+        # First eviction only compresses the block in memory
+        ((block_id, _),) = opCache.getBlockAccessTimes()
+        assert opCache.freeBlock(block_id) > 0
+        assert 0 < opCache.usedMemory() < uncompressed_size
+        assert opCache.CleanBlocks.value == [roiToSlice(*roi)]
+
+        cache_data = opCache.Output(*roi).wait()
+        assert (cache_data == data[roiToSlice(*roi)]).all()
+        assert opDataProvider.accessCount == 1
+        assert opCache.usedMemory() == uncompressed_size
+
+        # Second eviction moves it to disk, inner rois are restored from there
+        opCache.freeBlock(block_id)
+        opCache.freeBlock(block_id)
+        assert opCache.usedMemory() == 0
+        assert opCache.CleanBlocks.value == [roiToSlice(*roi)]
+
+        inner_roi = ((35, 35, 35), (45, 45, 45))
+        cache_data = opCache.Output(*inner_roi).wait()
+        assert (cache_data == data[roiToSlice(*inner_roi)]).all()
+        assert opDataProvider.accessCount == 1
+
+        # Dirtiness discards spilled blocks
+        opCache.freeBlock(block_id)
+        opCache.freeBlock(block_id)
+        opDataProvider.Input.setDirty((30, 30, 30), (31, 31, 31))
+        assert opCache.CleanBlocks.value == []
+        opCache.Output(*roi).wait()
+        assert opDataProvider.accessCount == 2
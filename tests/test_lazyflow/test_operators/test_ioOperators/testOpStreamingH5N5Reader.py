@@ -21,12 +21,16 @@
 ###############################################################################
 from typing import List
 
+import h5py
 import numpy
 import pytest
 import vigra
 import z5py
 
 from lazyflow.operators.ioOperators import OpStreamingH5N5Reader
+from lazyflow.request import processPool
+from lazyflow.utility.io_util import chunkCache
+from lazyflow.utility.io_util.parallelHdf5Reader import chunk_aligned_parts
 
 
 @pytest.fixture(params=["test.h5", "test.n5"])
@@ -70,3 +74,64 @@ def test_reader_loads_data_with_axistags(graph, h5n5_file, data):
     assert op.OutputImage.meta.shape == data.shape
     assert op.OutputImage.meta.axistags == axistags
     numpy.testing.assert_array_equal(op.OutputImage.value, data)
+
+
+@pytest.fixture
+def chunk_cache():
+    cache = chunkCache.ChunkCache()
+    chunkCache.setDefaultChunkCache(cache)
+    yield cache
+    chunkCache.setDefaultChunkCache(chunkCache.ChunkCache())
+
+
+def test_reader_reads_chunks_of_readonly_files_through_chunk_cache(graph, tmp_path, chunk_cache):
+    data = numpy.random.randint(0, 255, (50, 60), dtype=numpy.uint8)
+    with h5py.File(tmp_path / "chunked.h5", "w") as f:
+        f.create_dataset("data", data=data, chunks=(16, 16), compression="gzip")
+
+    with h5py.File(tmp_path / "chunked.h5", "r") as f:
+        op = OpStreamingH5N5Reader(graph=graph)
+        op.H5N5File.setValue(f)
+        op.InternalPath.setValue("data")
+
+        numpy.testing.assert_array_equal(op.OutputImage[5:20, 10:40].wait(), data[5:20, 10:40])
+        assert chunk_cache.getCounters().misses == 6
+        numpy.testing.assert_array_equal(op.OutputImage[10:40, 0:20].wait(), data[10:40, 0:20])
+        assert chunk_cache.getCounters().misses == 8
+        assert chunk_cache.getCounters().hits == 4
+
+
+@pytest.fixture
+def process_pool():
+    processPool.reset_process_pool(2)
+    yield processPool.get_process_pool()
+    processPool.reset_process_pool(0)
+
+
+def test_reader_reads_compressed_data_in_processes(graph, tmp_path, process_pool):
+    data = numpy.random.randint(0, 255, (50, 60, 70), dtype=numpy.uint8)
+    with h5py.File(tmp_path / "compressed.h5", "w") as f:
+        f.create_dataset("data", data=data, chunks=(16, 16, 16), compression="gzip")
+
+    with h5py.File(tmp_path / "compressed.h5", "r") as f:
+        op = OpStreamingH5N5Reader(graph=graph)
+        op.H5N5File.setValue(f)
+        op.InternalPath.setValue("data")
+
+        assert op._parallelReads
+        numpy.testing.assert_array_equal(op.OutputImage.value, data)
+        numpy.testing.assert_array_equal(op.OutputImage[5:40, 3:50, 10:11].wait(), data[5:40, 3:50, 10:11])
+
+
+@pytest.mark.parametrize("max_parts", [1, 2, 3, 100])
+def test_chunk_aligned_parts(max_parts):
+    start, stop, chunks = numpy.array([5, 3, 10]), numpy.array([40, 50, 11]), numpy.array([16, 16, 16])
+    parts = chunk_aligned_parts(start, stop, chunks, max_parts)
+
+    assert 1 <= len(parts) <= max_parts
+    covered = numpy.zeros(stop - start, dtype=int)
+    for part_start, part_stop in parts:
+        inner_bounds = [b for b in numpy.concatenate([part_start, part_stop]) if b not in start and b not in stop]
+        assert all(b % 16 == 0 for b in inner_bounds)
+        covered[tuple(slice(a, b) for a, b in zip(part_start - start, part_stop - start))] += 1
+    assert (covered == 1).all()
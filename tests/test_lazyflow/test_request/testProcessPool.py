@@ -0,0 +1,101 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2024, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+import math
+import os
+import pickle
+import threading
+import time
+
+import numpy
+import pytest
+
+from lazyflow.request import Request
+from lazyflow.request import processPool
+from lazyflow.request.processPool import SharedArray, run_kernel
+
+# Kernels must be importable in the worker processes, so these tests use functions from the standard library.
+
+
+class ProcessSafeOp:
+    processSafe = True
+
+
+class UnsafeOp:
+    processSafe = False
+
+
+@pytest.fixture
+def process_pool():
+    processPool.reset_process_pool(2)
+    yield processPool.get_process_pool()
+    processPool.reset_process_pool(0)
+
+
+def test_shared_array_is_pickled_by_reference():
+    shared = SharedArray.copy_of(numpy.arange(10))
+    attached = pickle.loads(pickle.dumps(shared))
+    attached.array[0] = 42
+    assert shared.array[0] == 42
+    attached.release()
+    shared.release()
+
+
+def test_kernels_run_in_place_without_pool():
+    shared = SharedArray.copy_of(numpy.arange(10))
+    assert run_kernel(ProcessSafeOp(), numpy.sum, shared) == 45
+    assert run_kernel(ProcessSafeOp(), os.getpid) == os.getpid()
+    assert processPool.share(ProcessSafeOp(), shared.array) is shared.array
+
+
+def test_kernels_run_in_pool(process_pool):
+    assert run_kernel(ProcessSafeOp(), os.getpid) != os.getpid()
+    assert run_kernel(UnsafeOp(), os.getpid) == os.getpid()
+
+    data = numpy.random.random(100000)
+    assert run_kernel(ProcessSafeOp(), numpy.sum, data) == pytest.approx(data.sum())
+    assert Request(lambda: run_kernel(ProcessSafeOp(), numpy.sum, data)).wait() == pytest.approx(data.sum())
+
+
+def test_kernels_write_into_shared_arrays(process_pool):
+    data = numpy.random.random(1000)
+    out = SharedArray.empty(data.shape, data.dtype)
+    run_kernel(ProcessSafeOp(), numpy.copyto, out, data)
+    numpy.testing.assert_array_equal(out.array, data)
+    out.release()
+
+
+def test_kernel_errors_are_raised(process_pool):
+    with pytest.raises(ValueError):
+        run_kernel(ProcessSafeOp(), math.factorial, -1)
+    assert run_kernel(ProcessSafeOp(), math.factorial, 3) == 6
+
+
+def test_waiting_request_can_be_cancelled(process_pool):
+    cancelled = threading.Event()
+    req = Request(lambda: run_kernel(ProcessSafeOp(), time.sleep, 10))
+    req.notify_cancelled(cancelled.set)
+    start = time.perf_counter()
+    req.submit()
+    time.sleep(0.5)
+    req.cancel()
+    assert cancelled.wait(timeout=5)
+    assert time.perf_counter() - start < 5
@@ -5,7 +5,7 @@ import itertools
 
 import pytest
 
-from lazyflow.request.threadPool import ThreadPool
+from lazyflow.request.threadPool import ThreadPool, WorkStealingThreadPool
 
 
 NUM_WORKERS = 4
@@ -26,9 +26,9 @@ class Task:
         self.fn()
 
 
-@pytest.fixture
-def pool():
-    return ThreadPool(NUM_WORKERS)
+@pytest.fixture(params=[ThreadPool, WorkStealingThreadPool])
+def pool(request):
+    return request.param(NUM_WORKERS)
 
 
 def test_thread_pool_starts_workers(pool: ThreadPool):
@@ -119,3 +119,40 @@ def test_exception_in_task_logged(caplog, pool):
     record = caplog.records[0]
 
     assert issubclass(record.exc_info[0], MyExc)
+
+
+def test_work_stealing_idle_workers_steal_unstarted_tasks():
+    pool = WorkStealingThreadPool(NUM_WORKERS)
+    release = threading.Event()
+    all_started = threading.Barrier(NUM_WORKERS + 1)
+    workers = set()
+
+    def child():
+        workers.add(threading.current_thread())
+        all_started.wait(timeout=1)
+        release.wait(timeout=1)
+
+    def parent():
+        # All children are queued on the parent's worker; the other workers have to steal them.
+        for _ in range(NUM_WORKERS - 1):
+            pool.wake_up(Task(child))
+        child()
+
+    pool.wake_up(Task(parent))
+    all_started.wait(timeout=1)
+    release.set()
+    pool.stop()
+
+    assert workers == pool.workers
+
+
+def test_work_stealing_workers_return_to_waiting():
+    pool = WorkStealingThreadPool(NUM_WORKERS)
+    stop = threading.Event()
+
+    pool.wake_up(Task(stop.set))
+    assert stop.wait(timeout=1)
+    time.sleep(0.1)
+
+    assert pool.get_states() == ["waiting"] * NUM_WORKERS
+    pool.stop()
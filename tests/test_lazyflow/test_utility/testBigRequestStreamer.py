@@ -158,3 +158,97 @@ def test_pool_results_discarded():
     # Now check that ALL results are truly lost.
     for ref in result_refs:
         assert ref() is None, "Some data was not discarded."
+
+
+def test_adaptive_streaming_covers_roi():
+    op = OpArrayPiper(graph=Graph())
+    inputData = numpy.indices((100, 100)).sum(0)
+    op.Input.setValue(inputData)
+
+    # A budget that is always exceeded forces the streamer to shrink the blocks while streaming.
+    batch = BigRequestStreamer(op.Output, [(0, 0), (100, 100)], (50, 50), batchSize=2, adaptive=True, memoryBudget=1)
+
+    results = numpy.zeros((100, 100), dtype=numpy.int32)
+    hits = numpy.zeros((100, 100), dtype=numpy.int32)
+
+    def handleResult(roi, result):
+        results[roiToSlice(*roi)] = result
+        hits[roiToSlice(*roi)] += 1
+
+    batch.resultSignal.subscribe(handleResult)
+    batch.execute()
+
+    assert (results == inputData).all()
+    assert (hits == 1).all()
+
+
+class TestAdaptiveStreamingController:
+    class FakeMeasurements:
+        def __init__(self):
+            self.memory = 1000
+            self.time = 0.0
+
+    def make_controller(self, measurements, **kwargs):
+        from lazyflow.utility.adaptiveStreaming import AdaptiveStreamingController
+
+        kwargs.setdefault("initial_in_flight", 4)
+        kwargs.setdefault("max_in_flight", 8)
+        return AdaptiveStreamingController(
+            (64, 64, 3),
+            memory_budget=10000,
+            unsplittable_axes=[2],
+            memory_probe=lambda: measurements.memory,
+            clock=lambda: measurements.time,
+            **kwargs,
+        )
+
+    def test_over_budget_reduces_in_flight_then_blockshape(self):
+        measurements = self.FakeMeasurements()
+        controller = self.make_controller(measurements)
+        limits = []
+        controller.inFlightLimitChanged = limits.append
+
+        blocks = controller.subdivide(iter([((0, 0, 0), (256, 256, 3))]))
+        measurements.memory = 20000
+        for _ in range(3):
+            controller.blockFinished(next(blocks))
+
+        assert limits == [2, 1]
+        assert controller.in_flight_limit == 1
+        # Shrinking never touches the channel axis
+        assert controller.blockshape == (32, 64, 3)
+
+        # Blocks that were not handed out yet use the new blockshape
+        remaining = list(blocks)
+        assert all(tuple(numpy.subtract(stop, start)) == (32, 64, 3) for start, stop in remaining)
+        assert (
+            sum(numpy.prod(numpy.subtract(stop, start)) for start, stop in remaining) == (256 * 256 - 3 * 64 * 64) * 3
+        )
+
+    def test_headroom_increases_in_flight(self):
+        measurements = self.FakeMeasurements()
+        controller = self.make_controller(measurements, initial_in_flight=1, ram_usage_per_pixel=0.01)
+
+        blocks = controller.subdivide(iter([((0, 0, 0), (640, 640, 3))]))
+        for _ in range(20):
+            measurements.time += 1.0
+            controller.blockFinished(next(blocks))
+
+        assert controller.in_flight_limit > 1
+        assert controller.blockshape == (64, 64, 3)
+
+    def test_lower_throughput_reverts_increase(self):
+        measurements = self.FakeMeasurements()
+        controller = self.make_controller(measurements, initial_in_flight=1, ram_usage_per_pixel=0.01)
+
+        blocks = controller.subdivide(iter([((0, 0, 0), (640, 640, 3))]))
+        for _ in range(2):
+            measurements.time += 1.0
+            controller.blockFinished(next(blocks))
+        assert controller.in_flight_limit == 2
+
+        # More parallel blocks, but each one is much slower: throughput drops
+        for _ in range(2):
+            measurements.time += 10.0
+            controller.blockFinished(next(blocks))
+        assert controller.in_flight_limit == 1
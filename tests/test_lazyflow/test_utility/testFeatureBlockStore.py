@@ -0,0 +1,79 @@
+import os
+import time
+
+import numpy
+import pytest
+
+from lazyflow.utility.featureBlockStore import FeatureBlockStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FeatureBlockStore(str(tmp_path / "store"))
+
+
+def test_put_get(store):
+    data = numpy.random.random((3, 4, 5)).astype(numpy.float32)
+    key = store.makeKey(store.digest(data), "GaussianSmoothing", 1.0)
+
+    assert store.get(key) is None
+    store.put(key, data)
+    assert key in store
+    numpy.testing.assert_array_equal(store.get(key), data)
+
+    out = numpy.zeros_like(data)
+    store.get(key, out=out)
+    numpy.testing.assert_array_equal(out, data)
+
+
+def test_digest_depends_on_content_shape_and_dtype():
+    data = numpy.arange(12, dtype=numpy.float32)
+    digest = FeatureBlockStore.digest(data)
+
+    assert FeatureBlockStore.digest(data.copy()) == digest
+    assert FeatureBlockStore.digest(data + 1) != digest
+    assert FeatureBlockStore.digest(data.reshape(3, 4)) != digest
+    assert FeatureBlockStore.digest(data.astype(numpy.float64)) != digest
+
+
+def test_store_persists(tmp_path, store):
+    data = numpy.ones((10, 10), dtype=numpy.uint8)
+    store.put("abc", data)
+
+    reopened = FeatureBlockStore(store.path)
+    assert "abc" in reopened
+    assert reopened.totalBytes == store.totalBytes
+    numpy.testing.assert_array_equal(reopened.get("abc"), data)
+
+
+def test_size_bound_evicts_least_recently_used(tmp_path):
+    data = numpy.random.random((100, 100))
+    store = FeatureBlockStore(str(tmp_path / "store"))
+    store.put("probe", data)
+    entry_size = store.totalBytes
+    store.clear()
+
+    store.max_bytes = int(2.5 * entry_size)
+    store.put("a", data)
+    store.put("b", data)
+    store.get("a")
+    store.put("c", data)
+
+    assert store.totalBytes <= store.max_bytes
+    assert "b" not in store
+    assert "a" in store and "c" in store
+
+
+def test_only_stale_temporary_directories_are_removed(tmp_path, store):
+    # Another process sharing the store may still be writing to a young temporary directory
+    fresh = os.path.join(store.path, ".tmp-fresh")
+    stale = os.path.join(store.path, ".tmp-stale")
+    os.makedirs(fresh)
+    os.makedirs(stale)
+    old = time.time() - 2 * FeatureBlockStore.STALE_TMP_SECONDS
+    os.utime(stale, (old, old))
+
+    reopened = FeatureBlockStore(store.path)
+    assert os.path.isdir(fresh)
+    assert not os.path.exists(stale)
+    assert ".tmp-fresh" not in reopened
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from lazyflow.utility.prefetcher import Prefetcher
+
+
+class RecordingFetch:
+    def __init__(self):
+        self.fetched = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, start, stop):
+        self.release.wait()
+        self.fetched.append((tuple(map(int, start)), tuple(map(int, stop))))
+
+    def wait_for(self, count, timeout=10):
+        deadline = time.time() + timeout
+        while len(self.fetched) < count and time.time() < deadline:
+            time.sleep(0.01)
+        return sorted(self.fetched)
+
+
+def block(y, x, size=10):
+    return (y * size, x * size), ((y + 1) * size, (x + 1) * size)
+
+
+@pytest.fixture
+def fetch():
+    fetch = RecordingFetch()
+    yield fetch
+    fetch.release.set()
+
+
+def test_raster_order_reads_ahead_across_rows(fetch):
+    prefetcher = Prefetcher((40, 40), fetch, block_shape=(10, 10), depth=2)
+    for x in range(4):
+        prefetcher.observe(*block(0, x))
+
+    assert fetch.wait_for(2) == sorted([block(1, 0), block(1, 1)])
+
+
+def test_out_of_order_accesses_and_learned_grid(fetch):
+    prefetcher = Prefetcher((40, 40), fetch, depth=1)
+    for x in [0, 2, 1, 3]:
+        prefetcher.observe(*block(0, x))
+
+    assert fetch.wait_for(1) == [block(1, 0)]
+
+
+def test_strided_access(fetch):
+    prefetcher = Prefetcher((40, 40), fetch, block_shape=(10, 10), depth=2)
+    for y in range(3):
+        prefetcher.observe(*block(y, 0))
+        prefetcher.observe(*block(y, 2))
+
+    # Read ahead after the first four accesses, then again after the fifth and sixth
+    assert fetch.wait_for(4) == sorted([block(2, 0), block(2, 2), block(3, 0), block(3, 2)])
+
+
+def test_no_pattern_no_read_ahead(fetch):
+    prefetcher = Prefetcher((40, 40), fetch, block_shape=(10, 10), depth=2)
+    for y, x in [(0, 0), (3, 3), (1, 2), (0, 1)]:
+        prefetcher.observe(*block(y, x))
+
+    assert not prefetcher._pending
+    assert fetch.wait_for(1, timeout=0.2) == []
+
+
+def test_changed_pattern_cancels_read_ahead(fetch):
+    fetch.release.clear()
+    prefetcher = Prefetcher((100, 100), fetch, block_shape=(10, 10), depth=2)
+    for x in range(4):
+        prefetcher.observe(*block(0, x))
+    read_aheads = list(prefetcher._pending.values())
+    assert len(read_aheads) == 2
+
+    prefetcher.observe(*block(9, 9))
+    assert all(task.cancelled for task in read_aheads)
+    assert not prefetcher._pending
+
+
+def test_depth_zero_disables_read_ahead(fetch):
+    prefetcher = Prefetcher((40, 40), fetch, block_shape=(10, 10), depth=0)
+    for x in range(4):
+        prefetcher.observe(*block(0, x))
+
+    assert not prefetcher._pending
@@ -0,0 +1,92 @@
+import threading
+
+import numpy
+import pytest
+
+from lazyflow.request import Request
+from lazyflow.roi import roiToSlice
+from lazyflow.utility.io_util.chunkCache import ChunkCache
+
+
+class CountingSource:
+    def __init__(self, data, delay=None):
+        self.data = data
+        self.reads = []
+        self._lock = threading.Lock()
+        self._delay = delay
+
+    def __call__(self, chunk_start, chunk_stop):
+        with self._lock:
+            self.reads.append((tuple(chunk_start), tuple(chunk_stop)))
+        if self._delay:
+            self._delay.wait()
+        return self.data[roiToSlice(chunk_start, chunk_stop)].copy()
+
+
+@pytest.fixture
+def data():
+    return numpy.random.default_rng(0).integers(0, 255, size=(20, 30), dtype=numpy.uint8)
+
+
+def read(cache, source, start, stop, chunks=(10, 10)):
+    out = numpy.zeros(numpy.subtract(stop, start), dtype=source.data.dtype)
+    return cache.read("data", source.data.shape, chunks, start, stop, source, out)
+
+
+def test_misaligned_reads_decode_each_chunk_once(data):
+    cache = ChunkCache()
+    source = CountingSource(data)
+
+    numpy.testing.assert_array_equal(read(cache, source, (5, 5), (15, 25)), data[5:15, 5:25])
+    numpy.testing.assert_array_equal(read(cache, source, (0, 15), (20, 30)), data[0:20, 15:30])
+
+    assert sorted(set(source.reads)) == sorted(source.reads)
+    assert ((10, 20), (20, 30)) in source.reads
+    assert cache.getCounters().hits == 4
+    assert cache.usedMemory() == len(source.reads) * 100
+
+
+def test_concurrent_reads_of_a_chunk_are_deduplicated(data):
+    cache = ChunkCache()
+    release = threading.Event()
+    source = CountingSource(data, delay=release)
+
+    requests = [Request(lambda i=i: read(cache, source, (i, i), (i + 5, i + 5))) for i in range(4)]
+    for request in requests:
+        request.submit()
+    release.set()
+
+    for i, request in enumerate(requests):
+        numpy.testing.assert_array_equal(request.wait(), data[i : i + 5, i : i + 5])
+    assert source.reads == [((0, 0), (10, 10))]
+
+
+def test_size_bound_evicts_least_recently_used(data):
+    cache = ChunkCache(max_bytes=250)
+    source = CountingSource(data)
+
+    read(cache, source, (0, 0), (10, 10))
+    read(cache, source, (0, 10), (10, 20))
+    read(cache, source, (0, 0), (10, 10))
+    read(cache, source, (0, 20), (10, 30))
+
+    assert cache.usedMemory() == 200
+    assert sorted(key for key, _ in cache.getBlockAccessTimes()) == [("data", (0, 0)), ("data", (0, 2))]
+
+
+def test_memory_manager_interface(data):
+    cache = ChunkCache()
+    source = CountingSource(data)
+    read(cache, source, (0, 0), (20, 30))
+
+    stats = cache.getBlockStats()
+    assert len(stats) == 6
+    assert all(s.size == 100 and s.compute_time is not None for s in stats)
+
+    assert cache.freeBlock(stats[0].block_id) == 100
+    assert cache.usedMemory() == 500
+    read(cache, source, (0, 0), (20, 30))
+    assert len(source.reads) == 7
+
+    assert cache.freeMemory() == 600
+    assert cache.usedMemory() == 0